@@ -0,0 +1,589 @@
+import asyncio
+import atexit
+import threading
+import weakref
+
+import httpx
+from ibm_cloud_sdk_core import DetailedResponse
+from ibm_cloud_sdk_core.api_exception import ApiException
+
+from ratelimit import RateLimitedTransport
+from endpoints import service_url as base_url_of
+
+try:
+    import h2  # noqa: F401
+
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+VPC_API_VERSION = "2024-12-17"
+
+# VpcV1 keyword arguments that the API spells as dotted filters
+VPC_FILTERS = {
+    "vpc_id": "vpc.id",
+    "vpc_crn": "vpc.crn",
+    "vpc_name": "vpc.name",
+    "resource_group_id": "resource_group.id",
+    "zone_name": "zone.name",
+}
+
+# One pooled client per event loop; connections cannot be shared across loops.
+_http_clients = weakref.WeakKeyDictionary()
+
+
+def shared_http_client():
+    """
+    Returns the long-lived httpx.AsyncClient for the running event loop.
+
+    The client keeps connections alive and negotiates HTTP/2 when the `h2`
+    package is installed, so concurrent calls to the same host are multiplexed
+    over a handful of TLS connections instead of opening one per request. Every
+    request goes through the shared rate limiter and retry policy.
+
+    Returns:
+        httpx.AsyncClient: The pooled client bound to the current event loop.
+    """
+    loop = asyncio.get_running_loop()
+    client = _http_clients.get(loop)
+    if client is None or client.is_closed:
+        transport = httpx.AsyncHTTPTransport(
+            http2=HTTP2_AVAILABLE,
+            limits=httpx.Limits(
+                max_connections=100,
+                max_keepalive_connections=20,
+                keepalive_expiry=60,
+            ),
+        )
+        client = httpx.AsyncClient(
+            transport=RateLimitedTransport(transport),
+            timeout=httpx.Timeout(60.0, connect=10.0),
+        )
+        _http_clients[loop] = client
+    return client
+
+
+async def close_http_clients():
+    """
+    Closes the pooled client belonging to the running event loop, if any.
+    """
+    client = _http_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+def raise_for_api_error(response):
+    """
+    Raises an ApiException for a non-2xx response.
+
+    The exception type matches what the ibm-vpc SDK raises, so callers can handle
+    errors the same way regardless of which client made the request.
+
+    Args:
+        response (httpx.Response): The response to check.
+
+    Raises:
+        ApiException: If the response status code is not 2xx.
+    """
+    if response.is_success:
+        return
+    message = response.reason_phrase
+    try:
+        body = response.json()
+        errors = body.get("errors") or []
+        if errors:
+            message = errors[0].get("message", message)
+        else:
+            message = body.get("errorMessage") or body.get("message") or message
+    except ValueError:
+        pass
+    raise ApiException(response.status_code, message=message)
+
+
+class AsyncServiceClient:
+    """
+    Base class for the coroutine-based IBM Cloud service clients.
+
+    Args:
+        token_source: Object with an async `get_token()` method.
+        service_url (str): Base URL every request path is joined to.
+        http_client (httpx.AsyncClient): Client to use instead of the shared one.
+    """
+
+    default_params = {}
+
+    def __init__(self, token_source, service_url, http_client=None):
+        self.token_source = token_source
+        self.service_url = service_url.rstrip("/")
+        self.http_client = http_client
+
+    async def request(self, method, path, params=None, json=None):
+        """
+        Sends an authenticated request and returns the decoded JSON body.
+
+        Args:
+            method (str): HTTP method.
+            path (str): Path relative to the service URL.
+            params (dict): Query parameters; None values are dropped.
+            json (dict): JSON request body.
+
+        Returns:
+            dict: The decoded response body, or an empty dict for 204 responses.
+
+        Raises:
+            ApiException: If the service returns a non-2xx status.
+        """
+        query = dict(self.default_params)
+        for key, value in (params or {}).items():
+            if value is None:
+                continue
+            query[key] = ",".join(value) if isinstance(value, list) else value
+        token = await self.token_source.get_token()
+        client = self.http_client or shared_http_client()
+        response = await client.request(
+            method,
+            f"{self.service_url}{path}",
+            params=query,
+            json=json,
+            headers={"Authorization": f"Bearer {token}", "Accept": "application/json"},
+        )
+        raise_for_api_error(response)
+        if response.status_code == 204 or not response.content:
+            return {}
+        return response.json()
+
+
+class AsyncVpcClient(AsyncServiceClient):
+    """
+    Coroutine equivalents of the VpcV1 operations used by this tool.
+
+    Method names and arguments mirror VpcV1 so the two can be used interchangeably
+    through SyncClient; list filters such as `vpc_id` are sent as the dotted query
+    parameters VpcV1 uses. Each coroutine returns the decoded result dict.
+
+    Args:
+        token_source: Object with an async `get_token()` method.
+        region (str): The IBM Cloud region to target (e.g., "us-south").
+        http_client (httpx.AsyncClient): Client to use instead of the shared one.
+    """
+
+    default_params = {"version": VPC_API_VERSION, "generation": 2}
+
+    def __init__(self, token_source, region, http_client=None, service_url=None):
+        super().__init__(
+            token_source,
+            service_url or base_url_of("vpc", region),
+            http_client,
+        )
+        self.region = region
+
+    async def request(self, method, path, params=None, json=None):
+        params = {
+            VPC_FILTERS.get(key, key): value for key, value in (params or {}).items()
+        }
+        return await super().request(method, path, params=params, json=json)
+
+    async def list_region_zones(self, region_name):
+        return await self.request("GET", f"/regions/{region_name}/zones")
+
+    async def create_vpc(self, **vpc_prototype):
+        return await self.request("POST", "/vpcs", json=vpc_prototype)
+
+    async def get_vpc(self, id):
+        return await self.request("GET", f"/vpcs/{id}")
+
+    async def create_vpc_address_prefix(self, vpc_id, cidr, zone, **prototype):
+        body = dict(prototype, cidr=cidr, zone=zone)
+        return await self.request("POST", f"/vpcs/{vpc_id}/address_prefixes", json=body)
+
+    async def get_vpc_address_prefix(self, vpc_id, id):
+        return await self.request("GET", f"/vpcs/{vpc_id}/address_prefixes/{id}")
+
+    async def list_vpc_address_prefixes(self, vpc_id, **params):
+        return await self.request(
+            "GET", f"/vpcs/{vpc_id}/address_prefixes", params=params
+        )
+
+    async def list_vpcs(self, **params):
+        return await self.request("GET", "/vpcs", params=params)
+
+    async def delete_vpc(self, id):
+        return await self.request("DELETE", f"/vpcs/{id}")
+
+    async def create_public_gateway(self, vpc, zone, **public_gateway_prototype):
+        body = dict(public_gateway_prototype, vpc=vpc, zone=zone)
+        return await self.request("POST", "/public_gateways", json=body)
+
+    async def get_public_gateway(self, id):
+        return await self.request("GET", f"/public_gateways/{id}")
+
+    async def list_public_gateways(self, **params):
+        return await self.request("GET", "/public_gateways", params=params)
+
+    async def delete_public_gateway(self, id):
+        return await self.request("DELETE", f"/public_gateways/{id}")
+
+    async def create_subnet(self, subnet_prototype):
+        body = {k: v for k, v in subnet_prototype.items() if v is not None}
+        return await self.request("POST", "/subnets", json=body)
+
+    async def get_subnet(self, id):
+        return await self.request("GET", f"/subnets/{id}")
+
+    async def list_subnets(self, **params):
+        return await self.request("GET", "/subnets", params=params)
+
+    async def delete_subnet(self, id):
+        return await self.request("DELETE", f"/subnets/{id}")
+
+    async def create_security_group(self, vpc, **security_group_prototype):
+        body = dict(security_group_prototype, vpc=vpc)
+        return await self.request("POST", "/security_groups", json=body)
+
+    async def get_security_group(self, id):
+        return await self.request("GET", f"/security_groups/{id}")
+
+    async def list_security_groups(self, **params):
+        return await self.request("GET", "/security_groups", params=params)
+
+    async def delete_security_group(self, id):
+        return await self.request("DELETE", f"/security_groups/{id}")
+
+    async def create_security_group_rule(
+        self, security_group_id, security_group_rule_prototype
+    ):
+        return await self.request(
+            "POST",
+            f"/security_groups/{security_group_id}/rules",
+            json=security_group_rule_prototype,
+        )
+
+    async def list_security_group_rules(self, security_group_id):
+        return await self.request("GET", f"/security_groups/{security_group_id}/rules")
+
+    async def list_images(self, **params):
+        return await self.request("GET", "/images", params=params)
+
+    async def list_keys(self, **params):
+        return await self.request("GET", "/keys", params=params)
+
+    async def list_instance_profiles(self):
+        return await self.request("GET", "/instance/profiles")
+
+    async def create_virtual_network_interface(self, **prototype):
+        return await self.request("POST", "/virtual_network_interfaces", json=prototype)
+
+    async def create_instance(self, instance_prototype):
+        return await self.request("POST", "/instances", json=instance_prototype)
+
+    async def get_instance(self, id):
+        return await self.request("GET", f"/instances/{id}")
+
+    async def list_instances(self, **params):
+        return await self.request("GET", "/instances", params=params)
+
+    async def delete_instance(self, id):
+        return await self.request("DELETE", f"/instances/{id}")
+
+
+class AsyncResourceManagerClient(AsyncServiceClient):
+    """
+    Coroutine equivalent of ResourceManagerV2.list_resource_groups.
+    """
+
+    def __init__(self, token_source, http_client=None, service_url=None):
+        super().__init__(
+            token_source,
+            service_url or f"{base_url_of('resource_manager')}/v2",
+            http_client,
+        )
+
+    async def list_resource_groups(self, account_id=None, **params):
+        return await self.request(
+            "GET", "/resource_groups", params=dict(params, account_id=account_id)
+        )
+
+
+class AsyncResourceControllerClient(AsyncServiceClient):
+    """
+    Coroutine equivalents of the ResourceControllerV2 instance operations.
+
+    The resource controller shares its host with the resource manager.
+    """
+
+    def __init__(self, token_source, http_client=None, service_url=None):
+        super().__init__(
+            token_source,
+            service_url or f"{base_url_of('resource_manager')}/v2",
+            http_client,
+        )
+
+    async def create_resource_instance(
+        self, name, target, resource_group, resource_plan_id
+    ):
+        body = {
+            "name": name,
+            "target": target,
+            "resource_group": resource_group,
+            "resource_plan_id": resource_plan_id,
+        }
+        return await self.request("POST", "/resource_instances", json=body)
+
+    async def get_resource_instance(self, id):
+        return await self.request("GET", f"/resource_instances/{id}")
+
+    async def list_resource_instances(self, **params):
+        return await self.request("GET", "/resource_instances", params=params)
+
+    async def delete_resource_instance(self, id, recursive=None):
+        return await self.request(
+            "DELETE", f"/resource_instances/{id}", params={"recursive": recursive}
+        )
+
+
+class AsyncDnsServicesClient(AsyncServiceClient):
+    """
+    Coroutine equivalents of the DnsSvcsV1 zone, permitted network and resource
+    record operations. `instance_id` is the GUID of a DNS Services instance.
+    """
+
+    def __init__(self, token_source, http_client=None, service_url=None):
+        super().__init__(token_source, service_url or base_url_of("dns"), http_client)
+
+    async def create_dnszone(self, instance_id, name, description=None, label=None):
+        body = {"name": name, "description": description, "label": label}
+        return await self.request(
+            "POST",
+            f"/instances/{instance_id}/dnszones",
+            json={k: v for k, v in body.items() if v is not None},
+        )
+
+    async def get_dnszone(self, instance_id, dnszone_id):
+        return await self.request(
+            "GET", f"/instances/{instance_id}/dnszones/{dnszone_id}"
+        )
+
+    async def list_dnszones(self, instance_id, **params):
+        return await self.request(
+            "GET", f"/instances/{instance_id}/dnszones", params=params
+        )
+
+    async def create_permitted_network(self, instance_id, dnszone_id, vpc_crn):
+        return await self.request(
+            "POST",
+            f"/instances/{instance_id}/dnszones/{dnszone_id}/permitted_networks",
+            json={"type": "vpc", "permitted_network": {"vpc_crn": vpc_crn}},
+        )
+
+    async def list_permitted_networks(self, instance_id, dnszone_id):
+        return await self.request(
+            "GET", f"/instances/{instance_id}/dnszones/{dnszone_id}/permitted_networks"
+        )
+
+    async def delete_permitted_network(
+        self, instance_id, dnszone_id, permitted_network_id
+    ):
+        return await self.request(
+            "DELETE",
+            f"/instances/{instance_id}/dnszones/{dnszone_id}"
+            f"/permitted_networks/{permitted_network_id}",
+        )
+
+    async def list_resource_records(self, instance_id, dnszone_id, **params):
+        return await self.request(
+            "GET",
+            f"/instances/{instance_id}/dnszones/{dnszone_id}/resource_records",
+            params=params,
+        )
+
+    async def create_resource_record(self, instance_id, dnszone_id, **record):
+        return await self.request(
+            "POST",
+            f"/instances/{instance_id}/dnszones/{dnszone_id}/resource_records",
+            json=record,
+        )
+
+    async def update_resource_record(
+        self, instance_id, dnszone_id, record_id, **record
+    ):
+        return await self.request(
+            "PUT",
+            f"/instances/{instance_id}/dnszones/{dnszone_id}/resource_records/{record_id}",
+            json=record,
+        )
+
+
+class AsyncIamIdentityClient(AsyncServiceClient):
+    """
+    Coroutine equivalent of IamIdentityV1.get_api_keys_details.
+    """
+
+    def __init__(self, token_source, http_client=None, service_url=None):
+        super().__init__(
+            token_source, service_url or f"{base_url_of('iam')}/v1", http_client
+        )
+
+    async def get_api_keys_details(self, iam_api_key):
+        token = await self.token_source.get_token()
+        client = self.http_client or shared_http_client()
+        response = await client.get(
+            f"{self.service_url}/apikeys/details",
+            headers={
+                "Authorization": f"Bearer {token}",
+                "IAM-ApiKey": iam_api_key,
+                "Accept": "application/json",
+            },
+        )
+        raise_for_api_error(response)
+        return response.json()
+
+
+async def create_tailscale_key(
+    token, tailnet_id, tailscale_tag, http_client=None, base_url=None, reusable=False
+):
+    """
+    Creates an ephemeral, preauthorized Tailscale auth key over the pooled client.
+
+    Args:
+        token (str): The Tailscale API token.
+        tailnet_id (str): The ID of the Tailscale tailnet.
+        tailscale_tag (str): The tag to apply to devices created with this key.
+        http_client (httpx.AsyncClient): Client to use instead of the shared one.
+        reusable (bool): Let several devices join with the key.
+
+    Returns:
+        dict: The JSON response from the Tailscale API.
+
+    Raises:
+        httpx.HTTPStatusError: If the Tailscale API returns an error status.
+    """
+    client = http_client or shared_http_client()
+    base_url = base_url or base_url_of("tailscale")
+    response = await client.post(
+        f"{base_url}/api/v2/tailnet/{tailnet_id}/keys?all=true",
+        headers={"Authorization": f"Bearer {token}"},
+        json={
+            "capabilities": {
+                "devices": {
+                    "create": {
+                        "reusable": reusable,
+                        "ephemeral": True,
+                        "preauthorized": True,
+                        "tags": [f"{tailscale_tag}"],
+                    }
+                }
+            },
+            "expirySeconds": 86400,
+            "description": "Labme access",
+        },
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+async def delete_tailscale_key(
+    token, tailnet_id, key_id, http_client=None, base_url=None
+):
+    """
+    Revokes a Tailscale auth key over the pooled client.
+
+    Args:
+        token (str): The Tailscale API token.
+        tailnet_id (str): The ID of the Tailscale tailnet.
+        key_id (str): The ID of the key to revoke.
+        http_client (httpx.AsyncClient): Client to use instead of the shared one.
+
+    Returns:
+        bool: True if the key was revoked, False if it no longer existed.
+
+    Raises:
+        httpx.HTTPStatusError: If the Tailscale API returns another error status.
+    """
+    client = http_client or shared_http_client()
+    base_url = base_url or base_url_of("tailscale")
+    response = await client.delete(
+        f"{base_url}/api/v2/tailnet/{tailnet_id}/keys/{key_id}",
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    if response.status_code == 404:
+        return False
+    response.raise_for_status()
+    return True
+
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def background_loop():
+    """
+    Returns the event loop that services blocking callers.
+
+    The loop runs forever in a daemon thread, so the pooled HTTP client and its
+    open connections survive between calls made from synchronous code.
+
+    Returns:
+        asyncio.AbstractEventLoop: The background event loop.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=_loop.run_forever, name="async-client-loop", daemon=True
+            ).start()
+            atexit.register(close_background_clients)
+    return _loop
+
+
+def close_background_clients():
+    """
+    Closes the pooled client of the background loop, if it has one.
+
+    Registered to run at interpreter exit once the loop is started, so the open
+    connections are shut down cleanly instead of being dropped with the thread.
+    """
+    if _loop is not None and _loop.is_running():
+        run_sync(close_http_clients())
+
+
+def run_sync(coro):
+    """
+    Runs a coroutine on the background loop and blocks until it finishes.
+
+    Safe to call from many threads at once; the calls run concurrently on the loop.
+
+    Args:
+        coro: The coroutine to run.
+
+    Returns:
+        The coroutine's return value.
+    """
+    return asyncio.run_coroutine_threadsafe(coro, background_loop()).result()
+
+
+class SyncClient:
+    """
+    Blocking facade over an async client with the same call shape as the SDK.
+
+    Every coroutine method of the wrapped client is exposed as a blocking method
+    returning a DetailedResponse, so the helpers in utils.py work unchanged with
+    either a VpcV1 instance or a SyncClient.
+
+    Args:
+        async_client: An AsyncVpcClient, AsyncResourceManagerClient or
+            AsyncIamIdentityClient instance.
+    """
+
+    def __init__(self, async_client):
+        self.async_client = async_client
+
+    def __getattr__(self, name):
+        method = getattr(self.async_client, name)
+        if not asyncio.iscoroutinefunction(method):
+            return method
+
+        def call(*args, **kwargs):
+            return DetailedResponse(response=run_sync(method(*args, **kwargs)))
+
+        return call
@@ -0,0 +1,231 @@
+import asyncio
+import base64
+import fcntl
+import functools
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+import jwt
+from ibm_cloud_sdk_core.authenticators import IAMAuthenticator
+
+from cache import cache_dir, atomic_write, refresh_requested
+from endpoints import service_url
+from ratelimit import retry_call
+
+logger = logging.getLogger(__name__)
+
+# Refresh this many seconds (at most) before the SDK's own refresh point, spread
+# randomly so concurrent deployments don't all hit IAM in the same second.
+REFRESH_JITTER = 60
+
+
+def disk_cache_enabled():
+    """
+    Returns True when the encrypted on-disk token cache is enabled.
+
+    The cache is opt-in through the `VPC_LAB_TOKEN_CACHE` environment variable.
+    """
+    return os.environ.get("VPC_LAB_TOKEN_CACHE", "").lower() in ("1", "true", "yes")
+
+
+class TokenProvider:
+    """
+    A process-wide IAM token source for one API key.
+
+    Wraps a single IAMAuthenticator that every SDK service client shares, refreshes
+    the token in a background thread before it expires, and optionally persists the
+    token to an encrypted file so later CLI runs (and other processes) can reuse it.
+    A cached token is not reused after `cache.request_refresh()`.
+    When the disk cache is on, token requests are serialized with a file lock and
+    the cache is re-read after the lock is taken, so a fleet of processes started
+    together makes one IAM call instead of one each.
+
+    Args:
+        api_key (str): The IBM Cloud API key.
+        url (str): IAM endpoint override, mainly for testing.
+        disk_cache (bool): Persist tokens between runs. Defaults to
+            `disk_cache_enabled()`.
+    """
+
+    def __init__(self, api_key, url=None, disk_cache=None):
+        self.api_key = api_key
+        self.authenticator = IAMAuthenticator(api_key, url=url)
+        self.token_manager = self.authenticator.token_manager
+        self._request_from_iam = functools.partial(
+            retry_call, "iam", self.token_manager.request_token
+        )
+        self.token_manager.request_token = self._request_token
+        self.disk_cache = disk_cache_enabled() if disk_cache is None else disk_cache
+        self.cache_path = None
+        if self.disk_cache:
+            digest = hashlib.sha256(api_key.encode()).hexdigest()[:16]
+            self.cache_path = cache_dir("tokens") / f"{digest}.bin"
+            cached = self._read_cache()
+            if cached:
+                self.token_manager._save_token_info(cached)
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._refresh_loop, name="iam-token-refresh", daemon=True
+        )
+        self._thread.start()
+
+    def get_token(self):
+        """
+        Returns a valid IAM access token, fetching one only if none is cached.
+
+        Returns:
+            str: The bearer token.
+        """
+        return self.token_manager.get_token()
+
+    def claims(self):
+        """
+        Returns the decoded (unverified) claims of the current access token.
+
+        Returns:
+            dict: The JWT claims.
+        """
+        return jwt.decode(
+            self.get_token(),
+            algorithms=["RS256"],
+            options={"verify_signature": False},
+        )
+
+    def account_id(self):
+        """
+        Returns the account ID embedded in the access token, if present.
+
+        Returns:
+            str: The account ID, or None if the token does not carry one.
+        """
+        return (self.claims().get("account") or {}).get("bss")
+
+    def stop(self):
+        """
+        Stops the background refresh thread.
+        """
+        self._stopped.set()
+        self._wakeup.set()
+
+    def _fernet(self):
+        from cryptography.fernet import Fernet
+
+        key = hashlib.sha256(f"vpc-lab-token-cache:{self.api_key}".encode()).digest()
+        return Fernet(base64.urlsafe_b64encode(key))
+
+    def _read_cache(self):
+        from cryptography.fernet import InvalidToken
+
+        if refresh_requested():
+            return None
+        try:
+            token_response = json.loads(
+                self._fernet().decrypt(self.cache_path.read_bytes())
+            )
+            claims = jwt.decode(
+                token_response["access_token"],
+                algorithms=["RS256"],
+                options={"verify_signature": False},
+            )
+        except (OSError, ValueError, KeyError, InvalidToken, jwt.PyJWTError):
+            return None
+        lifetime = claims["exp"] - claims["iat"]
+        if time.time() >= claims["exp"] - lifetime * 0.2:
+            return None
+        return token_response
+
+    def _request_token(self):
+        if not self.cache_path:
+            token_response = self._request_from_iam()
+        else:
+            with open(self.cache_path.with_suffix(".lock"), "w") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                token_response = self._read_cache()
+                if token_response is None:
+                    token_response = self._request_from_iam()
+                    atomic_write(
+                        self.cache_path,
+                        self._fernet().encrypt(json.dumps(token_response).encode()),
+                    )
+        self._wakeup.set()
+        return token_response
+
+    def _refresh_loop(self):
+        while not self._stopped.is_set():
+            manager = self.token_manager
+            if manager.access_token:
+                delay = manager.refresh_time - time.time()
+                delay -= random.uniform(0, REFRESH_JITTER)
+            else:
+                delay = None
+            if delay is None or delay > 0:
+                self._wakeup.wait(delay)
+                self._wakeup.clear()
+                continue
+            try:
+                manager._save_token_info(self._request_token())
+                self._wakeup.clear()
+            except Exception as e:
+                logger.warning(f"Background IAM token refresh failed: {e}")
+                self._stopped.wait(REFRESH_JITTER)
+
+
+class AsyncTokenSource:
+    """
+    Adapts a TokenProvider to the async `get_token()` interface of async_client.
+
+    Args:
+        provider (TokenProvider): The shared provider.
+    """
+
+    def __init__(self, provider):
+        self.provider = provider
+
+    async def get_token(self):
+        manager = self.provider.token_manager
+        if manager.access_token and time.time() < manager.refresh_time:
+            return manager.access_token
+        return await asyncio.to_thread(self.provider.get_token)
+
+
+_providers = {}
+_providers_lock = threading.Lock()
+
+
+def get_token_provider(api_key):
+    """
+    Returns the process-wide TokenProvider for an API key, creating it on first use.
+
+    Args:
+        api_key (str): The IBM Cloud API key.
+
+    Returns:
+        TokenProvider: The shared provider.
+    """
+    with _providers_lock:
+        provider = _providers.get(api_key)
+        if provider is None:
+            provider = TokenProvider(api_key, url=service_url("iam"))
+            _providers[api_key] = provider
+        return provider
+
+
+def get_authenticator(api_key):
+    """
+    Returns the shared IAMAuthenticator for an API key.
+
+    Every SDK service built with this authenticator reuses the same cached token.
+
+    Args:
+        api_key (str): The IBM Cloud API key.
+
+    Returns:
+        IAMAuthenticator: The shared authenticator.
+    """
+    return get_token_provider(api_key).authenticator
@@ -0,0 +1,292 @@
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import click
+from rich.console import Console
+from rich.table import Table
+
+from fake_cloud import FakeCloud, KINDS, parse_pairs
+
+# Scenario name -> number of labs
+SCENARIOS = {
+    "single": 1,
+    "fleet-10": 10,
+    "fleet-100": 100,
+    "fleet-500": 500,
+}
+
+
+def run_worker(spec):
+    """
+    Deploys the labs of one benchmark run; runs in a child process.
+
+    The tool reads its endpoints and credentials from the environment when its
+    modules are imported, so they are imported here, after the parent has
+    pointed the environment at the fake server.
+
+    Args:
+        spec (dict): `labs`, `regions`, `per_region_concurrency`, `max_workers`
+            and `limits` (family mapped to requests per second).
+
+    Returns:
+        dict: Wall time, lab outcomes and the process's peak RSS.
+    """
+    import ratelimit
+    from fleet import assign_regions, run_fleet
+
+    ratelimit.configure_limits(
+        **{
+            family: (rate, max(1, int(rate * 2)))
+            for family, rate in spec["limits"].items()
+        }
+    )
+    prefixes = [f"bench{n:03d}" for n in range(spec["labs"])]
+    labs = assign_regions(prefixes, spec["regions"])
+    started = time.monotonic()
+    run_fleet(
+        labs,
+        "default",
+        "lab-key",
+        "tag:bench",
+        per_region_concurrency=spec["per_region_concurrency"],
+        max_workers=spec["max_workers"],
+        resume=False,
+    )
+    failed = [lab for lab in labs if lab["state"] != "succeeded"]
+    return {
+        "wall_time": time.monotonic() - started,
+        "succeeded": len(labs) - len(failed),
+        "failed": len(failed),
+        "errors": sorted({lab.get("error") or "" for lab in failed})[:5],
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def run_scenario(
+    labs,
+    regions=("us-south",),
+    latency=0.02,
+    latency_for=None,
+    transition=1.0,
+    throttle=0.0,
+    quotas=None,
+    limits=None,
+    per_region_concurrency=10,
+    max_workers=4,
+):
+    """
+    Deploys labs end to end against a fresh FakeCloud and measures the run.
+
+    The deployment runs in a child process with its own cache directory, so
+    every run starts cold and its peak memory is measured on its own.
+
+    Args:
+        labs (int): Number of labs to deploy.
+        regions (tuple): Regions to spread the labs over.
+        latency (float): Seconds the fake adds to every request.
+        latency_for (dict): Per-operation latency overrides.
+        transition (float): Seconds resources stay pending.
+        throttle (float): Fraction of requests the fake answers with 429.
+        quotas (dict): Per-region quotas enforced by the fake.
+        limits (dict): Client rate limit overrides, family mapped to requests
+            per second.
+        per_region_concurrency (int): Labs deploying at once per region.
+        max_workers (int): Concurrent steps within one lab.
+
+    Returns:
+        dict: `labs`, `wall_time`, `succeeded`, `failed`, `errors`, `api_calls`,
+            `calls_per_lab`, `throttled`, `peak_rss_mb`, `resources` (kind mapped
+            to the number left in the fake) and `operations` (per-operation
+            request counts).
+
+    Raises:
+        RuntimeError: If the child process fails.
+    """
+    cloud = FakeCloud(
+        regions=regions,
+        latency=latency_for,
+        default_latency=latency,
+        transition=transition,
+        throttle=throttle,
+        quotas=quotas,
+    )
+    cloud.start()
+    spec = {
+        "labs": labs,
+        "regions": list(regions),
+        "per_region_concurrency": per_region_concurrency,
+        "max_workers": max_workers,
+        "limits": dict(limits or {}),
+    }
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            env = dict(
+                os.environ,
+                **cloud.environment(),
+                VPC_LAB_CACHE_DIR=workdir,
+                VPC_LAB_TOKEN_CACHE="",
+                IBMCLOUD_API_KEY="benchmark",
+                TAILSCALE_API_KEY="benchmark",
+                TAILNET_ID="benchmark.example.com",
+            )
+            completed = subprocess.run(
+                [
+                    sys.executable,
+                    os.path.abspath(__file__),
+                    "--worker",
+                    json.dumps(spec),
+                ],
+                env=env,
+                cwd=workdir,
+                capture_output=True,
+                text=True,
+            )
+        if completed.returncode != 0:
+            raise RuntimeError(f"Benchmark worker failed:\n{completed.stderr[-2000:]}")
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        stats = cloud.stats()
+        counts = {
+            kind: sum(len(cloud.resources(region, kind)) for region in regions)
+            for kind in KINDS
+        }
+    finally:
+        cloud.stop()
+    return {
+        "labs": labs,
+        "wall_time": round(result["wall_time"], 2),
+        "succeeded": result["succeeded"],
+        "failed": result["failed"],
+        "errors": result["errors"],
+        "api_calls": stats["requests"],
+        "calls_per_lab": round(stats["requests"] / labs, 1),
+        "throttled": stats["throttled"],
+        "peak_rss_mb": round(result["peak_rss_kb"] / 1024, 1),
+        "resources": counts,
+        "operations": stats["operations"],
+    }
+
+
+def results_table(results):
+    """
+    Renders benchmark results as a rich Table.
+
+    Args:
+        results (dict): Scenario name mapped to its `run_scenario` result.
+    """
+    table = Table(title="Deployment benchmarks (fake cloud)")
+    for column in [
+        "Scenario",
+        "Labs",
+        "OK",
+        "Wall time (s)",
+        "Labs/min",
+        "API calls",
+        "Calls/lab",
+        "429s",
+        "Peak RSS (MB)",
+    ]:
+        table.add_column(column, justify="left" if column == "Scenario" else "right")
+    for name, result in results.items():
+        table.add_row(
+            name,
+            str(result["labs"]),
+            str(result["succeeded"]),
+            f"{result['wall_time']:.1f}",
+            f"{result['succeeded'] / result['wall_time'] * 60:.1f}",
+            str(result["api_calls"]),
+            f"{result['calls_per_lab']:.1f}",
+            str(result["throttled"]),
+            f"{result['peak_rss_mb']:.0f}",
+        )
+    return table
+
+
+@click.command()
+@click.option(
+    "--scenario",
+    "scenarios",
+    multiple=True,
+    type=click.Choice(list(SCENARIOS)),
+    help="Scenario to run; repeat for more. Defaults to single and fleet-10",
+)
+@click.option("--region", "regions", multiple=True, help="Region to spread labs over")
+@click.option(
+    "--latency", default=0.02, show_default=True, help="Seconds added per request"
+)
+@click.option(
+    "--latency-for",
+    multiple=True,
+    help="Per-operation latency, e.g. 'POST vpc:/instances=0.5'",
+)
+@click.option(
+    "--transition",
+    default=1.0,
+    show_default=True,
+    help="Seconds resources stay pending",
+)
+@click.option(
+    "--throttle", default=0.0, show_default=True, help="Fraction of requests to 429"
+)
+@click.option("--quota", "quotas", multiple=True, help="Per-region quota, e.g. vpc=10")
+@click.option(
+    "--limit",
+    "limits",
+    multiple=True,
+    help="Client rate limit in requests per second, e.g. vpc=100",
+)
+@click.option("--per-region-concurrency", default=10, show_default=True)
+@click.option("--max-workers", default=4, show_default=True)
+@click.option("--report", type=click.Path(), help="Write the JSON results to a file")
+@click.option("--worker", hidden=True)
+def benchmark(
+    scenarios,
+    regions,
+    latency,
+    latency_for,
+    transition,
+    throttle,
+    quotas,
+    limits,
+    per_region_concurrency,
+    max_workers,
+    report,
+    worker,
+):
+    """
+    Benchmark end-to-end deployments against a local fake cloud.
+    """
+    if worker:
+        click.echo(json.dumps(run_worker(json.loads(worker))))
+        return
+
+    results = {}
+    for name in scenarios or ("single", "fleet-10"):
+        results[name] = run_scenario(
+            SCENARIOS[name],
+            regions=regions or ("us-south",),
+            latency=latency,
+            latency_for=parse_pairs(latency_for),
+            transition=transition,
+            throttle=throttle,
+            quotas=parse_pairs(quotas, int),
+            limits=parse_pairs(limits),
+            per_region_concurrency=per_region_concurrency,
+            max_workers=max_workers,
+        )
+    console = Console()
+    console.print(results_table(results))
+    for name, result in results.items():
+        for error in result["errors"]:
+            console.print(f"[red]{name}: {error}")
+    if report:
+        with open(report, "w") as handle:
+            json.dump(results, handle, indent=2)
+
+
+if __name__ == "__main__":
+    benchmark()
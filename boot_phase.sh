@@ -0,0 +1,11 @@
+# Boot phase markers: `vpc-lab-phase <name>` appends "VPC-LAB-BOOT <name> <epoch>"
+# to {{ boot_timings_path }} and echoes it to the serial console
+mkdir -p "$(dirname {{ boot_timings_path }})"
+cat <<'PHASE' > /usr/local/sbin/vpc-lab-phase
+#!/bin/sh
+line="VPC-LAB-BOOT $1 $(date +%s.%N)"
+echo "$line" >> {{ boot_timings_path }}
+echo "$line" > /dev/console 2>/dev/null || true
+PHASE
+chmod 755 /usr/local/sbin/vpc-lab-phase
+vpc-lab-phase start
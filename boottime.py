@@ -0,0 +1,172 @@
+import json
+import re
+import subprocess
+from datetime import datetime
+
+import click
+
+from journal import Journal
+from userdata import BOOT_TIMINGS_PATH
+
+MARKER = re.compile(r"VPC-LAB-BOOT (\S+) (\d+(?:\.\d+)?)")
+
+
+def parse_timings(text):
+    """
+    Extracts boot phase markers from a timings file or serial console log.
+
+    Lines without a marker are ignored, so a whole console log can be passed in.
+    A phase that appears more than once (e.g. after a reboot) keeps its first time.
+
+    Args:
+        text (str): Text containing "VPC-LAB-BOOT <phase> <epoch>" lines.
+
+    Returns:
+        list: Tuples of (phase, epoch seconds), in time order.
+    """
+    timings = {}
+    for phase, stamp in MARKER.findall(text):
+        timings.setdefault(phase, float(stamp))
+    return sorted(timings.items(), key=lambda item: item[1])
+
+
+def phase_durations(timings, origin=None):
+    """
+    Works out how long each boot phase took.
+
+    Args:
+        timings (list): Tuples of (phase, epoch seconds) from `parse_timings`.
+        origin (float): Epoch seconds to measure offsets from, e.g. when the
+            instance was created. Defaults to the first marker.
+
+    Returns:
+        list: One dict per phase with `phase`, `offset` (seconds since the origin)
+            and `duration` (seconds since the previous marker, or since the origin
+            for the first one).
+    """
+    if not timings:
+        return []
+    origin = timings[0][1] if origin is None else origin
+    durations = []
+    previous = origin
+    for phase, stamp in timings:
+        durations.append(
+            {
+                "phase": phase,
+                "offset": round(stamp - origin, 2),
+                "duration": round(stamp - previous, 2),
+            }
+        )
+        previous = stamp
+    return durations
+
+
+def collect_timings(host, user="root", path=BOOT_TIMINGS_PATH, timeout=30):
+    """
+    Reads the boot timings file from an instance over SSH.
+
+    The lab instance has no public address, so `host` is normally its Tailscale
+    name or address.
+
+    Args:
+        host (str): Host to connect to.
+        user (str): SSH user.
+        path (str): Timings file on the instance.
+        timeout (int): Seconds to wait for the connection and the command.
+
+    Returns:
+        list: Tuples of (phase, epoch seconds), in time order.
+
+    Raises:
+        subprocess.CalledProcessError: If SSH or reading the file fails.
+        subprocess.TimeoutExpired: If the command takes longer than `timeout`.
+    """
+    completed = subprocess.run(
+        [
+            "ssh",
+            "-o",
+            "BatchMode=yes",
+            "-o",
+            "StrictHostKeyChecking=accept-new",
+            "-o",
+            f"ConnectTimeout={timeout}",
+            f"{user}@{host}",
+            "cat",
+            path,
+        ],
+        capture_output=True,
+        text=True,
+        timeout=timeout,
+        check=True,
+    )
+    return parse_timings(completed.stdout)
+
+
+def instance_created_at(prefix, region):
+    """
+    Returns when a lab's instance was created, from the lab's journal.
+
+    Args:
+        prefix (str): The lab prefix.
+        region (str): The region the lab is deployed in.
+
+    Returns:
+        float: Epoch seconds, or None if the journal has no instance.
+    """
+    instance = Journal(prefix, region).get("instance") or {}
+    created_at = instance.get("created_at")
+    if not created_at:
+        return None
+    return datetime.fromisoformat(created_at.replace("Z", "+00:00")).timestamp()
+
+
+def timings_table(durations, title="Boot phases"):
+    """
+    Renders phase durations as a rich Table.
+
+    Args:
+        durations (list): Dicts from `phase_durations`.
+        title (str): Table title.
+    """
+    from rich.table import Table
+
+    table = Table(title=title)
+    table.add_column("Phase")
+    table.add_column("At (s)", justify="right")
+    table.add_column("Took (s)", justify="right")
+    for row in durations:
+        table.add_row(row["phase"], f"{row['offset']:.1f}", f"{row['duration']:.1f}")
+    return table
+
+
+@click.command()
+@click.option("--prefix", required=True, help="Prefix of the lab")
+@click.option("--region", required=True, help="Region the lab is deployed in")
+@click.option(
+    "--host",
+    help="Host to read the timings from; defaults to the instance's Tailscale name",
+)
+@click.option("--user", default="root", show_default=True, help="SSH user")
+@click.option("--json", "as_json", is_flag=True, help="Print the timings as JSON")
+def boot_timings(prefix, region, host, user, as_json):
+    """
+    Show where a lab instance's boot time went, phase by phase.
+    """
+    from rich.console import Console
+
+    timings = collect_timings(host or f"{prefix}-tailscale-instance", user=user)
+    if not timings:
+        raise click.ClickException("No boot phases recorded yet")
+    origin = instance_created_at(prefix, region)
+    durations = phase_durations(timings, origin)
+    if as_json:
+        click.echo(json.dumps(durations, indent=2))
+        return
+    since = "instance creation" if origin is not None else "the first marker"
+    Console().print(
+        timings_table(durations, title=f"Boot phases of {prefix} (from {since})")
+    )
+
+
+if __name__ == "__main__":
+    boot_timings()
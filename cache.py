@@ -0,0 +1,224 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+
+def cache_dir(*parts):
+    """
+    Returns (and creates) a directory under the tool's local cache root.
+
+    The root is `$VPC_LAB_CACHE_DIR` if set, otherwise `$XDG_CACHE_HOME/vpc-lab`
+    or `~/.cache/vpc-lab`.
+
+    Args:
+        *parts (str): Sub-directory names below the cache root.
+
+    Returns:
+        Path: The directory path, guaranteed to exist.
+    """
+    root = os.environ.get("VPC_LAB_CACHE_DIR")
+    if not root:
+        xdg = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+            os.path.expanduser("~"), ".cache"
+        )
+        root = os.path.join(xdg, "vpc-lab")
+    path = Path(root, *parts)
+    path.mkdir(parents=True, exist_ok=True, mode=0o700)
+    return path
+
+
+def atomic_write(path, data):
+    """
+    Writes bytes to a file atomically with owner-only permissions.
+
+    The data is written to a temporary file in the same directory and renamed over
+    the target, so concurrent readers never see a partially written file.
+
+    Args:
+        path (Path): Destination file.
+        data (bytes): Content to write.
+    """
+    path = Path(path)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "wb") as handle:
+            handle.write(data)
+        os.chmod(tmp_path, 0o600)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+# Seconds each kind of lookup is trusted before it is listed again
+LOOKUP_TTLS = {
+    "resource_groups": 24 * 3600,
+    "keys": 3600,
+    "zones": 7 * 24 * 3600,
+    "instance_profiles": 24 * 3600,
+}
+
+_lookup_caches = {}
+_lookup_caches_lock = threading.Lock()
+_refresh_requested = False
+
+
+class LookupCache:
+    """
+    Persistent name-to-ID maps for rarely changing collections.
+
+    Each kind (resource groups, SSH keys, zones) is stored as a dict populated by
+    one bulk list call, so lookups are O(1) and repeated runs skip the list call
+    entirely until the kind's TTL expires. One JSON file is kept per account and
+    region.
+
+    Args:
+        account_id (str): The account the cached data belongs to.
+        region (str): The region, or "global" for account-wide collections.
+        ttls (dict): Per-kind TTL overrides, in seconds.
+    """
+
+    def __init__(self, account_id, region, ttls=None):
+        self.path = cache_dir("lookups") / f"{account_id}-{region}.json"
+        self.ttls = dict(LOOKUP_TTLS, **(ttls or {}))
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._refreshed = set()
+        try:
+            self.entries = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def get(self, kind):
+        """
+        Returns the cached mapping for a kind, or None if missing or expired.
+
+        Args:
+            kind (str): The lookup kind, e.g. "keys".
+
+        Returns:
+            dict: The cached mapping.
+        """
+        with self._lock:
+            entry = self.entries.get(kind)
+            if entry is None:
+                return None
+            if _refresh_requested and kind not in self._refreshed:
+                return None
+            if time.time() - entry["stored_at"] > self.ttls.get(kind, 3600):
+                return None
+            return entry["values"]
+
+    def put(self, kind, values):
+        """
+        Stores the mapping for a kind and writes the cache file.
+
+        Args:
+            kind (str): The lookup kind.
+            values (dict): The mapping to store.
+        """
+        with self._lock:
+            self.entries[kind] = {"stored_at": time.time(), "values": values}
+            self._refreshed.add(kind)
+            atomic_write(self.path, json.dumps(self.entries).encode())
+
+    def invalidate(self, kind=None):
+        """
+        Drops one kind, or every kind when `kind` is None.
+
+        Args:
+            kind (str): The lookup kind to drop.
+        """
+        with self._lock:
+            if kind is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(kind, None)
+            atomic_write(self.path, json.dumps(self.entries).encode())
+
+    def lookup(self, kind, loader):
+        """
+        Returns the mapping for a kind, calling `loader()` once to populate it if
+        it is not cached.
+
+        Args:
+            kind (str): The lookup kind.
+            loader (callable): Returns the full mapping, normally from one list call.
+                Concurrent callers wait for a single loader instead of each listing.
+
+        Returns:
+            dict: The mapping.
+        """
+        values = self.get(kind)
+        if values is None:
+            with self._load_lock:
+                values = self.get(kind)
+                if values is None:
+                    values = loader()
+                    self.put(kind, values)
+        return values
+
+    def find(self, kind, name, loader):
+        """
+        Returns one entry of a kind's mapping.
+
+        A cached mapping that lacks the name is reloaded once before giving up,
+        so a resource created after the mapping was cached is found right away
+        rather than when the TTL expires.
+
+        Args:
+            kind (str): The lookup kind.
+            name (str): The key to look up, e.g. an SSH key name.
+            loader (callable): Returns the full mapping, as for `lookup`.
+
+        Returns:
+            The value for the name, or None if it is missing after a reload.
+        """
+        loaded = []
+
+        def load():
+            loaded.append(True)
+            return loader()
+
+        values = self.lookup(kind, load)
+        if name in values or loaded:
+            return values.get(name)
+        self.invalidate(kind)
+        return self.lookup(kind, loader).get(name)
+
+
+def lookup_cache(account_id, region="global"):
+    """
+    Returns the process-wide LookupCache for an account and region.
+
+    Args:
+        account_id (str): The account the cached data belongs to.
+        region (str): The region, or "global" for account-wide collections.
+
+    Returns:
+        LookupCache: The shared cache instance.
+    """
+    with _lookup_caches_lock:
+        key = (account_id, region)
+        if key not in _lookup_caches:
+            _lookup_caches[key] = LookupCache(account_id, region)
+        return _lookup_caches[key]
+
+
+def request_refresh():
+    """
+    Makes every lookup cache reload each kind once during this process, as if
+    its entries had expired. Used by `--refresh-cache`.
+    """
+    global _refresh_requested
+    _refresh_requested = True
+
+
+def refresh_requested():
+    """
+    Returns True once `request_refresh` has been called in this process.
+    """
+    return _refresh_requested
@@ -0,0 +1,552 @@
+import asyncio
+import base64
+import io
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import click
+import httpx
+import jwt
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from cache import atomic_write
+
+CASSETTE_VERSION = 1
+
+SCRUBBED = "SCRUBBED"
+
+# Request/response body fields and query parameters whose values are secrets
+SECRET_FIELDS = {
+    "apikey",
+    "api_key",
+    "refresh_token",
+    "delegated_refresh_token",
+    "key",
+    "password",
+    "private_key",
+    "user_data",
+}
+
+# Environment variables whose values are removed from anything recorded
+SECRET_VARIABLES = ("IBMCLOUD_API_KEY", "TAILSCALE_API_KEY")
+
+# Response headers worth keeping; the rest (cookies, tracing IDs) are dropped
+KEPT_HEADERS = {"content-type", "retry-after", "location", "x-ratelimit-remaining"}
+
+_cassette = None
+_originals = {}
+
+
+class CassetteMiss(LookupError):
+    """
+    Raised on replay when the cassette has no response for a request.
+    """
+
+
+def _scrub_value(value, secrets):
+    for secret in secrets:
+        value = value.replace(secret, SCRUBBED)
+    return value
+
+
+def _unsigned_jwt(token):
+    """
+    Replaces a JWT with an unsigned one that keeps only the account and lifetime.
+    """
+    try:
+        claims = jwt.decode(token, options={"verify_signature": False})
+    except jwt.PyJWTError:
+        return SCRUBBED
+    lifetime = claims.get("exp", 3600) - claims.get("iat", 0)
+    kept = {"account": claims["account"]} if "account" in claims else {}
+    return jwt.encode(dict(kept, iat=0, exp=lifetime), "", algorithm="none")
+
+
+def _scrub_json(data, secrets):
+    if isinstance(data, dict):
+        scrubbed = {}
+        for key, value in data.items():
+            if key == "access_token" and isinstance(value, str):
+                scrubbed[key] = _unsigned_jwt(value)
+            elif key in SECRET_FIELDS and isinstance(value, str):
+                scrubbed[key] = SCRUBBED
+            else:
+                scrubbed[key] = _scrub_json(value, secrets)
+        return scrubbed
+    if isinstance(data, list):
+        return [_scrub_json(value, secrets) for value in data]
+    if isinstance(data, str):
+        return _scrub_value(data, secrets)
+    return data
+
+
+def scrub_url(url, secrets=()):
+    """
+    Removes secrets from a URL's query string.
+
+    Args:
+        url (str): The request URL.
+        secrets (tuple): Literal secret values to replace wherever they appear.
+
+    Returns:
+        str: The URL with secret parameters replaced by SCRUBBED.
+    """
+    parts = urlsplit(str(url))
+    query = [
+        (name, SCRUBBED if name in SECRET_FIELDS else value)
+        for name, value in parse_qsl(parts.query, keep_blank_values=True)
+    ]
+    url = urlunsplit(parts._replace(query=urlencode(query)))
+    return _scrub_value(url, secrets)
+
+
+def scrub_body(body, content_type="", secrets=()):
+    """
+    Removes secrets from a request or response body.
+
+    JSON and form bodies have their secret fields replaced; IAM access tokens
+    become unsigned JWTs that keep only the account claim and the lifetime, so
+    replayed tokens still decode. Literal secret values are replaced anywhere.
+
+    Args:
+        body (str): The decoded body.
+        content_type (str): The body's Content-Type.
+        secrets (tuple): Literal secret values to replace.
+
+    Returns:
+        str: The scrubbed body.
+    """
+    if not body:
+        return body
+    if "json" in content_type:
+        try:
+            return json.dumps(_scrub_json(json.loads(body), secrets))
+        except ValueError:
+            pass
+    if "x-www-form-urlencoded" in content_type:
+        fields = parse_qsl(body, keep_blank_values=True)
+        fields = [(k, SCRUBBED if k in SECRET_FIELDS else v) for k, v in fields]
+        return _scrub_value(urlencode(fields), secrets)
+    return _scrub_value(body, secrets)
+
+
+def _fresh_tokens(data, now):
+    """
+    Re-issues recorded (unsigned) access tokens so they are valid from `now`.
+    """
+    if isinstance(data, dict):
+        data = {key: _fresh_tokens(value, now) for key, value in data.items()}
+        token = data.get("access_token")
+        if isinstance(token, str):
+            claims = jwt.decode(token, options={"verify_signature": False})
+            lifetime = claims["exp"] - claims["iat"]
+            claims.update(iat=now, exp=now + lifetime)
+            data["access_token"] = jwt.encode(claims, "", algorithm="none")
+            if "expiration" in data:
+                data["expiration"] = now + lifetime
+        return data
+    if isinstance(data, list):
+        return [_fresh_tokens(value, now) for value in data]
+    return data
+
+
+def _decode(content):
+    try:
+        return {"body": content.decode("utf-8")}
+    except UnicodeDecodeError:
+        return {"body_base64": base64.b64encode(content).decode()}
+
+
+def _name_of(body):
+    try:
+        payload = json.loads(body)
+    except (TypeError, ValueError):
+        return None
+    return payload.get("name") if isinstance(payload, dict) else None
+
+
+def match_key(method, url, body=None):
+    """
+    Returns the key replay uses to find the responses for a request.
+
+    Requests match on method, URL (with secrets scrubbed and the query sorted)
+    and, for calls that send a JSON body, its `name`, so concurrent creates in
+    one collection are told apart.
+
+    Args:
+        method (str): The HTTP method.
+        url (str): The (scrubbed) request URL.
+        body (str): The request body.
+
+    Returns:
+        str: The key.
+    """
+    parts = urlsplit(str(url))
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    key = f"{method} {urlunsplit(parts._replace(query=query))}"
+    name = _name_of(body)
+    return f"{key} name={name}" if name else key
+
+
+class Cassette:
+    """
+    A recording of HTTP interactions with their timing.
+
+    While recording, every request that leaves the process is sent for real and
+    its scrubbed request, response and duration are appended. While replaying,
+    requests are answered from the recording without touching the network: the
+    recorded responses for a request are served in order, the last one is
+    repeated once they run out (so extra status polls see the final state), and
+    each answer is delayed by its recorded duration times `scale`.
+
+    Args:
+        path (str): The cassette file.
+        mode (str): "record" or "replay".
+        scale (float): Replay latency multiplier; 0 replays without delays.
+    """
+
+    def __init__(self, path, mode="replay", scale=1.0):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode {mode!r}")
+        self.path = path
+        self.mode = mode
+        self.scale = scale
+        self.secrets = tuple(
+            value
+            for value in (os.environ.get(name) for name in SECRET_VARIABLES)
+            if value
+        )
+        self.started_at = time.time()
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self.interactions = []
+        self._queues = {}
+        if mode == "replay":
+            with open(path) as handle:
+                recording = json.load(handle)
+            self.interactions = recording["interactions"]
+            for interaction in self.interactions:
+                request = interaction["request"]
+                key = match_key(request["method"], request["url"], request.get("body"))
+                self._queues.setdefault(key, []).append(interaction)
+            self._served = {key: 0 for key in self._queues}
+
+    def record(
+        self, method, url, body, content_type, status, headers, content, start, end
+    ):
+        """
+        Appends one interaction.
+
+        Args:
+            method (str): The request method.
+            url (str): The request URL.
+            body (bytes): The request body.
+            content_type (str): The request's Content-Type.
+            status (int): The response status, or None if the request failed.
+            headers (dict): The response headers.
+            content (bytes): The decoded response body.
+            start (float): perf_counter() when the request was sent.
+            end (float): perf_counter() when the response was complete.
+        """
+        if isinstance(body, bytes):
+            body = body.decode("utf-8", errors="replace")
+        response_type = headers.get("content-type", "")
+        response = {
+            "status": status,
+            "headers": {
+                k.lower(): v for k, v in headers.items() if k.lower() in KEPT_HEADERS
+            },
+        }
+        decoded = _decode(content or b"")
+        if "body" in decoded:
+            decoded["body"] = scrub_body(decoded["body"], response_type, self.secrets)
+        response.update(decoded)
+        interaction = {
+            "request": {
+                "method": method,
+                "url": scrub_url(url, self.secrets),
+                "body": scrub_body(body or "", content_type or "", self.secrets),
+            },
+            "response": response,
+            "offset": round(start - self._origin, 4),
+            "elapsed": round(end - start, 4),
+        }
+        with self._lock:
+            self.interactions.append(interaction)
+
+    def play(self, method, url, body):
+        """
+        Returns the recorded interaction that answers a request.
+
+        Args:
+            method (str): The request method.
+            url (str): The request URL.
+            body (bytes): The request body.
+
+        Returns:
+            tuple: (interaction, delay in seconds, response body bytes).
+
+        Raises:
+            CassetteMiss: If nothing was recorded for the request.
+        """
+        if isinstance(body, bytes):
+            body = body.decode("utf-8", errors="replace")
+        key = match_key(method, scrub_url(url, self.secrets), body)
+        queue = self._queues.get(key)
+        if not queue:
+            raise CassetteMiss(f"No recorded response for {key} in {self.path}")
+        with self._lock:
+            index = min(self._served[key], len(queue) - 1)
+            self._served[key] += 1
+        interaction = queue[index]
+        response = interaction["response"]
+        if "body_base64" in response:
+            content = base64.b64decode(response["body_base64"])
+        else:
+            content = response.get("body", "")
+            if "json" in response["headers"].get("content-type", "") and content:
+                payload = _fresh_tokens(json.loads(content), int(time.time()))
+                content = json.dumps(payload)
+            content = content.encode()
+        return interaction, interaction["elapsed"] * self.scale, content
+
+    def unplayed(self):
+        """
+        Returns the match keys of recorded requests that replay never asked for.
+        """
+        return [key for key, count in self._served.items() if count == 0]
+
+    def save(self):
+        """
+        Writes the recording to the cassette file.
+        """
+        with self._lock:
+            interactions = list(self.interactions)
+        recording = {
+            "version": CASSETTE_VERSION,
+            "recorded_at": datetime.fromtimestamp(
+                self.started_at, timezone.utc
+            ).isoformat(),
+            "interactions": sorted(interactions, key=lambda item: item["offset"]),
+        }
+        atomic_write(self.path, json.dumps(recording, indent=1).encode())
+
+
+def _requests_response(adapter, request, interaction, content):
+    recorded = interaction["response"]
+    response = requests.Response()
+    response.status_code = recorded["status"]
+    response.headers = CaseInsensitiveDict(recorded["headers"])
+    response.headers["Content-Length"] = str(len(content))
+    response._content = content
+    response.raw = io.BytesIO(content)
+    response.url = request.url
+    response.request = request
+    response.connection = adapter
+    response.reason = "Recorded"
+    return response
+
+
+def _send(adapter, request, **kwargs):
+    cassette = _cassette
+    send = _originals["requests"]
+    if cassette is None:
+        return send(adapter, request, **kwargs)
+    if cassette.mode == "replay":
+        interaction, delay, content = cassette.play(
+            request.method, request.url, request.body
+        )
+        time.sleep(delay)
+        if interaction["response"]["status"] is None:
+            raise requests.exceptions.ConnectionError("Recorded connection failure")
+        return _requests_response(adapter, request, interaction, content)
+    content_type = request.headers.get("Content-Type", "")
+    start = time.perf_counter()
+    try:
+        response = send(adapter, request, **kwargs)
+        content = response.content
+    except requests.exceptions.ConnectionError:
+        cassette.record(
+            request.method,
+            request.url,
+            request.body,
+            content_type,
+            None,
+            {},
+            b"",
+            start,
+            time.perf_counter(),
+        )
+        raise
+    cassette.record(
+        request.method,
+        request.url,
+        request.body,
+        content_type,
+        response.status_code,
+        response.headers,
+        content,
+        start,
+        time.perf_counter(),
+    )
+    return response
+
+
+async def _handle_async_request(transport, request):
+    cassette = _cassette
+    handle = _originals["httpx"]
+    if cassette is None:
+        return await handle(transport, request)
+    body = await request.aread()
+    if cassette.mode == "replay":
+        interaction, delay, content = cassette.play(request.method, request.url, body)
+        await asyncio.sleep(delay)
+        recorded = interaction["response"]
+        if recorded["status"] is None:
+            raise httpx.ConnectError("Recorded connection failure", request=request)
+        return httpx.Response(
+            recorded["status"],
+            headers=recorded["headers"],
+            content=content,
+            request=request,
+        )
+    content_type = request.headers.get("Content-Type", "")
+    start = time.perf_counter()
+    try:
+        response = await handle(transport, request)
+        content = await response.aread()
+    except httpx.ConnectError:
+        cassette.record(
+            request.method,
+            request.url,
+            body,
+            content_type,
+            None,
+            {},
+            b"",
+            start,
+            time.perf_counter(),
+        )
+        raise
+    cassette.record(
+        request.method,
+        request.url,
+        body,
+        content_type,
+        response.status_code,
+        response.headers,
+        content,
+        start,
+        time.perf_counter(),
+    )
+    return httpx.Response(
+        response.status_code,
+        headers=[
+            (k, v)
+            for k, v in response.headers.multi_items()
+            if k.lower() not in ("content-encoding", "content-length")
+        ],
+        content=content,
+        request=request,
+        extensions=response.extensions,
+    )
+
+
+def start_cassette(path, mode="replay", scale=1.0):
+    """
+    Starts recording or replaying every HTTP request the process makes.
+
+    Both clients are hooked at their lowest layer: requests' HTTPAdapter (the
+    SDK services, below the rate limiter, and IAM token calls) and httpx's
+    AsyncHTTPTransport (the pooled client and the Tailscale API). Retries and
+    throttled responses are therefore recorded and replayed one by one.
+
+    Args:
+        path (str): The cassette file.
+        mode (str): "record" or "replay".
+        scale (float): Replay latency multiplier.
+
+    Returns:
+        Cassette: The active cassette.
+    """
+    global _cassette
+    cassette = Cassette(path, mode, scale)
+    if not _originals:
+        _originals["requests"] = requests.adapters.HTTPAdapter.send
+        _originals["httpx"] = httpx.AsyncHTTPTransport.handle_async_request
+        requests.adapters.HTTPAdapter.send = _send
+        httpx.AsyncHTTPTransport.handle_async_request = _handle_async_request
+    _cassette = cassette
+    return cassette
+
+
+def stop_cassette():
+    """
+    Stops recording or replaying and restores the HTTP clients.
+
+    Returns:
+        Cassette: The cassette that was active, or None.
+    """
+    global _cassette
+    cassette, _cassette = _cassette, None
+    if _originals:
+        requests.adapters.HTTPAdapter.send = _originals.pop("requests")
+        httpx.AsyncHTTPTransport.handle_async_request = _originals.pop("httpx")
+    return cassette
+
+
+@contextmanager
+def use_cassette(path, mode="replay", scale=1.0, enabled=True):
+    """
+    Records or replays everything run inside the block.
+
+    A recording is saved even if the block raises, since a failed deployment is
+    still a realistic one.
+
+    Args:
+        path (str): The cassette file.
+        mode (str): "record" or "replay".
+        scale (float): Replay latency multiplier.
+        enabled (bool): When False, the block runs against the real APIs.
+
+    Yields:
+        Cassette: The active cassette, or None when disabled.
+    """
+    if not enabled:
+        yield None
+        return
+    cassette = start_cassette(path, mode, scale)
+    try:
+        yield cassette
+    finally:
+        stop_cassette()
+        if mode == "record":
+            cassette.save()
+            click.echo(
+                f"Recorded {len(cassette.interactions)} requests to {path}", err=True
+            )
+
+
+def cassette_options(record, replay):
+    """
+    Turns the --record/--replay CLI options into `use_cassette` arguments.
+
+    Args:
+        record (str): Cassette to record to, or None.
+        replay (str): Cassette to replay, or None.
+
+    Returns:
+        tuple: (path, mode), with path None when neither option is given.
+
+    Raises:
+        click.UsageError: If both options are given.
+    """
+    if record and replay:
+        raise click.UsageError("--record and --replay cannot be used together")
+    return (record, "record") if record else (replay, "replay")
@@ -3,22 +3,27 @@ set -o errexit
 set -o nounset
 set -o pipefail
 
+{% include "boot_phase.sh" %}
+
 DEBIAN_FRONTEND=noninteractive apt-get update
+vpc-lab-phase packages_updated
 DEBIAN_FRONTEND=noninteractive apt-get upgrade -y
+vpc-lab-phase packages_upgraded
 DEBIAN_FRONTEND=noninteractive apt-get install -y python3-pip curl wget unzip jq build-essential
+vpc-lab-phase packages_installed
 
 # Install Tailscale
 curl -fsSL https://tailscale.com/install.sh | sh
+vpc-lab-phase tailscale_installed
 echo 'net.ipv4.ip_forward = 1' | tee -a /etc/sysctl.d/99-tailscale.conf
 echo 'net.ipv6.conf.all.forwarding = 1' | tee -a /etc/sysctl.d/99-tailscale.conf
 sysctl -p /etc/sysctl.d/99-tailscale.conf
-tailscale up --advertise-routes={{ first_subnet_cidr }} --authkey={{ tailscale_api_token }} --accept-routes
-
-cat <<EOF > /etc/networkd-dispatcher/routable.d/50-tailscale
-#!/bin/sh
-nethtool -K %s rx-udp-gro-forwarding on rx-gro-list off \n' "$(ip -o route get 8.8.8.8 | cut -f 5 -d " ")"
-EOF
+tailscale up --advertise-routes={{ advertise_routes }} --authkey={{ tailscale_api_token }} --accept-routes
+vpc-lab-phase tailscale_up
 
+printf '#!/bin/sh\n\nethtool -K %s rx-udp-gro-forwarding on rx-gro-list off\n' "$(ip -o route get 8.8.8.8 | cut -f 5 -d " ")" > /etc/networkd-dispatcher/routable.d/50-tailscale
 chmod 755 /etc/networkd-dispatcher/routable.d/50-tailscale
+vpc-lab-phase router_configured
 
 # Install Docker
+vpc-lab-phase done
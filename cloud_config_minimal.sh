@@ -0,0 +1,37 @@
+#!/bin/bash
+set -o errexit
+set -o nounset
+set -o pipefail
+
+{% include "boot_phase.sh" %}
+
+# Bring the subnet router up first; the install script pulls in its own dependencies
+curl -fsSL https://tailscale.com/install.sh | sh
+vpc-lab-phase tailscale_installed
+echo 'net.ipv4.ip_forward = 1' | tee -a /etc/sysctl.d/99-tailscale.conf
+echo 'net.ipv6.conf.all.forwarding = 1' | tee -a /etc/sysctl.d/99-tailscale.conf
+sysctl -p /etc/sysctl.d/99-tailscale.conf
+tailscale up --advertise-routes={{ advertise_routes }} --authkey={{ tailscale_api_token }} --accept-routes
+vpc-lab-phase tailscale_up
+
+printf '#!/bin/sh\n\nethtool -K %s rx-udp-gro-forwarding on rx-gro-list off\n' "$(ip -o route get 8.8.8.8 | cut -f 5 -d " ")" > /etc/networkd-dispatcher/routable.d/50-tailscale
+chmod 755 /etc/networkd-dispatcher/routable.d/50-tailscale
+vpc-lab-phase router_configured
+
+# Upgrade and install the tools in the background once the router is usable
+cat <<'DEFERRED' > /usr/local/sbin/vpc-lab-deferred-setup
+#!/bin/bash
+set -o errexit
+set -o nounset
+set -o pipefail
+export DEBIAN_FRONTEND=noninteractive
+apt-get -o DPkg::Lock::Timeout=600 update
+vpc-lab-phase packages_updated
+apt-get -o DPkg::Lock::Timeout=600 upgrade -y
+vpc-lab-phase packages_upgraded
+apt-get -o DPkg::Lock::Timeout=600 install -y python3-pip curl wget unzip jq build-essential
+vpc-lab-phase packages_installed
+vpc-lab-phase done
+DEFERRED
+chmod 755 /usr/local/sbin/vpc-lab-deferred-setup
+systemd-run --unit=vpc-lab-deferred-setup --no-block /usr/local/sbin/vpc-lab-deferred-setup
@@ -0,0 +1,65 @@
+import os
+
+import click
+
+
+class MissingCredential(click.ClickException, ValueError):
+    """
+    Raised when a command needs a credential that is not set in the environment.
+
+    It is a ClickException, so a command that hits it exits with a one-line
+    error instead of a traceback.
+    """
+
+
+def require_credentials(*names):
+    """
+    Checks that environment variables are set, reporting every missing one.
+
+    Commands call this before they start work, so a missing key fails the run
+    up front instead of halfway through a deployment.
+
+    Args:
+        *names (str): Environment variable names.
+
+    Raises:
+        MissingCredential: If any of the variables is unset or empty.
+    """
+    missing = [name for name in names if not os.environ.get(name)]
+    if missing:
+        raise MissingCredential(f"{', '.join(missing)} not set in the environment")
+
+
+def _credential(name):
+    require_credentials(name)
+    return os.environ[name]
+
+
+def ibmcloud_api_key():
+    """
+    Returns the IBM Cloud API key from `IBMCLOUD_API_KEY`.
+
+    Raises:
+        MissingCredential: If the variable is not set.
+    """
+    return _credential("IBMCLOUD_API_KEY")
+
+
+def tailscale_api_key():
+    """
+    Returns the Tailscale API key from `TAILSCALE_API_KEY`.
+
+    Raises:
+        MissingCredential: If the variable is not set.
+    """
+    return _credential("TAILSCALE_API_KEY")
+
+
+def tailnet_id():
+    """
+    Returns the Tailscale tailnet ID from `TAILNET_ID`.
+
+    Raises:
+        MissingCredential: If the variable is not set.
+    """
+    return _credential("TAILNET_ID")
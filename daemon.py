@@ -0,0 +1,949 @@
+import collections
+import http.client
+import json
+import os
+import re
+import socket
+import socketserver
+import sqlite3
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import click
+
+from cache import cache_dir
+from credentials import ibmcloud_api_key, require_credentials
+from journal import Journal
+from tracing import percentile
+from userdata import BOOT_PROFILES, DEFAULT_BOOT_PROFILE
+
+JOB_STATES = ("queued", "running", "succeeded", "failed", "cancelled")
+
+# Job fields a submission may set; None means the daemon's default is used
+JOB_FIELDS = {
+    "region": None,
+    "prefix": None,
+    "resource_group": None,
+    "ssh_key": None,
+    "tailscale_tag": None,
+    "boot_profile": DEFAULT_BOOT_PROFILE,
+    "routers": 1,
+    "router_bandwidth": None,
+    "dns_zone": None,
+    "ipam": True,
+    "wait": True,
+    "resume": True,
+}
+REQUIRED_FIELDS = ("region", "prefix", "resource_group", "ssh_key", "tailscale_tag")
+TEXT_FIELDS = REQUIRED_FIELDS + ("boot_profile", "dns_zone")
+FLAG_FIELDS = ("ipam", "wait", "resume")
+
+# Finished jobs the latency percentiles are computed over
+METRICS_WINDOW = 500
+
+DEFAULT_PORT = 8790
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    region TEXT NOT NULL,
+    prefix TEXT NOT NULL,
+    spec TEXT NOT NULL,
+    submitted_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_by_state ON jobs (state, submitted_at);
+CREATE INDEX IF NOT EXISTS jobs_by_lab ON jobs (region, prefix, state);
+CREATE INDEX IF NOT EXISTS jobs_by_finish ON jobs (finished_at);
+"""
+
+
+def _is_int(value):
+    # JSON true and false arrive as bools, which are ints to Python
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+class JobError(ValueError):
+    """
+    Raised when a job cannot be submitted or changed.
+
+    Attributes:
+        status (int): The HTTP status the API answers with.
+    """
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class JobCancelled(Exception):
+    """
+    Raised between deployment steps to stop a job whose cancellation was
+    requested. Steps already running finish first.
+    """
+
+
+def queue_path():
+    """
+    Returns the job queue database file.
+
+    Returns:
+        Path: The SQLite file under the cache root's `daemon` directory.
+    """
+    return cache_dir("daemon") / "jobs.sqlite3"
+
+
+def _job(row):
+    if row is None:
+        return None
+    job = dict(row)
+    job["spec"] = json.loads(job["spec"])
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    job["cancel_requested"] = bool(job["cancel_requested"])
+    return job
+
+
+class JobQueue:
+    """
+    A persistent queue of lab deployments, kept in SQLite.
+
+    Jobs survive daemon restarts: a job that was running when the daemon
+    stopped is queued again and resumes from the lab's journal. Taking the next
+    job and cancelling one run in immediate transactions, so two workers never
+    run the same job.
+
+    Args:
+        path (Path): Database file override, mainly for testing.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or queue_path()
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            str(self.path), timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self._db.row_factory = sqlite3.Row
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            # Jobs are journaled separately, so the last commits may be lost on
+            # a power cut but never corrupted
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(SCHEMA)
+
+    def close(self):
+        """
+        Closes the database connection.
+        """
+        with self._lock:
+            self._db.close()
+
+    def _write(self, statements):
+        # Runs (sql, params) pairs in one immediate transaction; returns the
+        # rows of the last statement
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                rows = None
+                for sql, params in statements(self._db):
+                    rows = self._db.execute(sql, params).fetchall()
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+        return rows
+
+    def submit(self, spec):
+        """
+        Queues a deployment.
+
+        Args:
+            spec (dict): The complete job fields, as from `Daemon.job_spec`.
+
+        Returns:
+            dict: The queued job.
+
+        Raises:
+            JobError: With status 409 if the same lab is already queued or running.
+        """
+        job_id = uuid.uuid4().hex
+
+        def statements(db):
+            active = db.execute(
+                """
+                SELECT id FROM jobs
+                WHERE region = ? AND prefix = ? AND state IN ('queued', 'running')
+                """,
+                (spec["region"], spec["prefix"]),
+            ).fetchone()
+            if active:
+                raise JobError(
+                    f"Lab {spec['region']}/{spec['prefix']} already has job {active['id']}",
+                    409,
+                )
+            yield (
+                """
+                INSERT INTO jobs (id, state, region, prefix, spec, submitted_at)
+                VALUES (?, 'queued', ?, ?, ?, ?)
+                """,
+                (job_id, spec["region"], spec["prefix"], json.dumps(spec), time.time()),
+            )
+
+        self._write(statements)
+        return self.get(job_id)
+
+    def get(self, job_id):
+        """
+        Returns a job, or None if there is no such job.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT * FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return _job(row)
+
+    def list(self, state=None, limit=100):
+        """
+        Lists jobs, newest first.
+
+        Args:
+            state (str): Only jobs in this state, one of JOB_STATES.
+            limit (int): Most jobs returned.
+
+        Returns:
+            list: The jobs.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                """
+                SELECT * FROM jobs WHERE ? IS NULL OR state = ?
+                ORDER BY submitted_at DESC LIMIT ?
+                """,
+                (state, state, limit),
+            ).fetchall()
+        return [_job(row) for row in rows]
+
+    def take(self):
+        """
+        Marks the oldest queued job as running.
+
+        Returns:
+            dict: The job, or None if nothing is queued.
+        """
+
+        def statements(db):
+            row = db.execute(
+                "SELECT id FROM jobs WHERE state = 'queued' ORDER BY submitted_at LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return
+            yield (
+                """
+                UPDATE jobs SET state = 'running', started_at = ?, attempts = attempts + 1
+                WHERE id = ?
+                """,
+                (time.time(), row["id"]),
+            )
+            yield "SELECT * FROM jobs WHERE id = ?", (row["id"],)
+
+        rows = self._write(statements)
+        return _job(rows[0]) if rows else None
+
+    def finish(self, job_id, state, result=None, error=None):
+        """
+        Records the outcome of a running job.
+
+        Args:
+            job_id (str): The job.
+            state (str): "succeeded", "failed" or "cancelled".
+            result (dict): What the deployment returned.
+            error (str): Why it failed.
+        """
+        self._write(
+            lambda db: [
+                (
+                    """
+                    UPDATE jobs SET state = ?, finished_at = ?, result = ?, error = ?
+                    WHERE id = ?
+                    """,
+                    (
+                        state,
+                        time.time(),
+                        json.dumps(result) if result else None,
+                        error,
+                        job_id,
+                    ),
+                )
+            ]
+        )
+
+    def cancel(self, job_id):
+        """
+        Cancels a queued job at once, or asks a running job to stop.
+
+        Args:
+            job_id (str): The job.
+
+        Returns:
+            dict: The job after the change.
+
+        Raises:
+            JobError: With status 404 if there is no such job, or 409 if it
+                already finished.
+        """
+
+        def statements(db):
+            row = db.execute(
+                "SELECT state FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if row is None:
+                raise JobError(f"No job {job_id}", 404)
+            if row["state"] == "queued":
+                yield (
+                    "UPDATE jobs SET state = 'cancelled', finished_at = ? WHERE id = ?",
+                    (time.time(), job_id),
+                )
+            elif row["state"] == "running":
+                yield "UPDATE jobs SET cancel_requested = 1 WHERE id = ?", (job_id,)
+            else:
+                raise JobError(f"Job {job_id} already {row['state']}", 409)
+
+        self._write(statements)
+        return self.get(job_id)
+
+    def cancel_requested(self, job_id):
+        """
+        Returns True if a running job was asked to stop.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return bool(row and row["cancel_requested"])
+
+    def requeue_running(self):
+        """
+        Queues again the jobs a stopped daemon left running.
+
+        Returns:
+            int: The number of jobs queued again.
+        """
+        rows = self._write(
+            lambda db: [
+                ("UPDATE jobs SET state = 'queued' WHERE state = 'running'", ()),
+                ("SELECT changes()", ()),
+            ]
+        )
+        return rows[0][0]
+
+    def metrics(self, window=METRICS_WINDOW):
+        """
+        Summarizes queue depth and latency.
+
+        Args:
+            window (int): Number of most recently finished jobs the latency
+                percentiles cover.
+
+        Returns:
+            dict: `depth` (jobs per state), `oldest_queued_s`, and the p50/p95 of
+                `queue_wait_s` (submit to start) and `run_time_s` (start to
+                finish) over the window, plus the window's outcomes.
+        """
+        with self._lock:
+            depth = dict(
+                self._db.execute(
+                    "SELECT state, COUNT(*) FROM jobs GROUP BY state"
+                ).fetchall()
+            )
+            (oldest,) = self._db.execute(
+                "SELECT MIN(submitted_at) FROM jobs WHERE state = 'queued'"
+            ).fetchone()
+            recent = self._db.execute(
+                """
+                SELECT state, submitted_at, started_at, finished_at FROM jobs
+                WHERE finished_at IS NOT NULL ORDER BY finished_at DESC LIMIT ?
+                """,
+                (window,),
+            ).fetchall()
+        ran = [row for row in recent if row["started_at"] is not None]
+        waits = [row["started_at"] - row["submitted_at"] for row in ran]
+        runs = [row["finished_at"] - row["started_at"] for row in ran]
+        outcomes = collections.Counter(row["state"] for row in recent)
+        return {
+            "depth": {state: depth.get(state, 0) for state in JOB_STATES},
+            "oldest_queued_s": round(time.time() - oldest, 3) if oldest else None,
+            "queue_wait_s": _percentiles(waits),
+            "run_time_s": _percentiles(runs),
+            "window": {state: outcomes.get(state, 0) for state in JOB_STATES[2:]},
+        }
+
+
+def _percentiles(values):
+    return {
+        name: None if value is None else round(value, 3)
+        for name, value in (
+            ("p50", percentile(values, 0.5)),
+            ("p95", percentile(values, 0.95)),
+        )
+    }
+
+
+class Daemon:
+    """
+    Runs queued lab deployments on a pool of worker threads.
+
+    The daemon keeps one authenticated VPC client and one ResourceWaiter per
+    region for its whole life, next to the process-wide IAM tokens and lookup
+    caches. A job therefore starts deploying without importing, authenticating
+    or listing anything again, and the labs of a region share batched readiness
+    polling as in a fleet run.
+
+    Args:
+        queue (JobQueue): The job queue.
+        defaults (dict): Job fields used when a submission leaves them out,
+            e.g. resource_group, ssh_key and tailscale_tag.
+        workers (int): Jobs running at once.
+        per_region_concurrency (int): Jobs running at once per region.
+        max_workers (int): Concurrent steps within one job.
+    """
+
+    def __init__(
+        self, queue, defaults=None, workers=8, per_region_concurrency=10, max_workers=4
+    ):
+        self.queue = queue
+        self.defaults = {key: value for key, value in (defaults or {}).items() if value}
+        self.workers = workers
+        self.per_region_concurrency = per_region_concurrency
+        self.max_workers = max_workers
+        self.started_at = time.time()
+        self._regions = {}
+        self._regions_lock = threading.Lock()
+        self._wakeup = threading.Condition()
+        self._stop = threading.Event()
+        self._threads = []
+        self._busy = 0
+        self._requests = collections.deque(maxlen=METRICS_WINDOW)
+
+    def region(self, region):
+        """
+        Returns the warm client, waiter and concurrency slots of a region.
+
+        Args:
+            region (str): The region.
+
+        Returns:
+            tuple: (VpcV1, ResourceWaiter, threading.Semaphore).
+        """
+        from utils import vpc_client
+        from waiters import ResourceWaiter
+
+        with self._regions_lock:
+            if region not in self._regions:
+                client = vpc_client(ibmcloud_api_key(), region)
+                self._regions[region] = (
+                    client,
+                    ResourceWaiter(client),
+                    threading.Semaphore(self.per_region_concurrency),
+                )
+            return self._regions[region]
+
+    def warm(self, regions):
+        """
+        Builds the clients of regions and fills their lookup caches up front.
+
+        Args:
+            regions (list): Regions to warm.
+
+        Raises:
+            LookupError: If the default resource group or SSH key does not exist.
+        """
+        from fleet import warm_region
+
+        for region in regions:
+            client = self.region(region)[0]
+            if "resource_group" in self.defaults and "ssh_key" in self.defaults:
+                warm_region(
+                    client,
+                    region,
+                    self.defaults["resource_group"],
+                    self.defaults["ssh_key"],
+                )
+
+    def job_spec(self, fields):
+        """
+        Validates a submission and fills in the defaults.
+
+        Args:
+            fields (dict): The submitted job fields.
+
+        Returns:
+            dict: Every field of JOB_FIELDS.
+
+        Raises:
+            JobError: If a field is unknown, missing or invalid.
+        """
+        from utils import MAX_ROUTERS
+
+        unknown = set(fields) - set(JOB_FIELDS)
+        if unknown:
+            raise JobError(f"Unknown fields: {', '.join(sorted(unknown))}")
+        spec = dict(JOB_FIELDS, **self.defaults)
+        spec.update({key: value for key, value in fields.items() if value is not None})
+        missing = [field for field in REQUIRED_FIELDS if not spec[field]]
+        if missing:
+            raise JobError(f"Missing fields: {', '.join(missing)}")
+        for field in TEXT_FIELDS:
+            if spec[field] is not None and not isinstance(spec[field], str):
+                raise JobError(f"{field} must be a string")
+        for field in FLAG_FIELDS:
+            if not isinstance(spec[field], bool):
+                raise JobError(f"{field} must be true or false")
+        if not _is_int(spec["routers"]) or not 1 <= spec["routers"] <= MAX_ROUTERS:
+            raise JobError(f"routers must be an integer from 1 to {MAX_ROUTERS}")
+        bandwidth = spec["router_bandwidth"]
+        if bandwidth is not None and (not _is_int(bandwidth) or bandwidth < 1):
+            raise JobError("router_bandwidth must be a positive integer (Mbps)")
+        if spec["boot_profile"] not in BOOT_PROFILES:
+            raise JobError(f"Unknown boot profile {spec['boot_profile']}")
+        if not re.fullmatch(r"[a-z0-9-]+", spec["region"] + spec["prefix"]):
+            raise JobError("Region and prefix may only hold a-z, 0-9 and '-'")
+        return spec
+
+    def submit(self, fields):
+        """
+        Queues a deployment and wakes a worker.
+
+        Args:
+            fields (dict): The submitted job fields.
+
+        Returns:
+            dict: The queued job.
+
+        Raises:
+            JobError: If the submission is invalid or the lab already has an
+                active job.
+        """
+        job = self.queue.submit(self.job_spec(fields))
+        with self._wakeup:
+            self._wakeup.notify()
+        return job
+
+    def start(self):
+        """
+        Queues again the jobs of a previous run and starts the workers.
+        """
+        self.queue.requeue_running()
+        for n in range(self.workers):
+            thread = threading.Thread(
+                target=self._work, name=f"job-worker-{n}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        """
+        Stops taking jobs and waits for the running ones to finish.
+
+        Args:
+            timeout (float): Seconds to wait for each worker; None waits forever.
+        """
+        self._stop.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _next_job(self):
+        # Checking under the condition means a submit cannot slip in between an
+        # empty queue and the wait
+        with self._wakeup:
+            while not self._stop.is_set():
+                job = self.queue.take()
+                if job is not None:
+                    return job
+                self._wakeup.wait(timeout=5)
+        return None
+
+    def _work(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            with self._wakeup:
+                self._busy += 1
+            try:
+                self.run_job(job)
+            finally:
+                with self._wakeup:
+                    self._busy -= 1
+
+    def run_job(self, job):
+        """
+        Deploys the lab of a running job and records the outcome.
+
+        Args:
+            job (dict): A job taken from the queue.
+        """
+        from ipam import AddressLedger
+        from main import deploy_lab, logger
+
+        spec = job["spec"]
+        region = spec["region"]
+
+        def check_cancelled(name, result):
+            if self.queue.cancel_requested(job["id"]):
+                raise JobCancelled(f"Cancelled after step {name}")
+
+        try:
+            client, waiter, slots = self.region(region)
+            lab = f"{region}/{spec['prefix']}"
+            address_block = (
+                AddressLedger().allocate([lab])[lab] if spec["ipam"] else None
+            )
+            journal = Journal(spec["prefix"], region)
+            # A job queued again after a restart always resumes
+            if not spec["resume"] and job["attempts"] == 1:
+                journal.reset()
+            with slots:
+                results = deploy_lab(
+                    client,
+                    spec["resource_group"],
+                    region,
+                    spec["prefix"],
+                    spec["ssh_key"],
+                    spec["tailscale_tag"],
+                    max_workers=self.max_workers,
+                    wait=spec["wait"],
+                    waiter=waiter,
+                    on_step=check_cancelled,
+                    journal=journal,
+                    boot_profile=spec["boot_profile"],
+                    routers=spec["routers"],
+                    router_bandwidth=spec["router_bandwidth"],
+                    dns_zone=spec["dns_zone"],
+                    address_block=address_block,
+                )
+        except JobCancelled as e:
+            self.queue.finish(job["id"], "cancelled", error=str(e))
+        except Exception as e:
+            logger.error(f"Job {job['id']} ({region}/{spec['prefix']}) failed: {e}")
+            self.queue.finish(job["id"], "failed", error=str(e))
+        else:
+            self.queue.finish(
+                job["id"],
+                "succeeded",
+                result={
+                    "instance_id": results["instance"]["id"],
+                    "steps": len(results),
+                },
+            )
+
+    def record_request(self, elapsed):
+        """
+        Records how long the API took to answer one request.
+        """
+        self._requests.append(elapsed)
+
+    def metrics(self):
+        """
+        Returns the queue metrics plus the state of the workers and the API.
+
+        Returns:
+            dict: `JobQueue.metrics` plus `workers`, `busy_workers`,
+                `warm_regions`, `uptime_s` and the p50/p95 of `request_time_s`.
+        """
+        metrics = self.queue.metrics()
+        metrics.update(
+            workers=self.workers,
+            busy_workers=self._busy,
+            warm_regions=sorted(self._regions),
+            uptime_s=round(time.time() - self.started_at, 1),
+            request_time_s=_percentiles(list(self._requests)),
+        )
+        return metrics
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _route(self, body):
+        daemon = self.server.daemon
+        parts = urlsplit(self.path)
+        query = dict(parse_qsl(parts.query))
+        match = re.fullmatch(r"/jobs/([0-9a-f]+)", parts.path)
+        if self.command == "GET" and parts.path == "/healthz":
+            return 200, {"ok": True}
+        if self.command == "GET" and parts.path == "/metrics":
+            return 200, daemon.metrics()
+        if self.command == "POST" and parts.path == "/jobs":
+            fields = json.loads(body or b"{}")
+            if not isinstance(fields, dict):
+                raise JobError("Expected a JSON object")
+            return 202, daemon.submit(fields)
+        if self.command == "GET" and parts.path == "/jobs":
+            state = query.get("state")
+            if state is not None and state not in JOB_STATES:
+                raise JobError(f"Unknown state {state}")
+            return 200, {"jobs": daemon.queue.list(state, int(query.get("limit", 100)))}
+        if match and self.command == "GET":
+            job = daemon.queue.get(match.group(1))
+            if job is None:
+                raise JobError(f"No job {match.group(1)}", 404)
+            return 200, job
+        if match and self.command == "DELETE":
+            return 200, daemon.queue.cancel(match.group(1))
+        raise JobError(f"No route for {self.command} {parts.path}", 404)
+
+    def _handle(self):
+        started = time.monotonic()
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        try:
+            status, result = self._route(body)
+        except JobError as e:
+            status, result = e.status, {"error": str(e)}
+        except ValueError as e:
+            status, result = 400, {"error": str(e)}
+        data = json.dumps(result).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        self.server.daemon.record_request(time.monotonic() - started)
+
+    do_GET = do_POST = do_DELETE = _handle
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        # BaseHTTPRequestHandler expects a (host, port) client address
+        return request, ("local", 0)
+
+
+def serve(daemon, host="127.0.0.1", port=DEFAULT_PORT, socket_path=None):
+    """
+    Creates the HTTP server of a daemon's API.
+
+    Args:
+        daemon (Daemon): The daemon the API drives.
+        host (str): Address to bind, unless `socket_path` is given.
+        port (int): Port to bind; 0 picks a free one.
+        socket_path (str): Unix socket to bind instead of a TCP port.
+
+    Returns:
+        socketserver.BaseServer: The server; call `serve_forever` to run it.
+    """
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        server = _UnixHTTPServer(socket_path, _Handler)
+    else:
+        server = ThreadingHTTPServer((host, port), _Handler)
+        server.daemon_threads = True
+    server.daemon = daemon
+    return server
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path, timeout=30):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def api_request(
+    method, path, body=None, host="127.0.0.1", port=DEFAULT_PORT, socket_path=None
+):
+    """
+    Calls the daemon's API.
+
+    Args:
+        method (str): HTTP method.
+        path (str): Request path, e.g. "/jobs".
+        body (dict): JSON body.
+        host (str): Daemon address, unless `socket_path` is given.
+        port (int): Daemon port.
+        socket_path (str): Unix socket of the daemon.
+
+    Returns:
+        tuple: (HTTP status, decoded JSON body).
+    """
+    if socket_path:
+        connection = _UnixHTTPConnection(socket_path)
+    else:
+        connection = http.client.HTTPConnection(host, port, timeout=30)
+    try:
+        data = json.dumps(body).encode() if body is not None else None
+        headers = {"Content-Type": "application/json"} if data else {}
+        connection.request(method, path, body=data, headers=headers)
+        response = connection.getresponse()
+        return response.status, json.loads(response.read() or b"null")
+    finally:
+        connection.close()
+
+
+@click.group()
+@click.option("--host", default="127.0.0.1", show_default=True, help="API address")
+@click.option("--port", default=DEFAULT_PORT, show_default=True, help="API port")
+@click.option("--socket", "socket_path", help="Use a Unix socket instead of a TCP port")
+@click.pass_context
+def daemon(ctx, host, port, socket_path):
+    """
+    Run lab deployments from a long-running daemon, or talk to one.
+    """
+    ctx.obj = {"host": host, "port": port, "socket_path": socket_path}
+
+
+def _call(connection, method, path, body=None):
+    status, result = api_request(method, path, body, **connection)
+    click.echo(json.dumps(result, indent=2))
+    if status >= 400:
+        raise SystemExit(1)
+
+
+@daemon.command(name="serve")
+@click.option("--workers", default=8, show_default=True, help="Jobs running at once")
+@click.option("--per-region-concurrency", default=10, show_default=True)
+@click.option(
+    "--max-workers", default=4, show_default=True, help="Concurrent steps per job"
+)
+@click.option("--region", "regions", multiple=True, help="Region to warm up at start")
+@click.option("--resource-group", help="Default resource group of submitted jobs")
+@click.option("--ssh-key", help="Default SSH key of submitted jobs")
+@click.option("--tailscale-tag", help="Default Tailscale tag of submitted jobs")
+@click.pass_obj
+def serve_command(
+    connection,
+    workers,
+    per_region_concurrency,
+    max_workers,
+    regions,
+    resource_group,
+    ssh_key,
+    tailscale_tag,
+):
+    """
+    Serve the job API and run queued deployments.
+    """
+    require_credentials("IBMCLOUD_API_KEY", "TAILSCALE_API_KEY", "TAILNET_ID")
+    runner = Daemon(
+        JobQueue(),
+        {
+            "resource_group": resource_group,
+            "ssh_key": ssh_key,
+            "tailscale_tag": tailscale_tag,
+        },
+        workers=workers,
+        per_region_concurrency=per_region_concurrency,
+        max_workers=max_workers,
+    )
+    runner.warm(regions)
+    server = serve(runner, **connection)
+    runner.start()
+    where = (
+        connection["socket_path"] or f"http://{connection['host']}:{connection['port']}"
+    )
+    click.echo(f"Serving on {where}", err=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        # Running jobs are queued again and resumed by the next daemon
+        runner.stop(timeout=0)
+
+
+@daemon.command()
+@click.option("--region", required=True, help="IBM Cloud region")
+@click.option("--prefix", required=True, help="Lab prefix")
+@click.option("--resource-group", help="Resource group; defaults to the daemon's")
+@click.option("--ssh-key", help="SSH key; defaults to the daemon's")
+@click.option("--tailscale-tag", help="Tailscale tag; defaults to the daemon's")
+@click.option("--boot-profile", type=click.Choice(sorted(BOOT_PROFILES)))
+@click.option("--routers", type=int, help="Tailscale routers in the lab")
+@click.option("--dns-zone", help="Private DNS zone to create for the lab")
+@click.pass_obj
+def submit(
+    connection,
+    region,
+    prefix,
+    resource_group,
+    ssh_key,
+    tailscale_tag,
+    boot_profile,
+    routers,
+    dns_zone,
+):
+    """
+    Queue a lab deployment.
+    """
+    fields = {
+        "region": region,
+        "prefix": prefix,
+        "resource_group": resource_group,
+        "ssh_key": ssh_key,
+        "tailscale_tag": tailscale_tag,
+        "boot_profile": boot_profile,
+        "routers": routers,
+        "dns_zone": dns_zone,
+    }
+    _call(
+        connection, "POST", "/jobs", {k: v for k, v in fields.items() if v is not None}
+    )
+
+
+@daemon.command()
+@click.argument("job_id", required=False)
+@click.option("--state", type=click.Choice(JOB_STATES), help="Only jobs in this state")
+@click.pass_obj
+def status(connection, job_id, state):
+    """
+    Show one job, or list recent jobs.
+    """
+    if job_id:
+        _call(connection, "GET", f"/jobs/{job_id}")
+    else:
+        _call(connection, "GET", "/jobs" + (f"?state={state}" if state else ""))
+
+
+@daemon.command()
+@click.argument("job_id")
+@click.pass_obj
+def cancel(connection, job_id):
+    """
+    Cancel a queued job, or stop a running one after its current steps.
+    """
+    _call(connection, "DELETE", f"/jobs/{job_id}")
+
+
+@daemon.command()
+@click.pass_obj
+def metrics(connection):
+    """
+    Show queue depth, latency percentiles and worker use.
+    """
+    _call(connection, "GET", "/metrics")
+
+
+if __name__ == "__main__":
+    daemon()
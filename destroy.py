@@ -0,0 +1,348 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+
+from main import logger
+from credentials import ibmcloud_api_key, tailnet_id, tailscale_api_key
+from fleet import expand_prefixes
+from utils import (
+    vpc_client,
+    get_zone_names,
+    delete_resource,
+    revoke_tailscale_key,
+    lab_resource_names,
+    MAX_ROUTERS,
+)
+from journal import Journal
+from ipam import AddressLedger
+from private_dns import delete_dns_instance, dns_instance_name, find_dns_instances
+from pagination import list_all
+from waiters import COLLECTIONS, ResourceWaiter
+
+# Deletion order; kinds on the same level do not depend on each other
+LEVELS = (
+    ("instance",),
+    ("subnet", "security_group"),
+    ("public_gateway",),
+    ("vpc",),
+)
+
+
+def discover_labs(client, region, prefixes):
+    """
+    Finds the resources of many labs in a region with one list call per kind.
+
+    Resources are matched on their exact names, so "lab1" never matches the
+    resources of "lab10". The Tailscale key and DNS Services instance of each lab
+    are taken from its journal; labs whose journal has no instance, e.g. after
+    an interrupted run, are looked up by the instance name.
+
+    Args:
+        client (VpcV1): An instance of the VpcV1 service for the region.
+        region (str): The region the client targets.
+        prefixes (list): Lab prefixes to look for.
+
+    Returns:
+        dict: Prefix mapped to {"resources": [...], "tailscale_key": key_id,
+            "dns_instance": guid} for every lab that has anything left to delete.
+
+    Raises:
+        ApiException: If there is an error while calling the IBM Cloud API.
+    """
+    zones = get_zone_names(client, region)
+    owners = {}
+    for prefix in prefixes:
+        # The router count is not known here, so look for the most a lab can have
+        for kind, names in lab_resource_names(prefix, zones, MAX_ROUTERS).items():
+            for name in names:
+                owners[(kind, name)] = prefix
+
+    kinds = [kind for level in LEVELS for kind in level]
+    with ThreadPoolExecutor(max_workers=len(kinds)) as executor:
+        listings = executor.map(
+            lambda kind: list_all(
+                getattr(client, COLLECTIONS[kind][0]), COLLECTIONS[kind][1]
+            ),
+            kinds,
+        )
+        listings = dict(zip(kinds, listings))
+
+    labs = {}
+    for prefix in prefixes:
+        journal = Journal(prefix, region)
+        key = journal.get("tailscale_key") or {}
+        dns = journal.get("dns_instance") or {}
+        labs[prefix] = {
+            "resources": [],
+            "tailscale_key": key.get("id"),
+            "dns_instance": dns.get("guid"),
+        }
+    unjournaled = {
+        dns_instance_name(prefix, region): prefix
+        for prefix, lab in labs.items()
+        if not lab["dns_instance"]
+    }
+    if unjournaled:
+        for name, instance in find_dns_instances(unjournaled).items():
+            labs[unjournaled[name]]["dns_instance"] = instance["guid"]
+    for kind, resources in listings.items():
+        for resource in resources:
+            prefix = owners.get((kind, resource["name"]))
+            if prefix is None:
+                continue
+            vpc_id = resource["id"] if kind == "vpc" else resource["vpc"]["id"]
+            labs[prefix]["resources"].append(
+                {
+                    "kind": kind,
+                    "id": resource["id"],
+                    "name": resource["name"],
+                    "vpc_id": vpc_id,
+                }
+            )
+    return {
+        prefix: lab
+        for prefix, lab in labs.items()
+        if lab["resources"] or lab["tailscale_key"] or lab["dns_instance"]
+    }
+
+
+def destroy_labs(client, region, labs, waiter=None, max_workers=20):
+    """
+    Deletes the resources of many labs in reverse dependency order.
+
+    Each level (instances; subnets and security groups; public gateways; VPCs)
+    is deleted for every lab at once, then the waiter tracks all of the level's
+    deletions with batched list calls before the next level starts. A lab whose
+    deletion fails is left alone from then on, so its remaining resources can be
+    inspected; the other labs carry on. Tailscale keys are revoked alongside.
+    Destroyed labs give their address blocks back to the ledger.
+    DNS Services instances are deleted alongside too, but must be gone before
+    the VPC level, since a VPC permitted to a DNS zone cannot be deleted.
+
+    Args:
+        client (VpcV1): An instance of the VpcV1 service for the region.
+        region (str): The region the client targets.
+        labs (dict): Labs as returned by `discover_labs`.
+        waiter (ResourceWaiter): Waiter used to track the deletions.
+        max_workers (int): Maximum delete requests in flight at once.
+
+    Returns:
+        list: One status dict per lab with the prefix, region, number of
+            resources, final state and error, if any.
+    """
+    waiter = waiter or ResourceWaiter(client)
+    errors = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        revocations = {
+            prefix: executor.submit(
+                revoke_tailscale_key,
+                tailscale_api_key(),
+                tailnet_id(),
+                lab["tailscale_key"],
+            )
+            for prefix, lab in labs.items()
+            if lab["tailscale_key"]
+        }
+        dns_deletions = {
+            prefix: executor.submit(delete_dns_instance, lab["dns_instance"])
+            for prefix, lab in labs.items()
+            if lab["dns_instance"]
+        }
+
+        for level in LEVELS:
+            if "vpc" in level:
+                for prefix, deletion in dns_deletions.items():
+                    try:
+                        deletion.result()
+                    except Exception as e:
+                        errors.setdefault(prefix, f"DNS instance: {e}")
+            batch = [
+                (prefix, resource)
+                for prefix, lab in labs.items()
+                if prefix not in errors
+                for resource in lab["resources"]
+                if resource["kind"] in level
+            ]
+            deletions = [
+                executor.submit(
+                    delete_resource, client, resource["kind"], resource["id"]
+                )
+                for _, resource in batch
+            ]
+            watches = []
+            for (prefix, resource), deletion in zip(batch, deletions):
+                try:
+                    if deletion.result():
+                        watches.append(
+                            (
+                                prefix,
+                                resource,
+                                waiter.watch(
+                                    resource["kind"],
+                                    resource["id"],
+                                    resource["vpc_id"],
+                                    deleted=True,
+                                ),
+                            )
+                        )
+                except Exception as e:
+                    errors.setdefault(prefix, f"{resource['name']}: {e}")
+            for prefix, resource, watch in watches:
+                try:
+                    watch.result()
+                except Exception as e:
+                    errors.setdefault(prefix, f"{resource['name']}: {e}")
+
+        for prefix, revocation in revocations.items():
+            try:
+                revocation.result()
+            except Exception as e:
+                errors.setdefault(prefix, f"Tailscale key: {e}")
+
+    AddressLedger().release(
+        [f"{region}/{prefix}" for prefix in labs if prefix not in errors]
+    )
+    results = []
+    for prefix, lab in labs.items():
+        error = errors.get(prefix)
+        if error is None:
+            Journal(prefix, region).reset()
+        else:
+            logger.error(f"Destroying {prefix} in {region} failed: {error}")
+        results.append(
+            {
+                "prefix": prefix,
+                "region": region,
+                "resources": len(lab["resources"]),
+                "state": "failed" if error else "destroyed",
+                "error": error,
+            }
+        )
+    return results
+
+
+def discovery_table(found):
+    """
+    Renders the resources found per lab as a rich Table.
+
+    Args:
+        found (dict): Region mapped to the labs from `discover_labs`.
+    """
+    from rich.table import Table
+
+    kinds = [kind for level in LEVELS for kind in level]
+    table = Table(title="Resources to delete")
+    for column in ["Region", "Prefix"] + kinds + ["Tailscale key", "DNS instance"]:
+        table.add_column(column)
+    for region, labs in found.items():
+        for prefix, lab in labs.items():
+            counts = [
+                str(sum(1 for r in lab["resources"] if r["kind"] == kind))
+                for kind in kinds
+            ]
+            table.add_row(
+                region,
+                prefix,
+                *counts,
+                lab["tailscale_key"] or "",
+                lab["dns_instance"] or "",
+            )
+    return table
+
+
+@click.command()
+@click.option(
+    "--region",
+    "regions",
+    multiple=True,
+    required=True,
+    help="Region to search; repeat for more regions",
+)
+@click.option(
+    "--prefix", "prefixes", multiple=True, help="Lab prefix; repeat for more labs"
+)
+@click.option(
+    "--prefix-template",
+    help="Generate prefixes from a template, e.g. 'lab{n:03d}'",
+)
+@click.option("--count", default=0, help="Number of prefixes to generate")
+@click.option("--start", default=1, show_default=True, help="First template number")
+@click.option(
+    "--max-workers",
+    default=20,
+    show_default=True,
+    help="Maximum delete requests in flight per region",
+)
+@click.option("--yes", is_flag=True, help="Do not ask for confirmation")
+@click.option("--report", type=click.Path(), help="Write the JSON report to a file")
+def destroy(regions, prefixes, prefix_template, count, start, max_workers, yes, report):
+    """
+    Delete every resource of one or more labs and revoke their Tailscale keys.
+    """
+    from rich.console import Console
+
+    names = expand_prefixes(prefixes, prefix_template, count, start)
+    if not names:
+        raise click.UsageError("Give --prefix or --prefix-template with --count")
+
+    console = Console()
+    clients = {region: vpc_client(ibmcloud_api_key(), region) for region in regions}
+    with ThreadPoolExecutor(max_workers=len(regions)) as executor:
+        found = dict(
+            zip(
+                regions,
+                executor.map(
+                    lambda region: discover_labs(clients[region], region, names),
+                    regions,
+                ),
+            )
+        )
+    found = {region: labs for region, labs in found.items() if labs}
+    if not found:
+        console.print("Nothing to destroy")
+        return
+
+    console.print(discovery_table(found))
+    total = sum(
+        len(lab["resources"]) for labs in found.values() for lab in labs.values()
+    )
+    lab_count = sum(len(labs) for labs in found.values())
+    if not yes:
+        click.confirm(f"Delete {total} resources in {lab_count} labs?", abort=True)
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=len(found)) as executor:
+        results = [
+            status
+            for statuses in executor.map(
+                lambda region: destroy_labs(
+                    clients[region], region, found[region], max_workers=max_workers
+                ),
+                found,
+            )
+            for status in statuses
+        ]
+    wall_time = time.monotonic() - started
+
+    failed = [status for status in results if status["state"] == "failed"]
+    console.print(
+        f"{len(results) - len(failed)}/{len(results)} labs destroyed in {wall_time:.0f}s"
+    )
+    for status in failed:
+        console.print(
+            f"[red]{status['prefix']} ({status['region']}): {status['error']}"
+        )
+    if report:
+        with open(report, "w") as handle:
+            json.dump(
+                {"wall_time": round(wall_time, 1), "labs": results}, handle, indent=2
+            )
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    destroy()
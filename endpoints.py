@@ -0,0 +1,71 @@
+import os
+import re
+
+# service -> (environment variable that overrides its base URL, default base URL)
+SERVICE_URLS = {
+    "iam": ("IBMCLOUD_IAM_URL", "https://iam.cloud.ibm.com"),
+    "resource_manager": (
+        "IBMCLOUD_RESOURCE_MANAGER_URL",
+        "https://resource-controller.cloud.ibm.com",
+    ),
+    "vpc": ("IBMCLOUD_VPC_URL", "https://{region}.iaas.cloud.ibm.com/v1"),
+    "tagging": (
+        "IBMCLOUD_TAGGING_URL",
+        "https://tags.global-search-tagging.cloud.ibm.com",
+    ),
+    "dns": ("IBMCLOUD_DNS_URL", "https://api.dns-svcs.cloud.ibm.com/v1"),
+    "tailscale": ("TAILSCALE_API_URL", "https://api.tailscale.com"),
+}
+
+
+def service_url(service, region=None):
+    """
+    Returns the base URL of a service, honoring its environment override.
+
+    The overrides point the tool at a stand-in such as fake_cloud.py. The VPC
+    URL is a template; `{region}` is replaced with the region.
+
+    Args:
+        service (str): A key of SERVICE_URLS.
+        region (str): The region, for the VPC service.
+
+    Returns:
+        str: The base URL, without a trailing slash.
+    """
+    variable, default = SERVICE_URLS[service]
+    return (os.environ.get(variable) or default).format(region=region).rstrip("/")
+
+
+def overridden_service(url):
+    """
+    Returns the service an overridden base URL belongs to.
+
+    Args:
+        url (str): A request URL.
+
+    Returns:
+        str: A key of SERVICE_URLS, or None if no override matches the URL.
+    """
+    url = str(url)
+    for service, (variable, _) in SERVICE_URLS.items():
+        override = os.environ.get(variable)
+        if override and url.startswith(override.split("{region}")[0].rstrip("/")):
+            return service
+    return None
+
+
+def vpc_region(url):
+    """
+    Returns the region a VPC service URL targets.
+
+    Args:
+        url (str): A VPC service URL.
+
+    Returns:
+        str: The region name, or None if the URL does not match the VPC URL.
+    """
+    variable, default = SERVICE_URLS["vpc"]
+    template = (os.environ.get(variable) or default).rstrip("/")
+    pattern = re.escape(template).replace(re.escape("{region}"), "([a-z0-9-]+)")
+    match = re.match(pattern, str(url))
+    return match.group(1) if match else None
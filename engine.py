@@ -0,0 +1,195 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import tracing
+from events import publish
+
+
+class ProvisioningError(Exception):
+    """
+    Raised when a node in a provisioning graph fails or cannot be scheduled.
+
+    Attributes:
+        node (str): The name of the node that failed, if any.
+        cause (Exception): The exception raised by the node function, if any.
+    """
+
+    def __init__(self, message, node=None, cause=None):
+        super().__init__(message)
+        self.node = node
+        self.cause = cause
+
+
+class Node:
+    """
+    A single provisioning step and the names of the steps it depends on.
+
+    Args:
+        name (str): Unique name of the step (e.g. "vpc" or "pgw:us-south-1").
+        func (callable): Called with a dict of the results of every completed
+            node. Its return value becomes this node's result.
+        requires (iterable): Names of nodes that must complete before this one runs.
+        verify (callable): For steps that create a resource, called with a result
+            recorded in the graph's journal; returns True if that result is still
+            valid and the step can be skipped.
+    """
+
+    def __init__(self, name, func, requires=(), verify=None):
+        self.name = name
+        self.func = func
+        self.requires = tuple(requires)
+        self.verify = verify
+
+    def __repr__(self):
+        return f"Node({self.name!r}, requires={list(self.requires)!r})"
+
+
+class ProvisioningGraph:
+    """
+    Runs provisioning steps concurrently, honoring their declared dependencies.
+
+    Nodes become eligible as soon as every node they require has completed, and
+    eligible nodes are submitted to a bounded thread pool. A node function may add
+    further nodes to the graph while it runs (for example one node per zone once
+    the zone list is known), so the graph can grow during execution.
+
+    With a journal, every node that has a `verify` function is recorded when it
+    completes. On a later run such a node first checks its recorded result and,
+    if it is still valid, reuses it instead of running again, so an interrupted
+    deployment resumes where it stopped.
+
+    Args:
+        max_workers (int): Maximum number of steps running at the same time.
+        on_complete (callable): Optional callback invoked as ``on_complete(name, result)``
+            from the scheduling thread each time a node finishes.
+        journal (Journal): Optional journal to record and resume steps from.
+        name (str): Name recorded on the graph's trace spans, e.g. "us-south/lab1".
+    """
+
+    def __init__(self, max_workers=8, on_complete=None, journal=None, name=None):
+        self.name = name
+        self.max_workers = max_workers
+        self.on_complete = on_complete
+        self.journal = journal
+        self.nodes = {}
+        self.results = {}
+        self.reused = set()
+        self._lock = threading.Lock()
+
+    def add(self, name, func, requires=(), verify=None):
+        """
+        Adds a node to the graph.
+
+        Args:
+            name (str): Unique name of the step.
+            func (callable): Function called with the dict of completed results.
+            requires (iterable): Names of the nodes this step depends on.
+            verify (callable): Called with the journaled result of this step;
+                returns True if the step can be skipped.
+
+        Returns:
+            Node: The node that was added.
+
+        Raises:
+            ProvisioningError: If a node with the same name already exists.
+        """
+        node = Node(name, func, requires, verify)
+        with self._lock:
+            if name in self.nodes:
+                raise ProvisioningError(f"Duplicate node name: {name}", node=name)
+            self.nodes[name] = node
+        publish("step_added", lab=self.name, step=name)
+        return node
+
+    def _ready_nodes(self, started):
+        with self._lock:
+            return [
+                node
+                for name, node in self.nodes.items()
+                if name not in started
+                and all(dep in self.results for dep in node.requires)
+            ]
+
+    def _run_node(self, node):
+        publish("step_started", lab=self.name, step=node.name)
+        started = time.monotonic()
+        try:
+            result, reused = self._run_step(node)
+        except Exception as e:
+            publish("step_failed", lab=self.name, step=node.name, error=str(e))
+            raise
+        publish(
+            "step_finished",
+            lab=self.name,
+            step=node.name,
+            reused=reused,
+            duration=round(time.monotonic() - started, 3),
+        )
+        return result
+
+    def _run_step(self, node):
+        with tracing.span(
+            node.name, "step", graph=self.name, requires=list(node.requires)
+        ) as span:
+            with self._lock:
+                inputs = dict(self.results)
+            journaled = self.journal is not None and node.verify is not None
+            if journaled:
+                recorded = self.journal.get(node.name)
+                if recorded is not None and node.verify(recorded):
+                    with self._lock:
+                        self.reused.add(node.name)
+                    span["reused"] = True
+                    return recorded, True
+            result = node.func(inputs)
+            if journaled:
+                self.journal.record(
+                    node.name, result, {dep: inputs[dep] for dep in node.requires}
+                )
+            return result, False
+
+    def run(self):
+        """
+        Executes every node in the graph.
+
+        Returns:
+            dict: Mapping of node name to the value returned by its function.
+
+        Raises:
+            ProvisioningError: If a node raises, or if the remaining nodes can never
+                run because of a missing or circular dependency. Nodes that are
+                already running are allowed to finish; nothing new is started.
+        """
+        started = set()
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while True:
+                for node in self._ready_nodes(started):
+                    started.add(node.name)
+                    running[executor.submit(self._run_node, node)] = node.name
+
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    error = future.exception()
+                    if error is not None:
+                        wait(running)
+                        raise ProvisioningError(
+                            f"Step {name} failed: {error}", node=name, cause=error
+                        ) from error
+                    result = future.result()
+                    with self._lock:
+                        self.results[name] = result
+                    if self.on_complete:
+                        self.on_complete(name, result)
+
+        pending = sorted(set(self.nodes) - set(self.results))
+        if pending:
+            raise ProvisioningError(
+                f"Unresolvable dependencies for steps: {', '.join(pending)}"
+            )
+        return dict(self.results)
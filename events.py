@@ -0,0 +1,348 @@
+import json
+import queue
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Lab states in the order a lab moves through them
+LAB_STATES = ("queued", "running", "succeeded", "failed")
+
+STATE_STYLES = {
+    "queued": "dim",
+    "running": "yellow",
+    "succeeded": "green",
+    "failed": "red",
+}
+
+_STOP = object()
+
+
+class EventBus:
+    """
+    Delivers progress events from provisioning code to renderers in-process.
+
+    Publishing never blocks: each subscriber has its own unbounded queue that it
+    drains on its own thread, so a slow terminal cannot hold up a deployment.
+    With no subscribers, publishing costs one attribute check.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = ()
+
+    def subscribe(self):
+        """
+        Returns a new queue that receives every event published from now on.
+
+        Returns:
+            queue.SimpleQueue: The subscriber's queue.
+        """
+        subscriber = queue.SimpleQueue()
+        with self._lock:
+            self._subscribers = self._subscribers + (subscriber,)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        """
+        Stops delivering events to a queue returned by `subscribe`.
+        """
+        with self._lock:
+            self._subscribers = tuple(
+                s for s in self._subscribers if s is not subscriber
+            )
+
+    def publish(self, type, **fields):
+        """
+        Sends an event to every subscriber.
+
+        Args:
+            type (str): Event type, e.g. "step_finished".
+            **fields: Event fields; `lab` names the lab as "region/prefix".
+        """
+        subscribers = self._subscribers
+        if not subscribers:
+            return
+        event = dict(fields, type=type, ts=time.time())
+        for subscriber in subscribers:
+            subscriber.put(event)
+
+
+bus = EventBus()
+
+
+def publish(type, **fields):
+    """
+    Publishes an event on the process-wide bus; see `EventBus.publish`.
+    """
+    bus.publish(type, **fields)
+
+
+class ProgressState:
+    """
+    The progress of every lab, folded from events.
+
+    Each lab tracks its state, the steps added to its graph so far (graphs grow
+    once zones are known, so totals are never guessed), the steps that finished
+    and the ones running right now.
+    """
+
+    def __init__(self):
+        self.labs = {}
+        self.summary = None
+
+    def lab(self, name):
+        return self.labs.setdefault(
+            name,
+            {
+                "state": "queued",
+                "steps": 0,
+                "done": 0,
+                "reused": 0,
+                "running": [],
+                "started": None,
+                "elapsed": None,
+                "error": None,
+            },
+        )
+
+    def apply(self, event):
+        """
+        Updates the state with one event.
+
+        Args:
+            event (dict): A published event.
+        """
+        kind = event["type"]
+        if kind == "fleet_finished":
+            self.summary = event
+            return
+        if not event.get("lab"):
+            return
+        lab = self.lab(event["lab"])
+        if kind == "lab_started":
+            lab.update(state="running", started=event["ts"])
+        elif kind == "lab_finished":
+            lab.update(state=event["state"], error=event.get("error"), running=[])
+            if event.get("elapsed") is not None:
+                lab["elapsed"] = event["elapsed"]
+            elif lab["started"] is not None:
+                lab["elapsed"] = event["ts"] - lab["started"]
+        elif kind == "step_added":
+            lab["steps"] += 1
+        elif kind == "step_started":
+            lab["running"].append(event["step"])
+        elif kind in ("step_finished", "step_failed"):
+            if event["step"] in lab["running"]:
+                lab["running"].remove(event["step"])
+            if kind == "step_finished":
+                lab["done"] += 1
+                lab["reused"] += bool(event.get("reused"))
+
+    def counts(self):
+        """
+        Returns the number of labs in each state.
+        """
+        counts = dict.fromkeys(LAB_STATES, 0)
+        for lab in self.labs.values():
+            counts[lab["state"]] += 1
+        return counts
+
+    def totals(self):
+        """
+        Returns (finished steps, known steps) across all labs.
+        """
+        return (
+            sum(lab["done"] for lab in self.labs.values()),
+            sum(lab["steps"] for lab in self.labs.values()),
+        )
+
+
+class JsonLinesRenderer:
+    """
+    Writes every event as one JSON line, for CI logs and other programs.
+
+    Args:
+        stream (file): Where to write; defaults to stdout.
+    """
+
+    # Nothing to redraw while no events arrive
+    idle_interval = None
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+
+    def start(self):
+        pass
+
+    def handle(self, events, state):
+        for event in events:
+            self.stream.write(json.dumps(event, default=str) + "\n")
+        self.stream.flush()
+
+    def stop(self):
+        pass
+
+
+class LiveRenderer:
+    """
+    Draws progress in the terminal with rich.
+
+    One bar covers every known step of every lab, followed by lab counts per
+    state and a table of labs. With many labs, only running and failed labs are
+    listed, up to `max_rows`, so hundreds of labs stay readable in one view.
+    Once the fleet has finished, the table lists every lab with its result and
+    elapsed time, as the final summary. While no events arrive, the view is
+    redrawn every `idle_interval` seconds so elapsed times keep counting.
+
+    Args:
+        max_rows (int): Most labs listed in the table.
+        console (rich.console.Console): Console to draw on.
+    """
+
+    idle_interval = 1.0
+
+    def __init__(self, max_rows=20, console=None):
+        self.max_rows = max_rows
+        self.console = console
+        self._live = None
+
+    def start(self):
+        from rich.live import Live
+
+        self._live = Live(console=self.console, auto_refresh=False, transient=False)
+        self._live.start()
+
+    def handle(self, events, state):
+        self._live.update(self.render(state), refresh=True)
+
+    def stop(self):
+        self._live.stop()
+
+    def render(self, state):
+        """
+        Builds the renderable for the current state.
+
+        Args:
+            state (ProgressState): The folded events.
+
+        Returns:
+            rich.console.Group: Bar, counts and lab table.
+        """
+        from rich.console import Group
+        from rich.progress_bar import ProgressBar
+        from rich.table import Table
+
+        done, total = state.totals()
+        counts = state.counts()
+        headline = "  ".join(
+            f"[{STATE_STYLES[name]}]{count} {name}[/]" for name, count in counts.items()
+        )
+        if state.summary:
+            summary = state.summary
+            headline += (
+                f"  [b]{summary['succeeded']}/{summary['total']} labs in "
+                f"{summary['wall_time']}s ({summary['labs_per_minute']} labs/min)[/]"
+            )
+
+        labs = list(state.labs.items())
+        max_rows = len(labs) if state.summary else self.max_rows
+        if len(labs) > max_rows:
+            labs = [item for item in labs if item[1]["state"] in ("running", "failed")]
+        hidden = len(state.labs) - len(labs[:max_rows])
+        table = Table(caption=f"{hidden} more labs not shown" if hidden else None)
+        for column in ("Lab", "State", "Steps", "Elapsed", "Running / error"):
+            table.add_column(column)
+        now = time.time()
+        for name, lab in labs[:max_rows]:
+            elapsed = lab["elapsed"]
+            if elapsed is None and lab["started"] is not None:
+                elapsed = now - lab["started"]
+            table.add_row(
+                name,
+                f"[{STATE_STYLES[lab['state']]}]{lab['state']}[/]",
+                f"{lab['done']}/{lab['steps']}",
+                f"{elapsed:.0f}s" if elapsed is not None else "",
+                lab["error"] or ", ".join(lab["running"]),
+            )
+        return Group(
+            ProgressBar(total=max(total, 1), completed=done),
+            f"{done}/{total} steps  {headline}",
+            table,
+        )
+
+
+def choose_renderer(mode):
+    """
+    Returns the renderer for a `--progress` option value.
+
+    Args:
+        mode (str): "live", "json", or "auto" for live on a terminal and JSON
+            lines otherwise.
+
+    Returns:
+        LiveRenderer or JsonLinesRenderer: The renderer.
+    """
+    if mode == "auto":
+        mode = "live" if sys.stdout.isatty() else "json"
+    return LiveRenderer() if mode == "live" else JsonLinesRenderer()
+
+
+@contextmanager
+def render_progress(renderer, min_interval=0.1, event_bus=None):
+    """
+    Renders the events published inside the block on a background thread.
+
+    The thread sleeps until an event arrives, then applies every queued event
+    and redraws once. Redraws are at least `min_interval` apart; events that
+    arrive meanwhile are batched into the next redraw, so a burst from hundreds
+    of labs costs a few redraws rather than one per event. Renderers with an
+    `idle_interval` are also redrawn that often when no events arrive.
+
+    Args:
+        renderer (LiveRenderer or JsonLinesRenderer): Draws the events.
+        min_interval (float): Shortest time between redraws, in seconds.
+        event_bus (EventBus): Bus to subscribe to; defaults to the process bus.
+
+    Yields:
+        ProgressState: The state the renderer draws, updated as events arrive.
+    """
+    event_bus = event_bus or bus
+    state = ProgressState()
+    subscriber = event_bus.subscribe()
+
+    idle_interval = getattr(renderer, "idle_interval", None)
+
+    def consume():
+        stopping = False
+        while not stopping:
+            try:
+                events = [subscriber.get(timeout=idle_interval)]
+            except queue.Empty:
+                renderer.handle([], state)
+                continue
+            while True:
+                try:
+                    events.append(subscriber.get_nowait())
+                except queue.Empty:
+                    break
+            if _STOP in events:
+                stopping = True
+                events = [event for event in events if event is not _STOP]
+            for event in events:
+                state.apply(event)
+            if events:
+                renderer.handle(events, state)
+            if not stopping:
+                time.sleep(min_interval)
+
+    renderer.start()
+    thread = threading.Thread(target=consume, name="progress-renderer", daemon=True)
+    thread.start()
+    try:
+        yield state
+    finally:
+        event_bus.unsubscribe(subscriber)
+        subscriber.put(_STOP)
+        thread.join()
+        renderer.stop()
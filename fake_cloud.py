@@ -0,0 +1,1157 @@
+import ipaddress
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import click
+import jwt
+
+ACCOUNT_ID = "fakeaccount0000000000000000000000"
+
+# Tokens are never verified; the key only has to be long enough for PyJWT
+JWT_SECRET = "fake-cloud-token-signing-key-000"
+
+# kind -> (collection path, status once ready); None means the kind has no status
+KINDS = {
+    "vpc": ("vpcs", "available"),
+    "public_gateway": ("public_gateways", "available"),
+    "subnet": ("subnets", "available"),
+    "security_group": ("security_groups", None),
+    "instance": ("instances", "running"),
+}
+COLLECTION_KINDS = {collection: kind for kind, (collection, _) in KINDS.items()}
+
+# Instance profiles served by the fake: name -> (vCPUs, memory GB, bandwidth Mbps, architecture)
+INSTANCE_PROFILES = {
+    "bx2-2x8": (2, 8, 4000, "amd64"),
+    "bx2-4x16": (4, 16, 8000, "amd64"),
+    "bx2-8x32": (8, 32, 16000, "amd64"),
+    "bx2-16x64": (16, 64, 32000, "amd64"),
+    "cx2-2x4": (2, 4, 4000, "amd64"),
+    "cx2-8x16": (8, 16, 16000, "amd64"),
+    "bz2-2x8": (2, 8, 4000, "s390x"),
+}
+
+# Kinds whose list call accepts a `vpc.id` filter
+VPC_FILTERED = {"subnet", "security_group", "instance"}
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _timestamp(moment):
+    return moment.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class ApiError(Exception):
+    """
+    An error response of the fake API.
+
+    Args:
+        status (int): HTTP status.
+        code (str): Machine-readable error code.
+        message (str): Human-readable message.
+    """
+
+    def __init__(self, status, code, message):
+        super().__init__(message)
+        self.status = status
+        self.code = code
+        self.message = message
+
+
+class FakeCloud:
+    """
+    An in-memory stand-in for the IBM Cloud VPC, IAM, Resource Manager, DNS
+    Services and Tailscale key APIs this tool calls, served over HTTP.
+
+    Created resources start out pending and become ready after `transition`
+    seconds; deleted ones are listed as deleting for `delete_delay` seconds before
+    they disappear. Every request can be slowed down per operation, a fraction of
+    them can be answered with 429, and per-region quotas can be enforced, so the
+    real HTTP, pagination, retry and polling code paths run against it.
+
+    Args:
+        regions (tuple): Regions served; each has three zones.
+        latency (dict): Operation ("POST vpc:/vpcs") or service ("vpc") mapped
+            to seconds added to each matching request.
+        default_latency (float): Seconds added to other requests.
+        transition (float): Seconds a created resource stays pending.
+        delete_delay (float): Seconds a deleted resource stays listed.
+        throttle (float): Fraction of requests answered with 429.
+        quotas (dict): Kind (or "vcpu") mapped to the maximum per region.
+        ssh_keys (tuple): Names of the SSH keys that exist in every region.
+        resource_groups (tuple): Names of the account's resource groups.
+        image_count (int): Number of public images per region.
+        seed (int): Seed for throttling decisions.
+    """
+
+    def __init__(
+        self,
+        regions=("us-south", "us-east", "eu-de"),
+        latency=None,
+        default_latency=0.0,
+        transition=1.0,
+        delete_delay=0.5,
+        throttle=0.0,
+        quotas=None,
+        ssh_keys=("lab-key",),
+        resource_groups=("default",),
+        image_count=250,
+        seed=0,
+    ):
+        self.regions = tuple(regions)
+        self.latency = dict(latency or {})
+        self.default_latency = default_latency
+        self.transition = transition
+        self.delete_delay = delete_delay
+        self.throttle = throttle
+        self.quotas = dict(quotas or {})
+        self.ssh_keys = tuple(ssh_keys)
+        self.resource_groups = {
+            name: f"rg{index:030d}" for index, name in enumerate(resource_groups)
+        }
+        self.image_count = image_count
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._resources = {
+            region: {kind: {} for kind in KINDS} for region in self.regions
+        }
+        self._images = {region: self._make_images(region) for region in self.regions}
+        self._tailscale_keys = {}
+        self._dns_instances = {}
+        self._counters = {}
+        self._requests = 0
+        self._throttled = 0
+        self._server = None
+        self._thread = None
+
+    # Serving
+
+    def start(self, host="127.0.0.1", port=0):
+        """
+        Serves the fake API from a background thread.
+
+        Args:
+            host (str): Address to bind.
+            port (int): Port to bind; 0 picks a free one.
+
+        Returns:
+            str: The server's base URL.
+        """
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.cloud = self
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="fake-cloud", daemon=True
+        )
+        self._thread.start()
+        return self.url
+
+    def stop(self):
+        """
+        Stops serving.
+        """
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def environment(self):
+        """
+        Returns the environment variables that point this tool at the server.
+
+        Returns:
+            dict: Variable name mapped to value; see endpoints.SERVICE_URLS.
+        """
+        return {
+            "IBMCLOUD_IAM_URL": f"{self.url}/iam",
+            "IBMCLOUD_RESOURCE_MANAGER_URL": f"{self.url}/rm",
+            "IBMCLOUD_VPC_URL": f"{self.url}/vpc/{{region}}/v1",
+            "TAILSCALE_API_URL": f"{self.url}/tailscale",
+            "IBMCLOUD_TAGGING_URL": f"{self.url}/tagging",
+            "IBMCLOUD_DNS_URL": f"{self.url}/dns/v1",
+        }
+
+    def stats(self):
+        """
+        Returns request counters.
+
+        Returns:
+            dict: `requests` (total), `throttled` (429s sent) and `operations`
+                (operation mapped to its request count).
+        """
+        with self._lock:
+            return {
+                "requests": self._requests,
+                "throttled": self._throttled,
+                "operations": dict(sorted(self._counters.items())),
+            }
+
+    def resources(self, region, kind):
+        """
+        Returns the current resources of one kind in a region.
+
+        Args:
+            region (str): The region.
+            kind (str): A key of KINDS.
+
+        Returns:
+            list: The resources, newest first.
+        """
+        with self._lock:
+            return [dict(resource) for resource in self._live(region, kind)]
+
+    def dns_instances(self):
+        """
+        Returns the DNS Services instances with their zones.
+
+        Returns:
+            list: Instances; each zone lists its permitted networks and records.
+        """
+        with self._lock:
+            return [
+                dict(
+                    _public(instance),
+                    zones=[
+                        dict(
+                            _public(zone),
+                            permitted_networks=list(zone["_networks"].values()),
+                            records=list(zone["_records"].values()),
+                        )
+                        for zone in instance["_zones"].values()
+                    ],
+                )
+                for instance in self._dns_instances.values()
+            ]
+
+    # Dispatching
+
+    def dispatch(self, method, target, headers, body):
+        """
+        Answers one request.
+
+        Args:
+            method (str): HTTP method.
+            target (str): Request path and query.
+            headers (Message): Request headers.
+            body (bytes): Request body.
+
+        Returns:
+            tuple: (status, JSON-serializable body or None, extra headers).
+        """
+        parts = urlsplit(target)
+        path = parts.path
+        query = dict(parse_qsl(parts.query))
+        if path == "/_stats":
+            return 200, self.stats(), {}
+        service, route, handler, params = self._route(method, path)
+        operation = f"{method} {service}:{route}"
+        with self._lock:
+            self._requests += 1
+            self._counters[operation] = self._counters.get(operation, 0) + 1
+            throttled = self.throttle and self._random.random() < self.throttle
+            if throttled:
+                self._throttled += 1
+        delay = self.latency.get(
+            operation, self.latency.get(service, self.default_latency)
+        )
+        if delay:
+            time.sleep(delay)
+        if throttled:
+            return (
+                429,
+                _error_body("too_many_requests", "Rate limit exceeded"),
+                {"Retry-After": "0"},
+            )
+        if handler is None:
+            return 404, _error_body("not_found", f"No route for {method} {path}"), {}
+        if service != "iam" and not headers.get("Authorization"):
+            return 401, _error_body("not_authorized", "Missing Authorization"), {}
+        try:
+            payload = json.loads(body) if body and body[:1] in (b"{", b"[") else {}
+            status, result = handler(query=query, payload=payload, **params)
+        except ApiError as e:
+            return e.status, _error_body(e.code, e.message), {}
+        return status, result, {}
+
+    def _route(self, method, path):
+        for service, prefix in (
+            ("iam", r"/iam"),
+            ("rm", r"/rm"),
+            ("tailscale", r"/tailscale"),
+            ("tagging", r"/tagging"),
+            ("dns", r"/dns/v1"),
+            ("vpc", r"/vpc/(?P<region>[a-z0-9-]+)/v1"),
+        ):
+            match = re.match(prefix, path)
+            if not match:
+                continue
+            rest = path[match.end() :] or "/"
+            params = dict(match.groupdict())
+            for route_method, pattern, name in ROUTES[service]:
+                found = re.fullmatch(pattern, rest)
+                if route_method == method and found:
+                    params.update(found.groupdict())
+                    route = re.sub(r"\(\?P<(\w+)>[^)]*\)", r"{\1}", pattern)
+                    if "collection" in params:
+                        route = route.replace("{collection}", params["collection"])
+                    return service, route, getattr(self, name), params
+            return service, rest, None, params
+        return "other", path, None, {}
+
+    # IAM and Resource Manager
+
+    def iam_token(self, query, payload):
+        issued = int(time.time())
+        claims = {
+            "iam_id": "iam-ServiceId-fake",
+            "account": {"bss": ACCOUNT_ID},
+            "iat": issued,
+            "exp": issued + 3600,
+        }
+        return 200, {
+            "access_token": jwt.encode(claims, JWT_SECRET, algorithm="HS256"),
+            "refresh_token": "not_supported",
+            "token_type": "Bearer",
+            "expires_in": 3600,
+            "expiration": issued + 3600,
+        }
+
+    def iam_api_key_details(self, query, payload):
+        return 200, {"id": "ApiKey-fake", "account_id": ACCOUNT_ID}
+
+    def list_resource_groups(self, query, payload):
+        groups = [
+            {"id": group_id, "name": name, "account_id": ACCOUNT_ID, "state": "ACTIVE"}
+            for name, group_id in self.resource_groups.items()
+        ]
+        return 200, {"resources": groups}
+
+    def create_resource_instance(self, query, payload):
+        guid = str(uuid.uuid4())
+        instance = {
+            "id": f"crn:v1:bluemix:public:dns-svcs:global:a/{ACCOUNT_ID}:{guid}::",
+            "guid": guid,
+            "name": payload["name"],
+            "resource_group_id": payload.get("resource_group"),
+            "resource_plan_id": payload.get("resource_plan_id"),
+            "state": "active",
+            "_zones": {},
+        }
+        with self._lock:
+            self._dns_instances[guid] = instance
+        return 201, _public(instance)
+
+    def get_resource_instance(self, query, payload, id):
+        with self._lock:
+            return 200, _public(self._dns_instance(id))
+
+    def list_resource_instances(self, query, payload):
+        with self._lock:
+            instances = [
+                _public(instance)
+                for instance in self._dns_instances.values()
+                if query.get("name") in (None, instance["name"])
+                and query.get("resource_plan_id")
+                in (None, instance["resource_plan_id"])
+            ]
+        return 200, {"resources": instances, "rows_count": len(instances)}
+
+    def delete_resource_instance(self, query, payload, id):
+        with self._lock:
+            instance = self._dns_instance(id)
+            if instance["_zones"] and query.get("recursive") != "true":
+                raise ApiError(400, "has_zones", f"Instance {id} still has zones")
+            del self._dns_instances[instance["guid"]]
+        return 204, None
+
+    # DNS Services
+
+    def _dns_instance(self, id):
+        # Must be called with the lock held; accepts a GUID or a CRN
+        for instance in self._dns_instances.values():
+            if id in (instance["guid"], instance["id"]):
+                return instance
+        raise ApiError(404, "not_found", f"Resource instance {id} not found")
+
+    def _zone(self, instance, zone):
+        instance = self._dns_instance(instance)
+        if zone not in instance["_zones"]:
+            raise ApiError(404, "not_found", f"Zone {zone} not found")
+        return instance["_zones"][zone]
+
+    def create_dnszone(self, query, payload, instance):
+        with self._lock:
+            owner = self._dns_instance(instance)
+            if any(z["name"] == payload["name"] for z in owner["_zones"].values()):
+                raise ApiError(
+                    409, "conflict", f"Zone {payload['name']} already exists"
+                )
+            zone_id = f"{uuid.uuid4()}:{payload['name']}"
+            zone = {
+                "id": zone_id,
+                "instance_id": owner["guid"],
+                "name": payload["name"],
+                "description": payload.get("description", ""),
+                "label": payload.get("label", ""),
+                "state": "pending_network_add",
+                "created_on": _timestamp(_now()),
+                "_networks": {},
+                "_records": {},
+            }
+            owner["_zones"][zone_id] = zone
+            return 200, _public(zone)
+
+    def get_dnszone(self, query, payload, instance, zone):
+        with self._lock:
+            return 200, _public(self._zone(instance, zone))
+
+    def list_dnszones(self, query, payload, instance):
+        with self._lock:
+            zones = [
+                _public(z) for z in self._dns_instance(instance)["_zones"].values()
+            ]
+        return 200, {"dnszones": zones, "total_count": len(zones)}
+
+    def create_permitted_network(self, query, payload, instance, zone):
+        vpc_crn = payload["permitted_network"]["vpc_crn"]
+        with self._lock:
+            target = self._zone(instance, zone)
+            if any(
+                network["permitted_network"]["vpc_crn"] == vpc_crn
+                for owner in self._dns_instances.values()
+                for other in owner["_zones"].values()
+                if other["name"] == target["name"]
+                for network in other["_networks"].values()
+            ):
+                raise ApiError(409, "conflict", f"VPC {vpc_crn} already permitted")
+            network = {
+                "id": f"{uuid.uuid4()}",
+                "type": "vpc",
+                "permitted_network": {"vpc_crn": vpc_crn},
+                "state": "ACTIVE",
+                "created_on": _timestamp(_now()),
+            }
+            target["_networks"][network["id"]] = network
+            target["state"] = "active"
+            return 200, network
+
+    def list_permitted_networks(self, query, payload, instance, zone):
+        with self._lock:
+            networks = list(self._zone(instance, zone)["_networks"].values())
+        return 200, {"permitted_networks": networks}
+
+    def delete_permitted_network(self, query, payload, instance, zone, network):
+        with self._lock:
+            target = self._zone(instance, zone)
+            if target["_networks"].pop(network, None) is None:
+                raise ApiError(
+                    404, "not_found", f"Permitted network {network} not found"
+                )
+            if not target["_networks"]:
+                target["state"] = "pending_network_add"
+        return 202, {}
+
+    def _record(self, zone, payload, record_id):
+        name = payload["name"]
+        if not name.endswith(f".{zone['name']}"):
+            name = f"{name}.{zone['name']}"
+        return {
+            "id": record_id,
+            "name": name,
+            "type": payload["type"],
+            "rdata": payload["rdata"],
+            "ttl": payload.get("ttl", 900),
+            "modified_on": _timestamp(_now()),
+        }
+
+    def create_resource_record(self, query, payload, instance, zone):
+        with self._lock:
+            target = self._zone(instance, zone)
+            record = self._record(target, payload, f"{payload['type']}:{uuid.uuid4()}")
+            if payload["type"] in ("A", "CNAME") and any(
+                r["name"] == record["name"] and r["type"] == "CNAME"
+                for r in target["_records"].values()
+            ):
+                raise ApiError(
+                    409, "conflict", f"CNAME {record['name']} already exists"
+                )
+            target["_records"][record["id"]] = record
+            return 200, record
+
+    def update_resource_record(self, query, payload, instance, zone, record):
+        with self._lock:
+            target = self._zone(instance, zone)
+            if record not in target["_records"]:
+                raise ApiError(404, "not_found", f"Record {record} not found")
+            target["_records"][record] = self._record(target, payload, record)
+            return 200, target["_records"][record]
+
+    def list_resource_records(self, query, payload, instance, zone):
+        with self._lock:
+            records = list(self._zone(instance, zone)["_records"].values())
+        offset = int(query.get("offset") or 0)
+        limit = min(int(query.get("limit") or 200), 1000)
+        return 200, {
+            "resource_records": records[offset : offset + limit],
+            "offset": offset,
+            "limit": limit,
+            "total_count": len(records),
+        }
+
+    # Tailscale
+
+    def create_tailscale_key(self, query, payload, tailnet):
+        created = _now()
+        expires = created + timedelta(seconds=payload.get("expirySeconds", 86400))
+        key_id = f"k{uuid.uuid4().hex[:16]}"
+        key = {
+            "id": key_id,
+            "key": f"tskey-auth-{key_id}-{uuid.uuid4().hex}",
+            "created": _timestamp(created),
+            "expires": _timestamp(expires),
+            "capabilities": payload.get("capabilities", {}),
+            "description": payload.get("description", ""),
+        }
+        with self._lock:
+            self._tailscale_keys[key_id] = key
+        return 200, key
+
+    def delete_tailscale_key(self, query, payload, tailnet, key_id):
+        with self._lock:
+            if self._tailscale_keys.pop(key_id, None) is None:
+                raise ApiError(404, "not_found", f"Key {key_id} not found")
+        return 200, {}
+
+    # Global tagging
+
+    def attach_tag(self, query, payload):
+        crns = {item["resource_id"] for item in payload.get("resources", [])}
+        tagged = set()
+        with self._lock:
+            for region in self._resources.values():
+                for resources in region.values():
+                    for resource in resources.values():
+                        if resource["crn"] in crns:
+                            tags = set(resource.get("tags", [])) | set(
+                                payload["tag_names"]
+                            )
+                            resource["tags"] = sorted(tags)
+                            tagged.add(resource["crn"])
+        results = [{"resource_id": crn, "is_error": crn not in tagged} for crn in crns]
+        return 200, {"results": results}
+
+    # VPC: static collections
+
+    def _make_images(self, region):
+        images = []
+        start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        for n in range(self.image_count):
+            version, family = [
+                ("24.04 LTS Noble Numbat", "Ubuntu Linux"),
+                ("22.04 LTS Jammy Jellyfish", "Ubuntu Linux"),
+                ("9.4", "Red Hat Enterprise Linux"),
+                ("12", "Debian GNU/Linux"),
+            ][n % 4]
+            architecture = "s390x" if n % 5 == 4 else "amd64"
+            images.append(
+                {
+                    "id": f"r006-image-{region}-{n:05d}",
+                    "name": f"{family.split()[0].lower()}-{version.split()[0]}-{n:05d}-{architecture}",
+                    "created_at": _timestamp(start + timedelta(hours=n)),
+                    "status": "available",
+                    "visibility": "public",
+                    "user_data_format": "cloud_init",
+                    "operating_system": {
+                        "family": family,
+                        "version": version,
+                        "architecture": architecture,
+                    },
+                }
+            )
+        return list(reversed(images))
+
+    def list_region_zones(self, query, payload, region, region_name):
+        self._region(region)
+        zones = [
+            {
+                "name": f"{region_name}-{n}",
+                "status": "available",
+                "region": {"name": region_name},
+            }
+            for n in (1, 2, 3)
+        ]
+        return 200, {"zones": zones}
+
+    def list_instance_profiles(self, query, payload, region):
+        self._region(region)
+        profiles = [
+            {
+                "name": name,
+                "family": name.split("-")[0],
+                "vcpu_count": {"type": "fixed", "value": vcpus},
+                "memory": {"type": "fixed", "value": memory},
+                "bandwidth": {"type": "fixed", "value": bandwidth},
+                "vcpu_architecture": {"type": "fixed", "value": architecture},
+            }
+            for name, (
+                vcpus,
+                memory,
+                bandwidth,
+                architecture,
+            ) in INSTANCE_PROFILES.items()
+        ]
+        return 200, {"profiles": profiles}
+
+    def list_keys(self, query, payload, region):
+        self._region(region)
+        keys = [
+            {"id": f"r006-key-{region}-{n}", "name": name, "type": "rsa"}
+            for n, name in enumerate(self.ssh_keys)
+        ]
+        return 200, _page(keys, "keys", query)
+
+    def list_images(self, query, payload, region):
+        images = self._images[self._region(region)]
+        if query.get("name"):
+            images = [image for image in images if image["name"] == query["name"]]
+        return 200, _page(images, "images", query)
+
+    # VPC: resources
+
+    def _region(self, region):
+        if region not in self._resources:
+            raise ApiError(404, "region_not_found", f"Region {region} not found")
+        return region
+
+    def _live(self, region, kind):
+        # Must be called with the lock held; applies due state transitions
+        now = time.monotonic()
+        resources = self._resources[region][kind]
+        for resource_id in list(resources):
+            resource = resources[resource_id]
+            meta = resource["_meta"]
+            if meta.get("gone_at") and now >= meta["gone_at"]:
+                del resources[resource_id]
+            elif meta.get("ready_at") and now >= meta["ready_at"]:
+                resource["status"] = KINDS[kind][1]
+                meta.pop("ready_at")
+        return sorted(
+            resources.values(),
+            key=lambda resource: resource["_meta"]["order"],
+            reverse=True,
+        )
+
+    def _get(self, region, kind, resource_id):
+        for resource in self._live(region, kind):
+            if resource["id"] == resource_id:
+                return resource
+        raise ApiError(404, "not_found", f"{kind} {resource_id} not found")
+
+    def _check_quota(self, region, kind, vcpus=0):
+        limit = self.quotas.get(kind)
+        if limit is not None and len(self._live(region, kind)) >= limit:
+            raise ApiError(
+                400, "over_quota", f"{kind} quota of {limit} reached in {region}"
+            )
+        limit = self.quotas.get("vcpu")
+        if vcpus and limit is not None:
+            used = sum(i["vcpu"]["count"] for i in self._live(region, "instance"))
+            if used + vcpus > limit:
+                raise ApiError(
+                    400, "over_quota", f"vCPU quota of {limit} reached in {region}"
+                )
+
+    def _create(self, region, kind, payload, **fields):
+        self._region(region)
+        name = payload.get("name") or f"{kind}-{uuid.uuid4().hex[:8]}"
+        scope = fields.get("vpc", {}).get("id") if kind == "subnet" else None
+        for existing in self._live(region, kind):
+            existing_scope = (
+                existing.get("vpc", {}).get("id") if kind == "subnet" else None
+            )
+            if existing["name"] == name and existing_scope == scope:
+                raise ApiError(
+                    409, "validation_unique_failed", f"{kind} name {name} is in use"
+                )
+        resource_id = f"r006-{uuid.uuid4()}"
+        collection, ready_status = KINDS[kind]
+        resource = {
+            "id": resource_id,
+            "crn": f"crn:v1:bluemix:public:is:{region}:a/{ACCOUNT_ID}::{kind}:{resource_id}",
+            "href": f"{self.url}/vpc/{region}/v1/{collection}/{resource_id}",
+            "name": name,
+            "created_at": _timestamp(_now()),
+            "resource_group": payload.get("resource_group")
+            or {"id": next(iter(self.resource_groups.values()), "")},
+            "_meta": {"order": time.monotonic_ns()},
+        }
+        resource.update(fields)
+        if ready_status is not None:
+            resource["status"] = "pending"
+            resource["_meta"]["ready_at"] = time.monotonic() + self.transition
+        self._resources[region][kind][resource_id] = resource
+        return resource
+
+    def _vpc_ref(self, region, payload):
+        vpc_id = (payload.get("vpc") or {}).get("id")
+        vpc = self._get(region, "vpc", vpc_id)
+        return {"id": vpc["id"], "crn": vpc["crn"], "name": vpc["name"]}
+
+    def create_vpc(self, query, payload, region):
+        with self._lock:
+            self._check_quota(self._region(region), "vpc")
+            resource = self._create(
+                region,
+                "vpc",
+                payload,
+                classic_access=payload.get("classic_access", False),
+                default_security_group={"id": f"r006-{uuid.uuid4()}"},
+                _manual_prefixes=payload.get("address_prefix_management") == "manual",
+                _address_prefixes={},
+            )
+            return 201, _public(resource)
+
+    def create_vpc_address_prefix(self, query, payload, region, vpc_id):
+        with self._lock:
+            vpc = self._get(self._region(region), "vpc", vpc_id)
+            cidr = ipaddress.ip_network(payload["cidr"])
+            for existing in vpc["_address_prefixes"].values():
+                if cidr.overlaps(ipaddress.ip_network(existing["cidr"])):
+                    raise ApiError(
+                        409,
+                        "address_prefix_overlap",
+                        f"{cidr} overlaps {existing['cidr']}",
+                    )
+            prefix_id = f"r006-{uuid.uuid4()}"
+            prefix = {
+                "id": prefix_id,
+                "name": payload.get("name") or f"prefix-{prefix_id[5:13]}",
+                "cidr": str(cidr),
+                "zone": payload["zone"],
+                "is_default": False,
+                "has_subnets": False,
+                "created_at": _timestamp(_now()),
+            }
+            vpc["_address_prefixes"][prefix_id] = prefix
+            return 201, prefix
+
+    def get_vpc_address_prefix(self, query, payload, region, vpc_id, id):
+        with self._lock:
+            vpc = self._get(self._region(region), "vpc", vpc_id)
+            if id not in vpc["_address_prefixes"]:
+                raise ApiError(404, "not_found", f"Address prefix {id} not found")
+            return 200, vpc["_address_prefixes"][id]
+
+    def list_vpc_address_prefixes(self, query, payload, region, vpc_id):
+        with self._lock:
+            vpc = self._get(self._region(region), "vpc", vpc_id)
+            prefixes = list(vpc["_address_prefixes"].values())
+        return 200, _page(prefixes, "address_prefixes", query)
+
+    def _check_subnet_cidr(self, region, vpc_id, zone, cidr):
+        # Must be called with the lock held
+        network = ipaddress.ip_network(cidr)
+        vpc = self._get(region, "vpc", vpc_id)
+        zone_prefixes = [
+            ipaddress.ip_network(prefix["cidr"])
+            for prefix in vpc["_address_prefixes"].values()
+            if prefix["zone"]["name"] == zone
+        ]
+        if vpc["_manual_prefixes"] and not any(
+            network.subnet_of(prefix) for prefix in zone_prefixes
+        ):
+            raise ApiError(
+                400, "cidr_not_in_prefix", f"{cidr} is in no address prefix of {zone}"
+            )
+        for subnet in self._live(region, "subnet"):
+            if subnet["vpc"]["id"] == vpc_id and network.overlaps(
+                ipaddress.ip_network(subnet["ipv4_cidr_block"])
+            ):
+                raise ApiError(409, "cidr_overlap", f"{cidr} overlaps {subnet['name']}")
+
+    def create_public_gateway(self, query, payload, region):
+        with self._lock:
+            vpc = self._vpc_ref(region, payload)
+            resource = self._create(
+                region, "public_gateway", payload, vpc=vpc, zone=payload.get("zone")
+            )
+            return 201, _public(resource)
+
+    def create_subnet(self, query, payload, region):
+        with self._lock:
+            vpc = self._vpc_ref(region, payload)
+            count = payload.get("total_ipv4_address_count", 256)
+            index = sum(
+                1
+                for subnet in self._live(region, "subnet")
+                if subnet["vpc"]["id"] == vpc["id"]
+            )
+            cidr = payload.get("ipv4_cidr_block")
+            if cidr:
+                zone = (payload.get("zone") or {}).get("name")
+                self._check_subnet_cidr(region, vpc["id"], zone, cidr)
+                count = ipaddress.ip_network(cidr).num_addresses
+            else:
+                cidr = _cidr(index, count)
+            gateway = payload.get("public_gateway")
+            if gateway:
+                self._get(region, "public_gateway", gateway["id"])
+            resource = self._create(
+                region,
+                "subnet",
+                payload,
+                vpc=vpc,
+                zone=payload.get("zone"),
+                ipv4_cidr_block=cidr,
+                total_ipv4_address_count=count,
+                public_gateway=gateway,
+            )
+            return 201, _public(resource)
+
+    def create_security_group(self, query, payload, region):
+        with self._lock:
+            vpc = self._vpc_ref(region, payload)
+            rules = [
+                dict(rule, id=f"r006-{uuid.uuid4()}")
+                for rule in payload.get("rules", [])
+            ]
+            resource = self._create(
+                region, "security_group", payload, vpc=vpc, rules=rules, targets=[]
+            )
+            return 201, _public(resource)
+
+    def list_security_group_rules(self, query, payload, region, id):
+        with self._lock:
+            group = self._get(self._region(region), "security_group", id)
+            return 200, {"rules": list(group["rules"])}
+
+    def create_security_group_rule(self, query, payload, region, id):
+        with self._lock:
+            group = self._get(self._region(region), "security_group", id)
+            rule = dict(payload, id=f"r006-{uuid.uuid4()}")
+            group["rules"].append(rule)
+            return 201, rule
+
+    def create_instance(self, query, payload, region):
+        with self._lock:
+            vpc = self._vpc_ref(region, payload)
+            interface = payload.get("primary_network_interface") or {}
+            subnet = self._get(
+                region, "subnet", (interface.get("subnet") or {}).get("id")
+            )
+            if subnet.get("status") != "available":
+                raise ApiError(
+                    409,
+                    "subnet_not_available",
+                    f"Subnet {subnet['id']} is not available",
+                )
+            profile = (payload.get("profile") or {}).get("name", "bx2-2x8")
+            match = re.search(r"-(\d+)x(\d+)", profile)
+            vcpus = int(match.group(1)) if match else 2
+            self._check_quota(region, "instance")
+            self._check_quota(region, "vcpu", vcpus)
+            nic_id = f"r006-{uuid.uuid4()}"
+            nic = {
+                "id": nic_id,
+                "name": interface.get("name", "eth0"),
+                "subnet": {"id": subnet["id"], "name": subnet["name"]},
+                "primary_ip": {
+                    "address": str(ipaddress.ip_network(subnet["ipv4_cidr_block"])[4])
+                },
+            }
+            resource = self._create(
+                region,
+                "instance",
+                payload,
+                vpc=vpc,
+                zone=payload.get("zone"),
+                profile={"name": profile},
+                vcpu={"count": vcpus},
+                image=payload.get("image"),
+                primary_network_interface=nic,
+                network_interfaces=[nic],
+            )
+            for group in interface.get("security_groups", []):
+                target = self._get(region, "security_group", group["id"])
+                target["targets"].append(
+                    {"id": nic_id, "resource_type": "network_interface"}
+                )
+            return 201, _public(resource)
+
+    def get_resource(self, query, payload, region, collection, id):
+        with self._lock:
+            kind = COLLECTION_KINDS[collection]
+            return 200, _public(self._get(self._region(region), kind, id))
+
+    def list_resources(self, query, payload, region, collection):
+        with self._lock:
+            kind = COLLECTION_KINDS[collection]
+            resources = self._live(self._region(region), kind)
+            vpc_id = query.get("vpc.id")
+            if vpc_id and kind in VPC_FILTERED:
+                resources = [r for r in resources if r["vpc"]["id"] == vpc_id]
+            if query.get("name"):
+                resources = [r for r in resources if r["name"] == query["name"]]
+            if query.get("resource_group.id"):
+                resources = [
+                    r
+                    for r in resources
+                    if r["resource_group"]["id"] == query["resource_group.id"]
+                ]
+            return 200, _page([_public(r) for r in resources], collection, query)
+
+    def delete_resource(self, query, payload, region, collection, id):
+        with self._lock:
+            kind = COLLECTION_KINDS[collection]
+            resource = self._get(self._region(region), kind, id)
+            if kind == "vpc":
+                if any(
+                    network["permitted_network"]["vpc_crn"] == resource["crn"]
+                    for instance in self._dns_instances.values()
+                    for zone in instance["_zones"].values()
+                    for network in zone["_networks"].values()
+                ):
+                    raise ApiError(
+                        409, "vpc_in_use", f"VPC {id} is permitted to a DNS zone"
+                    )
+                for child in ("public_gateway", "subnet", "security_group", "instance"):
+                    if any(r["vpc"]["id"] == id for r in self._live(region, child)):
+                        raise ApiError(
+                            409, "vpc_in_use", f"VPC {id} still has {child}s"
+                        )
+            if kind == "subnet" and any(
+                r["primary_network_interface"]["subnet"]["id"] == id
+                for r in self._live(region, "instance")
+            ):
+                raise ApiError(409, "subnet_in_use", f"Subnet {id} still has instances")
+            if "status" in resource:
+                resource["status"] = "deleting"
+            resource["_meta"].pop("ready_at", None)
+            resource["_meta"]["gone_at"] = time.monotonic() + self.delete_delay
+            return 204, None
+
+
+def _error_body(code, message):
+    return {
+        "errors": [{"code": code, "message": message, "more_info": ""}],
+        "trace": uuid.uuid4().hex,
+        "message": message,
+    }
+
+
+def _public(resource):
+    return {key: value for key, value in resource.items() if not key.startswith("_")}
+
+
+def _cidr(index, count):
+    # Subnets of one VPC are laid out back to back from 10.240.0.0
+    size = max(8, 1 << (max(count, 1) - 1).bit_length())
+    start = ipaddress.ip_address("10.240.0.0") + index * size
+    return str(ipaddress.ip_network(f"{start}/{32 - size.bit_length() + 1}"))
+
+
+def _page(items, collection, query):
+    limit = min(int(query.get("limit") or 50), 100)
+    start = int(query.get("start") or 0)
+    page = {
+        collection: items[start : start + limit],
+        "limit": limit,
+        "total_count": len(items),
+        "first": {"href": f"?{urlencode({'limit': limit})}"},
+    }
+    if start + limit < len(items):
+        page["next"] = {
+            "href": f"?{urlencode({'start': start + limit, 'limit': limit})}"
+        }
+    return page
+
+
+_COLLECTIONS = "|".join(COLLECTION_KINDS)
+_ZONE = r"/instances/(?P<instance>[^/]+)/dnszones/(?P<zone>[^/]+)"
+
+# service -> (method, path pattern, FakeCloud method)
+ROUTES = {
+    "iam": [
+        ("POST", r"/identity/token", "iam_token"),
+        ("GET", r"/v1/apikeys/details", "iam_api_key_details"),
+    ],
+    "rm": [
+        ("GET", r"/v2/resource_groups", "list_resource_groups"),
+        ("POST", r"/v2/resource_instances", "create_resource_instance"),
+        ("GET", r"/v2/resource_instances", "list_resource_instances"),
+        ("GET", r"/v2/resource_instances/(?P<id>[^/]+)", "get_resource_instance"),
+        ("DELETE", r"/v2/resource_instances/(?P<id>[^/]+)", "delete_resource_instance"),
+    ],
+    "tailscale": [
+        ("POST", r"/api/v2/tailnet/(?P<tailnet>[^/]+)/keys", "create_tailscale_key"),
+        (
+            "DELETE",
+            r"/api/v2/tailnet/(?P<tailnet>[^/]+)/keys/(?P<key_id>[^/]+)",
+            "delete_tailscale_key",
+        ),
+    ],
+    "tagging": [
+        ("POST", r"/v3/tags/attach", "attach_tag"),
+    ],
+    "dns": [
+        ("POST", r"/instances/(?P<instance>[^/]+)/dnszones", "create_dnszone"),
+        ("GET", r"/instances/(?P<instance>[^/]+)/dnszones", "list_dnszones"),
+        ("GET", rf"{_ZONE}", "get_dnszone"),
+        ("POST", rf"{_ZONE}/permitted_networks", "create_permitted_network"),
+        ("GET", rf"{_ZONE}/permitted_networks", "list_permitted_networks"),
+        (
+            "DELETE",
+            rf"{_ZONE}/permitted_networks/(?P<network>[^/]+)",
+            "delete_permitted_network",
+        ),
+        ("POST", rf"{_ZONE}/resource_records", "create_resource_record"),
+        ("GET", rf"{_ZONE}/resource_records", "list_resource_records"),
+        (
+            "PUT",
+            rf"{_ZONE}/resource_records/(?P<record>[^/]+)",
+            "update_resource_record",
+        ),
+    ],
+    "vpc": [
+        ("GET", r"/regions/(?P<region_name>[^/]+)/zones", "list_region_zones"),
+        ("GET", r"/instance/profiles", "list_instance_profiles"),
+        ("GET", r"/keys", "list_keys"),
+        ("GET", r"/images", "list_images"),
+        ("POST", r"/vpcs", "create_vpc"),
+        (
+            "POST",
+            r"/vpcs/(?P<vpc_id>[^/]+)/address_prefixes",
+            "create_vpc_address_prefix",
+        ),
+        (
+            "GET",
+            r"/vpcs/(?P<vpc_id>[^/]+)/address_prefixes",
+            "list_vpc_address_prefixes",
+        ),
+        (
+            "GET",
+            r"/vpcs/(?P<vpc_id>[^/]+)/address_prefixes/(?P<id>[^/]+)",
+            "get_vpc_address_prefix",
+        ),
+        ("POST", r"/public_gateways", "create_public_gateway"),
+        ("POST", r"/subnets", "create_subnet"),
+        ("POST", r"/security_groups", "create_security_group"),
+        ("GET", r"/security_groups/(?P<id>[^/]+)/rules", "list_security_group_rules"),
+        ("POST", r"/security_groups/(?P<id>[^/]+)/rules", "create_security_group_rule"),
+        ("POST", r"/instances", "create_instance"),
+        ("GET", rf"/(?P<collection>{_COLLECTIONS})", "list_resources"),
+        ("GET", rf"/(?P<collection>{_COLLECTIONS})/(?P<id>[^/]+)", "get_resource"),
+        (
+            "DELETE",
+            rf"/(?P<collection>{_COLLECTIONS})/(?P<id>[^/]+)",
+            "delete_resource",
+        ),
+    ],
+}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _handle(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        status, result, headers = self.server.cloud.dispatch(
+            self.command, self.path, self.headers, body
+        )
+        data = b"" if result is None else json.dumps(result).encode()
+        self.send_response(status)
+        if data:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_POST = do_DELETE = do_PATCH = do_PUT = _handle
+
+    def log_message(self, format, *args):
+        pass
+
+
+def parse_pairs(values, convert=float):
+    """
+    Parses `NAME=VALUE` options, e.g. "POST vpc:/instances=0.5" or "vpc=10".
+
+    Args:
+        values (tuple): The option values.
+        convert (callable): Converts each value.
+
+    Returns:
+        dict: Name mapped to converted value.
+
+    Raises:
+        click.BadParameter: If a value is not of that form.
+    """
+    pairs = {}
+    for value in values:
+        name, _, converted = value.rpartition("=")
+        try:
+            pairs[name] = convert(converted)
+        except ValueError:
+            raise click.BadParameter(f"Expected NAME=VALUE, got {value!r}")
+    return pairs
+
+
+@click.command()
+@click.option("--port", default=8780, show_default=True, help="Port to listen on")
+@click.option(
+    "--latency", default=0.05, show_default=True, help="Seconds added per request"
+)
+@click.option(
+    "--latency-for",
+    multiple=True,
+    help="Per-operation latency, e.g. 'POST vpc:/instances=0.5' or 'iam=0.2'",
+)
+@click.option(
+    "--transition",
+    default=1.0,
+    show_default=True,
+    help="Seconds resources stay pending",
+)
+@click.option(
+    "--throttle", default=0.0, show_default=True, help="Fraction of requests to 429"
+)
+@click.option("--quota", "quotas", multiple=True, help="Per-region quota, e.g. vpc=10")
+def fake_cloud(port, latency, latency_for, transition, throttle, quotas):
+    """
+    Serve a local fake of the IBM Cloud and Tailscale APIs this tool uses.
+    """
+    cloud = FakeCloud(
+        latency=parse_pairs(latency_for),
+        default_latency=latency,
+        transition=transition,
+        throttle=throttle,
+        quotas=parse_pairs(quotas, int),
+    )
+    cloud.start(port=port)
+    for name, value in cloud.environment().items():
+        click.echo(f"export {name}='{value}'")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        cloud.stop()
+
+
+if __name__ == "__main__":
+    fake_cloud()
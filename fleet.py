@@ -0,0 +1,416 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+
+from main import deploy_lab, logger
+from credentials import ibmcloud_api_key, require_credentials
+from utils import (
+    MAX_ROUTERS,
+    vpc_client,
+    get_group_id_by_name,
+    get_ssh_key_id,
+    get_instance_profiles,
+    get_latest_ubuntu,
+    get_zone_names,
+)
+from cache import request_refresh
+from events import choose_renderer, publish, render_progress
+from journal import Journal
+from ipam import AddressLedger
+from userdata import BOOT_PROFILES, DEFAULT_BOOT_PROFILE
+from tracing import trace_run
+from waiters import ResourceWaiter
+
+
+def expand_prefixes(prefixes, prefix_template, count, start):
+    """
+    Builds the list of lab prefixes from explicit names and/or a template.
+
+    Args:
+        prefixes (tuple): Explicit prefixes.
+        prefix_template (str): A format string with an `n` field, e.g. "lab{n:03d}".
+        count (int): Number of prefixes to generate from the template.
+        start (int): First value of `n`.
+
+    Returns:
+        list: The prefixes, with duplicates removed and order preserved.
+    """
+    names = list(prefixes)
+    if prefix_template:
+        names.extend(prefix_template.format(n=n) for n in range(start, start + count))
+    return list(dict.fromkeys(names))
+
+
+def assign_regions(prefixes, regions):
+    """
+    Spreads labs over regions round-robin.
+
+    Args:
+        prefixes (list): Lab prefixes.
+        regions (list): Target regions.
+
+    Returns:
+        list: One status dict per lab, in the "queued" state.
+    """
+    return [
+        {
+            "prefix": prefix,
+            "region": regions[i % len(regions)],
+            "state": "queued",
+            "step": None,
+            "elapsed": None,
+            "instance_id": None,
+            "error": None,
+        }
+        for i, prefix in enumerate(prefixes)
+    ]
+
+
+def warm_region(client, region, resource_group, ssh_key, profiles=False):
+    """
+    Fills the shared lookup caches for a region before its labs start, so every
+    lab in the region is served from the cache instead of listing again.
+
+    Args:
+        client (VpcV1): An instance of the VpcV1 service for the region.
+        region (str): The region the client targets.
+        resource_group (str): Resource group name.
+        ssh_key (str): SSH key name.
+        profiles (bool): Also list the region's instance profiles, for labs that
+            size their routers by bandwidth.
+
+    Raises:
+        LookupError: If the resource group or SSH key does not exist.
+    """
+    if get_group_id_by_name(resource_group) is None:
+        raise LookupError(f"Resource group {resource_group} not found")
+    if get_ssh_key_id(client, ssh_key) is None:
+        raise LookupError(f"SSH key {ssh_key} not found in {region}")
+    get_zone_names(client, region)
+    get_latest_ubuntu(client)
+    if profiles:
+        get_instance_profiles(client, region)
+
+
+def run_fleet(
+    labs,
+    resource_group,
+    ssh_key,
+    tailscale_tag,
+    per_region_concurrency=10,
+    max_workers=4,
+    wait=True,
+    resume=True,
+    boot_profile=DEFAULT_BOOT_PROFILE,
+    routers=1,
+    router_bandwidth=None,
+    dns_zone=None,
+    ipam=True,
+):
+    """
+    Deploys many labs concurrently, capping the number in flight per region.
+
+    All labs in a region share one VPC client and one ResourceWaiter, so readiness
+    polling is batched across labs. Every lab keeps its own journal, so rerunning
+    a partly failed fleet only redoes the missing steps. Each lab's status dict is updated in place as
+    it progresses, which lets a caller render live status from another thread.
+
+    Args:
+        labs (list): Status dicts from `assign_regions`.
+        resource_group (str): Resource group name.
+        ssh_key (str): SSH key name, which must exist in every target region.
+        tailscale_tag (str): Tag applied to each lab's Tailscale auth key.
+        per_region_concurrency (int): Maximum labs deploying at once per region.
+        max_workers (int): Maximum concurrent steps within one lab.
+        wait (bool): Wait for each lab's resources to become ready.
+        resume (bool): Reuse resources journaled by an earlier run.
+        boot_profile (str): User-data boot profile of every lab instance.
+        routers (int): Tailscale routers per lab.
+        router_bandwidth (int): Bandwidth each lab's routers must reach together,
+            in Mbps.
+        dns_zone (str): Private DNS zone created in every lab.
+        ipam (bool): Plan every lab's CIDRs up front from the address ledger,
+            so no two labs advertise overlapping routes on the tailnet.
+
+    Returns:
+        list: The same status dicts, in their final state.
+    """
+    regions = sorted({lab["region"] for lab in labs})
+    clients = {region: vpc_client(ibmcloud_api_key(), region) for region in regions}
+    waiters = {region: ResourceWaiter(clients[region]) for region in regions}
+    slots = {region: threading.Semaphore(per_region_concurrency) for region in regions}
+    names = [f"{lab['region']}/{lab['prefix']}" for lab in labs]
+    blocks = AddressLedger().allocate(names) if ipam else {}
+
+    for lab in labs:
+        publish("lab_queued", lab=f"{lab['region']}/{lab['prefix']}")
+
+    warm_errors = {}
+    with ThreadPoolExecutor(max_workers=len(regions)) as executor:
+        futures = {
+            region: executor.submit(
+                warm_region,
+                clients[region],
+                region,
+                resource_group,
+                ssh_key,
+                profiles=bool(router_bandwidth),
+            )
+            for region in regions
+        }
+    for region, future in futures.items():
+        if future.exception() is not None:
+            warm_errors[region] = str(future.exception())
+
+    def run_lab(lab):
+        region = lab["region"]
+        if region in warm_errors:
+            lab.update(state="failed", error=warm_errors[region], elapsed=0.0)
+            publish(
+                "lab_finished",
+                lab=f"{region}/{lab['prefix']}",
+                state="failed",
+                error=warm_errors[region],
+                elapsed=0.0,
+            )
+            return
+        with slots[region]:
+            lab["state"] = "running"
+            started = time.monotonic()
+            journal = Journal(lab["prefix"], region)
+            if not resume:
+                journal.reset()
+            try:
+                results = deploy_lab(
+                    clients[region],
+                    resource_group,
+                    region,
+                    lab["prefix"],
+                    ssh_key,
+                    tailscale_tag,
+                    max_workers=max_workers,
+                    wait=wait,
+                    waiter=waiters[region],
+                    on_step=lambda name, result: lab.update(step=name),
+                    journal=journal,
+                    boot_profile=boot_profile,
+                    routers=routers,
+                    router_bandwidth=router_bandwidth,
+                    dns_zone=dns_zone,
+                    address_block=blocks.get(f"{region}/{lab['prefix']}"),
+                )
+                lab["instance_id"] = results["instance"]["id"]
+                lab["state"] = "succeeded"
+            except Exception as e:
+                logger.error(f"Lab {lab['prefix']} in {region} failed: {e}")
+                lab.update(state="failed", error=str(e))
+            finally:
+                lab["elapsed"] = time.monotonic() - started
+
+    total_slots = per_region_concurrency * len(regions)
+    with ThreadPoolExecutor(max_workers=max(1, total_slots)) as executor:
+        list(executor.map(run_lab, labs))
+    return labs
+
+
+def fleet_report(labs, wall_time):
+    """
+    Summarizes a fleet run.
+
+    Args:
+        labs (list): Final lab status dicts.
+        wall_time (float): Seconds the whole run took.
+
+    Returns:
+        dict: Totals, per-region counts, throughput and every lab's status.
+    """
+    succeeded = [lab for lab in labs if lab["state"] == "succeeded"]
+    regions = {}
+    for lab in labs:
+        counts = regions.setdefault(lab["region"], {"succeeded": 0, "failed": 0})
+        counts["succeeded" if lab["state"] == "succeeded" else "failed"] += 1
+    return {
+        "total": len(labs),
+        "succeeded": len(succeeded),
+        "failed": len(labs) - len(succeeded),
+        "wall_time": round(wall_time, 1),
+        "labs_per_minute": round(len(succeeded) / wall_time * 60, 2)
+        if wall_time
+        else 0.0,
+        "regions": regions,
+        "labs": labs,
+    }
+
+
+@click.command()
+@click.option("--resource-group", required=True, help="IBM Cloud resource group")
+@click.option(
+    "--region",
+    "regions",
+    multiple=True,
+    required=True,
+    help="Target region; repeat to spread labs across regions",
+)
+@click.option(
+    "--prefix", "prefixes", multiple=True, help="Lab prefix; repeat for more labs"
+)
+@click.option(
+    "--prefix-template",
+    help="Generate prefixes from a template, e.g. 'lab{n:03d}'",
+)
+@click.option("--count", default=0, help="Number of prefixes to generate")
+@click.option("--start", default=1, show_default=True, help="First template number")
+@click.option("--tailscale-tag", required=True, help="Tailscale tag")
+@click.option("--ssh-key", required=True, help="VPC SSH key name in every region")
+@click.option(
+    "--per-region-concurrency",
+    default=10,
+    show_default=True,
+    help="Maximum labs deploying at once in each region",
+)
+@click.option(
+    "--max-workers",
+    default=4,
+    show_default=True,
+    help="Maximum concurrent provisioning steps within one lab",
+)
+@click.option("--wait/--no-wait", default=True, show_default=True)
+@click.option("--refresh-cache", is_flag=True, help="Ignore cached lookups")
+@click.option(
+    "--resume/--no-resume",
+    default=True,
+    show_default=True,
+    help="Reuse resources journaled by an earlier run of the same labs",
+)
+@click.option(
+    "--boot-profile",
+    type=click.Choice(sorted(BOOT_PROFILES)),
+    default=DEFAULT_BOOT_PROFILE,
+    show_default=True,
+    help="User-data profile; 'minimal' brings Tailscale up before upgrading packages",
+)
+@click.option(
+    "--routers",
+    type=click.IntRange(1, MAX_ROUTERS),
+    default=1,
+    show_default=True,
+    help="Tailscale subnet routers per lab, spread across the region's zones",
+)
+@click.option(
+    "--router-bandwidth",
+    type=click.IntRange(1),
+    help="Bandwidth the routers must reach together, in Mbps; sizes their profile",
+)
+@click.option(
+    "--dns-zone", help="Private DNS zone to create in every lab, e.g. lab.internal"
+)
+@click.option(
+    "--ipam/--no-ipam",
+    default=True,
+    show_default=True,
+    help="Plan non-overlapping CIDRs for every lab up front instead of letting VPCs pick",
+)
+@click.option(
+    "--trace",
+    is_flag=True,
+    help="Record every API call and step to a Chrome trace under the cache root",
+)
+@click.option(
+    "--record",
+    type=click.Path(dir_okay=False),
+    help="Record every HTTP request, scrubbed and timed, to a cassette file",
+)
+@click.option(
+    "--replay",
+    type=click.Path(exists=True, dir_okay=False),
+    help="Answer every HTTP request from a recorded cassette, offline",
+)
+@click.option(
+    "--replay-scale",
+    default=1.0,
+    show_default=True,
+    help="Multiply the recorded latencies when replaying; 0 replays without delays",
+)
+@click.option(
+    "--progress",
+    type=click.Choice(["auto", "live", "json"]),
+    default="auto",
+    show_default=True,
+    help="Progress output: a live view, JSON lines, or the live view only on a terminal",
+)
+@click.option("--report", type=click.Path(), help="Write the JSON report to a file")
+def fleet(
+    resource_group,
+    regions,
+    prefixes,
+    prefix_template,
+    count,
+    start,
+    tailscale_tag,
+    ssh_key,
+    per_region_concurrency,
+    max_workers,
+    wait,
+    refresh_cache,
+    resume,
+    boot_profile,
+    routers,
+    router_bandwidth,
+    dns_zone,
+    ipam,
+    trace,
+    record,
+    replay,
+    replay_scale,
+    progress,
+    report,
+):
+    """
+    Deploy many identical labs across regions concurrently.
+    """
+    from cassette import cassette_options, use_cassette
+
+    names = expand_prefixes(prefixes, prefix_template, count, start)
+    if not names:
+        raise click.UsageError("Give --prefix or --prefix-template with --count")
+    require_credentials("IBMCLOUD_API_KEY", "TAILSCALE_API_KEY", "TAILNET_ID")
+    cassette_path, cassette_mode = cassette_options(record, replay)
+    # Cached lookups would skip the calls a cassette needs to record or replay
+    if refresh_cache or cassette_path:
+        request_refresh()
+
+    labs = assign_regions(names, list(regions))
+    started = time.monotonic()
+    with use_cassette(
+        cassette_path, cassette_mode, replay_scale, enabled=bool(cassette_path)
+    ), trace_run("fleet", enabled=trace), render_progress(choose_renderer(progress)):
+        run_fleet(
+            labs,
+            resource_group,
+            ssh_key,
+            tailscale_tag,
+            per_region_concurrency=per_region_concurrency,
+            max_workers=max_workers,
+            wait=wait,
+            resume=resume,
+            boot_profile=boot_profile,
+            routers=routers,
+            router_bandwidth=router_bandwidth,
+            dns_zone=dns_zone,
+            ipam=ipam,
+        )
+        summary = fleet_report(labs, time.monotonic() - started)
+        publish("fleet_finished", **summary)
+
+    if report:
+        with open(report, "w") as handle:
+            json.dump(summary, handle, indent=2)
+    if summary["failed"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    fleet()
@@ -0,0 +1,222 @@
+import json
+import logging
+import time
+
+from cache import cache_dir, atomic_write, refresh_requested
+from endpoints import vpc_region
+from pagination import iter_pages
+
+logger = logging.getLogger(__name__)
+
+# Regions whose index was rebuilt in full after a refresh was requested
+_rebuilt = set()
+
+# How long a region's catalog index is trusted without asking the API at all
+CATALOG_TTL = 6 * 3600
+
+PUBLIC_IMAGE_FILTERS = {
+    "status": ["available"],
+    "visibility": "public",
+    "user_data_format": ["cloud_init"],
+}
+
+
+def iter_image_pages(vpc_client, page_size=100, **filters):
+    """
+    Lazily yields pages of images, following the collection's `next` links.
+
+    Args:
+        vpc_client (VpcV1): An instance of the VpcV1 service.
+        page_size (int): Number of images to request per page.
+        **filters: Extra `list_images` filters (status, visibility, ...).
+
+    Yields:
+        list: The images on each page.
+    """
+    return iter_pages(vpc_client.list_images, "images", page_size, **filters)
+
+
+def image_matches(image, family, version, architecture):
+    """
+    Returns True if an image's operating system matches the requested one.
+
+    Args:
+        image (dict): An image from `list_images` or a catalog index entry.
+        family (str): Case-insensitive substring of the OS family (e.g. "ubuntu").
+        version (str): Prefix of the OS version (e.g. "24.04").
+        architecture (str): CPU architecture (e.g. "amd64").
+
+    Returns:
+        bool: Whether the image matches.
+    """
+    os_info = image.get("operating_system") or {}
+    return (
+        family.lower() in (os_info.get("family") or "").lower()
+        and (os_info.get("version") or "").startswith(version)
+        and os_info.get("architecture") == architecture
+    )
+
+
+def newest(images):
+    """
+    Returns the image with the latest `created_at`, or None for an empty list.
+    """
+    return max(images, key=lambda image: image.get("created_at", ""), default=None)
+
+
+def find_latest_image(vpc_client, family, version, architecture, page_size=100):
+    """
+    Finds the newest matching public image by streaming the image collection.
+
+    VPC collections are returned newest first, so once a page contains a match no
+    later page can hold a newer one and the scan stops there. Matches within that
+    page are still compared by `created_at`.
+
+    Args:
+        vpc_client (VpcV1): An instance of the VpcV1 service.
+        family (str): OS family, e.g. "ubuntu".
+        version (str): OS version prefix, e.g. "24.04".
+        architecture (str): CPU architecture, e.g. "amd64".
+        page_size (int): Number of images to request per page.
+
+    Returns:
+        dict: The newest matching image, or None if there is none.
+    """
+    for page in iter_image_pages(vpc_client, page_size, **PUBLIC_IMAGE_FILTERS):
+        matches = [
+            image
+            for image in page
+            if image_matches(image, family, version, architecture)
+        ]
+        if matches:
+            return newest(matches)
+    return None
+
+
+def _index_entry(image):
+    os_info = image.get("operating_system") or {}
+    return {
+        "id": image["id"],
+        "name": image.get("name"),
+        "created_at": image.get("created_at"),
+        "operating_system": {
+            "family": os_info.get("family"),
+            "version": os_info.get("version"),
+            "architecture": os_info.get("architecture"),
+        },
+    }
+
+
+class ImageCatalog:
+    """
+    A per-region, on-disk index of the public image catalog.
+
+    Within `ttl` seconds of the last refresh, lookups are answered from the local
+    index without any API call. After that, a single one-image request checks
+    whether the newest image in the region has changed; only if it has is the
+    full catalog streamed again. After `cache.request_refresh()`, as for
+    `--refresh-cache` and `--record`, the index is rebuilt in full once per
+    process, so a recording holds every catalog call a cold cache makes.
+
+    Args:
+        region (str): The IBM Cloud region the index belongs to.
+        ttl (int): Seconds the index is trusted without revalidation.
+    """
+
+    def __init__(self, region, ttl=CATALOG_TTL):
+        self.region = region
+        self.ttl = ttl
+        self.path = cache_dir("images") / f"{region}.json"
+        self.index = self._load()
+
+    def _load(self):
+        try:
+            return json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            return None
+
+    def _save(self):
+        atomic_write(self.path, json.dumps(self.index).encode())
+
+    def is_fresh(self):
+        """
+        Returns True if the index exists and is younger than the TTL, and was
+        rebuilt in this process if a refresh was requested.
+        """
+        if refresh_requested() and self.region not in _rebuilt:
+            return False
+        return bool(self.index) and time.time() - self.index["fetched_at"] < self.ttl
+
+    def refresh(self, vpc_client, force=False):
+        """
+        Brings the index up to date, re-downloading the catalog only if it changed.
+
+        Args:
+            vpc_client (VpcV1): An instance of the VpcV1 service for this region.
+            force (bool): Rebuild the index even if the newest image is unchanged.
+
+        Raises:
+            ApiException: If there is an error while calling the IBM Cloud API.
+        """
+        if self.index and not force:
+            head = next(iter_image_pages(vpc_client, 1, **PUBLIC_IMAGE_FILTERS), [])
+            newest_id = head[0]["id"] if head else None
+            if newest_id == self.index.get("newest_id"):
+                self.index["fetched_at"] = time.time()
+                self._save()
+                return
+
+        images = []
+        for page in iter_image_pages(vpc_client, 100, **PUBLIC_IMAGE_FILTERS):
+            images.extend(_index_entry(image) for image in page)
+        self.index = {
+            "fetched_at": time.time(),
+            "newest_id": images[0]["id"] if images else None,
+            "images": images,
+        }
+        self._save()
+        if refresh_requested():
+            _rebuilt.add(self.region)
+        logger.info(f"Indexed {len(images)} public images in {self.region}")
+
+    def resolve(self, vpc_client, family, version, architecture):
+        """
+        Returns the newest matching image, refreshing the index first if stale.
+
+        Args:
+            vpc_client (VpcV1): An instance of the VpcV1 service for this region.
+            family (str): OS family, e.g. "ubuntu".
+            version (str): OS version prefix, e.g. "24.04".
+            architecture (str): CPU architecture, e.g. "amd64".
+
+        Returns:
+            dict: The matching index entry, or None if there is none.
+        """
+        if not self.is_fresh():
+            self.refresh(vpc_client, force=refresh_requested())
+        return newest(
+            [
+                image
+                for image in self.index["images"]
+                if image_matches(image, family, version, architecture)
+            ]
+        )
+
+
+def client_region(vpc_client):
+    """
+    Returns the region a VPC client targets, or None if it cannot be determined.
+
+    Args:
+        vpc_client: A VpcV1 instance or a SyncClient over an AsyncVpcClient.
+
+    Returns:
+        str: The region name, e.g. "us-south".
+    """
+    region = getattr(getattr(vpc_client, "async_client", None), "region", None)
+    if region:
+        return region
+    service_url = getattr(vpc_client, "service_url", None)
+    if isinstance(service_url, str):
+        return vpc_region(service_url)
+    return None
@@ -0,0 +1,484 @@
+import json
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+
+from credentials import ibmcloud_api_key
+from utils import vpc_client, getAccountId
+from cache import cache_dir
+from pagination import iter_pages
+from waiters import COLLECTIONS
+
+# kind -> (list method, collection key) for everything the inventory indexes
+INVENTORY_COLLECTIONS = {
+    kind: COLLECTIONS[kind][:2]
+    for kind in ("vpc", "subnet", "public_gateway", "security_group", "instance")
+}
+INVENTORY_COLLECTIONS["key"] = ("list_keys", "keys")
+
+# Incremental syncs cannot see deletions or status changes of older resources,
+# so a kind is fully re-listed once its last full sync is this old
+FULL_SYNC_INTERVAL = 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS resources (
+    crn TEXT PRIMARY KEY,
+    region TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    vpc_id TEXT,
+    zone TEXT,
+    status TEXT,
+    created_at TEXT,
+    data TEXT NOT NULL,
+    seen_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS resources_by_name ON resources (region, kind, name);
+CREATE INDEX IF NOT EXISTS resources_by_vpc ON resources (vpc_id, kind);
+CREATE INDEX IF NOT EXISTS resources_by_zone ON resources (region, kind, zone);
+CREATE TABLE IF NOT EXISTS sync_state (
+    region TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    watermark TEXT,
+    synced_at REAL,
+    full_synced_at REAL,
+    PRIMARY KEY (region, kind)
+);
+"""
+
+UPSERT = """
+INSERT INTO resources
+    (crn, region, kind, id, name, vpc_id, zone, status, created_at, data, seen_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (crn) DO UPDATE SET
+    name = excluded.name,
+    vpc_id = excluded.vpc_id,
+    zone = excluded.zone,
+    status = excluded.status,
+    data = excluded.data,
+    seen_at = excluded.seen_at
+"""
+
+
+def inventory_path(account_id):
+    """
+    Returns the inventory database file for an account.
+
+    Args:
+        account_id (str): The IBM Cloud account ID.
+
+    Returns:
+        Path: The SQLite file under the cache root's `inventory` directory.
+    """
+    return cache_dir("inventory") / f"{account_id}.sqlite3"
+
+
+def _row(region, kind, resource, seen_at):
+    vpc = resource.get("vpc") or {}
+    zone = resource.get("zone") or {}
+    return (
+        resource["crn"],
+        region,
+        kind,
+        resource["id"],
+        resource["name"],
+        resource["id"] if kind == "vpc" else vpc.get("id"),
+        zone.get("name"),
+        resource.get("status") or resource.get("lifecycle_state"),
+        resource.get("created_at"),
+        json.dumps(resource),
+        seen_at,
+    )
+
+
+class Inventory:
+    """
+    An indexed SQLite copy of the VPC resources in one account.
+
+    Each region and kind is synced by streaming list pages straight into batched
+    upserts keyed by CRN. The first sync of a kind lists everything; later syncs
+    rely on VPC collections being returned newest first and stop at the first
+    resource that is already indexed and not newer than the previous sync's
+    newest `created_at`. Because that cannot notice deletions or status changes
+    of older resources, a kind is listed in full again every `full_interval`
+    seconds, and rows not seen by a full sync are removed.
+
+    Args:
+        path (Path): The SQLite database file.
+        full_interval (float): Seconds between full syncs of a kind.
+    """
+
+    def __init__(self, path, full_interval=FULL_SYNC_INTERVAL):
+        self.path = path
+        self.full_interval = full_interval
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(path), check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript(SCHEMA)
+
+    def close(self):
+        """
+        Closes the database connection.
+        """
+        with self._lock:
+            self._db.close()
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return [dict(row) for row in self._db.execute(sql, params).fetchall()]
+
+    def _state(self, region, kind):
+        rows = self._query(
+            "SELECT * FROM sync_state WHERE region = ? AND kind = ?", (region, kind)
+        )
+        return rows[0] if rows else {}
+
+    def sync_kind(self, client, region, kind, full=False):
+        """
+        Syncs one kind of resource in a region.
+
+        Args:
+            client (VpcV1): An instance of the VpcV1 service for the region.
+            region (str): The region the client targets.
+            kind (str): One of the keys of `INVENTORY_COLLECTIONS`.
+            full (bool): List everything even if an incremental sync would do.
+
+        Returns:
+            dict: The number of pages listed, rows upserted and rows removed, and
+                whether the sync was full.
+
+        Raises:
+            ApiException: If there is an error while calling the IBM Cloud API.
+        """
+        state = self._state(region, kind)
+        started = time.time()
+        full = (
+            full
+            or not state
+            or started - (state.get("full_synced_at") or 0) > self.full_interval
+        )
+        watermark = state.get("watermark")
+        known = set()
+        if not full:
+            known = {
+                row["crn"]
+                for row in self._query(
+                    "SELECT crn FROM resources WHERE region = ? AND kind = ?",
+                    (region, kind),
+                )
+            }
+
+        method, collection = INVENTORY_COLLECTIONS[kind]
+        stats = {"pages": 0, "upserted": 0, "removed": 0, "full": full}
+        newest = watermark
+        for page in iter_pages(getattr(client, method), collection):
+            stats["pages"] += 1
+            rows = []
+            caught_up = False
+            for resource in page:
+                created_at = resource.get("created_at")
+                if (
+                    not full
+                    and resource["crn"] in known
+                    and (watermark is None or (created_at or "") <= watermark)
+                ):
+                    caught_up = True
+                    break
+                rows.append(_row(region, kind, resource, started))
+                if created_at and (newest is None or created_at > newest):
+                    newest = created_at
+            with self._lock, self._db:
+                self._db.executemany(UPSERT, rows)
+            stats["upserted"] += len(rows)
+            if caught_up:
+                break
+
+        with self._lock, self._db:
+            if full:
+                stats["removed"] = self._db.execute(
+                    "DELETE FROM resources WHERE region = ? AND kind = ? AND seen_at < ?",
+                    (region, kind, started),
+                ).rowcount
+            self._db.execute(
+                """
+                INSERT INTO sync_state (region, kind, watermark, synced_at, full_synced_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (region, kind) DO UPDATE SET
+                    watermark = excluded.watermark,
+                    synced_at = excluded.synced_at,
+                    full_synced_at = COALESCE(excluded.full_synced_at, full_synced_at)
+                """,
+                (region, kind, newest, started, started if full else None),
+            )
+        return stats
+
+    def sync(self, client, region, kinds=None, full=False):
+        """
+        Syncs every indexed kind in a region, listing the kinds concurrently.
+
+        Args:
+            client (VpcV1): An instance of the VpcV1 service for the region.
+            region (str): The region the client targets.
+            kinds (list): Kinds to sync; defaults to all of them.
+            full (bool): Force a full sync.
+
+        Returns:
+            dict: Kind mapped to the stats returned by `sync_kind`.
+        """
+        kinds = list(kinds or INVENTORY_COLLECTIONS)
+        with ThreadPoolExecutor(max_workers=len(kinds)) as executor:
+            stats = executor.map(
+                lambda kind: self.sync_kind(client, region, kind, full), kinds
+            )
+            return dict(zip(kinds, stats))
+
+    def find(self, region, kind, name):
+        """
+        Returns the indexed resource with a given name.
+
+        Args:
+            region (str): The region.
+            kind (str): The resource kind.
+            name (str): The resource name.
+
+        Returns:
+            dict: The full resource as last listed, or None.
+        """
+        rows = self._query(
+            "SELECT data FROM resources WHERE region = ? AND kind = ? AND name = ?",
+            (region, kind, name),
+        )
+        return json.loads(rows[0]["data"]) if rows else None
+
+    def labs(self, prefix="", region=None):
+        """
+        Lists the labs whose prefix starts with `prefix`, with their resource counts.
+
+        A lab is a VPC named `{prefix}-vpc`; its resources are everything indexed
+        in that VPC.
+
+        Args:
+            prefix (str): Prefix filter; empty for all labs.
+            region (str): Region filter; None for all regions.
+
+        Returns:
+            list: Dicts with the lab prefix, region, VPC ID and a count per kind.
+        """
+        pattern = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        vpcs = self._query(
+            """
+            SELECT region, id, substr(name, 1, length(name) - 4) AS prefix
+            FROM resources
+            WHERE kind = 'vpc' AND name LIKE ? ESCAPE '\\' AND name LIKE '%-vpc'
+                AND (? IS NULL OR region = ?)
+            ORDER BY region, name
+            """,
+            (pattern + "%", region, region),
+        )
+        counts = {}
+        for row in self._query(
+            """
+            SELECT vpc_id, kind, count(*) AS n FROM resources
+            WHERE kind != 'vpc' AND vpc_id IS NOT NULL GROUP BY vpc_id, kind
+            """
+        ):
+            counts.setdefault(row["vpc_id"], {})[row["kind"]] = row["n"]
+        return [
+            {
+                "prefix": vpc["prefix"],
+                "region": vpc["region"],
+                "vpc_id": vpc["id"],
+                "counts": counts.get(vpc["id"], {}),
+            }
+            for vpc in vpcs
+        ]
+
+    def instances_without_tailscale_sg(self, region=None):
+        """
+        Lists instances none of whose network interfaces is a target of a lab
+        security group (one named `{prefix}-security-group`).
+
+        Args:
+            region (str): Region filter; None for all regions.
+
+        Returns:
+            list: Dicts with the region, ID, name and VPC ID of each instance.
+        """
+        return self._query(
+            """
+            SELECT i.region, i.id, i.name, i.vpc_id FROM resources i
+            WHERE i.kind = 'instance' AND (? IS NULL OR i.region = ?)
+                AND NOT EXISTS (
+                    SELECT 1
+                    FROM resources sg, json_each(sg.data, '$.targets') target,
+                        json_each(i.data, '$.network_interfaces') nic
+                    WHERE sg.kind = 'security_group'
+                        AND sg.vpc_id = i.vpc_id
+                        AND sg.name LIKE '%-security-group'
+                        AND json_extract(target.value, '$.id')
+                            = json_extract(nic.value, '$.id')
+                )
+            ORDER BY i.region, i.name
+            """,
+            (region, region),
+        )
+
+    def subnets_per_zone(self, region=None):
+        """
+        Counts subnets per zone.
+
+        Args:
+            region (str): Region filter; None for all regions.
+
+        Returns:
+            dict: Zone name mapped to the number of subnets in it.
+        """
+        rows = self._query(
+            """
+            SELECT zone, count(*) AS n FROM resources
+            WHERE kind = 'subnet' AND (? IS NULL OR region = ?)
+            GROUP BY zone ORDER BY zone
+            """,
+            (region, region),
+        )
+        return {row["zone"]: row["n"] for row in rows}
+
+    def snapshot(self, region):
+        """
+        Returns the indexed resources of a region in the shape of a plan snapshot.
+
+        Args:
+            region (str): The region.
+
+        Returns:
+            dict: The region, the time of its oldest sync and the compacted
+                resources of each kind, as produced by `plan.take_snapshot`.
+        """
+        resources = {kind: [] for kind in INVENTORY_COLLECTIONS}
+        for row in self._query(
+            """
+            SELECT kind, id, name, status, vpc_id,
+                json_extract(data, '$.vcpu.count') AS vcpu
+            FROM resources WHERE region = ?
+            """,
+            (region,),
+        ):
+            entry = {"id": row["id"], "name": row["name"], "status": row["status"]}
+            if row["vpc_id"] and row["kind"] != "vpc":
+                entry["vpc_id"] = row["vpc_id"]
+            if row["kind"] == "instance":
+                entry["vcpu"] = row["vcpu"] or 0
+            resources[row["kind"]].append(entry)
+        synced = self._query(
+            "SELECT min(synced_at) AS t FROM sync_state WHERE region = ?", (region,)
+        )
+        return {
+            "region": region,
+            "taken_at": synced[0]["t"] or 0,
+            "calls": 0,
+            "resources": resources,
+        }
+
+
+_inventories = {}
+_inventories_lock = threading.Lock()
+
+
+def open_inventory(account_id):
+    """
+    Returns the process-wide Inventory for an account, opening it on first use.
+
+    Args:
+        account_id (str): The IBM Cloud account ID.
+
+    Returns:
+        Inventory: The shared inventory.
+    """
+    with _inventories_lock:
+        if account_id not in _inventories:
+            _inventories[account_id] = Inventory(inventory_path(account_id))
+        return _inventories[account_id]
+
+
+@click.group()
+def inventory():
+    """
+    Sync and query the local index of VPC resources.
+    """
+
+
+@inventory.command()
+@click.option(
+    "--region", "regions", multiple=True, required=True, help="Region to sync"
+)
+@click.option(
+    "--full", is_flag=True, help="List everything instead of syncing incrementally"
+)
+def sync(regions, full):
+    """
+    Bring the index up to date with one or more regions.
+    """
+    from rich.console import Console
+
+    index = open_inventory(getAccountId())
+    console = Console()
+    for region in regions:
+        stats = index.sync(vpc_client(ibmcloud_api_key(), region), region, full=full)
+        pages = sum(entry["pages"] for entry in stats.values())
+        upserted = sum(entry["upserted"] for entry in stats.values())
+        removed = sum(entry["removed"] for entry in stats.values())
+        console.print(
+            f"{region}: {pages} list calls, {upserted} updated, {removed} removed"
+        )
+
+
+@inventory.command()
+@click.option("--prefix", default="", help="Only labs whose prefix starts with this")
+@click.option("--region", help="Only labs in this region")
+def labs(prefix, region):
+    """
+    List labs and their resource counts.
+    """
+    from rich.console import Console
+    from rich.table import Table
+
+    kinds = ("public_gateway", "subnet", "security_group", "instance")
+    table = Table(title="Labs")
+    for column in ("Prefix", "Region", "VPC") + kinds:
+        table.add_column(column)
+    for lab in open_inventory(getAccountId()).labs(prefix, region):
+        counts = [str(lab["counts"].get(kind, 0)) for kind in kinds]
+        table.add_row(lab["prefix"], lab["region"], lab["vpc_id"], *counts)
+    Console().print(table)
+
+
+@inventory.command()
+@click.option("--region", help="Only instances in this region")
+def unprotected(region):
+    """
+    List instances that are not in a lab security group.
+    """
+    for instance in open_inventory(getAccountId()).instances_without_tailscale_sg(
+        region
+    ):
+        click.echo(f"{instance['region']}\t{instance['id']}\t{instance['name']}")
+
+
+@inventory.command()
+@click.option("--region", help="Only subnets in this region")
+def zones(region):
+    """
+    Count subnets per zone.
+    """
+    for zone, count in open_inventory(getAccountId()).subnets_per_zone(region).items():
+        click.echo(f"{zone}\t{count}")
+
+
+if __name__ == "__main__":
+    inventory()
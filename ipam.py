@@ -0,0 +1,273 @@
+import bisect
+import ipaddress
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import click
+
+from cache import cache_dir
+
+# Address space lab blocks are carved from. It stays clear of the 10.240.0.0/12
+# prefixes VPCs pick for themselves and of the tailnet's 100.64.0.0/10.
+DEFAULT_POOL = "10.64.0.0/10"
+
+# A lab block has one /24 address prefix for each of up to four zones; each zone
+# prefix holds a /25 frontend and a /25 backend subnet
+LAB_PREFIXLEN = 22
+ZONE_PREFIXLEN = 24
+SUBNET_PREFIXLEN = 25
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blocks (
+    lab TEXT PRIMARY KEY,
+    cidr TEXT NOT NULL UNIQUE,
+    allocated_at REAL NOT NULL
+);
+"""
+
+
+class IntervalAllocator:
+    """
+    Hands out aligned, non-overlapping IPv4 networks from a pool.
+
+    Free space is a sorted list of disjoint [start, end) address intervals.
+    Reserving a network splits the interval containing it, found by bisection,
+    and allocating takes the first aligned fit, so planning thousands of labs
+    costs one pass over a handful of intervals per lab.
+
+    Args:
+        pool (str): The pool network, e.g. "10.64.0.0/10".
+    """
+
+    def __init__(self, pool=DEFAULT_POOL):
+        network = ipaddress.ip_network(pool)
+        self._free = [
+            (int(network.network_address), int(network.broadcast_address) + 1)
+        ]
+
+    def free_addresses(self):
+        """
+        Returns the number of addresses not yet reserved.
+        """
+        return sum(end - start for start, end in self._free)
+
+    def reserve(self, cidr):
+        """
+        Takes a network out of the free space. Parts outside the pool or already
+        taken are ignored, so reserving is safe for any recorded network.
+
+        Args:
+            cidr (str): The network.
+        """
+        network = ipaddress.ip_network(cidr)
+        low, high = int(network.network_address), int(network.broadcast_address) + 1
+        index = max(bisect.bisect_right(self._free, (low, float("inf"))) - 1, 0)
+        while index < len(self._free) and self._free[index][0] < high:
+            start, end = self._free[index]
+            if end <= low:
+                index += 1
+                continue
+            remainder = [(start, low)] if start < low else []
+            remainder += [(high, end)] if high < end else []
+            self._free[index : index + 1] = remainder
+            index += len(remainder)
+
+    def allocate(self, prefixlen):
+        """
+        Takes the lowest free network of a size.
+
+        Args:
+            prefixlen (int): Prefix length of the network, e.g. 22.
+
+        Returns:
+            str: The network in CIDR notation.
+
+        Raises:
+            LookupError: If no aligned network of that size is free.
+        """
+        size = 1 << (32 - prefixlen)
+        for start, end in self._free:
+            aligned = -(-start // size) * size
+            if aligned + size <= end:
+                cidr = f"{ipaddress.IPv4Address(aligned)}/{prefixlen}"
+                self.reserve(cidr)
+                return cidr
+        raise LookupError(f"No free /{prefixlen} left in the address pool")
+
+
+def zone_plan(block, zones):
+    """
+    Splits a lab block into the address prefix and subnets of each zone.
+
+    Args:
+        block (str): The lab's block, as allocated by `AddressLedger`.
+        zones (list): Sorted zone names of the region, as from `get_zone_names`.
+
+    Returns:
+        dict: Zone mapped to {"prefix", "frontend", "backend"} CIDRs.
+
+    Raises:
+        ValueError: If the region has more zones than a block has room for.
+    """
+    prefixes = list(ipaddress.ip_network(block).subnets(new_prefix=ZONE_PREFIXLEN))
+    if len(zones) > len(prefixes):
+        raise ValueError(f"A lab block holds {len(prefixes)} zones, not {len(zones)}")
+    plan = {}
+    for zone, prefix in zip(zones, prefixes):
+        frontend, backend = prefix.subnets(new_prefix=SUBNET_PREFIXLEN)
+        plan[zone] = {
+            "prefix": str(prefix),
+            "frontend": str(frontend),
+            "backend": str(backend),
+        }
+    return plan
+
+
+def ledger_path():
+    """
+    Returns the address ledger's database file.
+
+    Returns:
+        Path: The SQLite file under the cache root's `ipam` directory.
+    """
+    return cache_dir("ipam") / "blocks.sqlite3"
+
+
+class AddressLedger:
+    """
+    The lab blocks handed out so far, kept in SQLite.
+
+    A lab keeps its block until it is released when the lab is destroyed, so
+    reruns and resumed deployments plan the same addresses, and blocks never
+    overlap across regions and processes; every lab can advertise its routes on
+    one tailnet. Allocation runs in an immediate transaction.
+
+    Args:
+        pool (str): Address space to allocate from.
+        path (Path): Database file override, mainly for testing.
+    """
+
+    def __init__(self, pool=DEFAULT_POOL, path=None):
+        self.pool = pool
+        self.path = path or ledger_path()
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            str(self.path), timeout=30, isolation_level=None, check_same_thread=False
+        )
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript(SCHEMA)
+
+    def close(self):
+        """
+        Closes the database connection.
+        """
+        with self._lock:
+            self._db.close()
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._db
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def blocks(self):
+        """
+        Returns every allocated block.
+
+        Returns:
+            dict: Lab ("region/prefix") mapped to its CIDR.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT lab, cidr FROM blocks ORDER BY cidr"
+            ).fetchall()
+        return dict(rows)
+
+    def allocate(self, labs, dry_run=False):
+        """
+        Returns the blocks of labs, allocating blocks for labs that have none.
+
+        Args:
+            labs (list): Labs as "region/prefix".
+            dry_run (bool): Return the blocks new labs would get without
+                recording them, as plan.py does.
+
+        Returns:
+            dict: Lab mapped to its CIDR.
+
+        Raises:
+            LookupError: If the pool has no room for every new lab; nothing is
+                allocated then.
+        """
+        with self._transaction() as db:
+            allocated = dict(db.execute("SELECT lab, cidr FROM blocks").fetchall())
+            allocator = IntervalAllocator(self.pool)
+            for cidr in allocated.values():
+                allocator.reserve(cidr)
+            now = time.time()
+            for lab in dict.fromkeys(labs):
+                if lab in allocated:
+                    continue
+                allocated[lab] = allocator.allocate(LAB_PREFIXLEN)
+                if dry_run:
+                    continue
+                db.execute(
+                    "INSERT INTO blocks (lab, cidr, allocated_at) VALUES (?, ?, ?)",
+                    (lab, allocated[lab], now),
+                )
+        return {lab: allocated[lab] for lab in labs}
+
+    def release(self, labs):
+        """
+        Returns the blocks of destroyed labs to the pool.
+
+        Args:
+            labs (list): Labs as "region/prefix".
+        """
+        with self._transaction() as db:
+            db.executemany("DELETE FROM blocks WHERE lab = ?", [(lab,) for lab in labs])
+
+
+@click.group()
+def ipam():
+    """
+    Show or release the address blocks planned for labs.
+    """
+
+
+@ipam.command(name="list")
+def list_blocks():
+    """
+    List the block of every lab.
+    """
+    from rich.console import Console
+    from rich.table import Table
+
+    table = Table(title="Lab address blocks")
+    for column in ("Lab", "Block"):
+        table.add_column(column)
+    for lab, cidr in AddressLedger().blocks().items():
+        table.add_row(lab, cidr)
+    Console().print(table)
+
+
+@ipam.command()
+@click.option("--region", required=True, help="IBM Cloud region")
+@click.option("--prefix", "prefixes", multiple=True, required=True, help="Lab prefix")
+def release(region, prefixes):
+    """
+    Release the blocks of labs that were deleted without destroy.py.
+    """
+    AddressLedger().release([f"{region}/{prefix}" for prefix in prefixes])
+
+
+if __name__ == "__main__":
+    ipam()
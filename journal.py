@@ -0,0 +1,139 @@
+import json
+import os
+import re
+import threading
+import time
+
+from cache import cache_dir
+
+
+def journal_path(prefix, region):
+    """
+    Returns the journal file for a lab, keyed by region and prefix.
+
+    Args:
+        prefix (str): The lab prefix.
+        region (str): The region the lab is deployed in.
+
+    Returns:
+        Path: The JSONL file under the cache root's `journals` directory.
+    """
+    safe = re.sub(r"[^A-Za-z0-9_.-]", "_", f"{region}--{prefix}")
+    return cache_dir("journals") / f"{safe}.jsonl"
+
+
+class Journal:
+    """
+    An append-only record of the steps a lab deployment has completed.
+
+    Each completed step is appended as one JSON line holding the step name, its
+    result (resource IDs or the created resource) and the results of the steps it
+    depended on. Lines are flushed and fsynced as they are written, so a crash
+    loses at most the step that was running. Replaying the file gives the latest
+    result per step; a `forget` line drops one step and a `reset` line drops all
+    of them, which keeps the file append-only while still allowing a fresh start.
+
+    Args:
+        prefix (str): The lab prefix.
+        region (str): The region the lab is deployed in.
+        path (Path): Journal file override, mainly for testing.
+    """
+
+    def __init__(self, prefix, region, path=None):
+        self.prefix = prefix
+        self.region = region
+        self.path = path or journal_path(prefix, region)
+        self._lock = threading.Lock()
+        self._steps = {}
+        for entry in self.entries():
+            self._apply(entry)
+
+    def entries(self):
+        """
+        Reads every entry in the journal.
+
+        A truncated last line, left by a crash mid-write, is ignored.
+
+        Returns:
+            list: The decoded entries, oldest first.
+        """
+        try:
+            with open(self.path) as handle:
+                lines = handle.readlines()
+        except FileNotFoundError:
+            return []
+        entries = []
+        for line in lines:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                continue
+        return entries
+
+    def _apply(self, entry):
+        if entry.get("reset"):
+            self._steps.clear()
+        elif entry.get("forget"):
+            self._steps.pop(entry["step"], None)
+        elif "step" in entry:
+            self._steps[entry["step"]] = entry
+
+    def _append(self, entry):
+        entry = dict(entry, time=time.time())
+        line = json.dumps(entry, default=str) + "\n"
+        with self._lock:
+            with open(self.path, "a") as handle:
+                handle.write(line)
+                handle.flush()
+                os.fsync(handle.fileno())
+            self._apply(json.loads(line))
+
+    def get(self, step):
+        """
+        Returns the recorded result of a step.
+
+        Args:
+            step (str): The step name.
+
+        Returns:
+            The step's result, or None if the step has not been recorded.
+        """
+        with self._lock:
+            entry = self._steps.get(step)
+        return None if entry is None else entry["result"]
+
+    def steps(self):
+        """
+        Returns the latest entry of every recorded step.
+
+        Returns:
+            dict: Step name mapped to its entry (`step`, `result`, `inputs`, `time`).
+        """
+        with self._lock:
+            return dict(self._steps)
+
+    def record(self, step, result, inputs=None):
+        """
+        Appends a completed step.
+
+        Args:
+            step (str): The step name.
+            result: The step's result; must be JSON serializable.
+            inputs (dict): Results of the steps this one depended on.
+        """
+        self._append({"step": step, "result": result, "inputs": inputs or {}})
+
+    def forget(self, step):
+        """
+        Marks a step as no longer completed, e.g. after its resource was deleted.
+
+        Args:
+            step (str): The step name.
+        """
+        self._append({"step": step, "forget": True})
+
+    def reset(self):
+        """
+        Marks every step as no longer completed, so the next run starts over.
+        """
+        self._append({"reset": True})
@@ -1,31 +1,448 @@
-import os
-from tamga import Tamga
+import threading
 import time
-from time import sleep
-import random
 import click
-from utils import *
-from rich.live import Live
-from rich.panel import Panel
-from rich.progress import Progress, SpinnerColumn, BarColumn, TextColumn
-from rich.table import Table
+from utils import (
+    INSTANCE_PROFILE,
+    MAX_ROUTERS,
+    address_prefix_exists,
+    create_address_prefix,
+    create_new_instance,
+    create_public_gateways,
+    create_rules,
+    create_subnets,
+    create_tailscale_key,
+    create_tailscale_sg_group,
+    create_vpc,
+    get_group_id_by_name,
+    get_instance_profiles,
+    get_latest_ubuntu,
+    get_ssh_key_id,
+    get_zone_names,
+    resource_exists,
+    router_layout,
+    router_name,
+    select_instance_profile,
+    tailscale_key_usable,
+    vpc_client,
+)
+from credentials import (
+    ibmcloud_api_key,
+    require_credentials,
+    tailnet_id,
+    tailscale_api_key,
+)
+from engine import ProvisioningGraph
+from events import choose_renderer, publish, render_progress
+from journal import Journal
+from ipam import AddressLedger, zone_plan
+from cache import request_refresh
+from waiters import ResourceWaiter
+from private_dns import (
+    create_dns_instance,
+    create_dns_zone,
+    dns_instance_exists,
+    dns_instance_name,
+    dns_zone_exists,
+    lab_dns_records,
+    permit_vpc,
+    register_records,
+)
+from tracing import trace_run
+from userdata import BOOT_PROFILES, DEFAULT_BOOT_PROFILE, boot_profile_parts
+
+
+class LockedTamga:
+    """
+    A Tamga JSON logger that is created on first use and can be called from
+    many threads.
+
+    Importing tamga loads its database backends, so the logger is only built
+    once something is logged. Tamga rewrites its whole JSON file on every call,
+    so calls are serialized; concurrent calls from deployment steps and fleet
+    workers would otherwise corrupt the file.
+    """
+
+    def __init__(self, **options):
+        self._options = options
+        self._logger = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            with self._lock:
+                if self._logger is None:
+                    from tamga import Tamga
+
+                    self._logger = Tamga(**self._options)
+                return getattr(self._logger, name)(*args, **kwargs)
+
+        return call
+
+
+logger = LockedTamga(logToJSON=True, logToConsole=False)
+
+
+def deploy_lab(
+    client,
+    resource_group,
+    region,
+    prefix,
+    ssh_key,
+    tailscale_tag,
+    max_workers=8,
+    wait=True,
+    waiter=None,
+    on_step=None,
+    journal=None,
+    boot_profile=DEFAULT_BOOT_PROFILE,
+    routers=1,
+    router_bandwidth=None,
+    dns_zone=None,
+    address_block=None,
+):
+    """
+    Deploys one lab (VPC, gateways, subnets, security group and Tailscale routers).
+
+    The deployment runs as a ProvisioningGraph, so independent steps overlap and
+    the instance is created as soon as its inputs are ready. With a journal, each
+    created resource is recorded as soon as it exists, and a rerun after a failure
+    verifies the recorded resources and only runs the steps that are missing.
+
+    The routers are spread over the region's zones, each in a frontend subnet of
+    its own zone, and each advertises the subnets of the zones it serves (see
+    `router_layout`). More routers add throughput, and a lost zone only takes its
+    own subnets off the tailnet.
+
+    With a DNS zone, a DNS Services instance, the zone and its link to the VPC
+    are created alongside the network and compute steps; only the records wait
+    for the routers to be created (not to boot), so the zone adds no time to the
+    deployment's longest path.
+
+    With an address block, the VPC gets one address prefix per zone and every
+    subnet an explicit CIDR from `ipam.zone_plan`. The routers' routes are then
+    known up front, so a router is launched as soon as its own frontend subnet
+    is ready rather than after every subnet it advertises exists.
+
+    Args:
+        client (VpcV1): An instance of the VpcV1 service for the region.
+        resource_group (str): Name of the resource group to deploy into.
+        region (str): The IBM Cloud region (e.g., "us-south").
+        prefix (str): Prefix for the lab's resource names.
+        ssh_key (str): Name of an existing SSH key in the region.
+        tailscale_tag (str): Tag applied to the Tailscale auth key.
+        max_workers (int): Maximum number of steps running at the same time.
+        wait (bool): Wait for gateways, subnets and the instance to become ready.
+        waiter (ResourceWaiter): Waiter to share with other labs in the region.
+        on_step (callable): Called as ``on_step(name, result)`` after each step.
+        journal (Journal): Journal to record created resources in and resume from.
+        boot_profile (str): User-data boot profile of the instance, a key of
+            BOOT_PROFILES.
+        routers (int): Number of Tailscale routers.
+        router_bandwidth (int): Bandwidth the router tier must reach, in Mbps.
+            Each router gets the smallest profile that carries its share;
+            without it, every router uses INSTANCE_PROFILE.
+        dns_zone (str): Private DNS zone to create for the lab, e.g.
+            "lab.internal"; records name every router and subnet.
+        address_block (str): The lab's CIDR block from `ipam.AddressLedger`;
+            without it, the VPC picks the subnet CIDRs. Ignored when resuming a
+            lab whose VPC was created without one.
+
+    Returns:
+        dict: The result of every step, keyed by step name.
+
+    Raises:
+        ProvisioningError: If any step fails.
+    """
+    waiter = waiter or ResourceWaiter(client)
+    lab = f"{region}/{prefix}"
+    if address_block and journal is not None and journal.get("vpc") is not None:
+        if not any(step.startswith("address_prefix:") for step in journal.steps()):
+            logger.info(f"{lab} was created with VPC-picked CIDRs; keeping them")
+            address_block = None
+    graph = ProvisioningGraph(
+        max_workers=max_workers,
+        on_complete=on_step,
+        journal=journal,
+        name=lab,
+    )
+
+    def exists(kind, key=None):
+        return lambda result: resource_exists(
+            client, kind, result[key] if key else result
+        )
 
-logger = Tamga(logToJSON=True, logToConsole=False)
+    def new_tailscale_key(r):
+        key = create_tailscale_key(
+            tailscale_api_key(), tailnet_id(), tailscale_tag, reusable=routers > 1
+        )
+        fields = {field: key.get(field) for field in ("id", "key", "expires")}
+        return dict(fields, reusable=routers > 1)
+
+    # A single-use key is spent once a router has joined with it, and a tier of
+    # routers needs a key every router can use
+    def reusable_tailscale_key(key):
+        if not tailscale_key_usable(key):
+            return False
+        if key.get("reusable"):
+            return True
+        return routers == 1 and journal.get("instance") is None
+
+    def instance_step(index):
+        return "instance" if index == 0 else f"instance:{index}"
+
+    # The waiter may be shared with other labs; only this lab's timings are reported
+    waited = []
+
+    def wait(kind, resource_id, vpc_id=None):
+        waited.append((kind, resource_id))
+        return waiter.wait(kind, resource_id, vpc_id)
+
+    # Lookups and the Tailscale key have no dependencies and start immediately
+    graph.add("resource_group", lambda r: get_group_id_by_name(resource_group))
+    graph.add("tailscale_key", new_tailscale_key, verify=reusable_tailscale_key)
+    graph.add("ssh_key", lambda r: get_ssh_key_id(client, ssh_key))
+    graph.add("image", lambda r: get_latest_ubuntu(client))
+    if router_bandwidth:
+        # The target is for the whole tier; every router carries its share
+        graph.add(
+            "router_profile",
+            lambda r: select_instance_profile(
+                get_instance_profiles(client, region), -(-router_bandwidth // routers)
+            ),
+        )
+    graph.add(
+        "vpc",
+        lambda r: create_vpc(
+            client,
+            r["resource_group"],
+            prefix,
+            **({"address_prefix_management": "manual"} if address_block else {}),
+        )["id"],
+        requires=["resource_group"],
+        verify=exists("vpc"),
+    )
+    graph.add(
+        "security_group",
+        lambda r: create_tailscale_sg_group(
+            client, r["vpc"], r["resource_group"], prefix
+        )["id"],
+        requires=["vpc"],
+        verify=exists("security_group"),
+    )
+
+    if dns_zone:
+        graph.add(
+            "dns_instance",
+            lambda r: create_dns_instance(
+                r["resource_group"], dns_instance_name(prefix, region)
+            ),
+            requires=["resource_group"],
+            verify=dns_instance_exists,
+        )
+        graph.add(
+            "dns_zone",
+            lambda r: create_dns_zone(r["dns_instance"]["guid"], dns_zone, prefix),
+            requires=["dns_instance"],
+            verify=dns_zone_exists,
+        )
+        graph.add(
+            "dns_permitted_network",
+            lambda r: permit_vpc(
+                r["dns_zone"], client.get_vpc(id=r["vpc"]).get_result()["crn"]
+            ),
+            requires=["dns_zone", "vpc"],
+        )
+
+    def launch_router(r, index, zone, served, frontend, plan):
+        frontend_subnet = r[frontend]
+        # Each router advertises its own frontend subnet and the backend subnets
+        # of the zones it serves
+        if plan:
+            routes = [plan[zone]["frontend"]] + [plan[z]["backend"] for z in served]
+        else:
+            routes = [frontend_subnet["ipv4_cidr_block"]] + [
+                r[f"backend_subnet:{served_zone}"]["ipv4_cidr_block"]
+                for served_zone in served
+            ]
+        logger.info(f"subnet_id in {zone} is: {frontend_subnet['id']}")
+        logger.info(f"Routes advertised by {router_name(prefix, index)}: {routes}")
+        logger.info(f"Ubuntu Image ID: {r['image']}")
+        return create_new_instance(
+            client,
+            prefix,
+            r["security_group"],
+            r["resource_group"],
+            r["vpc"],
+            zone,
+            r["image"],
+            r["ssh_key"],
+            frontend_subnet["id"],
+            r["tailscale_key"]["key"],
+            list(dict.fromkeys(routes)),
+            user_data_parts=boot_profile_parts(boot_profile),
+            profile=r.get("router_profile", INSTANCE_PROFILE),
+            index=index,
+        ).get_result()
+
+    def add_zone_steps(r):
+        regional_zones = get_zone_names(client, region)
+        layout = router_layout(regional_zones, routers)
+        plan = zone_plan(address_block, regional_zones) if address_block else {}
+
+        # The first zone keeps the step names a lab with one router always had
+        def frontend_step(zone):
+            if zone == regional_zones[0]:
+                return "frontend_subnet"
+            return f"frontend_subnet:{zone}"
+
+        for zone in regional_zones:
+            # Subnets with a planned CIDR need their zone's address prefix
+            prefix_step = []
+            if plan:
+                prefix_step = [f"address_prefix:{zone}"]
+                graph.add(
+                    f"address_prefix:{zone}",
+                    lambda r, zone=zone: create_address_prefix(
+                        client, r["vpc"], zone, plan[zone]["prefix"], prefix
+                    ),
+                    requires=["vpc"],
+                    verify=lambda result: address_prefix_exists(client, result),
+                )
+            graph.add(
+                f"pgw:{zone}",
+                lambda r, zone=zone: create_public_gateways(
+                    client, r["vpc"], zone, r["resource_group"], prefix
+                )["id"],
+                requires=["vpc"],
+                verify=exists("public_gateway"),
+            )
+            if wait:
+                graph.add(
+                    f"pgw_ready:{zone}",
+                    lambda r, zone=zone: wait("public_gateway", r[f"pgw:{zone}"]),
+                    requires=[f"pgw:{zone}"],
+                )
+            # Only zones that host a router get a frontend subnet
+            if zone in {router_zone for router_zone, _ in layout}:
+                frontend = frontend_step(zone)
+                graph.add(
+                    frontend,
+                    lambda r, zone=zone: create_subnets(
+                        client,
+                        r[f"pgw:{zone}"],
+                        r["resource_group"],
+                        r["vpc"],
+                        zone,
+                        f"{prefix}-frontend",
+                        **({"ipv4_cidr_block": plan[zone]["frontend"]} if plan else {}),
+                    ),
+                    requires=[f"pgw:{zone}"] + prefix_step,
+                    verify=exists("subnet", "id"),
+                )
+                # The instance can only be placed in an available subnet
+                graph.add(
+                    f"{frontend}_ready",
+                    lambda r, frontend=frontend: wait(
+                        "subnet", r[frontend]["id"], r["vpc"]
+                    ),
+                    requires=[frontend],
+                )
+            graph.add(
+                f"backend_subnet:{zone}",
+                lambda r, zone=zone: create_subnets(
+                    client,
+                    None,
+                    r["resource_group"],
+                    r["vpc"],
+                    zone,
+                    f"{prefix}-backend",
+                    **({"ipv4_cidr_block": plan[zone]["backend"]} if plan else {}),
+                ),
+                requires=["vpc"] + prefix_step,
+                verify=exists("subnet", "id"),
+            )
+            if wait:
+                graph.add(
+                    f"backend_subnet_ready:{zone}",
+                    lambda r, zone=zone: wait(
+                        "subnet", r[f"backend_subnet:{zone}"]["id"], r["vpc"]
+                    ),
+                    requires=[f"backend_subnet:{zone}"],
+                )
 
+        for index, (zone, served) in enumerate(layout):
+            frontend = frontend_step(zone)
+            step = instance_step(index)
+            graph.add(
+                step,
+                lambda r, index=index, zone=zone, served=served, frontend=frontend: (
+                    launch_router(r, index, zone, served, frontend, plan)
+                ),
+                requires=[
+                    f"{frontend}_ready",
+                    "security_group",
+                    "image",
+                    "ssh_key",
+                    "tailscale_key",
+                ]
+                # Without a plan, the routes are only known once the subnets exist
+                + ([] if plan else [f"backend_subnet:{z}" for z in served])
+                + (["router_profile"] if router_bandwidth else []),
+                verify=exists("instance", "id"),
+            )
+            if wait:
+                graph.add(
+                    f"instance_ready:{index}" if index else "instance_ready",
+                    lambda r, step=step: wait("instance", r[step]["id"], r["vpc"]),
+                    requires=[step],
+                )
 
-tailscale_api_key = os.getenv("TAILSCALE_API_KEY")
-if not tailscale_api_key:
-    logger.error("TAILSCALE_API_KEY is not set")
-    exit(1)
+        if dns_zone:
+            router_steps = [instance_step(index) for index in range(len(layout))]
+            subnet_steps = [
+                frontend_step(zone)
+                for zone in dict.fromkeys(zone for zone, _ in layout)
+            ] + [f"backend_subnet:{zone}" for zone in regional_zones]
+            # One reconciling pass registers every record once the routers have
+            # addresses, while they are still booting
+            graph.add(
+                "dns_records",
+                lambda r: register_records(
+                    r["dns_zone"],
+                    lab_dns_records(
+                        [r[step] for step in router_steps],
+                        [r[step] for step in subnet_steps],
+                    ),
+                ),
+                requires=["dns_zone"] + router_steps + subnet_steps,
+            )
+        return regional_zones
 
-tailnet_id = os.getenv("TAILNET_ID")
-if not tailnet_id:
-    logger.error("TAILNET_ID is not set")
-    exit(1)
+    graph.add("zones", add_zone_steps)
 
-ibmcloud_api_key = os.environ.get("IBMCLOUD_API_KEY")
-if not ibmcloud_api_key:
-    logger.error("IBMCLOUD_API_KEY environment variable not found")
+    publish("lab_started", lab=lab)
+    started = time.monotonic()
+    try:
+        results = graph.run()
+    except Exception as e:
+        waiter.pop_ready_times(waited)
+        elapsed = round(time.monotonic() - started, 1)
+        publish("lab_finished", lab=lab, state="failed", error=str(e), elapsed=elapsed)
+        raise
+    if graph.reused:
+        logger.info(f"Resumed {prefix}: reused {', '.join(sorted(graph.reused))}")
+    instance_id = results["instance"]["id"]
+    logger.info(f"New Instance ID: {instance_id}")
+    for (kind, resource_id), elapsed in waiter.pop_ready_times(waited).items():
+        logger.info(f"Time to ready for {kind} {resource_id}: {elapsed:.1f}s")
+    publish(
+        "lab_finished",
+        lab=lab,
+        state="succeeded",
+        instance_id=instance_id,
+        elapsed=round(time.monotonic() - started, 1),
+    )
+    return results
 
 
 @click.command()
@@ -54,131 +471,140 @@ if not ibmcloud_api_key:
     prompt="Name of an existing SSH key in the region.",
     help="VPC SSH key name",
 )
-# @click.option(
-#     "--dns-zone",
-#     prompt="Name of the Private DNS zone to create",
-#     help="DNS Zone name",
-# )
-# ssh_key, dns_zone
-def main(resource_group, region, prefix, ssh_key, tailscale_tag):
-    job_progress = Progress(
-        "{task.description}",
-        SpinnerColumn(),
-        BarColumn(),
-        TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
-    )
-    job1 = job_progress.add_task(
-        f"[green]Starting VPC deployment in the {region} region", total=2
-    )
-    job2 = job_progress.add_task("[green]Creating Public Gateways", total=1)
-    job3 = job_progress.add_task("[green]Creating front and backend subnets", total=2)
-    job4 = job_progress.add_task("[blue]Creating Tailscale Security Group", total=2)
-    job5 = job_progress.add_task("[blue]Creating Tailscale device token", total=1)
-    job6 = job_progress.add_task("[blue]Creating Tailscale VPC compute instance", total=3)
-
-
-    total = sum(task.total for task in job_progress.tasks)
-    overall_progress = Progress()
-    overall_task = overall_progress.add_task("All Jobs", total=int(total))
-
-    progress_table = Table.grid()
-    progress_table.add_row(
-        Panel.fit(
-            overall_progress,
-            title="Overall Progress",
-            border_style="green",
-            padding=(2, 2),
-        ),
-        Panel.fit(job_progress, title="[b]Jobs", border_style="red", padding=(1, 2)),
-    )
-
-    with Live(progress_table, refresh_per_second=10):
-        # Job 1 - create vpc client, retrieve resource group id, create vpc in the region
-        client = vpc_client(ibmcloud_api_key, region)
-        resource_group_id = get_group_id_by_name(resource_group)
-        job_progress.update(job1, advance=1)
-        response = create_vpc(client, resource_group_id, prefix)
-        vpc_id = response["id"]
-        job_progress.update(job1, advance=1)
-
-        # Job 2 = create public gateways and subnets
-        regional_zones = []
-        zones = client.list_region_zones(region).get_result()["zones"]
-        for zone in zones:
-            regional_zones.append(zone["name"])
-        job_progress.update(job2, advance=1)
-
-        all_frontend_subnets = []
-        all_backend_subnets = []
-
-        for i, zone in enumerate(regional_zones):
-            pgw_response = create_public_gateways(
-                client, vpc_id, zone, resource_group_id, prefix
-            )
-            pg_id = pgw_response["id"]
-            if i == 0:  # Only create frontend subnet in the first zone
-                frontend_subnet = create_subnets(
-                    client, pg_id, resource_group_id, vpc_id, zone, f"{prefix}-frontend"
-                )
-                all_frontend_subnets.append(frontend_subnet["id"])
-                all_frontend_subnets.append(frontend_subnet["ipv4_cidr_block"])
-                job_progress.update(job3, advance=1)
-            backend_subnet = create_subnets(
-                client, None, resource_group_id, vpc_id, zone, f"{prefix}-backend"
-            )
-
-            all_backend_subnets.append(backend_subnet["id"])
-            job_progress.update(job3, advance=1)
+@click.option(
+    "--dns-zone",
+    help="Private DNS zone to create for the lab, e.g. lab.internal",
+)
+@click.option(
+    "--ipam/--no-ipam",
+    default=True,
+    show_default=True,
+    help="Plan the lab's CIDRs from the local address ledger, not by the VPC",
+)
+@click.option(
+    "--max-workers",
+    default=8,
+    show_default=True,
+    help="Maximum number of provisioning steps to run concurrently",
+)
+@click.option(
+    "--refresh-cache",
+    is_flag=True,
+    help="Ignore cached lookups (resource groups, SSH keys, zones) and list them again",
+)
+@click.option(
+    "--wait/--no-wait",
+    default=True,
+    show_default=True,
+    help="Wait for the gateways, subnets and instance to become ready",
+)
+@click.option(
+    "--resume/--no-resume",
+    default=True,
+    show_default=True,
+    help="Reuse resources recorded by an earlier run with the same prefix and region",
+)
+@click.option(
+    "--boot-profile",
+    type=click.Choice(sorted(BOOT_PROFILES)),
+    default=DEFAULT_BOOT_PROFILE,
+    show_default=True,
+    help="User-data profile; 'minimal' brings Tailscale up before upgrading packages",
+)
+@click.option(
+    "--routers",
+    type=click.IntRange(1, MAX_ROUTERS),
+    default=1,
+    show_default=True,
+    help="Tailscale subnet routers per lab, spread across the region's zones",
+)
+@click.option(
+    "--router-bandwidth",
+    type=click.IntRange(1),
+    help="Bandwidth the routers must reach together, in Mbps; sizes their profile",
+)
+@click.option(
+    "--trace",
+    is_flag=True,
+    help="Record every API call and step to a Chrome trace under the cache root",
+)
+@click.option(
+    "--record",
+    type=click.Path(dir_okay=False),
+    help="Record every HTTP request, scrubbed and timed, to a cassette file",
+)
+@click.option(
+    "--replay",
+    type=click.Path(exists=True, dir_okay=False),
+    help="Answer every HTTP request from a recorded cassette, offline",
+)
+@click.option(
+    "--replay-scale",
+    default=1.0,
+    show_default=True,
+    help="Multiply the recorded latencies when replaying; 0 replays without delays",
+)
+@click.option(
+    "--progress",
+    type=click.Choice(["auto", "live", "json"]),
+    default="auto",
+    show_default=True,
+    help="Progress output: a live view, JSON lines, or the live view only on a terminal",
+)
+def main(
+    resource_group,
+    region,
+    prefix,
+    ssh_key,
+    tailscale_tag,
+    dns_zone,
+    ipam,
+    max_workers,
+    refresh_cache,
+    wait,
+    resume,
+    boot_profile,
+    routers,
+    router_bandwidth,
+    trace,
+    record,
+    replay,
+    replay_scale,
+    progress,
+):
+    from cassette import cassette_options, use_cassette
 
-        first_subnet_zone = f"{region}-1"
+    require_credentials("IBMCLOUD_API_KEY", "TAILSCALE_API_KEY", "TAILNET_ID")
+    cassette_path, cassette_mode = cassette_options(record, replay)
+    # Cached lookups would skip the calls a cassette needs to record or replay
+    if refresh_cache or cassette_path:
+        request_refresh()
+    journal = Journal(prefix, region)
+    if not resume:
+        journal.reset()
+    lab = f"{region}/{prefix}"
+    address_block = AddressLedger().allocate([lab])[lab] if ipam else None
 
-        # job 4 create secrutiy group
-        ts_group_resonse = create_tailscale_sg_group(
-            client, vpc_id, resource_group_id, prefix
-        )
-        job_progress.update(job4, advance=1)
-        sg_id = ts_group_resonse["id"]
-        update_rules = create_rules(client, sg_id)
-        job_progress.update(job4, advance=1)
-        generate_device_token = create_tailscale_key(
-            tailscale_api_key, tailnet_id, tailscale_tag
-        )
-        tailscale_device_token = generate_device_token["key"]
-        ssh_key_id = get_ssh_key_id(client, ssh_key)
-
-        job_progress.update(job5, advance=1)
-        first_subnet_id = all_frontend_subnets[0]
-        first_subnet_cidr = all_frontend_subnets[1]
-        first_subnet_zone = f"{region}-1"
-        logger.info(f"subnet_id in {first_subnet_zone} is: {first_subnet_id}")
-        logger.info(f"subnet_cidr in is: {first_subnet_cidr}")
-
-        job_progress.update(job6, advance=1)
-        image_id = get_latest_ubuntu(client)
-        logger.info(f"Ubuntu Image ID: {image_id}")
-        job_progress.update(job6, advance=1)
-
-        new_instance = create_new_instance(
+    with use_cassette(
+        cassette_path, cassette_mode, replay_scale, enabled=bool(cassette_path)
+    ), trace_run(prefix, enabled=trace), render_progress(choose_renderer(progress)):
+        client = vpc_client(ibmcloud_api_key(), region)
+        deploy_lab(
             client,
+            resource_group,
+            region,
             prefix,
-            sg_id,
-            resource_group_id,
-            vpc_id,
-            first_subnet_zone,
-            image_id,
-            ssh_key_id,
-            first_subnet_id,
-            tailscale_device_token,
-            first_subnet_cidr
+            ssh_key,
+            tailscale_tag,
+            max_workers=max_workers,
+            wait=wait,
+            journal=journal,
+            boot_profile=boot_profile,
+            routers=routers,
+            router_bandwidth=router_bandwidth,
+            dns_zone=dns_zone,
+            address_block=address_block,
         )
-        job_progress.update(job6, advance=1)
-        instance_id = new_instance.get_result()["id"]
-        logger.info(f"New Instance ID: {instance_id}")
-        completed = sum(task.completed for task in job_progress.tasks)
-        overall_progress.update(overall_task, completed=completed)
-
-        while not overall_progress.finished:
-            sleep(0.1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,54 @@
+from urllib.parse import parse_qs, urlsplit
+
+
+def get_query_param(url, name):
+    """
+    Returns the first value of a query parameter in a URL, or None.
+    """
+    values = parse_qs(urlsplit(url).query).get(name)
+    return values[0] if values else None
+
+
+def iter_pages(list_method, collection, page_size=100, **params):
+    """
+    Lazily yields pages of a VPC collection, following its `next` links.
+
+    Only as many pages as the caller consumes are requested.
+
+    Args:
+        list_method (callable): A list method such as `vpc_client.list_subnets`.
+        collection (str): Key of the resource list in each page, e.g. "subnets".
+        page_size (int): Number of resources to request per page.
+        **params: Filters passed to every `list_method` call.
+
+    Yields:
+        list: The resources on each page.
+
+    Raises:
+        ApiException: If there is an error while calling the IBM Cloud API.
+    """
+    start = None
+    while True:
+        result = list_method(start=start, limit=page_size, **params).get_result()
+        yield result.get(collection, [])
+        next_link = result.get("next")
+        start = get_query_param(next_link["href"], "start") if next_link else None
+        if not start:
+            return
+
+
+def list_all(list_method, collection, page_size=100, **params):
+    """
+    Yields every resource of a VPC collection across all pages.
+
+    Args:
+        list_method (callable): A list method such as `vpc_client.list_subnets`.
+        collection (str): Key of the resource list in each page, e.g. "subnets".
+        page_size (int): Number of resources to request per page.
+        **params: Filters passed to every `list_method` call.
+
+    Yields:
+        dict: Each resource in the collection.
+    """
+    for page in iter_pages(list_method, collection, page_size, **params):
+        yield from page
@@ -0,0 +1,566 @@
+import json
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+
+from credentials import ibmcloud_api_key
+from fleet import expand_prefixes, assign_regions
+from utils import (
+    vpc_client,
+    getAccountId,
+    get_group_id_by_name,
+    get_instance_profiles,
+    get_zone_names,
+    lab_resource_names,
+    select_instance_profile,
+    tailscale_key_usable,
+    INSTANCE_PROFILE,
+    MAX_ROUTERS,
+)
+from cache import cache_dir, atomic_write
+from journal import Journal
+from ipam import AddressLedger, zone_plan
+from inventory import open_inventory
+from pagination import iter_pages
+from private_dns import dns_instance_name
+from waiters import COLLECTIONS
+
+# kind -> (list method, collection key) for everything a plan looks at
+SNAPSHOT_COLLECTIONS = {
+    kind: COLLECTIONS[kind][:2]
+    for kind in ("vpc", "subnet", "public_gateway", "security_group", "instance")
+}
+SNAPSHOT_COLLECTIONS["key"] = ("list_keys", "keys")
+
+# Default per-region account quotas; override with --quota
+DEFAULT_QUOTAS = {
+    "vpc": 10,
+    "vcpu": 200,
+}
+
+# Resource names are unique per region for these kinds and per VPC for the rest
+REGION_SCOPED = {"vpc", "instance"}
+
+
+def profile_vcpus(profile):
+    """
+    Returns the vCPU count encoded in an instance profile name.
+
+    Args:
+        profile (str): A profile name such as "bx2-2x8".
+
+    Returns:
+        int: The number of vCPUs, e.g. 2.
+    """
+    return int(re.search(r"-(\d+)x", profile).group(1))
+
+
+def _compact(kind, resource):
+    entry = {
+        "id": resource["id"],
+        "name": resource["name"],
+        "status": resource.get("status") or resource.get("lifecycle_state"),
+    }
+    if "vpc" in resource:
+        entry["vpc_id"] = resource["vpc"]["id"]
+    if kind == "instance":
+        entry["vcpu"] = (resource.get("vcpu") or {}).get("count", 0)
+    return entry
+
+
+def take_snapshot(client, region):
+    """
+    Lists everything a plan needs from a region, one collection at a time.
+
+    All collections are listed concurrently and only the fields a plan uses are
+    kept, so the snapshot stays small enough to cache for large accounts.
+
+    Args:
+        client (VpcV1): An instance of the VpcV1 service for the region.
+        region (str): The region the client targets.
+
+    Returns:
+        dict: The region, the time it was taken, the number of list calls made
+            and the compacted resources of each kind.
+
+    Raises:
+        ApiException: If there is an error while calling the IBM Cloud API.
+    """
+
+    def list_kind(kind):
+        method, collection = SNAPSHOT_COLLECTIONS[kind]
+        pages = list(iter_pages(getattr(client, method), collection))
+        return [_compact(kind, r) for page in pages for r in page], len(pages)
+
+    kinds = list(SNAPSHOT_COLLECTIONS)
+    with ThreadPoolExecutor(max_workers=len(kinds)) as executor:
+        listed = dict(zip(kinds, executor.map(list_kind, kinds)))
+    return {
+        "region": region,
+        "taken_at": time.time(),
+        "calls": sum(calls for _, calls in listed.values()),
+        "resources": {kind: resources for kind, (resources, _) in listed.items()},
+    }
+
+
+def load_snapshot(client, region, max_age=300):
+    """
+    Returns a region snapshot, reusing the cached one if it is recent enough.
+
+    Args:
+        client (VpcV1): An instance of the VpcV1 service for the region.
+        region (str): The region the client targets.
+        max_age (float): Seconds a cached snapshot stays usable; 0 always lists.
+
+    Returns:
+        dict: The snapshot, as from `take_snapshot`. A cached snapshot reports
+            zero calls.
+    """
+    path = cache_dir("snapshots", getAccountId()) / f"{region}.json"
+    try:
+        snapshot = json.loads(path.read_text())
+        if time.time() - snapshot["taken_at"] < max_age:
+            return dict(snapshot, calls=0)
+    except (OSError, ValueError, KeyError):
+        pass
+    snapshot = take_snapshot(client, region)
+    atomic_write(path, json.dumps(snapshot).encode())
+    return snapshot
+
+
+def _journaled_ids(journal):
+    ids = set()
+    for entry in journal.steps().values():
+        result = entry["result"]
+        ids.add(result.get("id") if isinstance(result, dict) else result)
+    return ids
+
+
+def plan_lab(
+    snapshot,
+    prefix,
+    zones,
+    ssh_key,
+    journal,
+    routers=1,
+    dns_zone=None,
+    address_block=None,
+):
+    """
+    Evaluates the deploy flow for one lab against a region snapshot.
+
+    Every resource `deploy_lab` would create is classified as created, reused
+    (it exists and is recorded in the lab's journal, so a resumed run keeps it)
+    or conflicting (a resource with the same name exists but is not the lab's).
+
+    Args:
+        snapshot (dict): The region snapshot.
+        prefix (str): The lab prefix.
+        zones (list): Sorted zone names of the region.
+        ssh_key (str): Name of the SSH key the instance uses.
+        journal (Journal): The lab's journal.
+        routers (int): Number of Tailscale routers in the lab.
+        dns_zone (str): Private DNS zone the lab gets, if any. DNS Services
+            resources are not in the snapshot, so they are classified from the
+            journal.
+        address_block (str): The lab's block from the address ledger, if its
+            CIDRs are planned; adds one address prefix per zone.
+
+    Returns:
+        dict: The prefix and region plus `create`, `reuse`, `conflicts` and
+            `errors` lists of human-readable entries.
+    """
+    resources = snapshot["resources"]
+    by_name = {}
+    for kind, items in resources.items():
+        for resource in items:
+            by_name.setdefault((kind, resource["name"]), []).append(resource)
+    journaled = _journaled_ids(journal)
+    plan = {
+        "prefix": prefix,
+        "region": snapshot["region"],
+        "create": [],
+        "reuse": [],
+        "conflicts": [],
+        "errors": [],
+    }
+
+    vpcs = by_name.get(("vpc", f"{prefix}-vpc"), [])
+    vpc_id = vpcs[0]["id"] if vpcs else None
+    names = lab_resource_names(prefix, zones, routers)
+    for kind in ("vpc", "public_gateway", "subnet", "security_group", "instance"):
+        for name in sorted(names[kind]):
+            matches = by_name.get((kind, name), [])
+            if kind not in REGION_SCOPED:
+                matches = [m for m in matches if vpc_id and m.get("vpc_id") == vpc_id]
+            if not matches:
+                plan["create"].append(f"{kind} {name}")
+            elif matches[0]["id"] in journaled:
+                plan["reuse"].append(f"{kind} {name} ({matches[0]['id']})")
+            else:
+                plan["conflicts"].append(
+                    f"{kind} {name} already exists ({matches[0]['id']})"
+                )
+
+    key = journal.get("tailscale_key")
+    if key and tailscale_key_usable(key) and journal.get("instance") is None:
+        plan["reuse"].append(f"tailscale_key {key.get('id')}")
+    else:
+        plan["create"].append("tailscale_key")
+
+    # deploy_lab keeps VPC-picked CIDRs for a lab whose VPC was made without a block
+    steps = journal.steps()
+    if "vpc" in steps and not any(step.startswith("address_prefix:") for step in steps):
+        address_block = None
+    if address_block:
+        for zone, cidrs in zone_plan(address_block, zones).items():
+            entry = f"address_prefix {prefix}-prefix-{zone} ({cidrs['prefix']})"
+            if f"address_prefix:{zone}" in steps:
+                plan["reuse"].append(entry)
+            else:
+                plan["create"].append(entry)
+
+    if dns_zone:
+        instance = journal.get("dns_instance")
+        name = dns_instance_name(prefix, snapshot["region"])
+        if instance:
+            plan["reuse"].append(f"dns_instance {name} ({instance['guid']})")
+        else:
+            plan["create"].append(f"dns_instance {name}")
+        zone = journal.get("dns_zone")
+        if zone:
+            plan["reuse"].append(f"dns_zone {dns_zone} ({zone['id']})")
+            plan["reuse"].append(f"dns_permitted_network {prefix}-vpc")
+        else:
+            plan["create"].append(f"dns_zone {dns_zone}")
+            plan["create"].append(f"dns_permitted_network {prefix}-vpc")
+        # Registering reconciles, so only missing or changed records are sent
+        records = len(names["instance"]) + len(names["subnet"])
+        plan["create"].append(f"dns_records up to {records} in {dns_zone}")
+
+    if ("key", ssh_key) not in by_name:
+        plan["errors"].append(f"SSH key {ssh_key} not found in {snapshot['region']}")
+    return plan
+
+
+def quota_headroom(snapshot, plans, quotas=None, profile=INSTANCE_PROFILE):
+    """
+    Compares a region's usage plus the planned creates with its quotas.
+
+    Args:
+        snapshot (dict): The region snapshot.
+        plans (list): Lab plans for the region, from `plan_lab`.
+        quotas (dict): Quota overrides, merged over `DEFAULT_QUOTAS`.
+        profile (str): Instance profile of the planned routers.
+
+    Returns:
+        dict: For each quota, its limit, current use, planned use and headroom
+            left after the run (negative if the run would exceed it).
+    """
+    limits = dict(DEFAULT_QUOTAS, **(quotas or {}))
+    resources = snapshot["resources"]
+    new_instances = sum(
+        1 for plan in plans for item in plan["create"] if item.startswith("instance ")
+    )
+    usage = {
+        "vpc": (
+            len(resources["vpc"]),
+            sum(
+                1
+                for plan in plans
+                for item in plan["create"]
+                if item.startswith("vpc ")
+            ),
+        ),
+        "vcpu": (
+            sum(instance.get("vcpu", 0) for instance in resources["instance"]),
+            new_instances * profile_vcpus(profile),
+        ),
+    }
+    return {
+        name: {
+            "limit": limit,
+            "used": usage[name][0],
+            "planned": usage[name][1],
+            "headroom": limit - usage[name][0] - usage[name][1],
+        }
+        for name, limit in limits.items()
+        if name in usage
+    }
+
+
+def build_plan(
+    labs,
+    ssh_key,
+    resource_group,
+    max_age=300,
+    quotas=None,
+    use_inventory=False,
+    routers=1,
+    router_bandwidth=None,
+    dns_zone=None,
+    ipam=True,
+):
+    """
+    Plans a fleet of labs with one snapshot per region and no mutating calls.
+
+    With `use_inventory`, each region's snapshot comes from the local inventory
+    after an incremental sync, which usually needs one list call per kind.
+
+    Args:
+        labs (list): Lab status dicts from `assign_regions`.
+        ssh_key (str): SSH key name, which must exist in every target region.
+        resource_group (str): Resource group name.
+        max_age (float): Seconds a cached region snapshot stays usable.
+        quotas (dict): Quota overrides.
+        use_inventory (bool): Read the regions from the inventory index.
+        routers (int): Tailscale routers per lab.
+        router_bandwidth (int): Bandwidth each lab's routers must reach together,
+            in Mbps; picks their profile in each region as `deploy_lab` does.
+        dns_zone (str): Private DNS zone each lab gets, if any.
+        ipam (bool): Plan the address prefixes of the labs' blocks, as deploys
+            do by default. New labs are shown with the blocks they would get;
+            nothing is recorded in the ledger.
+
+    Returns:
+        dict: Per-lab plans, per-region quota headroom, the total number of list
+            calls made and any fleet-wide errors.
+    """
+    regions = sorted({lab["region"] for lab in labs})
+    clients = {region: vpc_client(ibmcloud_api_key(), region) for region in regions}
+
+    def region_inputs(region):
+        client = clients[region]
+        if use_inventory:
+            index = open_inventory(getAccountId())
+            stats = index.sync(client, region)
+            snapshot = index.snapshot(region)
+            snapshot["calls"] = sum(entry["pages"] for entry in stats.values())
+        else:
+            snapshot = load_snapshot(client, region, max_age)
+        profile = INSTANCE_PROFILE
+        if router_bandwidth:
+            profile = select_instance_profile(
+                get_instance_profiles(client, region), -(-router_bandwidth // routers)
+            )
+        return snapshot, get_zone_names(client, region), profile
+
+    with ThreadPoolExecutor(max_workers=len(regions)) as executor:
+        inputs = dict(zip(regions, executor.map(region_inputs, regions)))
+
+    errors = []
+    if get_group_id_by_name(resource_group) is None:
+        errors.append(f"Resource group {resource_group} not found")
+
+    blocks = {}
+    if ipam:
+        names = [f"{lab['region']}/{lab['prefix']}" for lab in labs]
+        blocks = AddressLedger().allocate(names, dry_run=True)
+
+    plans = [
+        plan_lab(
+            inputs[lab["region"]][0],
+            lab["prefix"],
+            inputs[lab["region"]][1],
+            ssh_key,
+            Journal(lab["prefix"], lab["region"]),
+            routers,
+            dns_zone,
+            blocks.get(f"{lab['region']}/{lab['prefix']}"),
+        )
+        for lab in labs
+    ]
+    quota = {
+        region: quota_headroom(
+            snapshot,
+            [plan for plan in plans if plan["region"] == region],
+            quotas,
+            profile,
+        )
+        for region, (snapshot, _, profile) in inputs.items()
+    }
+    return {
+        "labs": plans,
+        "quota": quota,
+        "calls": sum(snapshot["calls"] for snapshot, _, _ in inputs.values()),
+        "errors": errors,
+    }
+
+
+def plan_ok(plan):
+    """
+    Returns True if a plan has no errors, conflicts or exceeded quotas.
+    """
+    return not (
+        plan["errors"]
+        or any(lab["conflicts"] or lab["errors"] for lab in plan["labs"])
+        or any(
+            entry["headroom"] < 0
+            for region in plan["quota"].values()
+            for entry in region.values()
+        )
+    )
+
+
+def plan_table(plan):
+    """
+    Renders a fleet plan as a rich Table.
+    """
+    from rich.table import Table
+
+    table = Table(title="Deployment plan")
+    for column in ("Prefix", "Region", "Create", "Reuse", "Problems"):
+        table.add_column(column)
+    for lab in plan["labs"]:
+        problems = lab["conflicts"] + lab["errors"]
+        table.add_row(
+            lab["prefix"],
+            lab["region"],
+            str(len(lab["create"])),
+            str(len(lab["reuse"])),
+            "[red]" + "\n".join(problems) if problems else "",
+        )
+    return table
+
+
+def parse_quotas(values):
+    """
+    Parses --quota values of the form NAME=LIMIT.
+
+    Raises:
+        click.BadParameter: If a name is unknown or a limit is not a number.
+    """
+    quotas = {}
+    for value in values:
+        name, _, limit = value.partition("=")
+        if name not in DEFAULT_QUOTAS or not limit.isdigit():
+            raise click.BadParameter(
+                f"expected one of {', '.join(DEFAULT_QUOTAS)} as NAME=LIMIT, got {value}"
+            )
+        quotas[name] = int(limit)
+    return quotas
+
+
+@click.command()
+@click.option("--resource-group", required=True, help="IBM Cloud resource group")
+@click.option(
+    "--region",
+    "regions",
+    multiple=True,
+    required=True,
+    help="Target region; repeat to spread labs across regions",
+)
+@click.option(
+    "--prefix", "prefixes", multiple=True, help="Lab prefix; repeat for more labs"
+)
+@click.option(
+    "--prefix-template",
+    help="Generate prefixes from a template, e.g. 'lab{n:03d}'",
+)
+@click.option("--count", default=0, help="Number of prefixes to generate")
+@click.option("--start", default=1, show_default=True, help="First template number")
+@click.option("--ssh-key", required=True, help="VPC SSH key name in every region")
+@click.option(
+    "--snapshot-max-age",
+    default=300,
+    show_default=True,
+    help="Seconds a cached region snapshot is reused; 0 always lists again",
+)
+@click.option(
+    "--quota",
+    "quota_values",
+    multiple=True,
+    help="Override a region quota, e.g. vpc=50 or vcpu=400",
+)
+@click.option(
+    "--inventory",
+    "use_inventory",
+    is_flag=True,
+    help="Sync and read the local inventory index instead of a snapshot",
+)
+@click.option(
+    "--routers",
+    type=click.IntRange(1, MAX_ROUTERS),
+    default=1,
+    show_default=True,
+    help="Tailscale subnet routers per lab",
+)
+@click.option(
+    "--router-bandwidth",
+    type=click.IntRange(1),
+    help="Bandwidth the routers must reach together, in Mbps; sizes their profile",
+)
+@click.option("--dns-zone", help="Private DNS zone the labs get, e.g. lab.internal")
+@click.option(
+    "--ipam/--no-ipam",
+    default=True,
+    show_default=True,
+    help="Plan the address prefixes of the labs' blocks, as the deploy does",
+)
+@click.option("--json", "as_json", is_flag=True, help="Print the plan as JSON")
+def plan(
+    resource_group,
+    regions,
+    prefixes,
+    prefix_template,
+    count,
+    start,
+    ssh_key,
+    snapshot_max_age,
+    quota_values,
+    use_inventory,
+    routers,
+    router_bandwidth,
+    dns_zone,
+    ipam,
+    as_json,
+):
+    """
+    Show what a deployment would create, reuse or conflict with, without
+    changing anything.
+    """
+    from rich.console import Console
+
+    names = expand_prefixes(prefixes, prefix_template, count, start)
+    if not names:
+        raise click.UsageError("Give --prefix or --prefix-template with --count")
+    quotas = parse_quotas(quota_values)
+
+    labs = assign_regions(names, list(regions))
+    result = build_plan(
+        labs,
+        ssh_key,
+        resource_group,
+        snapshot_max_age,
+        quotas,
+        use_inventory,
+        routers,
+        router_bandwidth,
+        dns_zone,
+        ipam,
+    )
+
+    if as_json:
+        click.echo(json.dumps(result, indent=2))
+    else:
+        console = Console()
+        console.print(plan_table(result))
+        for region, quota in result["quota"].items():
+            for name, entry in quota.items():
+                style = "red" if entry["headroom"] < 0 else "green"
+                console.print(
+                    f"{region} {name}: {entry['used']} used + {entry['planned']} "
+                    f"planned of {entry['limit']} "
+                    f"([{style}]{entry['headroom']} left[/{style}])"
+                )
+        for error in result["errors"]:
+            console.print(f"[red]{error}")
+        console.print(f"Planned with {result['calls']} list calls")
+    if not plan_ok(result):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    plan()
@@ -0,0 +1,586 @@
+import json
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import click
+
+from cache import cache_dir
+from credentials import (
+    ibmcloud_api_key,
+    require_credentials,
+    tailnet_id,
+    tailscale_api_key,
+)
+from journal import Journal
+from userdata import BOOT_PROFILES, DEFAULT_BOOT_PROFILE
+
+# Member states; a member moves building -> ready -> claimed, or to failed
+MEMBER_STATES = ("building", "ready", "claimed", "failed")
+
+# Ready members older than this are retired and rebuilt from a fresh image
+DEFAULT_MAX_AGE = 24 * 3600
+
+# A member still building after this long was left behind by a crashed run
+BUILD_TIMEOUT = 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS members (
+    prefix TEXT PRIMARY KEY,
+    region TEXT NOT NULL,
+    state TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    ready_at REAL,
+    claimed_at REAL,
+    claimed_by TEXT,
+    instance_id TEXT,
+    tailscale_key TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS members_by_state ON members (region, state, ready_at);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+def pool_path(name):
+    """
+    Returns the database file of a named pool.
+
+    Args:
+        name (str): The pool name.
+
+    Returns:
+        Path: The SQLite file under the cache root's `pools` directory.
+    """
+    safe = re.sub(r"[^A-Za-z0-9_.-]", "_", name)
+    return cache_dir("pools") / f"{safe}.sqlite3"
+
+
+class WarmPool:
+    """
+    The members of a pool of pre-provisioned labs, kept in SQLite.
+
+    A member is an ordinary lab whose prefix is derived from the pool name, so
+    its resources are journaled, planned and destroyed like any other lab. The
+    database only tracks each member's state. Claims run in an immediate
+    transaction, so two claims from different processes never get the same
+    lab.
+
+    Args:
+        name (str): The pool name; members are named `{name}-{n:04d}`.
+        path (Path): Database file override, mainly for testing.
+    """
+
+    def __init__(self, name="warm", path=None):
+        self.name = name
+        self.path = path or pool_path(name)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            str(self.path), timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self._db.row_factory = sqlite3.Row
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript(SCHEMA)
+
+    def close(self):
+        """
+        Closes the database connection.
+        """
+        with self._lock:
+            self._db.close()
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._db
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def members(self, region=None, state=None):
+        """
+        Lists members, oldest first.
+
+        Args:
+            region (str): Only members in this region.
+            state (str): Only members in this state, one of MEMBER_STATES.
+
+        Returns:
+            list: One dict per member, with every column.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                """
+                SELECT * FROM members
+                WHERE (? IS NULL OR region = ?) AND (? IS NULL OR state = ?)
+                ORDER BY created_at, prefix
+                """,
+                (region, region, state, state),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def reserve(self, region):
+        """
+        Adds a member in the "building" state under a new, never reused prefix.
+
+        Args:
+            region (str): The region the member will be built in.
+
+        Returns:
+            str: The member's prefix.
+        """
+        with self._transaction() as db:
+            db.execute(
+                """
+                INSERT INTO counters (name, value) VALUES ('member', 1)
+                ON CONFLICT (name) DO UPDATE SET value = value + 1
+                """
+            )
+            (number,) = db.execute(
+                "SELECT value FROM counters WHERE name = 'member'"
+            ).fetchone()
+            prefix = f"{self.name}-{number:04d}"
+            db.execute(
+                "INSERT INTO members (prefix, region, state, created_at) VALUES (?, ?, ?, ?)",
+                (prefix, region, "building", time.time()),
+            )
+        return prefix
+
+    def update(self, prefix, **fields):
+        """
+        Sets columns of a member.
+
+        Args:
+            prefix (str): The member's prefix.
+            **fields: Column values, e.g. state="ready".
+        """
+        columns = ", ".join(f"{column} = ?" for column in fields)
+        with self._transaction() as db:
+            db.execute(
+                f"UPDATE members SET {columns} WHERE prefix = ?",
+                (*fields.values(), prefix),
+            )
+
+    def remove(self, prefix):
+        """
+        Forgets a member.
+        """
+        with self._transaction() as db:
+            db.execute("DELETE FROM members WHERE prefix = ?", (prefix,))
+
+    def take(self, region, claimed_by):
+        """
+        Marks the oldest ready member of a region as claimed.
+
+        Args:
+            region (str): The region to claim a lab in.
+            claimed_by (str): Who the lab is for.
+
+        Returns:
+            dict: The claimed member, or None if no member is ready.
+        """
+        with self._transaction() as db:
+            row = db.execute(
+                """
+                SELECT prefix FROM members WHERE region = ? AND state = 'ready'
+                ORDER BY ready_at, prefix LIMIT 1
+                """,
+                (region,),
+            ).fetchone()
+            if row is None:
+                return None
+            db.execute(
+                """
+                UPDATE members SET state = 'claimed', claimed_at = ?, claimed_by = ?
+                WHERE prefix = ?
+                """,
+                (time.time(), claimed_by, row["prefix"]),
+            )
+            member = db.execute(
+                "SELECT * FROM members WHERE prefix = ?", (row["prefix"],)
+            ).fetchone()
+        return dict(member)
+
+    def stale(self, region, max_age=DEFAULT_MAX_AGE, build_timeout=BUILD_TIMEOUT):
+        """
+        Lists the members of a region that should be torn down.
+
+        Args:
+            region (str): The region.
+            max_age (float): Seconds a ready member may wait for a claim.
+            build_timeout (float): Seconds after which a building member is
+                considered abandoned.
+
+        Returns:
+            list: Failed members, ready members older than `max_age` and
+                building members older than `build_timeout`.
+        """
+        now = time.time()
+        return [
+            member
+            for member in self.members(region)
+            if member["state"] == "failed"
+            or (member["state"] == "ready" and now - member["ready_at"] > max_age)
+            or (
+                member["state"] == "building"
+                and now - member["created_at"] > build_timeout
+            )
+        ]
+
+
+def build_members(
+    pool, regions_needed, resource_group, ssh_key, tailscale_tag, **options
+):
+    """
+    Deploys new pool members and records each one as ready or failed.
+
+    Members are deployed together as one fleet, so they share clients, waiters
+    and lookup caches exactly like a `fleet.py` run.
+
+    Args:
+        pool (WarmPool): The pool.
+        regions_needed (dict): Region mapped to the number of members to build.
+        resource_group (str): Resource group name.
+        ssh_key (str): SSH key name, which must exist in every region.
+        tailscale_tag (str): Tag of the routers' Tailscale key.
+        **options: Passed on to `run_fleet`, e.g. boot_profile or routers.
+
+    Returns:
+        list: The final lab status dicts from `run_fleet`.
+    """
+    from fleet import run_fleet
+
+    labs = []
+    for region, count in regions_needed.items():
+        for _ in range(count):
+            prefix = pool.reserve(region)
+            labs.append(
+                {
+                    "prefix": prefix,
+                    "region": region,
+                    "state": "queued",
+                    "step": None,
+                    "elapsed": None,
+                    "instance_id": None,
+                    "error": None,
+                }
+            )
+    if not labs:
+        return labs
+    run_fleet(labs, resource_group, ssh_key, tailscale_tag, resume=False, **options)
+    for lab in labs:
+        if lab["state"] == "succeeded":
+            pool.update(
+                lab["prefix"],
+                state="ready",
+                ready_at=time.time(),
+                instance_id=lab["instance_id"],
+            )
+        else:
+            pool.update(lab["prefix"], state="failed", error=lab["error"])
+    return labs
+
+
+def retire_members(pool, client, region, members):
+    """
+    Destroys pool members and forgets those whose resources are all gone.
+
+    Args:
+        pool (WarmPool): The pool.
+        client (VpcV1): An instance of the VpcV1 service for the region.
+        region (str): The members' region.
+        members (list): Members from `WarmPool.stale`.
+
+    Returns:
+        list: The prefixes that were retired.
+    """
+    from destroy import destroy_labs, discover_labs
+
+    prefixes = [member["prefix"] for member in members]
+    if not prefixes:
+        return []
+    found = discover_labs(client, region, prefixes)
+    failed = {
+        result["prefix"]
+        for result in destroy_labs(client, region, found)
+        if result["state"] != "destroyed"
+    }
+    retired = [prefix for prefix in prefixes if prefix not in failed]
+    for prefix in retired:
+        pool.remove(prefix)
+    return retired
+
+
+def replenish(
+    pool,
+    regions,
+    size,
+    resource_group,
+    ssh_key,
+    tailscale_tag,
+    max_age=DEFAULT_MAX_AGE,
+    **options,
+):
+    """
+    Brings every region of a pool to its target size once.
+
+    Stale members are retired first, then enough members are built to have
+    `size` ready or building members in each region.
+
+    Args:
+        pool (WarmPool): The pool.
+        regions (list): Regions the pool keeps labs in.
+        size (int): Target number of unclaimed members per region.
+        resource_group (str): Resource group name.
+        ssh_key (str): SSH key name, which must exist in every region.
+        tailscale_tag (str): Tag of the routers' Tailscale key.
+        max_age (float): Seconds a ready member may wait for a claim.
+        **options: Passed on to `run_fleet`.
+
+    Returns:
+        dict: `retired` and `built` prefixes and the `failed` builds.
+    """
+    from utils import vpc_client
+
+    retired = []
+    needed = {}
+    for region in regions:
+        stale = pool.stale(region, max_age)
+        if stale:
+            client = vpc_client(ibmcloud_api_key(), region)
+            retired += retire_members(pool, client, region, stale)
+        unclaimed = [
+            member
+            for member in pool.members(region)
+            if member["state"] in ("building", "ready")
+        ]
+        needed[region] = max(0, size - len(unclaimed))
+    labs = build_members(
+        pool, needed, resource_group, ssh_key, tailscale_tag, **options
+    )
+    return {
+        "retired": retired,
+        "built": [lab["prefix"] for lab in labs if lab["state"] == "succeeded"],
+        "failed": [lab["prefix"] for lab in labs if lab["state"] != "succeeded"],
+    }
+
+
+def run_replenisher(pool, stop, interval=60, **replenish_options):
+    """
+    Replenishes a pool until `stop` is set.
+
+    A pass that raises is logged and retried at the next interval, so a
+    transient API failure does not stop the replenisher.
+
+    Args:
+        pool (WarmPool): The pool.
+        stop (threading.Event): Set to stop after the current pass.
+        interval (float): Seconds between the start of two passes.
+        **replenish_options: Passed on to `replenish`.
+    """
+    from main import logger
+
+    while not stop.is_set():
+        started = time.monotonic()
+        try:
+            outcome = replenish(pool, **replenish_options)
+            if any(outcome.values()):
+                logger.info(f"Pool {pool.name}: {outcome}")
+        except Exception as e:
+            logger.error(f"Pool {pool.name} replenish failed: {e}")
+        stop.wait(max(0.0, interval - (time.monotonic() - started)))
+
+
+def claim_lab(pool, region, claimed_by, tailscale_tag):
+    """
+    Hands the oldest ready lab of a region to a learner.
+
+    The lab's VPC and routers are tagged with `claimed-by:{claimed_by}` and a
+    fresh single-use Tailscale key is minted for the learner, so claiming takes
+    a few API calls rather than a deployment.
+
+    Args:
+        pool (WarmPool): The pool.
+        region (str): The region to claim a lab in.
+        claimed_by (str): Who the lab is for.
+        tailscale_tag (str): Tag of the learner's Tailscale key.
+
+    Returns:
+        dict: The claimed member plus `tailscale_key` (the secret) and
+            `tailscale_key_expires`.
+
+    Raises:
+        LookupError: If the pool has no ready lab in the region.
+    """
+    from utils import create_tailscale_key, tag_resources, vpc_client
+
+    member = pool.take(region, claimed_by)
+    if member is None:
+        raise LookupError(f"Pool {pool.name} has no ready lab in {region}")
+    journal = Journal(member["prefix"], region)
+    try:
+        client = vpc_client(ibmcloud_api_key(), region)
+        crns = [client.get_vpc(id=journal.get("vpc")).get_result()["crn"]]
+        crns += [
+            entry["result"]["crn"]
+            for step, entry in journal.steps().items()
+            if step == "instance" or step.startswith("instance:")
+        ]
+        tag_resources(crns, [f"claimed-by:{claimed_by}", f"pool:{pool.name}"])
+        key = create_tailscale_key(tailscale_api_key(), tailnet_id(), tailscale_tag)
+    except Exception:
+        # Put the lab back so the next claim can have it
+        pool.update(member["prefix"], state="ready", claimed_at=None, claimed_by=None)
+        raise
+    pool.update(member["prefix"], tailscale_key=key.get("id"))
+    return dict(
+        member,
+        tailscale_key=key.get("key"),
+        tailscale_key_expires=key.get("expires"),
+    )
+
+
+@click.group()
+@click.option(
+    "--pool", "pool_name", default="warm", show_default=True, help="Pool name"
+)
+@click.pass_context
+def pool(ctx, pool_name):
+    """
+    Keep pre-provisioned labs ready and hand them out in seconds.
+    """
+    ctx.obj = pool_name
+
+
+@pool.command(name="replenish")
+@click.option(
+    "--region", "regions", multiple=True, required=True, help="Region to keep labs in"
+)
+@click.option(
+    "--size", default=2, show_default=True, help="Unclaimed labs to keep per region"
+)
+@click.option("--resource-group", required=True, help="IBM Cloud resource group")
+@click.option("--ssh-key", required=True, help="VPC SSH key name in every region")
+@click.option(
+    "--tailscale-tag", required=True, help="Tag of the routers' Tailscale key"
+)
+@click.option(
+    "--max-age",
+    default=DEFAULT_MAX_AGE,
+    show_default=True,
+    help="Seconds a ready lab may wait for a claim before it is rebuilt",
+)
+@click.option(
+    "--boot-profile",
+    type=click.Choice(sorted(BOOT_PROFILES)),
+    default=DEFAULT_BOOT_PROFILE,
+    show_default=True,
+    help="User-data profile of the pool's routers",
+)
+@click.option("--per-region-concurrency", default=10, show_default=True)
+@click.option(
+    "--watch",
+    is_flag=True,
+    help="Keep replenishing every --interval seconds until interrupted",
+)
+@click.option(
+    "--interval", default=60, show_default=True, help="Seconds between passes"
+)
+@click.pass_obj
+def replenish_command(
+    pool_name,
+    regions,
+    size,
+    resource_group,
+    ssh_key,
+    tailscale_tag,
+    max_age,
+    boot_profile,
+    per_region_concurrency,
+    watch,
+    interval,
+):
+    """
+    Retire stale labs and build new ones up to the target size.
+    """
+    require_credentials("IBMCLOUD_API_KEY", "TAILSCALE_API_KEY", "TAILNET_ID")
+    warm = WarmPool(pool_name)
+    options = dict(
+        regions=list(regions),
+        size=size,
+        resource_group=resource_group,
+        ssh_key=ssh_key,
+        tailscale_tag=tailscale_tag,
+        max_age=max_age,
+        boot_profile=boot_profile,
+        per_region_concurrency=per_region_concurrency,
+    )
+    if not watch:
+        click.echo(json.dumps(replenish(warm, **options)))
+        return
+    stop = threading.Event()
+    try:
+        run_replenisher(warm, stop, interval, **options)
+    except KeyboardInterrupt:
+        stop.set()
+
+
+@pool.command()
+@click.option("--region", required=True, help="Region to claim a lab in")
+@click.option("--user", "claimed_by", required=True, help="Who the lab is for")
+@click.option(
+    "--tailscale-tag", required=True, help="Tag of the learner's Tailscale key"
+)
+@click.pass_obj
+def claim(pool_name, region, claimed_by, tailscale_tag):
+    """
+    Hand a ready lab to a learner and print it with a fresh Tailscale key.
+    """
+    require_credentials("IBMCLOUD_API_KEY", "TAILSCALE_API_KEY", "TAILNET_ID")
+    try:
+        lab = claim_lab(WarmPool(pool_name), region, claimed_by, tailscale_tag)
+    except LookupError as e:
+        raise click.ClickException(str(e))
+    click.echo(json.dumps(lab, indent=2))
+
+
+@pool.command(name="list")
+@click.option("--region", help="Only labs in this region")
+@click.option(
+    "--state", type=click.Choice(MEMBER_STATES), help="Only labs in this state"
+)
+@click.pass_obj
+def list_members(pool_name, region, state):
+    """
+    List the pool's labs and their states.
+    """
+    from rich.console import Console
+    from rich.table import Table
+
+    table = Table(title=f"Pool {pool_name}")
+    for column in ("Prefix", "Region", "State", "Age", "Claimed by", "Error"):
+        table.add_column(column)
+    now = time.time()
+    for member in WarmPool(pool_name).members(region, state):
+        table.add_row(
+            member["prefix"],
+            member["region"],
+            member["state"],
+            f"{(now - member['created_at']) / 60:.0f}m",
+            member["claimed_by"] or "",
+            member["error"] or "",
+        )
+    Console().print(table)
+
+
+if __name__ == "__main__":
+    pool()
@@ -0,0 +1,425 @@
+import asyncio
+import time
+
+from credentials import ibmcloud_api_key
+from tracing import traced
+
+# Resource plan of the DNS Services standard plan
+DNS_PLAN_ID = "2fdf0c08-2d32-4f46-84b5-32e0c92fffd8"
+
+RECORD_TTL = 300
+
+# Record creates in flight at once for one zone
+RECORD_CONCURRENCY = 16
+
+# Instance lookups by name in flight at once
+LOOKUP_CONCURRENCY = 16
+
+# Seconds between polls while an instance is provisioned or a network removed
+POLL_INTERVAL = 2.0
+POLL_TIMEOUT = 600.0
+
+
+def dns_instance_name(prefix, region):
+    """
+    Returns the name of a lab's DNS Services instance.
+
+    DNS Services instances are global, so the region is part of the name and
+    labs with the same prefix in different regions get their own instance.
+    """
+    return f"{prefix}-{region}-dns"
+
+
+def _clients():
+    import async_client
+    from auth import AsyncTokenSource, get_token_provider
+
+    token_source = AsyncTokenSource(get_token_provider(ibmcloud_api_key()))
+    return (
+        async_client.AsyncResourceControllerClient(token_source),
+        async_client.AsyncDnsServicesClient(token_source),
+    )
+
+
+def _run(coro_function, *args):
+    # The clients are cheap wrappers; the pooled connections and token are shared
+    import async_client
+
+    return async_client.run_sync(coro_function(*_clients(), *args))
+
+
+def _not_found(error):
+    from ibm_cloud_sdk_core.api_exception import ApiException
+
+    return isinstance(error, ApiException) and error.status_code == 404
+
+
+async def _until(check, what):
+    deadline = time.monotonic() + POLL_TIMEOUT
+    while True:
+        result = await check()
+        if result:
+            return result
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Timed out waiting for {what}")
+        await asyncio.sleep(POLL_INTERVAL)
+
+
+def _instance_fields(instance):
+    return {key: instance.get(key) for key in ("id", "guid", "name", "state")}
+
+
+async def _find_instance(controller, name):
+    listing = await controller.list_resource_instances(
+        name=name, resource_plan_id=DNS_PLAN_ID
+    )
+    for instance in listing.get("resources", []):
+        if instance.get("state") not in ("failed", "pending_removal", "removed"):
+            return instance
+    return None
+
+
+async def _create_instance(controller, dns, resource_group_id, name):
+    # A run interrupted while the instance was provisioned left it unjournaled
+    instance = await _find_instance(controller, name)
+    if instance is None:
+        instance = await controller.create_resource_instance(
+            name, "global", resource_group_id, DNS_PLAN_ID
+        )
+
+    async def active():
+        current = await controller.get_resource_instance(instance["guid"])
+        if current.get("state") == "failed":
+            raise RuntimeError(f"DNS Services instance {name} failed to provision")
+        return current if current.get("state") == "active" else None
+
+    if instance.get("state") != "active":
+        instance = await _until(active, f"DNS Services instance {name}")
+    return _instance_fields(instance)
+
+
+@traced
+def create_dns_instance(resource_group_id, name):
+    """
+    Creates a DNS Services instance and waits until it is active.
+
+    An instance of that name left by an interrupted run is reused, and waited
+    for if it is still being provisioned, rather than created again.
+
+    Args:
+        resource_group_id (str): The ID of the resource group to create it in.
+        name (str): Instance name, as from `dns_instance_name`.
+
+    Returns:
+        dict: The instance's id (CRN), guid, name and state.
+
+    Raises:
+        ApiException: If there is an error while calling the IBM Cloud API.
+        RuntimeError: If provisioning fails.
+        TimeoutError: If the instance does not become active in time.
+    """
+    return _run(_create_instance, resource_group_id, name)
+
+
+async def _find_instances(controller, dns, names):
+    slots = asyncio.Semaphore(LOOKUP_CONCURRENCY)
+
+    async def find(name):
+        async with slots:
+            return await _find_instance(controller, name)
+
+    found = await asyncio.gather(*(find(name) for name in names))
+    return {
+        name: _instance_fields(instance)
+        for name, instance in zip(names, found)
+        if instance is not None
+    }
+
+
+@traced
+def find_dns_instances(names):
+    """
+    Looks up DNS Services instances by name.
+
+    Finds the instances of labs whose journal does not have them, e.g. because
+    a run was interrupted while the instance was provisioned.
+
+    Args:
+        names (list): Instance names, as from `dns_instance_name`.
+
+    Returns:
+        dict: Name mapped to the instance's id (CRN), guid, name and state, for
+            every name that has an instance.
+
+    Raises:
+        ApiException: If there is an error while calling the IBM Cloud API.
+    """
+    return _run(_find_instances, list(names))
+
+
+async def _instance_exists(controller, dns, guid):
+    try:
+        instance = await controller.get_resource_instance(guid)
+    except Exception as e:
+        if _not_found(e):
+            return False
+        raise
+    return instance.get("state") == "active"
+
+
+@traced
+def dns_instance_exists(instance):
+    """
+    Checks that a journaled DNS Services instance is still active.
+
+    Args:
+        instance (dict): The result of `create_dns_instance`.
+
+    Returns:
+        bool: True if the instance exists and is active.
+    """
+    return _run(_instance_exists, instance["guid"])
+
+
+async def _create_zone(controller, dns, instance_guid, zone_name, description):
+    return await dns.create_dnszone(instance_guid, zone_name, description=description)
+
+
+@traced
+def create_dns_zone(instance_guid, zone_name, prefix):
+    """
+    Creates a private DNS zone.
+
+    The zone stays in the `pending_network_add` state until a network is
+    permitted to resolve it.
+
+    Args:
+        instance_guid (str): GUID of the DNS Services instance.
+        zone_name (str): The zone, e.g. "lab.internal".
+        prefix (str): The lab prefix, used in the zone description.
+
+    Returns:
+        dict: The zone; `instance_id` is the GUID of its instance.
+
+    Raises:
+        ApiException: If there is an error while calling the IBM Cloud API.
+    """
+    return _run(_create_zone, instance_guid, zone_name, f"Private DNS for lab {prefix}")
+
+
+async def _zone_exists(controller, dns, instance_guid, zone_id):
+    try:
+        zone = await dns.get_dnszone(instance_guid, zone_id)
+    except Exception as e:
+        if _not_found(e):
+            return False
+        raise
+    return zone.get("state") not in ("deleted", "pending_delete")
+
+
+@traced
+def dns_zone_exists(zone):
+    """
+    Checks that a journaled DNS zone still exists.
+
+    Args:
+        zone (dict): The result of `create_dns_zone`.
+
+    Returns:
+        bool: True if the zone exists and is not being deleted.
+    """
+    return _run(_zone_exists, zone["instance_id"], zone["id"])
+
+
+async def _permit(controller, dns, instance_guid, zone_id, vpc_crn):
+    from ibm_cloud_sdk_core.api_exception import ApiException
+
+    try:
+        return await dns.create_permitted_network(instance_guid, zone_id, vpc_crn)
+    except ApiException as e:
+        if e.status_code != 409:
+            raise
+    # Already permitted, e.g. by an interrupted run
+    listing = await dns.list_permitted_networks(instance_guid, zone_id)
+    for network in listing.get("permitted_networks", []):
+        if network["permitted_network"]["vpc_crn"] == vpc_crn:
+            return network
+    raise RuntimeError(f"VPC {vpc_crn} is permitted to a zone of another instance")
+
+
+@traced
+def permit_vpc(zone, vpc_crn):
+    """
+    Lets a VPC resolve a private DNS zone. Permitting a VPC that already is
+    permitted returns the existing link.
+
+    Args:
+        zone (dict): The result of `create_dns_zone`.
+        vpc_crn (str): CRN of the VPC.
+
+    Returns:
+        dict: The permitted network.
+
+    Raises:
+        ApiException: If there is an error while calling the IBM Cloud API.
+    """
+    return _run(_permit, zone["instance_id"], zone["id"], vpc_crn)
+
+
+def lab_dns_records(routers, subnets):
+    """
+    Returns the records that name a lab's routers and subnets.
+
+    Each router gets an A record with its private address, and each subnet a TXT
+    record holding its CIDR, so lab hosts can look up both by name.
+
+    Args:
+        routers (list): Instances, as returned by `create_new_instance`.
+        subnets (list): Subnets, as returned by `create_subnets`.
+
+    Returns:
+        list: Record dicts with name, type and rdata, for `register_records`.
+    """
+    records = [
+        {
+            "name": router["name"],
+            "type": "A",
+            "rdata": {
+                "ip": router["primary_network_interface"]["primary_ip"]["address"]
+            },
+        }
+        for router in routers
+    ]
+    records += [
+        {
+            "name": subnet["name"],
+            "type": "TXT",
+            "rdata": {"text": subnet["ipv4_cidr_block"]},
+        }
+        for subnet in subnets
+    ]
+    return records
+
+
+def _relative_name(name, zone_name):
+    # The API answers with fully qualified names
+    suffix = f".{zone_name}"
+    return name[: -len(suffix)] if name.endswith(suffix) else name
+
+
+async def _register(controller, dns, instance_guid, zone, records, concurrency):
+    existing = {}
+    offset = 0
+    while True:
+        page = await dns.list_resource_records(
+            instance_guid, zone["id"], offset=offset, limit=1000
+        )
+        for record in page.get("resource_records", []):
+            name = _relative_name(record["name"], zone["name"])
+            existing[(record["type"], name)] = record
+        offset += len(page.get("resource_records", []))
+        if not page.get("resource_records") or offset >= page.get("total_count", 0):
+            break
+
+    slots = asyncio.Semaphore(concurrency)
+
+    async def apply(record):
+        body = dict(record, ttl=record.get("ttl", RECORD_TTL))
+        current = existing.get((record["type"], record["name"]))
+        if current is not None and current.get("rdata") == record["rdata"]:
+            return current
+        async with slots:
+            if current is None:
+                return await dns.create_resource_record(
+                    instance_guid, zone["id"], **body
+                )
+            return await dns.update_resource_record(
+                instance_guid, zone["id"], current["id"], **body
+            )
+
+    applied = await asyncio.gather(*(apply(record) for record in records))
+    return {
+        f"{record['type']} {record['name']}": result["id"]
+        for record, result in zip(records, applied)
+    }
+
+
+@traced
+def register_records(zone, records, concurrency=RECORD_CONCURRENCY):
+    """
+    Makes a zone hold the given records.
+
+    The zone's records are listed once; missing records are then created and
+    changed ones updated concurrently, and records that already match cost no
+    call. Running it again after a partial failure only sends what is left.
+
+    Args:
+        zone (dict): The result of `create_dns_zone`.
+        records (list): Records from `lab_dns_records`, with names relative
+            to the zone.
+        concurrency (int): Most create or update requests in flight at once.
+
+    Returns:
+        dict: "TYPE name" mapped to the record ID.
+
+    Raises:
+        ApiException: If there is an error while calling the IBM Cloud API.
+    """
+    return _run(_register, zone["instance_id"], zone, records, concurrency)
+
+
+async def _delete_instance(controller, dns, guid):
+    try:
+        zones = (await dns.list_dnszones(guid)).get("dnszones", [])
+    except Exception as e:
+        if _not_found(e):
+            return False
+        raise
+
+    async def unpermit(zone):
+        listing = await dns.list_permitted_networks(guid, zone["id"])
+        await asyncio.gather(
+            *(
+                dns.delete_permitted_network(guid, zone["id"], network["id"])
+                for network in listing.get("permitted_networks", [])
+            )
+        )
+
+        # Removal is asynchronous, and the VPC cannot be deleted until it is done
+        async def removed():
+            listing = await dns.list_permitted_networks(guid, zone["id"])
+            return not listing.get("permitted_networks")
+
+        await _until(
+            removed, f"permitted networks of zone {zone['name']} to be removed"
+        )
+
+    await asyncio.gather(*(unpermit(zone) for zone in zones))
+    try:
+        await controller.delete_resource_instance(guid, recursive=True)
+    except Exception as e:
+        if _not_found(e):
+            return False
+        raise
+    return True
+
+
+@traced
+def delete_dns_instance(guid):
+    """
+    Deletes a DNS Services instance with its zones and records.
+
+    Permitted networks are removed first, and their removal is awaited, since a
+    VPC that is still permitted to a zone cannot be deleted.
+
+    Args:
+        guid (str): GUID of the instance.
+
+    Returns:
+        bool: True if the instance was deleted, False if it was already gone.
+
+    Raises:
+        ApiException: If there is an error while calling the IBM Cloud API.
+        TimeoutError: If a permitted network is not removed in time.
+    """
+    return _run(_delete_instance, guid)
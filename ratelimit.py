@@ -0,0 +1,518 @@
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+import httpx
+import requests
+import urllib3
+from ibm_cloud_sdk_core.api_exception import ApiException
+from ibm_cloud_sdk_core.http_adapter import SSLHTTPAdapter
+
+import tracing
+from endpoints import overridden_service
+
+logger = logging.getLogger(__name__)
+
+# Requests per second and burst size per endpoint family
+FAMILY_LIMITS = {
+    "vpc": (20.0, 40),
+    "iam": (5.0, 10),
+    "resource_manager": (10.0, 20),
+    "tailscale": (5.0, 10),
+    "other": (20.0, 40),
+}
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def endpoint_family(url):
+    """
+    Maps a request URL to the endpoint family whose limiter it goes through.
+
+    Args:
+        url (str): The request URL.
+
+    Returns:
+        str: One of "vpc", "iam", "resource_manager", "tailscale" or "other".
+    """
+    service = overridden_service(url)
+    if service:
+        return service
+    host = urlsplit(str(url)).hostname or ""
+    if host.endswith(".iaas.cloud.ibm.com"):
+        return "vpc"
+    if host.startswith("iam."):
+        return "iam"
+    if host.startswith("resource-controller.") or host.startswith("resource-manager."):
+        return "resource_manager"
+    if host == "api.tailscale.com":
+        return "tailscale"
+    return "other"
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket shared by every caller of one endpoint family.
+
+    Callers reserve a token and are told how long to wait for it, so the same
+    bucket serves threads (which sleep) and coroutines (which await).
+
+    Args:
+        rate (float): Tokens added per second.
+        burst (int): Maximum number of tokens held.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Takes one token, possibly from the future.
+
+        Returns:
+            float: Seconds the caller must wait before using the token.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def acquire(self):
+        """
+        Blocks until a token is available.
+        """
+        delay = self.reserve()
+        if delay:
+            time.sleep(delay)
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def bucket_for(family):
+    """
+    Returns the process-wide TokenBucket for an endpoint family.
+    """
+    with _buckets_lock:
+        if family not in _buckets:
+            _buckets[family] = TokenBucket(
+                *FAMILY_LIMITS.get(family, FAMILY_LIMITS["other"])
+            )
+        return _buckets[family]
+
+
+def configure_limits(**limits):
+    """
+    Overrides the rate and burst of endpoint families.
+
+    Args:
+        **limits: Family name mapped to a (rate, burst) tuple, e.g. vpc=(50, 100).
+    """
+    with _buckets_lock:
+        for family, (rate, burst) in limits.items():
+            FAMILY_LIMITS[family] = (rate, burst)
+            _buckets.pop(family, None)
+
+
+def retry_after_seconds(value):
+    """
+    Parses a Retry-After header given as seconds or as an HTTP date.
+
+    Args:
+        value (str): The header value, or None.
+
+    Returns:
+        float: Seconds to wait, or None if the header is missing or invalid.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    """
+    Retry with decorrelated jitter, honoring Retry-After.
+
+    Each delay is drawn uniformly between `base` and three times the previous
+    delay, capped at `cap`. A Retry-After header, when present, sets the minimum
+    delay instead.
+
+    Args:
+        max_attempts (int): Total attempts, including the first.
+        base (float): Smallest delay in seconds.
+        cap (float): Largest delay in seconds.
+    """
+
+    def __init__(self, max_attempts=6, base=0.5, cap=30.0):
+        self.max_attempts = max_attempts
+        self.base = base
+        self.cap = cap
+
+    def next_delay(self, previous, retry_after=None):
+        """
+        Returns the delay before the next attempt.
+
+        Args:
+            previous (float): The previous delay, or 0 for the first retry.
+            retry_after (float): Seconds requested by the server, if any.
+
+        Returns:
+            float: Seconds to wait.
+        """
+        delay = min(self.cap, random.uniform(self.base, max(self.base, previous * 3)))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.cap * 4))
+        return delay
+
+
+DEFAULT_POLICY = RetryPolicy()
+
+
+def classify(method, status, maybe_sent=False):
+    """
+    Decides what to do with a response.
+
+    Creates (POST) are only retried blindly on 429, or when the connection failed
+    before the request was sent; both guarantee the request was not processed.
+    Other retryable statuses on a create, and connections that broke once the
+    request may have reached the server, are ambiguous: the resource may exist,
+    so the caller must look it up by name before retrying.
+
+    Args:
+        method (str): The HTTP method.
+        status (int): The response status, or None for a connection failure.
+        maybe_sent (bool): For a connection failure, whether the request may
+            have reached the server.
+
+    Returns:
+        str: "done", "retry" or "check".
+    """
+    if status is None:
+        return "check" if maybe_sent and method == "POST" else "retry"
+    if status == 429:
+        return "retry"
+    if status not in RETRY_STATUSES:
+        return "done"
+    return "check" if method == "POST" else "retry"
+
+
+def _may_have_been_sent(error):
+    # requests wraps urllib3's errors; only failures to connect (including
+    # connect timeouts) guarantee that nothing was sent. An aborted connection
+    # or RemoteDisconnected may come after the server read the whole request.
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return False
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return not isinstance(reason, urllib3.exceptions.ConnectTimeoutError)
+
+
+# httpx failures to retry; the first group is raised before anything is sent
+HTTPX_NOT_SENT = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+HTTPX_RETRYABLE = HTTPX_NOT_SENT + (
+    httpx.ReadError,
+    httpx.WriteError,
+    httpx.ReadTimeout,
+    httpx.WriteTimeout,
+    httpx.RemoteProtocolError,
+)
+
+
+def _body_size(body):
+    return len(body) if isinstance(body, (str, bytes)) else None
+
+
+def _record_response(span, request_body, response):
+    span["status"] = response.status_code
+    span["request_bytes"] = _body_size(request_body)
+    length = response.headers.get("Content-Length")
+    span["response_bytes"] = int(length) if length and length.isdigit() else None
+
+
+def _created_name(body):
+    if not body:
+        return None
+    try:
+        return json.loads(body).get("name")
+    except (ValueError, AttributeError):
+        return None
+
+
+def _lookup_url(url, name):
+    parts = urlsplit(str(url))
+    query = [
+        (k, v) for k, v in parse_qsl(parts.query) if k in ("version", "generation")
+    ]
+    query.append(("name", name))
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def _find_named(collection_body, name):
+    for value in collection_body.values():
+        if isinstance(value, list):
+            for resource in value:
+                if isinstance(resource, dict) and resource.get("name") == name:
+                    return resource
+    return None
+
+
+class RateLimitedAdapter(SSLHTTPAdapter):
+    """
+    A requests transport adapter that sends every call through the endpoint
+    family's token bucket and retries throttled or failed calls.
+
+    Mounted on the SDK services' sessions, it covers every ibm-vpc and
+    ibm-platform-services call without changing the call sites.
+
+    Args:
+        policy (RetryPolicy): Retry policy to use.
+    """
+
+    def __init__(self, *args, policy=DEFAULT_POLICY, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.policy = policy
+
+    def send(self, request, **kwargs):
+        family = endpoint_family(request.url)
+        name = tracing.operation_name(request.method, request.url)
+        with tracing.span(name, "http", family=family) as span:
+            response = self._send(request, span, **kwargs)
+            _record_response(span, request.body, response)
+            return response
+
+    def _send(self, request, span, **kwargs):
+        bucket = bucket_for(endpoint_family(request.url))
+        delay = 0.0
+        for attempt in range(1, self.policy.max_attempts + 1):
+            span["attempts"] = attempt
+            bucket.acquire()
+            try:
+                response, error = super().send(request, **kwargs), None
+            except requests.exceptions.ConnectionError as e:
+                if attempt == self.policy.max_attempts:
+                    raise
+                response, error = None, e
+                status, retry_after = None, None
+            else:
+                status = response.status_code
+                retry_after = retry_after_seconds(response.headers.get("Retry-After"))
+            maybe_sent = error is not None and _may_have_been_sent(error)
+            action = classify(request.method, status, maybe_sent)
+            if action == "done" or attempt == self.policy.max_attempts:
+                return response
+            if action == "check":
+                existing = self._existing(request, **kwargs)
+                if existing is not None:
+                    if response is not None:
+                        response.close()
+                    return existing
+                if not _created_name(request.body):
+                    if error is not None:
+                        raise error
+                    return response
+            if response is not None:
+                response.close()
+            delay = self.policy.next_delay(delay, retry_after)
+            logger.info(
+                f"{request.method} {request.url} got {error or status}; retry {attempt} in {delay:.1f}s"
+            )
+            time.sleep(delay)
+
+    def _existing(self, request, **kwargs):
+        name = _created_name(request.body)
+        if not name:
+            return None
+        lookup = request.copy()
+        lookup.prepare_method("GET")
+        lookup.prepare_url(_lookup_url(request.url, name), None)
+        lookup.body = None
+        lookup.headers.pop("Content-Type", None)
+        lookup.headers.pop("Content-Length", None)
+        bucket_for(endpoint_family(request.url)).acquire()
+        try:
+            found = super().send(lookup, **kwargs)
+            resource = _find_named(found.json(), name) if found.ok else None
+        except (requests.exceptions.RequestException, ValueError):
+            return None
+        if resource is None:
+            return None
+        logger.info(f"Create of {name} already succeeded; reusing {resource.get('id')}")
+        response = requests.Response()
+        response.status_code = 201
+        response._content = json.dumps(resource).encode()
+        response.headers["Content-Type"] = "application/json"
+        response.url = request.url
+        response.request = request
+        return response
+
+
+def install(service, policy=DEFAULT_POLICY):
+    """
+    Mounts a RateLimitedAdapter on an SDK service's HTTP session.
+
+    Args:
+        service (BaseService): An SDK service such as VpcV1 or ResourceManagerV2.
+        policy (RetryPolicy): Retry policy to use.
+
+    Returns:
+        BaseService: The same service, for chaining.
+    """
+    adapter = RateLimitedAdapter(
+        policy=policy,
+        _disable_ssl_verification=service.disable_ssl_verification,
+    )
+    service.http_adapter = adapter
+    service.http_client.mount("http://", adapter)
+    service.http_client.mount("https://", adapter)
+    return service
+
+
+class RateLimitedTransport(httpx.AsyncBaseTransport):
+    """
+    The httpx counterpart of RateLimitedAdapter for the pooled async client.
+
+    Args:
+        transport (httpx.AsyncBaseTransport): The transport that sends requests.
+        policy (RetryPolicy): Retry policy to use.
+    """
+
+    def __init__(self, transport, policy=DEFAULT_POLICY):
+        self.transport = transport
+        self.policy = policy
+
+    async def handle_async_request(self, request):
+        family = endpoint_family(request.url)
+        name = tracing.operation_name(request.method, request.url)
+        with tracing.span(name, "http", family=family) as span:
+            body = await request.aread()
+            response = await self._handle(request, body, span)
+            _record_response(span, body, response)
+            return response
+
+    async def _handle(self, request, body, span):
+        bucket = bucket_for(endpoint_family(request.url))
+        delay = 0.0
+        for attempt in range(1, self.policy.max_attempts + 1):
+            span["attempts"] = attempt
+            wait = bucket.reserve()
+            if wait:
+                await asyncio.sleep(wait)
+            try:
+                response = await self.transport.handle_async_request(request)
+                error = None
+            except HTTPX_RETRYABLE as e:
+                if attempt == self.policy.max_attempts:
+                    raise
+                response, error = None, e
+                status, retry_after = None, None
+            else:
+                status = response.status_code
+                retry_after = retry_after_seconds(response.headers.get("Retry-After"))
+            maybe_sent = error is not None and not isinstance(error, HTTPX_NOT_SENT)
+            action = classify(request.method, status, maybe_sent)
+            if action == "done" or attempt == self.policy.max_attempts:
+                return response
+            if action == "check":
+                existing = await self._existing(request, body)
+                if existing is not None:
+                    if response is not None:
+                        await response.aclose()
+                    return existing
+                if not _created_name(body):
+                    if error is not None:
+                        raise error
+                    return response
+            if response is not None:
+                await response.aclose()
+            delay = self.policy.next_delay(delay, retry_after)
+            logger.info(
+                f"{request.method} {request.url} got {error or status}; retry {attempt} in {delay:.1f}s"
+            )
+            await asyncio.sleep(delay)
+
+    async def _existing(self, request, body):
+        name = _created_name(body)
+        if not name:
+            return None
+        headers = [
+            (k, v)
+            for k, v in request.headers.raw
+            if k.lower() not in (b"content-type", b"content-length")
+        ]
+        lookup = httpx.Request("GET", _lookup_url(request.url, name), headers=headers)
+        wait = bucket_for(endpoint_family(request.url)).reserve()
+        if wait:
+            await asyncio.sleep(wait)
+        try:
+            found = await self.transport.handle_async_request(lookup)
+            await found.aread()
+            resource = _find_named(found.json(), name) if found.is_success else None
+        except (httpx.HTTPError, ValueError):
+            return None
+        if resource is None:
+            return None
+        logger.info(f"Create of {name} already succeeded; reusing {resource.get('id')}")
+        return httpx.Response(201, json=resource, request=request)
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+def retry_call(family, func, *args, policy=DEFAULT_POLICY, **kwargs):
+    """
+    Calls a function that raises ApiException, with rate limiting and retries.
+
+    Used for calls that bypass the SDK session, such as IAM token requests.
+
+    Args:
+        family (str): The endpoint family whose bucket to use.
+        func (callable): The function to call.
+        *args: Positional arguments for `func`.
+        policy (RetryPolicy): Retry policy to use.
+        **kwargs: Keyword arguments for `func`.
+
+    Returns:
+        The function's return value.
+
+    Raises:
+        ApiException: If the call still fails after the last attempt, or fails
+            with a status that is not retryable.
+    """
+    delay = 0.0
+    for attempt in range(1, policy.max_attempts + 1):
+        bucket_for(family).acquire()
+        try:
+            return func(*args, **kwargs)
+        except ApiException as e:
+            if e.status_code not in RETRY_STATUSES or attempt == policy.max_attempts:
+                raise
+            headers = e.http_response.headers if e.http_response is not None else {}
+            delay = policy.next_delay(
+                delay, retry_after_seconds(headers.get("Retry-After"))
+            )
+            logger.info(
+                f"{family} call got {e.status_code}; retry {attempt} in {delay:.1f}s"
+            )
+            time.sleep(delay)
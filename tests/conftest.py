@@ -0,0 +1,52 @@
+import sys
+import os
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import auth
+import cache
+from fake_cloud import FakeCloud
+
+
+@pytest.fixture
+def fake_cloud(monkeypatch, tmp_path):
+    """
+    Returns a function that starts a FakeCloud and points the tools at it.
+
+    The function takes FakeCloud's keyword arguments (one "us-south" region by
+    default), exports its endpoints and fake credentials, gives the run an empty
+    cache directory and process-wide state, and returns the started cloud. Every
+    cloud started is stopped when the test ends.
+    """
+    clouds = []
+
+    def start(regions=("us-south",), **options):
+        cloud = FakeCloud(regions=regions, **options)
+        cloud.start()
+        clouds.append(cloud)
+        for name, value in cloud.environment().items():
+            monkeypatch.setenv(name, value)
+        monkeypatch.setenv("VPC_LAB_CACHE_DIR", str(tmp_path / "cache"))
+        monkeypatch.setenv("IBMCLOUD_API_KEY", "fake-api-key")
+        monkeypatch.setenv("TAILSCALE_API_KEY", "tskey-api-fake")
+        monkeypatch.setenv("TAILNET_ID", "example.com")
+        monkeypatch.setattr(auth, "_providers", {})
+        monkeypatch.setattr(cache, "_lookup_caches", {})
+        return cloud
+
+    yield start
+    for cloud in clouds:
+        cloud.stop()
+
+
+@pytest.fixture
+def cloud(fake_cloud):
+    """
+    A FakeCloud whose resources are ready and deleted immediately.
+
+    Test modules that need other timings override this fixture with their own
+    options for `fake_cloud`.
+    """
+    return fake_cloud(transition=0, delete_delay=0)
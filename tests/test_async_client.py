@@ -0,0 +1,106 @@
+import sys
+import os
+import asyncio
+import httpx
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import async_client
+from ibm_cloud_sdk_core.api_exception import ApiException
+
+
+class StaticToken:
+    async def get_token(self):
+        return "mock_token"
+
+
+def make_client(handler):
+    http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return async_client.AsyncVpcClient(StaticToken(), "us-south", http_client)
+
+
+def test_vpc_requests_carry_version_and_token():
+    seen = []
+
+    def handler(request):
+        seen.append(request)
+        return httpx.Response(201, json={"id": "vpc-1"})
+
+    client = make_client(handler)
+    result = asyncio.run(client.create_vpc(name="lab-vpc", classic_access=False))
+
+    assert result == {"id": "vpc-1"}
+    request = seen[0]
+    assert request.url.host == "us-south.iaas.cloud.ibm.com"
+    assert request.url.path == "/v1/vpcs"
+    assert request.url.params["version"] == async_client.VPC_API_VERSION
+    assert request.url.params["generation"] == "2"
+    assert request.headers["Authorization"] == "Bearer mock_token"
+
+
+def test_list_params_are_joined_and_none_dropped():
+    seen = []
+
+    def handler(request):
+        seen.append(request)
+        return httpx.Response(200, json={"images": []})
+
+    client = make_client(handler)
+    asyncio.run(client.list_images(limit=100, status=["available"], start=None))
+
+    params = seen[0].url.params
+    assert params["status"] == "available"
+    assert params["limit"] == "100"
+    assert "start" not in params
+
+
+def test_sdk_filter_arguments_become_dotted_params():
+    seen = []
+
+    def handler(request):
+        seen.append(request)
+        return httpx.Response(200, json={"subnets": []})
+
+    client = make_client(handler)
+    asyncio.run(client.list_subnets(vpc_id="vpc-1", resource_group_id="rg-1"))
+
+    params = seen[0].url.params
+    assert params["vpc.id"] == "vpc-1"
+    assert params["resource_group.id"] == "rg-1"
+    assert "vpc_id" not in params
+
+
+def test_error_response_raises_api_exception():
+    def handler(request):
+        return httpx.Response(
+            409, json={"errors": [{"message": "name is already in use"}]}
+        )
+
+    client = make_client(handler)
+    with pytest.raises(ApiException) as excinfo:
+        asyncio.run(client.create_vpc(name="lab-vpc"))
+
+    assert excinfo.value.status_code == 409
+    assert "already in use" in excinfo.value.message
+
+
+def test_sync_client_returns_detailed_response():
+    def handler(request):
+        return httpx.Response(200, json={"zones": [{"name": "us-south-1"}]})
+
+    sync = async_client.SyncClient(make_client(handler))
+    zones = sync.list_region_zones("us-south").get_result()["zones"]
+
+    assert zones == [{"name": "us-south-1"}]
+
+
+def test_shared_http_client_is_reused_per_loop():
+    async def grab_twice():
+        first = async_client.shared_http_client()
+        second = async_client.shared_http_client()
+        await async_client.close_http_clients()
+        return first, second
+
+    first, second = asyncio.run(grab_twice())
+    assert first is second
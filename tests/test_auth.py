@@ -0,0 +1,73 @@
+import sys
+import os
+import time
+import threading
+import jwt
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from auth import TokenProvider
+
+
+def make_token_response(lifetime=3600):
+    now = int(time.time())
+    token = jwt.encode(
+        {"iat": now, "exp": now + lifetime, "account": {"bss": "mock_account_id"}},
+        "mock-signing-secret-for-unit-tests-only",
+        algorithm="HS256",
+    )
+    return {"access_token": token, "expires_in": lifetime}
+
+
+def counting_provider(disk_cache, calls):
+    provider = TokenProvider("mock_ibmcloud_api_key", disk_cache=disk_cache)
+
+    def request_from_iam():
+        calls.append(1)
+        time.sleep(0.05)
+        return make_token_response()
+
+    provider._request_from_iam = request_from_iam
+    return provider
+
+
+def test_concurrent_callers_share_one_iam_request():
+    calls = []
+    provider = counting_provider(False, calls)
+    tokens = []
+    threads = [
+        threading.Thread(target=lambda: tokens.append(provider.get_token()))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    provider.stop()
+
+    assert len(calls) == 1
+    assert len(set(tokens)) == 1
+
+
+def test_account_id_comes_from_token():
+    calls = []
+    provider = counting_provider(False, calls)
+
+    assert provider.account_id() == "mock_account_id"
+    provider.stop()
+
+
+def test_disk_cache_is_encrypted_and_reused(tmp_path, monkeypatch):
+    monkeypatch.setenv("VPC_LAB_CACHE_DIR", str(tmp_path))
+    calls = []
+    first = counting_provider(True, calls)
+    token = first.get_token()
+    first.stop()
+
+    cached = next((tmp_path / "tokens").glob("*.bin")).read_bytes()
+    assert token.encode() not in cached
+
+    second = counting_provider(True, calls)
+    assert second.get_token() == token
+    second.stop()
+    assert len(calls) == 1
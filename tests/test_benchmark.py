@@ -0,0 +1,24 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmark import run_scenario
+
+
+def test_fleet_deploys_end_to_end_against_fake_cloud():
+    result = run_scenario(
+        2, latency=0.0, transition=0.1, throttle=0.05, per_region_concurrency=2
+    )
+
+    assert result["errors"] == []
+    assert result["succeeded"] == 2
+    assert result["resources"] == {
+        "vpc": 2,
+        "public_gateway": 6,
+        "subnet": 8,
+        "security_group": 2,
+        "instance": 2,
+    }
+    assert result["api_calls"] >= result["operations"]["POST vpc:/instances"] >= 2
+    assert result["peak_rss_mb"] > 0
@@ -0,0 +1,66 @@
+import sys
+import os
+import subprocess
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from boottime import (
+    collect_timings,
+    instance_created_at,
+    parse_timings,
+    phase_durations,
+)
+from journal import Journal
+
+CONSOLE = """\
+[   12.3] cloud-init[900]: Reading package lists...
+VPC-LAB-BOOT start 1700000000.50
+VPC-LAB-BOOT tailscale_installed 1700000020.00
+cloud-init[900]: Success.
+VPC-LAB-BOOT tailscale_up 1700000024.25
+VPC-LAB-BOOT start 1700000300.00
+"""
+
+
+def test_parse_timings_ignores_noise_and_repeats():
+    assert parse_timings(CONSOLE) == [
+        ("start", 1700000000.5),
+        ("tailscale_installed", 1700000020.0),
+        ("tailscale_up", 1700000024.25),
+    ]
+
+
+def test_phase_durations_from_origin():
+    durations = phase_durations(parse_timings(CONSOLE), origin=1699999990.5)
+
+    assert durations == [
+        {"phase": "start", "offset": 10.0, "duration": 10.0},
+        {"phase": "tailscale_installed", "offset": 29.5, "duration": 19.5},
+        {"phase": "tailscale_up", "offset": 33.75, "duration": 4.25},
+    ]
+    assert phase_durations([]) == []
+
+
+def test_collect_timings_reads_file_over_ssh():
+    completed = subprocess.CompletedProcess([], 0, stdout=CONSOLE, stderr="")
+    with patch("boottime.subprocess.run", return_value=completed) as run:
+        timings = collect_timings("lab1-tailscale-instance")
+
+    command = run.call_args[0][0]
+    assert command[0] == "ssh"
+    assert "root@lab1-tailscale-instance" in command
+    assert command[-1] == "/var/log/vpc-lab/boot-timings.log"
+    phases = [phase for phase, _ in timings]
+    assert phases == ["start", "tailscale_installed", "tailscale_up"]
+
+
+def test_instance_created_at_comes_from_journal(monkeypatch, tmp_path):
+    monkeypatch.setenv("VPC_LAB_CACHE_DIR", str(tmp_path))
+    assert instance_created_at("lab1", "us-south") is None
+
+    Journal("lab1", "us-south").record(
+        "instance", {"id": "i-1", "created_at": "2023-11-14T22:13:20Z"}
+    )
+
+    assert instance_created_at("lab1", "us-south") == 1700000000.0
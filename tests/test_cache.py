@@ -0,0 +1,71 @@
+import sys
+import os
+import time
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import cache
+
+
+@pytest.fixture(autouse=True)
+def cache_root(monkeypatch, tmp_path):
+    monkeypatch.setenv("VPC_LAB_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(cache, "_refresh_requested", False)
+    return tmp_path
+
+
+def test_lookup_calls_loader_once_and_persists():
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return {"default": "rg-1"}
+
+    first = cache.LookupCache("acct", "global")
+    assert first.lookup("resource_groups", loader) == {"default": "rg-1"}
+    assert first.lookup("resource_groups", loader) == {"default": "rg-1"}
+
+    second = cache.LookupCache("acct", "global")
+    assert second.lookup("resource_groups", loader) == {"default": "rg-1"}
+    assert len(calls) == 1
+
+
+def test_expired_kind_is_reloaded():
+    lookups = cache.LookupCache("acct", "us-south", ttls={"keys": 0})
+    lookups.put("keys", {"old": "key-1"})
+    time.sleep(0.01)
+
+    assert lookups.lookup("keys", lambda: {"new": "key-2"}) == {"new": "key-2"}
+
+
+def test_invalidate_and_refresh_request():
+    lookups = cache.LookupCache("acct", "us-south")
+    lookups.put("keys", {"a": "1"})
+    lookups.put("zones", {"us-south-1": "available"})
+
+    lookups.invalidate("keys")
+    assert lookups.get("keys") is None
+    assert lookups.get("zones") is not None
+
+    cache.request_refresh()
+    reloaded = cache.LookupCache("acct", "us-south")
+    assert reloaded.get("zones") is None
+    reloaded.lookup("zones", lambda: {"us-south-2": "available"})
+    assert reloaded.get("zones") == {"us-south-2": "available"}
+
+
+def test_find_reloads_once_when_a_name_is_missing():
+    lookups = cache.LookupCache("acct", "us-south")
+    lookups.put("keys", {"old": "key-1"})
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return {"old": "key-1", "new": "key-2"}
+
+    assert lookups.find("keys", "old", loader) == "key-1"
+    assert calls == []
+    assert lookups.find("keys", "new", loader) == "key-2"
+    assert lookups.find("keys", "gone", loader) is None
+    assert len(calls) == 2
@@ -0,0 +1,164 @@
+import sys
+import os
+import json
+
+import pytest
+import requests
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import auth
+import cache
+import cassette
+from cassette import Cassette, CassetteMiss, scrub_body, scrub_url, use_cassette
+from fleet import assign_regions, run_fleet
+
+
+@pytest.fixture
+def cloud(fake_cloud):
+    return fake_cloud(latency={"POST vpc:/vpcs": 0.3}, transition=0)
+
+
+def deploy(prefix):
+    labs = assign_regions([prefix], ["us-south"])
+    run_fleet(labs, "default", "lab-key", "tag:lab", resume=False)
+    return labs[0]
+
+
+def test_record_then_replay_a_deployment_offline(cloud, monkeypatch, tmp_path):
+    path = tmp_path / "lab.json"
+    with use_cassette(path, "record"):
+        assert deploy("lab1")["state"] == "succeeded"
+    cloud.stop()
+
+    text = path.read_text()
+    recording = json.loads(text)
+    assert os.environ["IBMCLOUD_API_KEY"] not in text
+    assert "tskey-auth" not in text
+    (create_vpc,) = [
+        item
+        for item in recording["interactions"]
+        if item["request"]["method"] == "POST" and "/v1/vpcs?" in item["request"]["url"]
+    ]
+    assert create_vpc["elapsed"] >= 0.3
+
+    monkeypatch.setenv("VPC_LAB_CACHE_DIR", str(tmp_path / "replay"))
+    monkeypatch.setattr(auth, "_providers", {})
+    monkeypatch.setattr(cache, "_lookup_caches", {})
+    with use_cassette(path, "replay", scale=0) as replayed:
+        lab = deploy("lab1")
+
+    assert lab["state"] == "succeeded", lab.get("error")
+    assert replayed.unplayed() == []
+
+
+def test_recording_with_a_warm_cache_replays_with_a_cold_one(
+    cloud, monkeypatch, tmp_path
+):
+    import images
+
+    # An earlier deploy leaves fresh lookups and image index in the cache
+    assert deploy("lab0")["state"] == "succeeded"
+    monkeypatch.setattr(auth, "_providers", {})
+    monkeypatch.setattr(cache, "_lookup_caches", {})
+    # --record requests a refresh, as the CLIs do
+    monkeypatch.setattr(cache, "_refresh_requested", True)
+    monkeypatch.setattr(images, "_rebuilt", set())
+    path = tmp_path / "lab.json"
+    with use_cassette(path, "record"):
+        assert deploy("lab1")["state"] == "succeeded"
+    cloud.stop()
+
+    monkeypatch.setenv("VPC_LAB_CACHE_DIR", str(tmp_path / "replay"))
+    monkeypatch.setattr(auth, "_providers", {})
+    monkeypatch.setattr(cache, "_lookup_caches", {})
+    monkeypatch.setattr(cache, "_refresh_requested", False)
+    with use_cassette(path, "replay", scale=0):
+        lab = deploy("lab1")
+
+    assert lab["state"] == "succeeded", lab.get("error")
+
+
+def test_replay_serves_recorded_responses_in_order_and_scales_latency(tmp_path):
+    path = tmp_path / "cassette.json"
+    recorded = Cassette(path, "record")
+    for status, elapsed in ((429, 0.1), (200, 0.4)):
+        recorded.record(
+            "GET",
+            "https://us-south.iaas.cloud.ibm.com/v1/keys?version=1&generation=2",
+            b"",
+            "",
+            status,
+            {"Content-Type": "application/json", "Set-Cookie": "session=1"},
+            b'{"keys": []}',
+            0.0,
+            elapsed,
+        )
+    recorded.save()
+
+    replay = Cassette(path, "replay", scale=0.5)
+    url = "https://us-south.iaas.cloud.ibm.com/v1/keys?generation=2&version=1"
+    statuses = []
+    for _ in range(3):
+        interaction, delay, content = replay.play("GET", url, None)
+        statuses.append((interaction["response"]["status"], delay))
+
+    assert statuses == [(429, 0.05), (200, 0.2), (200, 0.2)]
+    assert interaction["response"]["headers"] == {"content-type": "application/json"}
+    assert json.loads(content) == {"keys": []}
+    with pytest.raises(CassetteMiss):
+        replay.play("GET", "https://us-south.iaas.cloud.ibm.com/v1/vpcs", None)
+
+
+def test_replay_reissues_scrubbed_iam_tokens(tmp_path):
+    import jwt
+
+    token = jwt.encode(
+        {
+            "account": {"bss": "acct"},
+            "email": "me@example.com",
+            "iat": 100,
+            "exp": 3700,
+        },
+        "a-secret-signing-key-of-32-bytes!",
+        algorithm="HS256",
+    )
+    body = json.dumps({"access_token": token, "refresh_token": "r", "expiration": 3700})
+
+    scrubbed = json.loads(scrub_body(body, "application/json"))
+    claims = jwt.decode(scrubbed["access_token"], options={"verify_signature": False})
+    fresh = cassette._fresh_tokens(scrubbed, 5000)
+    fresh_claims = jwt.decode(
+        fresh["access_token"], options={"verify_signature": False}
+    )
+
+    assert scrubbed["refresh_token"] == "SCRUBBED"
+    assert claims == {"account": {"bss": "acct"}, "iat": 0, "exp": 3600}
+    assert (fresh_claims["iat"], fresh_claims["exp"], fresh["expiration"]) == (
+        5000,
+        8600,
+        8600,
+    )
+
+
+def test_scrubbing_forms_urls_and_literal_secrets():
+    form = "grant_type=urn%3Aibm%3Aparams%3Aoauth%3Agrant-type%3Aapikey&apikey=abc123"
+
+    assert "abc123" not in scrub_body(form, "application/x-www-form-urlencoded")
+    assert (
+        scrub_url("https://x/v1/y?apikey=abc&limit=5")
+        == "https://x/v1/y?apikey=SCRUBBED&limit=5"
+    )
+    assert (
+        scrub_body("token hunter2 here", "text/plain", ("hunter2",))
+        == "token SCRUBBED here"
+    )
+
+
+def test_requests_are_hooked_only_while_a_cassette_is_active(tmp_path):
+    original = requests.adapters.HTTPAdapter.send
+    with use_cassette(tmp_path / "x.json", "record"):
+        assert requests.adapters.HTTPAdapter.send is not original
+
+    assert requests.adapters.HTTPAdapter.send is original
+    assert json.loads((tmp_path / "x.json").read_text())["interactions"] == []
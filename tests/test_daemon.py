@@ -0,0 +1,153 @@
+import sys
+import os
+import threading
+import time
+from functools import partial
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import waiters
+from daemon import Daemon, JobError, JobQueue, api_request, serve
+
+SPEC = dict(
+    resource_group="default",
+    ssh_key="lab-key",
+    tailscale_tag="tag:lab",
+    boot_profile="full",
+    routers=1,
+    router_bandwidth=None,
+    dns_zone=None,
+    ipam=True,
+    wait=True,
+    resume=True,
+)
+
+
+@pytest.fixture
+def cloud(cloud, monkeypatch):
+    waiter = partial(waiters.ResourceWaiter, base_delay=0.05)
+    monkeypatch.setattr(waiters, "ResourceWaiter", waiter)
+    return cloud
+
+
+def test_queue_takes_each_job_once_and_survives_restarts(tmp_path):
+    path = tmp_path / "jobs.sqlite3"
+    queue = JobQueue(path)
+    for n in range(20):
+        queue.submit(dict(SPEC, region="us-south", prefix=f"lab{n:03d}"))
+    with pytest.raises(JobError) as error:
+        queue.submit(dict(SPEC, region="us-south", prefix="lab000"))
+    assert error.value.status == 409
+
+    # Separate connections stand in for separate worker processes
+    takers = [JobQueue(path) for _ in range(8)]
+    taken = []
+
+    def drain(taker):
+        while True:
+            job = taker.take()
+            if job is None:
+                return
+            taken.append(job["prefix"])
+
+    threads = [threading.Thread(target=drain, args=(taker,)) for taker in takers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(taken) == [f"lab{n:03d}" for n in range(20)]
+
+    # A restarted daemon queues the jobs it left running again
+    assert JobQueue(path).requeue_running() == 20
+    assert queue.metrics()["depth"]["queued"] == 20
+
+
+def test_cancel_queued_and_running_jobs(tmp_path):
+    queue = JobQueue(tmp_path / "jobs.sqlite3")
+    running = queue.submit(dict(SPEC, region="us-south", prefix="lab001"))
+    queued = queue.submit(dict(SPEC, region="us-south", prefix="lab002"))
+    assert queue.take()["id"] == running["id"]
+
+    assert queue.cancel(queued["id"])["state"] == "cancelled"
+    assert queue.take() is None
+    job = queue.cancel(running["id"])
+    assert job["state"] == "running" and queue.cancel_requested(running["id"])
+
+    queue.finish(running["id"], "cancelled")
+    with pytest.raises(JobError) as error:
+        queue.cancel(running["id"])
+    assert error.value.status == 409
+    assert queue.metrics()["window"]["cancelled"] == 2
+
+
+def test_job_fields_are_checked_for_type_and_range(tmp_path):
+    runner = Daemon(
+        JobQueue(tmp_path / "jobs.sqlite3"),
+        {"resource_group": "default", "ssh_key": "lab-key", "tailscale_tag": "tag:lab"},
+    )
+    lab = {"region": "us-south", "prefix": "lab1"}
+
+    for fields, message in [
+        ({"routers": 0, "router_bandwidth": -5, "wait": "no"}, "wait"),
+        ({"routers": 0}, "routers"),
+        ({"routers": 13}, "routers"),
+        ({"routers": "2"}, "routers"),
+        ({"routers": True}, "routers"),
+        ({"router_bandwidth": -5}, "router_bandwidth"),
+        ({"router_bandwidth": 1.5}, "router_bandwidth"),
+        ({"ipam": 1}, "ipam"),
+        ({"resume": "false"}, "resume"),
+        ({"prefix": 7}, "prefix"),
+    ]:
+        with pytest.raises(JobError) as error:
+            runner.submit(dict(lab, **fields))
+        assert error.value.status == 400 and message in str(error.value)
+
+    spec = runner.job_spec(dict(lab, routers=12, router_bandwidth=1, wait=False))
+    assert (spec["routers"], spec["router_bandwidth"], spec["wait"]) == (12, 1, False)
+    assert runner.queue.list() == []
+
+
+def test_daemon_deploys_submitted_labs_over_its_api(cloud, tmp_path):
+    runner = Daemon(
+        JobQueue(),
+        {"resource_group": "default", "ssh_key": "lab-key", "tailscale_tag": "tag:lab"},
+        workers=2,
+    )
+    runner.warm(["us-south"])
+    server = serve(runner, socket_path=str(tmp_path / "daemon.sock"))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    runner.start()
+    call = partial(api_request, socket_path=str(tmp_path / "daemon.sock"))
+    try:
+        status, first = call(
+            "POST", "/jobs", {"region": "us-south", "prefix": "lab001"}
+        )
+        assert status == 202
+        status, _ = call("POST", "/jobs", {"region": "us-south", "prefix": "lab002"})
+        assert status == 202
+        status, error = call("POST", "/jobs", {"region": "us-south", "colour": "red"})
+        assert status == 400 and "colour" in error["error"]
+
+        deadline = time.time() + 30
+        while time.time() < deadline:
+            jobs = call("GET", "/jobs")[1]["jobs"]
+            if all(job["state"] == "succeeded" for job in jobs):
+                break
+            time.sleep(0.1)
+        assert [job["state"] for job in jobs] == ["succeeded", "succeeded"]
+        job = call("GET", f"/jobs/{first['id']}")[1]
+        assert job["result"]["instance_id"]
+
+        metrics = call("GET", "/metrics")[1]
+        assert metrics["depth"]["succeeded"] == 2
+        assert metrics["warm_regions"] == ["us-south"]
+        assert metrics["run_time_s"]["p50"] > 0
+        # The VPC client authenticated once, during warm-up
+        assert cloud.stats()["operations"]["POST iam:/identity/token"] == 1
+    finally:
+        runner.stop(timeout=5)
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,189 @@
+import sys
+import os
+import pytest
+from concurrent.futures import Future
+from unittest.mock import patch, MagicMock
+from click.testing import CliRunner
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import destroy
+from journal import Journal
+
+ZONES = ["us-south-1", "us-south-2"]
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(monkeypatch, tmp_path):
+    monkeypatch.setenv("VPC_LAB_CACHE_DIR", str(tmp_path))
+    monkeypatch.setenv("IBMCLOUD_API_KEY", "mock_ibmcloud_api_key")
+    monkeypatch.setenv("TAILSCALE_API_KEY", "mock_tailscale_api_key")
+    monkeypatch.setenv("TAILNET_ID", "mock_tailnet_id")
+
+
+@pytest.fixture(autouse=True)
+def dns_instances():
+    with patch("destroy.find_dns_instances", return_value={}) as mock_find:
+        yield mock_find
+
+
+def listing(collection, resources):
+    return MagicMock(get_result=MagicMock(return_value={collection: resources}))
+
+
+def region_client(prefixes):
+    resources = {
+        "vpcs": [],
+        "public_gateways": [],
+        "subnets": [],
+        "security_groups": [],
+        "instances": [],
+    }
+    for prefix in prefixes:
+        vpc = {"id": f"{prefix}-vpc-id"}
+        resources["vpcs"].append({"id": f"{prefix}-vpc-id", "name": f"{prefix}-vpc"})
+        for zone in ZONES:
+            resources["public_gateways"].append(
+                {
+                    "id": f"{prefix}-pgw-{zone}",
+                    "name": f"{prefix}-pgw-{zone}",
+                    "vpc": vpc,
+                }
+            )
+            resources["subnets"].append(
+                {
+                    "id": f"{prefix}-backend-{zone}",
+                    "name": f"{prefix}-backend-subnet-{zone}",
+                    "vpc": vpc,
+                }
+            )
+        resources["security_groups"].append(
+            {"id": f"{prefix}-sg", "name": f"{prefix}-security-group", "vpc": vpc}
+        )
+        resources["instances"].append(
+            {"id": f"{prefix}-vsi", "name": f"{prefix}-tailscale-instance", "vpc": vpc}
+        )
+    client = MagicMock()
+    for collection, items in resources.items():
+        getattr(client, f"list_{collection}").return_value = listing(collection, items)
+    return client
+
+
+@pytest.fixture
+def zones():
+    with patch("destroy.get_zone_names", return_value=ZONES) as mock_zones:
+        yield mock_zones
+
+
+def test_discovery_matches_exact_names(zones):
+    client = region_client(["lab1", "lab10"])
+    Journal("lab1", "us-south").record("tailscale_key", {"id": "k-1", "key": "x"})
+
+    labs = destroy.discover_labs(client, "us-south", ["lab1", "lab2"])
+
+    assert set(labs) == {"lab1"}
+    assert labs["lab1"]["tailscale_key"] == "k-1"
+    kinds = sorted(resource["kind"] for resource in labs["lab1"]["resources"])
+    assert kinds == [
+        "instance",
+        "public_gateway",
+        "public_gateway",
+        "security_group",
+        "subnet",
+        "subnet",
+        "vpc",
+    ]
+    client.list_vpcs.assert_called_once()
+
+
+def test_discovery_looks_up_dns_instances_missing_from_the_journal(
+    zones, dns_instances
+):
+    client = region_client([])
+    Journal("lab1", "us-south").record("dns_instance", {"guid": "g-1"})
+    dns_instances.return_value = {"lab2-us-south-dns": {"guid": "g-2"}}
+
+    labs = destroy.discover_labs(client, "us-south", ["lab1", "lab2", "lab3"])
+
+    (names,) = dns_instances.call_args.args
+    assert sorted(names) == ["lab2-us-south-dns", "lab3-us-south-dns"]
+    assert {prefix: lab["dns_instance"] for prefix, lab in labs.items()} == {
+        "lab1": "g-1",
+        "lab2": "g-2",
+    }
+
+
+def test_levels_are_deleted_in_reverse_dependency_order(zones):
+    client = region_client(["lab1", "lab2"])
+    Journal("lab1", "us-south").record("tailscale_key", {"id": "k-1", "key": "x"})
+    labs = destroy.discover_labs(client, "us-south", ["lab1", "lab2"])
+    deleted = []
+    waiter = MagicMock()
+
+    def watch(kind, resource_id, vpc_id=None, deleted=False):
+        future = Future()
+        future.set_result(None)
+        return future
+
+    waiter.watch.side_effect = watch
+
+    def fake_delete(client, kind, resource_id):
+        deleted.append(kind)
+        return True
+
+    with patch("destroy.delete_resource", side_effect=fake_delete), patch(
+        "destroy.revoke_tailscale_key"
+    ) as mock_revoke:
+        results = destroy.destroy_labs(client, "us-south", labs, waiter)
+
+    assert deleted[:2] == ["instance", "instance"]
+    assert set(deleted[2:8]) == {"subnet", "security_group"}
+    assert deleted[8:12] == ["public_gateway"] * 4
+    assert deleted[12:] == ["vpc", "vpc"]
+    assert waiter.watch.call_count == 14
+    mock_revoke.assert_called_once_with(
+        "mock_tailscale_api_key", "mock_tailnet_id", "k-1"
+    )
+    assert [status["state"] for status in results] == ["destroyed", "destroyed"]
+    assert Journal("lab1", "us-south").get("tailscale_key") is None
+
+
+def test_failed_lab_stops_at_its_level(zones):
+    client = region_client(["lab1", "lab2"])
+    labs = destroy.discover_labs(client, "us-south", ["lab1", "lab2"])
+    deleted = []
+    waiter = MagicMock()
+    done = Future()
+    done.set_result(None)
+    waiter.watch.return_value = done
+
+    def fake_delete(client, kind, resource_id):
+        if resource_id == "lab1-sg":
+            raise RuntimeError("security group in use")
+        deleted.append(resource_id)
+        return True
+
+    with patch("destroy.delete_resource", side_effect=fake_delete):
+        results = destroy.destroy_labs(client, "us-south", labs, waiter)
+
+    assert "lab1-vpc-id" not in deleted
+    assert "lab2-vpc-id" in deleted
+    assert results[0]["state"] == "failed"
+    assert "security group in use" in results[0]["error"]
+    assert results[1]["state"] == "destroyed"
+
+
+def test_destroy_command_asks_before_deleting(zones):
+    client = region_client(["lab1"])
+    with patch("destroy.vpc_client", return_value=client), patch(
+        "destroy.destroy_labs"
+    ) as mock_destroy:
+        result = CliRunner().invoke(
+            destroy.destroy,
+            ["--region", "us-south", "--prefix", "lab1"],
+            input="n\n",
+        )
+
+    assert result.exit_code == 1
+    assert "Delete 7 resources in 1 labs?" in result.output
+    mock_destroy.assert_not_called()
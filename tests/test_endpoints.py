@@ -0,0 +1,26 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from endpoints import service_url, vpc_region
+from ratelimit import endpoint_family
+
+
+def test_defaults():
+    assert service_url("vpc", "eu-de") == "https://eu-de.iaas.cloud.ibm.com/v1"
+    assert vpc_region("https://eu-de.iaas.cloud.ibm.com/v1") == "eu-de"
+
+
+def test_overrides_route_urls_families_and_regions(monkeypatch):
+    monkeypatch.setenv("IBMCLOUD_VPC_URL", "http://127.0.0.1:8780/vpc/{region}/v1")
+    monkeypatch.setenv("TAILSCALE_API_URL", "http://127.0.0.1:8780/tailscale/")
+
+    assert service_url("vpc", "us-east") == "http://127.0.0.1:8780/vpc/us-east/v1"
+    assert service_url("tailscale") == "http://127.0.0.1:8780/tailscale"
+    assert vpc_region("http://127.0.0.1:8780/vpc/us-east/v1") == "us-east"
+    assert endpoint_family("http://127.0.0.1:8780/vpc/us-east/v1/vpcs") == "vpc"
+    assert (
+        endpoint_family("http://127.0.0.1:8780/tailscale/api/v2/tailnet/t/keys")
+        == "tailscale"
+    )
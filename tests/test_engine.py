@@ -0,0 +1,72 @@
+import sys
+import os
+import threading
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from engine import ProvisioningGraph, ProvisioningError
+
+
+def test_dependencies_receive_results():
+    graph = ProvisioningGraph(max_workers=4)
+    graph.add("vpc", lambda r: "vpc-1")
+    graph.add("subnet", lambda r: f"{r['vpc']}-subnet", requires=["vpc"])
+
+    results = graph.run()
+
+    assert results == {"vpc": "vpc-1", "subnet": "vpc-1-subnet"}
+
+
+def test_independent_nodes_run_concurrently():
+    barrier = threading.Barrier(3, timeout=5)
+    graph = ProvisioningGraph(max_workers=3)
+    for name in ("image", "ssh_key", "tailscale_key"):
+        graph.add(name, lambda r, name=name: barrier.wait() is not None and name)
+
+    results = graph.run()
+
+    assert set(results) == {"image", "ssh_key", "tailscale_key"}
+
+
+def test_nodes_added_while_running():
+    graph = ProvisioningGraph(max_workers=2)
+
+    def add_zones(r):
+        for zone in ("us-south-1", "us-south-2"):
+            graph.add(f"pgw:{zone}", lambda r, zone=zone: f"pgw-{zone}")
+        return ["us-south-1", "us-south-2"]
+
+    graph.add("zones", add_zones)
+    graph.add("instance", lambda r: r["pgw:us-south-1"], requires=["pgw:us-south-1"])
+
+    results = graph.run()
+
+    assert results["instance"] == "pgw-us-south-1"
+    assert results["pgw:us-south-2"] == "pgw-us-south-2"
+
+
+def test_failure_stops_dependent_nodes():
+    called = []
+
+    def boom(r):
+        raise RuntimeError("quota exceeded")
+
+    graph = ProvisioningGraph(max_workers=2)
+    graph.add("vpc", boom)
+    graph.add("subnet", lambda r: called.append("subnet"), requires=["vpc"])
+
+    with pytest.raises(ProvisioningError) as excinfo:
+        graph.run()
+
+    assert excinfo.value.node == "vpc"
+    assert isinstance(excinfo.value.cause, RuntimeError)
+    assert called == []
+
+
+def test_missing_dependency_is_reported():
+    graph = ProvisioningGraph()
+    graph.add("instance", lambda r: None, requires=["frontend_subnet"])
+
+    with pytest.raises(ProvisioningError, match="instance"):
+        graph.run()
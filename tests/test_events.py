@@ -0,0 +1,188 @@
+import sys
+import os
+import io
+import json
+import threading
+import time
+
+import pytest
+from rich.console import Console
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from engine import ProvisioningError, ProvisioningGraph
+from events import (
+    EventBus,
+    JsonLinesRenderer,
+    LiveRenderer,
+    ProgressState,
+    bus,
+    publish,
+    render_progress,
+)
+
+
+class SlowRenderer:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.batches = []
+
+    def start(self):
+        pass
+
+    def handle(self, events, state):
+        self.batches.append(len(events))
+        time.sleep(self.delay)
+
+    def stop(self):
+        pass
+
+
+def test_publish_without_subscribers_is_a_no_op():
+    local = EventBus()
+    local.publish("step_started", lab="us-south/lab1", step="vpc")
+
+    subscriber = local.subscribe()
+    local.publish("step_started", lab="us-south/lab1", step="vpc")
+    local.unsubscribe(subscriber)
+    local.publish("step_finished", lab="us-south/lab1", step="vpc")
+
+    event = subscriber.get_nowait()
+    assert (event["type"], event["step"]) == ("step_started", "vpc")
+    assert subscriber.empty()
+
+
+def test_graph_events_count_steps_added_at_run_time():
+    graph = ProvisioningGraph(name="us-south/lab1")
+
+    def add_zones(r):
+        for zone in ("us-south-1", "us-south-2", "us-south-3"):
+            graph.add(f"subnet:{zone}", lambda r: zone, requires=["zones"])
+        return ["us-south-1", "us-south-2", "us-south-3"]
+
+    with render_progress(SlowRenderer()) as state:
+        graph.add("zones", add_zones)
+        graph.run()
+
+    lab = state.labs["us-south/lab1"]
+    assert (lab["done"], lab["steps"]) == (4, 4)
+    assert lab["running"] == []
+
+
+def test_failed_step_is_published():
+    graph = ProvisioningGraph(name="us-south/lab1")
+    graph.add("vpc", lambda r: 1 / 0)
+    output = io.StringIO()
+
+    with render_progress(JsonLinesRenderer(output)):
+        with pytest.raises(ProvisioningError):
+            graph.run()
+
+    events = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [event["type"] for event in events] == ["step_started", "step_failed"]
+    assert events[1]["error"] == "division by zero"
+
+
+def test_slow_renderer_never_stalls_publishers_and_batches_events():
+    renderer = SlowRenderer(delay=0.05)
+
+    def deploy(n):
+        lab = f"us-south/lab{n:03d}"
+        publish("lab_started", lab=lab)
+        for step in range(20):
+            publish("step_added", lab=lab, step=str(step))
+            publish("step_finished", lab=lab, step=str(step))
+        publish("lab_finished", lab=lab, state="succeeded")
+
+    with render_progress(renderer, min_interval=0.01) as state:
+        started = time.monotonic()
+        threads = [threading.Thread(target=deploy, args=(n,)) for n in range(300)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        publishing = time.monotonic() - started
+
+    assert publishing < 1.0
+    assert sum(renderer.batches) == 300 * 42
+    assert len(renderer.batches) < 300
+    assert state.counts()["succeeded"] == 300
+    assert state.totals() == (6000, 6000)
+
+
+def test_idle_renderer_is_redrawn_without_events():
+    renderer = SlowRenderer()
+    renderer.idle_interval = 0.05
+
+    with render_progress(renderer):
+        publish("lab_started", lab="us-south/lab1")
+        time.sleep(0.5)
+
+    assert renderer.batches[0] == 1
+    assert renderer.batches[1:].count(0) >= 4
+    assert LiveRenderer.idle_interval == 1.0
+    assert JsonLinesRenderer.idle_interval is None
+
+
+def test_live_view_lists_only_active_labs_when_there_are_many():
+    state = ProgressState()
+    for n in range(300):
+        lab = f"us-south/lab{n:03d}"
+        state.apply({"type": "lab_started", "lab": lab, "ts": 0.0})
+        state.apply({"type": "step_added", "lab": lab, "step": "vpc", "ts": 0.0})
+        if n % 10:
+            state.apply(
+                {"type": "lab_finished", "lab": lab, "state": "succeeded", "ts": 5.0}
+            )
+    console = Console(file=io.StringIO(), width=120)
+
+    console.print(LiveRenderer(max_rows=20).render(state))
+
+    text = console.file.getvalue()
+    assert "30 running" in text and "270 succeeded" in text
+    assert "280 more labs not shown" in text
+    assert text.count("us-south/lab") == 20
+
+
+def test_finished_fleet_lists_every_lab_with_its_elapsed_time():
+    state = ProgressState()
+    for n in range(30):
+        lab = f"us-south/lab{n:03d}"
+        state.apply({"type": "lab_started", "lab": lab, "ts": 0.0})
+        state.apply(
+            {
+                "type": "lab_finished",
+                "lab": lab,
+                "state": "failed" if n == 7 else "succeeded",
+                "error": "quota exceeded" if n == 7 else None,
+                "elapsed": 61.0 + n,
+                "ts": 200.0,
+            }
+        )
+    state.apply(
+        {
+            "type": "fleet_finished",
+            "total": 30,
+            "succeeded": 29,
+            "failed": 1,
+            "wall_time": 95.0,
+            "labs_per_minute": 18.32,
+            "labs": [],
+            "ts": 200.0,
+        }
+    )
+    console = Console(file=io.StringIO(), width=120)
+
+    console.print(LiveRenderer(max_rows=20).render(state))
+
+    text = console.file.getvalue()
+    assert text.count("us-south/lab") == 30
+    assert "not shown" not in text
+    assert "61s" in text and "quota exceeded" in text
+
+
+def test_process_bus_has_no_subscribers_after_rendering():
+    with render_progress(SlowRenderer()):
+        pass
+
+    assert bus._subscribers == ()
@@ -0,0 +1,123 @@
+import sys
+import os
+import time
+
+import pytest
+import requests
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from fake_cloud import FakeCloud
+
+AUTH = {"Authorization": "Bearer token"}
+
+
+@pytest.fixture
+def cloud():
+    cloud = FakeCloud(
+        regions=("us-south",), transition=0.2, delete_delay=0.1, image_count=120
+    )
+    cloud.start()
+    yield cloud
+    cloud.stop()
+
+
+def vpc_url(cloud, path):
+    return f"{cloud.url}/vpc/us-south/v1{path}"
+
+
+def test_resources_become_available_and_are_deleted(cloud):
+    vpc = requests.post(vpc_url(cloud, "/vpcs"), json={"name": "lab-vpc"}, headers=AUTH)
+    vpc_id = vpc.json()["id"]
+
+    assert vpc.status_code == 201
+    assert vpc.json()["status"] == "pending"
+    time.sleep(0.25)
+    got = requests.get(vpc_url(cloud, f"/vpcs/{vpc_id}"), headers=AUTH).json()
+    assert got["status"] == "available"
+
+    assert (
+        requests.delete(vpc_url(cloud, f"/vpcs/{vpc_id}"), headers=AUTH).status_code
+        == 204
+    )
+    listed = requests.get(vpc_url(cloud, "/vpcs"), headers=AUTH).json()["vpcs"]
+    assert [vpc["status"] for vpc in listed] == ["deleting"]
+    time.sleep(0.15)
+    assert (
+        requests.get(vpc_url(cloud, f"/vpcs/{vpc_id}"), headers=AUTH).status_code == 404
+    )
+
+
+def test_duplicate_names_and_quotas(cloud):
+    cloud.quotas["vpc"] = 2
+    first = requests.post(vpc_url(cloud, "/vpcs"), json={"name": "a"}, headers=AUTH)
+    duplicate = requests.post(vpc_url(cloud, "/vpcs"), json={"name": "a"}, headers=AUTH)
+    second = requests.post(vpc_url(cloud, "/vpcs"), json={"name": "b"}, headers=AUTH)
+    over = requests.post(vpc_url(cloud, "/vpcs"), json={"name": "c"}, headers=AUTH)
+
+    assert (first.status_code, second.status_code) == (201, 201)
+    assert duplicate.status_code == 409
+    assert over.status_code == 400
+    assert over.json()["errors"][0]["code"] == "over_quota"
+
+
+def test_images_are_paginated_newest_first(cloud):
+    first = requests.get(vpc_url(cloud, "/images?limit=100"), headers=AUTH).json()
+    href = first["next"]["href"]
+    second = requests.get(vpc_url(cloud, f"/images{href}"), headers=AUTH).json()
+
+    assert len(first["images"]) == 100
+    assert len(second["images"]) == 20
+    assert "next" not in second
+    assert first["images"][0]["created_at"] > second["images"][-1]["created_at"]
+
+
+def test_throttling_and_stats(cloud):
+    cloud.throttle = 1.0
+    response = requests.get(vpc_url(cloud, "/keys"), headers=AUTH)
+    cloud.throttle = 0.0
+    keys = requests.get(vpc_url(cloud, "/keys"), headers=AUTH).json()["keys"]
+    unauthorized = requests.get(vpc_url(cloud, "/keys"))
+
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "0"
+    assert [key["name"] for key in keys] == ["lab-key"]
+    assert unauthorized.status_code == 401
+    stats = cloud.stats()
+    assert stats["requests"] == 3
+    assert stats["throttled"] == 1
+    assert stats["operations"]["GET vpc:/keys"] == 3
+
+
+def test_instance_needs_an_available_subnet(cloud):
+    vpc = requests.post(
+        vpc_url(cloud, "/vpcs"), json={"name": "v"}, headers=AUTH
+    ).json()
+    subnet = requests.post(
+        vpc_url(cloud, "/subnets"),
+        json={
+            "name": "s",
+            "vpc": {"id": vpc["id"]},
+            "zone": {"name": "us-south-1"},
+            "total_ipv4_address_count": 128,
+        },
+        headers=AUTH,
+    ).json()
+    prototype = {
+        "name": "i",
+        "vpc": {"id": vpc["id"]},
+        "profile": {"name": "bx2-2x8"},
+        "primary_network_interface": {"subnet": {"id": subnet["id"]}},
+    }
+
+    early = requests.post(vpc_url(cloud, "/instances"), json=prototype, headers=AUTH)
+    time.sleep(0.25)
+    created = requests.post(vpc_url(cloud, "/instances"), json=prototype, headers=AUTH)
+
+    assert subnet["ipv4_cidr_block"] == "10.240.0.0/25"
+    assert early.status_code == 409
+    assert created.status_code == 201
+    assert (
+        created.json()["primary_network_interface"]["primary_ip"]["address"]
+        == "10.240.0.4"
+    )
@@ -0,0 +1,104 @@
+import sys
+import os
+import json
+import threading
+import time
+import pytest
+from unittest.mock import patch, MagicMock
+from click.testing import CliRunner
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import fleet
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(monkeypatch, tmp_path):
+    monkeypatch.setenv("VPC_LAB_CACHE_DIR", str(tmp_path))
+    monkeypatch.setenv("IBMCLOUD_API_KEY", "mock_ibmcloud_api_key")
+    monkeypatch.setenv("TAILSCALE_API_KEY", "mock_tailscale_api_key")
+    monkeypatch.setenv("TAILNET_ID", "mock_tailnet_id")
+
+
+@pytest.fixture
+def mock_region_setup():
+    with patch("fleet.vpc_client") as mock_client, patch(
+        "fleet.ResourceWaiter"
+    ) as mock_waiter, patch("fleet.warm_region") as mock_warm:
+        yield mock_client, mock_waiter, mock_warm
+
+
+def test_expand_prefixes_and_round_robin_regions():
+    names = fleet.expand_prefixes(("demo",), "lab{n:02d}", 3, 1)
+    labs = fleet.assign_regions(names, ["us-south", "eu-de"])
+
+    assert names == ["demo", "lab01", "lab02", "lab03"]
+    assert [lab["region"] for lab in labs] == [
+        "us-south",
+        "eu-de",
+        "us-south",
+        "eu-de",
+    ]
+
+
+def test_per_region_concurrency_is_capped(mock_region_setup):
+    running = {}
+    peak = {}
+    lock = threading.Lock()
+
+    def fake_deploy(client, resource_group, region, prefix, *args, **kwargs):
+        with lock:
+            running[region] = running.get(region, 0) + 1
+            peak[region] = max(peak.get(region, 0), running[region])
+        time.sleep(0.02)
+        with lock:
+            running[region] -= 1
+        if prefix == "lab05":
+            raise RuntimeError("quota exceeded")
+        return {"instance": {"id": f"{prefix}-vsi"}}
+
+    labs = fleet.assign_regions(
+        fleet.expand_prefixes((), "lab{n:02d}", 8, 1), ["us-south", "us-east"]
+    )
+    with patch("fleet.deploy_lab", side_effect=fake_deploy):
+        fleet.run_fleet(labs, "CDE", "key", "tag:lab", per_region_concurrency=2)
+
+    assert peak == {"us-south": 2, "us-east": 2}
+    failed = [lab for lab in labs if lab["state"] == "failed"]
+    assert [lab["prefix"] for lab in failed] == ["lab05"]
+    assert labs[0]["instance_id"] == "lab01-vsi"
+
+    summary = fleet.fleet_report(labs, 60.0)
+    assert summary["succeeded"] == 7
+    assert summary["labs_per_minute"] == 7.0
+    assert summary["regions"]["us-south"] == {"succeeded": 3, "failed": 1}
+
+
+def test_fleet_command_writes_report(mock_region_setup, tmp_path):
+    report = tmp_path / "report.json"
+    with patch(
+        "fleet.deploy_lab",
+        return_value={"instance": {"id": "vsi"}},
+    ):
+        result = CliRunner().invoke(
+            fleet.fleet,
+            [
+                "--resource-group",
+                "CDE",
+                "--region",
+                "us-south",
+                "--prefix",
+                "lab01",
+                "--prefix",
+                "lab02",
+                "--tailscale-tag",
+                "tag:lab",
+                "--ssh-key",
+                "key",
+                "--report",
+                str(report),
+            ],
+        )
+
+    assert result.exit_code == 0, result.output
+    assert json.loads(report.read_text())["succeeded"] == 2
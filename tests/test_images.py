@@ -0,0 +1,87 @@
+import sys
+import os
+from unittest.mock import MagicMock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import images
+
+
+def image(id, created_at, version="24.04 LTS Noble Numbat", arch="amd64"):
+    return {
+        "id": id,
+        "name": f"ibm-{id}",
+        "created_at": created_at,
+        "operating_system": {
+            "family": "Ubuntu Linux",
+            "version": version,
+            "architecture": arch,
+        },
+    }
+
+
+def paged_client(pages):
+    client = MagicMock()
+    responses = []
+    for i, page in enumerate(pages):
+        result = {"images": page}
+        if i < len(pages) - 1:
+            result["next"] = {"href": f"https://x/v1/images?start=page{i + 1}"}
+        responses.append(MagicMock(get_result=MagicMock(return_value=result)))
+    client.list_images.side_effect = responses
+    return client
+
+
+def test_find_latest_stops_at_first_matching_page():
+    client = paged_client(
+        [
+            [image("rhel", "2025-03-01", version="9.4")],
+            [
+                image("ubuntu-old", "2025-01-01"),
+                image("ubuntu-new", "2025-02-01"),
+                image("ubuntu-arm", "2025-02-15", arch="s390x"),
+            ],
+            [image("ubuntu-older", "2024-06-01")],
+        ]
+    )
+
+    found = images.find_latest_image(client, "ubuntu", "24.04", "amd64")
+
+    assert found["id"] == "ubuntu-new"
+    assert client.list_images.call_count == 2
+    assert client.list_images.call_args.kwargs["start"] == "page1"
+
+
+def test_catalog_is_served_locally_while_fresh(tmp_path, monkeypatch):
+    monkeypatch.setenv("VPC_LAB_CACHE_DIR", str(tmp_path))
+    client = paged_client([[image("ubuntu-new", "2025-02-01")]])
+
+    first = images.ImageCatalog("us-south").resolve(client, "ubuntu", "24.04", "amd64")
+    second = images.ImageCatalog("us-south").resolve(
+        MagicMock(), "ubuntu", "24.04", "amd64"
+    )
+
+    assert first["id"] == second["id"] == "ubuntu-new"
+    assert client.list_images.call_count == 1
+
+
+def test_stale_catalog_revalidates_with_one_small_request(tmp_path, monkeypatch):
+    monkeypatch.setenv("VPC_LAB_CACHE_DIR", str(tmp_path))
+    images.ImageCatalog("us-south").refresh(
+        paged_client([[image("ubuntu-new", "2025-02-01")]])
+    )
+
+    catalog = images.ImageCatalog("us-south", ttl=0)
+    client = paged_client([[image("ubuntu-new", "2025-02-01")]])
+    found = catalog.resolve(client, "ubuntu", "24.04", "amd64")
+
+    assert found["id"] == "ubuntu-new"
+    assert client.list_images.call_count == 1
+    assert client.list_images.call_args.kwargs["limit"] == 1
+
+
+def test_client_region_from_service_url():
+    client = MagicMock(spec=["service_url"])
+    client.service_url = "https://eu-de.iaas.cloud.ibm.com/v1"
+
+    assert images.client_region(client) == "eu-de"
@@ -0,0 +1,141 @@
+import sys
+import os
+import pytest
+from unittest.mock import MagicMock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from inventory import Inventory, INVENTORY_COLLECTIONS
+
+
+def resource(kind, n, name, created_at, **fields):
+    return dict(
+        {
+            "id": f"{kind}-{n}",
+            "crn": f"crn:v1:{kind}-{n}",
+            "name": name,
+            "created_at": created_at,
+        },
+        **fields,
+    )
+
+
+def lab_resources():
+    vpc = {"id": "vpc-1"}
+    return {
+        "vpcs": [
+            resource("vpc", 2, "lab2-vpc", "2025-01-02T00:00:00Z"),
+            resource("vpc", 1, "lab1-vpc", "2025-01-01T00:00:00Z"),
+        ],
+        "subnets": [
+            resource(
+                "subnet",
+                2,
+                "lab1-backend-subnet-us-south-2",
+                "2025-01-01T00:02:00Z",
+                vpc=vpc,
+                zone={"name": "us-south-2"},
+            ),
+            resource(
+                "subnet",
+                1,
+                "lab1-frontend-subnet-us-south-1",
+                "2025-01-01T00:01:00Z",
+                vpc=vpc,
+                zone={"name": "us-south-1"},
+            ),
+        ],
+        "public_gateways": [],
+        "security_groups": [
+            resource(
+                "sg",
+                1,
+                "lab1-security-group",
+                "2025-01-01T00:03:00Z",
+                vpc=vpc,
+                targets=[{"id": "nic-1"}],
+            ),
+        ],
+        "instances": [
+            resource(
+                "instance",
+                2,
+                "stray",
+                "2025-01-01T00:05:00Z",
+                vpc=vpc,
+                network_interfaces=[{"id": "nic-2"}],
+                vcpu={"count": 4},
+            ),
+            resource(
+                "instance",
+                1,
+                "lab1-tailscale-instance",
+                "2025-01-01T00:04:00Z",
+                vpc=vpc,
+                network_interfaces=[{"id": "nic-1"}],
+                vcpu={"count": 2},
+            ),
+        ],
+        "keys": [resource("key", 1, "my-key", "2024-01-01T00:00:00Z")],
+    }
+
+
+def fake_client(collections):
+    client = MagicMock()
+    for method, collection in INVENTORY_COLLECTIONS.values():
+
+        def list_method(collection=collection, **kwargs):
+            page = {collection: list(collections[collection])}
+            return MagicMock(get_result=MagicMock(return_value=page))
+
+        getattr(client, method).side_effect = list_method
+    return client
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = Inventory(tmp_path / "inventory.sqlite3")
+    yield index
+    index.close()
+
+
+def test_queries_after_full_sync(index):
+    stats = index.sync(fake_client(lab_resources()), "us-south")
+
+    assert all(entry["full"] for entry in stats.values())
+    assert stats["subnet"]["upserted"] == 2
+    assert index.find("us-south", "key", "my-key")["id"] == "key-1"
+    labs = index.labs("lab1")
+    assert [lab["prefix"] for lab in labs] == ["lab1"]
+    assert labs[0]["counts"] == {"subnet": 2, "security_group": 1, "instance": 2}
+    assert [lab["prefix"] for lab in index.labs()] == ["lab1", "lab2"]
+    assert index.subnets_per_zone("us-south") == {"us-south-1": 1, "us-south-2": 1}
+    assert [i["name"] for i in index.instances_without_tailscale_sg()] == ["stray"]
+    snapshot = index.snapshot("us-south")
+    assert {i["name"]: i["vcpu"] for i in snapshot["resources"]["instance"]} == {
+        "stray": 4,
+        "lab1-tailscale-instance": 2,
+    }
+
+
+def test_incremental_sync_stops_at_known_resources(index):
+    collections = lab_resources()
+    index.sync(fake_client(collections), "us-south")
+
+    new_vpc = resource("vpc", 3, "lab3-vpc", "2025-01-03T00:00:00Z")
+    collections["vpcs"].insert(0, new_vpc)
+    stats = index.sync_kind(fake_client(collections), "us-south", "vpc")
+
+    assert stats == {"pages": 1, "upserted": 1, "removed": 0, "full": False}
+    assert [lab["prefix"] for lab in index.labs()] == ["lab1", "lab2", "lab3"]
+
+
+def test_full_sync_removes_deleted_resources(index):
+    collections = lab_resources()
+    index.sync(fake_client(collections), "us-south")
+
+    collections["vpcs"].pop(0)
+    stats = index.sync_kind(fake_client(collections), "us-south", "vpc", full=True)
+
+    assert stats["removed"] == 1
+    assert [lab["prefix"] for lab in index.labs()] == ["lab1"]
@@ -0,0 +1,121 @@
+import sys
+import os
+import ipaddress
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from ipam import AddressLedger, IntervalAllocator, zone_plan
+
+
+@pytest.fixture
+def cloud(fake_cloud):
+    return fake_cloud(transition=0.3, delete_delay=0)
+
+
+def test_allocator_skips_reserved_space_and_keeps_alignment():
+    allocator = IntervalAllocator("10.0.0.0/16")
+    allocator.reserve("10.0.0.0/24")
+    allocator.reserve("10.0.4.0/23")
+    # Reserving outside the pool, or twice, changes nothing
+    allocator.reserve("192.168.0.0/24")
+    allocator.reserve("10.0.4.0/24")
+
+    assert allocator.allocate(22) == "10.0.8.0/22"
+    assert allocator.allocate(24) == "10.0.1.0/24"
+    assert allocator.allocate(23) == "10.0.2.0/23"
+    assert allocator.allocate(24) == "10.0.6.0/24"
+    assert allocator.free_addresses() == 65536 - 256 * 11
+    with pytest.raises(LookupError):
+        allocator.allocate(15)
+
+
+def test_zone_plan_splits_a_block_per_zone():
+    plan = zone_plan("10.64.4.0/22", ["us-south-1", "us-south-2", "us-south-3"])
+
+    assert plan["us-south-1"] == {
+        "prefix": "10.64.4.0/24",
+        "frontend": "10.64.4.0/25",
+        "backend": "10.64.4.128/25",
+    }
+    assert plan["us-south-3"]["backend"] == "10.64.6.128/25"
+    with pytest.raises(ValueError):
+        zone_plan("10.64.4.0/22", [f"zone-{n}" for n in range(5)])
+
+
+def test_ledger_blocks_are_stable_disjoint_and_released(tmp_path):
+    path = tmp_path / "blocks.sqlite3"
+    ledger = AddressLedger(path=path)
+    labs = [f"us-south/lab{n:03d}" for n in range(200)]
+
+    def allocate(chunk):
+        AddressLedger(path=path).allocate(chunk)
+
+    threads = [threading.Thread(target=allocate, args=(labs[n::4],)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    blocks = ledger.blocks()
+    assert sorted(blocks) == sorted(labs)
+    networks = sorted(ipaddress.ip_network(cidr) for cidr in blocks.values())
+    assert all(
+        a.broadcast_address < b.network_address for a, b in zip(networks, networks[1:])
+    )
+    # A lab keeps its block, and labs of other regions get their own
+    again = ledger.allocate(["us-south/lab007", "eu-de/lab007"])
+    assert again["us-south/lab007"] == blocks["us-south/lab007"]
+    assert again["eu-de/lab007"] not in blocks.values()
+
+    # A dry run shows the next block without recording it
+    preview = ledger.allocate(["eu-de/lab009"], dry_run=True)
+    assert "eu-de/lab009" not in ledger.blocks()
+    assert ledger.allocate(["eu-de/lab009"]) == preview
+
+    ledger.release(["us-south/lab000"])
+    # The lowest free block is handed out next
+    reused = ledger.allocate(["eu-de/lab008"])
+    assert reused == {"eu-de/lab008": blocks["us-south/lab000"]}
+
+
+def test_planned_cidrs_reach_the_vpc_and_are_released(cloud):
+    import destroy
+    import utils
+    from journal import Journal
+    from main import deploy_lab
+    from waiters import ResourceWaiter
+
+    client = utils.vpc_client(os.environ["IBMCLOUD_API_KEY"], "us-south")
+    (block,) = AddressLedger().allocate(["us-south/ipam"]).values()
+    results = deploy_lab(
+        client,
+        "default",
+        "us-south",
+        "ipam",
+        "lab-key",
+        "tag:lab",
+        waiter=ResourceWaiter(client, base_delay=0.05),
+        journal=Journal("ipam", "us-south"),
+        address_block=block,
+    )
+
+    plan = zone_plan(block, ["us-south-1", "us-south-2", "us-south-3"])
+    subnets = {
+        s["name"]: s["ipv4_cidr_block"] for s in cloud.resources("us-south", "subnet")
+    }
+    assert subnets == {
+        "ipam-frontend-subnet-us-south-1": plan["us-south-1"]["frontend"],
+        "ipam-backend-subnet-us-south-1": plan["us-south-1"]["backend"],
+        "ipam-backend-subnet-us-south-2": plan["us-south-2"]["backend"],
+        "ipam-backend-subnet-us-south-3": plan["us-south-3"]["backend"],
+    }
+    assert results["address_prefix:us-south-2"]["cidr"] == plan["us-south-2"]["prefix"]
+
+    labs = destroy.discover_labs(client, "us-south", ["ipam"])
+    waiter = ResourceWaiter(client, base_delay=0.05)
+    (status,) = destroy.destroy_labs(client, "us-south", labs, waiter)
+    assert status["state"] == "destroyed", status["error"]
+    assert AddressLedger().blocks() == {}
@@ -0,0 +1,68 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from journal import Journal, journal_path
+from engine import ProvisioningGraph
+
+
+def test_entries_replay_across_instances(tmp_path):
+    path = tmp_path / "lab.jsonl"
+    journal = Journal("lab", "us-south", path=path)
+    journal.record("vpc", "vpc-1")
+    journal.record("pgw:us-south-1", "pgw-1", {"vpc": "vpc-1"})
+    journal.forget("pgw:us-south-1")
+
+    reopened = Journal("lab", "us-south", path=path)
+
+    assert reopened.get("vpc") == "vpc-1"
+    assert reopened.get("pgw:us-south-1") is None
+    assert len(reopened.entries()) == 3
+
+
+def test_reset_and_truncated_line(tmp_path):
+    path = tmp_path / "lab.jsonl"
+    journal = Journal("lab", "us-south", path=path)
+    journal.record("vpc", "vpc-1")
+    journal.reset()
+    journal.record("vpc", "vpc-2")
+    with open(path, "a") as handle:
+        handle.write('{"step": "security_group", "res')
+
+    reopened = Journal("lab", "us-south", path=path)
+
+    assert reopened.steps().keys() == {"vpc"}
+    assert reopened.get("vpc") == "vpc-2"
+
+
+def test_journal_path_is_keyed_by_region_and_prefix(monkeypatch, tmp_path):
+    monkeypatch.setenv("VPC_LAB_CACHE_DIR", str(tmp_path))
+
+    assert journal_path("lab/1", "us-south").name == "us-south--lab_1.jsonl"
+    assert journal_path("lab", "eu-de") != journal_path("lab", "us-south")
+
+
+def test_graph_skips_verified_steps(tmp_path):
+    journal = Journal("lab", "us-south", path=tmp_path / "lab.jsonl")
+    journal.record("vpc", "vpc-1")
+    journal.record("subnet", "subnet-gone", {"vpc": "vpc-1"})
+    calls = []
+
+    graph = ProvisioningGraph(journal=journal)
+    graph.add("vpc", lambda r: calls.append("vpc"), verify=lambda id: True)
+    graph.add(
+        "subnet",
+        lambda r: calls.append("subnet") or f"{r['vpc']}-subnet-2",
+        requires=["vpc"],
+        verify=lambda id: id != "subnet-gone",
+    )
+    graph.add("ready", lambda r: calls.append("ready"), requires=["subnet"])
+
+    results = graph.run()
+
+    assert calls == ["subnet", "ready"]
+    assert graph.reused == {"vpc"}
+    assert results["subnet"] == "vpc-1-subnet-2"
+    assert journal.steps()["subnet"]["inputs"] == {"vpc": "vpc-1"}
+    assert "ready" not in journal.steps()
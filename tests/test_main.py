@@ -14,7 +14,8 @@ from main import main
 
 # Mock environment variables
 @pytest.fixture(autouse=True)
-def mock_env_vars(monkeypatch):
+def mock_env_vars(monkeypatch, tmp_path):
+    monkeypatch.setenv("VPC_LAB_CACHE_DIR", str(tmp_path))
     monkeypatch.setenv("TAILSCALE_API_KEY", "mock_tailscale_api_key")
     monkeypatch.setenv("TAILNET_ID", "mock_tailnet_id")
     monkeypatch.setenv("IBMCLOUD_API_KEY", "mock_ibmcloud_api_key")
@@ -27,7 +28,7 @@ def mock_vpc_client():
         # Return a mock object
         mock_client_instance = MagicMock()
         # Mock list_region_zones or whichever call returns the zones
-        mock_client_instance.list_region_zones.return_value = {
+        mock_client_instance.list_region_zones.return_value.get_result.return_value = {
             "zones": [
                 {"name": "us-south-1"},
                 {"name": "us-south-2"},
@@ -38,6 +39,17 @@ def mock_vpc_client():
         yield mock_client
 
 
+@pytest.fixture
+def mock_resource_waiter():
+    with patch("main.ResourceWaiter") as mock_waiter:
+        mock_waiter.return_value.wait.side_effect = lambda kind, id, vpc_id=None: {
+            "id": id,
+            "status": "running" if kind == "instance" else "available",
+        }
+        mock_waiter.return_value.pop_ready_times.return_value = {}
+        yield mock_waiter
+
+
 @pytest.fixture
 def mock_get_group_id_by_name():
     with patch("main.get_group_id_by_name") as mock_func:
@@ -100,6 +112,7 @@ def mock_create_new_instance():
 
 def test_main(
     mock_vpc_client,
+    mock_resource_waiter,
     mock_get_group_id_by_name,
     mock_create_vpc,
     mock_create_public_gateways,
@@ -113,17 +126,17 @@ def test_main(
 ):
     # pdb.set_trace()
     # Set up mock return values
-    mock_vpc_client.return_value = MagicMock()
     mock_get_group_id_by_name.return_value = "mock_resource_group_id"
     mock_create_vpc.return_value = {"id": "mock_vpc_id"}
     mock_create_public_gateways.return_value = {"id": "mock_pgw_id"}
     mock_create_subnets.return_value = {
         "id": "mock_subnet_id",
-        "zone": {"name": "mock_zone"},
+        "zone": {"name": "us-south-1"},
+        "ipv4_cidr_block": "10.64.0.0/25",
     }
     mock_create_tailscale_sg_group.return_value = {"id": "mock_sg_id"}
     mock_create_rules.return_value = None
-    mock_create_tailscale_key.return_value = "mock_tailscale_device_token"
+    mock_create_tailscale_key.return_value = {"key": "mock_tailscale_device_token"}
     mock_get_ssh_key_id.return_value = "mock_ssh_key_id"
     mock_get_latest_ubuntu.return_value = "mock_image_id"
     mock_create_new_instance.return_value = MagicMock(
@@ -156,19 +169,32 @@ def test_main(
     # Add assertions to verify the expected behavior
     mock_vpc_client.assert_called_once_with("mock_ibmcloud_api_key", "us-south")
     mock_get_group_id_by_name.assert_called_once_with("CDE")
+    # The lab's CIDRs are planned from the address ledger, not picked by the VPC
     mock_create_vpc.assert_called_once_with(
-        mock_vpc_client.return_value, "mock_resource_group_id", "rpv3"
+        mock_vpc_client.return_value,
+        "mock_resource_group_id",
+        "rpv3",
+        address_prefix_management="manual",
     )
-    mock_create_public_gateways.assert_called()
-    mock_create_subnets.assert_called()
+    assert mock_create_public_gateways.call_count == 3
+    # One frontend subnet in the first zone plus a backend subnet per zone
+    assert mock_create_subnets.call_count == 4
+    cidrs = sorted(
+        c.kwargs["ipv4_cidr_block"] for c in mock_create_subnets.call_args_list
+    )
+    assert cidrs == [
+        "10.64.0.0/25",
+        "10.64.0.128/25",
+        "10.64.1.128/25",
+        "10.64.2.128/25",
+    ]
     mock_create_tailscale_sg_group.assert_called_once_with(
         mock_vpc_client.return_value, "mock_vpc_id", "mock_resource_group_id", "rpv3"
     )
-    mock_create_rules.assert_called_once_with(
-        mock_vpc_client.return_value, "mock_sg_id"
-    )
+    # Rules are sent with the security group instead of one call per rule
+    mock_create_rules.assert_not_called()
     mock_create_tailscale_key.assert_called_once_with(
-        "mock_tailscale_api_key", "mock_tailnet_id", "tag:rst"
+        "mock_tailscale_api_key", "mock_tailnet_id", "tag:rst", reusable=False
     )
     mock_get_ssh_key_id.assert_called_once_with(
         mock_vpc_client.return_value, "mock_ssh_key"
@@ -180,10 +206,143 @@ def test_main(
         "mock_sg_id",
         "mock_resource_group_id",
         "mock_vpc_id",
-        "mock_zone",
+        "us-south-1",
         "mock_image_id",
         "mock_ssh_key_id",
         "mock_subnet_id",
+        "mock_tailscale_device_token",
+        # The only router advertises every subnet, straight from the plan
+        ["10.64.0.0/25", "10.64.0.128/25", "10.64.1.128/25", "10.64.2.128/25"],
+        user_data_parts=("cloud_config.sh",),
+        profile="bx2-2x8",
+        index=0,
     )
 
+    waits = [c.args for c in mock_resource_waiter.return_value.wait.call_args_list]
+    assert ("subnet", "mock_subnet_id", "mock_vpc_id") in waits
+    assert ("instance", "mock_instance_id", "mock_vpc_id") in waits
+    assert len(waits) == 8
+
     assert result.exit_code == 0
+
+
+def test_rerun_resumes_from_journal(
+    mock_vpc_client,
+    mock_resource_waiter,
+    mock_get_group_id_by_name,
+    mock_create_vpc,
+    mock_create_public_gateways,
+    mock_create_subnets,
+    mock_create_tailscale_sg_group,
+    mock_create_rules,
+    mock_create_tailscale_key,
+    mock_get_ssh_key_id,
+    mock_get_latest_ubuntu,
+    mock_create_new_instance,
+):
+    mock_get_group_id_by_name.return_value = "mock_resource_group_id"
+    mock_create_vpc.return_value = {"id": "mock_vpc_id"}
+    mock_create_public_gateways.return_value = {"id": "mock_pgw_id"}
+    mock_create_subnets.return_value = {
+        "id": "mock_subnet_id",
+        "zone": {"name": "mock_zone"},
+        "ipv4_cidr_block": "10.240.0.0/25",
+    }
+    mock_create_tailscale_sg_group.return_value = {"id": "mock_sg_id"}
+    mock_create_tailscale_key.return_value = {
+        "id": "mock_key_id",
+        "key": "mock_tailscale_device_token",
+        "expires": "2999-01-01T00:00:00Z",
+    }
+    mock_get_ssh_key_id.return_value = "mock_ssh_key_id"
+    mock_get_latest_ubuntu.return_value = "mock_image_id"
+    # Configure the getters up front; MagicMock children are not thread safe
+    client = mock_vpc_client.return_value
+    for getter in ("get_vpc", "get_public_gateway", "get_subnet", "get_instance"):
+        getter = getattr(client, getter)
+        getter.return_value.get_result.return_value = {"status": "available"}
+    client.get_security_group.return_value.get_result.return_value = {}
+    client.get_vpc_address_prefix.return_value.get_result.return_value = {}
+    client.create_vpc_address_prefix.return_value.get_result.return_value = {
+        "id": "mock_prefix_id"
+    }
+    mock_create_new_instance.side_effect = [
+        RuntimeError("instance quota exceeded"),
+        MagicMock(get_result=lambda: {"id": "mock_instance_id"}),
+    ]
+    args = [
+        "--resource-group",
+        "CDE",
+        "--region",
+        "us-south",
+        "--prefix",
+        "rpv3",
+        "--tailscale-tag",
+        "tag:rst",
+        "--ssh-key",
+        "mock_ssh_key",
+    ]
+
+    first = CliRunner().invoke(main, args)
+    second = CliRunner().invoke(main, args)
+
+    assert first.exit_code != 0
+    assert second.exit_code == 0
+    # Everything but the instance was reused from the first run's journal
+    mock_create_vpc.assert_called_once()
+    mock_create_tailscale_sg_group.assert_called_once()
+    mock_create_tailscale_key.assert_called_once()
+    assert mock_create_public_gateways.call_count == 3
+    assert mock_create_subnets.call_count == 4
+    assert mock_create_new_instance.call_count == 2
+    mock_vpc_client.return_value.get_vpc.assert_called_once_with(id="mock_vpc_id")
+
+
+def test_router_tier_spreads_routers_over_zones(fake_cloud, monkeypatch):
+    import utils
+    from main import deploy_lab
+    from waiters import ResourceWaiter
+
+    cloud = fake_cloud(transition=0)
+    routes = {}
+    render = utils.build_user_data
+
+    def build_user_data(**context):
+        routes[context["tailscale_api_token"], context["advertise_routes"]] = True
+        return render(**context)
+
+    monkeypatch.setattr(utils, "build_user_data", build_user_data)
+    client = utils.vpc_client(os.environ["IBMCLOUD_API_KEY"], "us-south")
+    results = deploy_lab(
+        client,
+        "default",
+        "us-south",
+        "tier",
+        "lab-key",
+        "tag:lab",
+        waiter=ResourceWaiter(client, base_delay=0.05),
+        routers=4,
+        router_bandwidth=30000,
+    )
+    instances = cloud.resources("us-south", "instance")
+    subnets = cloud.resources("us-south", "subnet")
+
+    # 30 Gbps over four routers needs 7.5 Gbps each, so 8 Gbps profiles
+    assert results["router_profile"] == "bx2-4x16"
+    assert sorted(
+        (i["name"], i["zone"]["name"], i["profile"]["name"]) for i in instances
+    ) == [
+        ("tier-tailscale-instance", "us-south-1", "bx2-4x16"),
+        ("tier-tailscale-instance-2", "us-south-2", "bx2-4x16"),
+        ("tier-tailscale-instance-3", "us-south-3", "bx2-4x16"),
+        ("tier-tailscale-instance-4", "us-south-1", "bx2-4x16"),
+    ]
+    cidrs = {subnet["name"]: subnet["ipv4_cidr_block"] for subnet in subnets}
+    assert len(cidrs) == 6
+    # All routers share one reusable key and advertise their own zone's subnets
+    assert {token for token, _ in routes} == {results["tailscale_key"]["key"]}
+    assert results["tailscale_key"]["reusable"] is True
+    assert sorted(advertised for _, advertised in routes) == sorted(
+        f"{cidrs[f'tier-frontend-subnet-{zone}']},{cidrs[f'tier-backend-subnet-{zone}']}"
+        for zone in ("us-south-1", "us-south-2", "us-south-3")
+    )
@@ -0,0 +1,144 @@
+import sys
+import os
+import pytest
+from unittest.mock import patch, MagicMock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import plan
+from journal import Journal
+
+ZONES = ["us-south-1", "us-south-2"]
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(monkeypatch, tmp_path):
+    monkeypatch.setenv("VPC_LAB_CACHE_DIR", str(tmp_path))
+
+
+def snapshot(**resources):
+    base = {kind: [] for kind in plan.SNAPSHOT_COLLECTIONS}
+    base.update(resources)
+    return {"region": "us-south", "taken_at": 0, "calls": 6, "resources": base}
+
+
+def test_plan_classifies_create_reuse_and_conflicts():
+    region = snapshot(
+        vpc=[
+            {"id": "v-1", "name": "lab1-vpc"},
+            {"id": "v-2", "name": "lab2-vpc"},
+        ],
+        subnet=[
+            {"id": "s-1", "name": "lab1-backend-subnet-us-south-1", "vpc_id": "v-1"},
+            {"id": "s-x", "name": "lab1-backend-subnet-us-south-2", "vpc_id": "v-9"},
+        ],
+        key=[{"id": "k-1", "name": "my-key"}],
+    )
+    journal = Journal("lab1", "us-south")
+    journal.record("vpc", "v-1")
+    journal.record("backend_subnet:us-south-1", "s-1")
+
+    lab1 = plan.plan_lab(region, "lab1", ZONES, "my-key", journal)
+    lab2 = plan.plan_lab(
+        region, "lab2", ZONES, "other-key", Journal("lab2", "us-south")
+    )
+
+    assert lab1["reuse"] == [
+        "vpc lab1-vpc (v-1)",
+        "subnet lab1-backend-subnet-us-south-1 (s-1)",
+    ]
+    # A same-named subnet in another VPC does not collide
+    assert "subnet lab1-backend-subnet-us-south-2" in lab1["create"]
+    assert "instance lab1-tailscale-instance" in lab1["create"]
+    assert "tailscale_key" in lab1["create"]
+    assert lab1["conflicts"] == [] and lab1["errors"] == []
+    assert len(lab1["create"]) == 7
+
+    assert lab2["conflicts"] == ["vpc lab2-vpc already exists (v-2)"]
+    assert lab2["errors"] == ["SSH key other-key not found in us-south"]
+
+
+def test_plan_lists_dns_resources_from_the_journal():
+    region = snapshot(key=[{"id": "k-1", "name": "my-key"}])
+    journal = Journal("lab1", "us-south")
+    journal.record("dns_instance", {"guid": "g-1", "id": "crn:g-1"})
+
+    lab1 = plan.plan_lab(
+        region, "lab1", ZONES, "my-key", journal, dns_zone="lab.internal"
+    )
+
+    assert "dns_instance lab1-us-south-dns (g-1)" in lab1["reuse"]
+    assert "dns_zone lab.internal" in lab1["create"]
+    assert "dns_permitted_network lab1-vpc" in lab1["create"]
+    # One router and three subnets get a record each
+    assert "dns_records up to 4 in lab.internal" in lab1["create"]
+
+
+def test_plan_lists_the_address_prefixes_of_a_block():
+    region = snapshot(key=[{"id": "k-1", "name": "my-key"}])
+    resumed = Journal("lab2", "us-south")
+    resumed.record("vpc", "v-2")
+    resumed.record("address_prefix:us-south-1", {"id": "p-1"})
+    legacy = Journal("lab3", "us-south")
+    legacy.record("vpc", "v-3")
+
+    lab1 = plan.plan_lab(
+        region,
+        "lab1",
+        ZONES,
+        "my-key",
+        Journal("lab1", "us-south"),
+        address_block="10.64.0.0/22",
+    )
+    lab2 = plan.plan_lab(
+        region, "lab2", ZONES, "my-key", resumed, address_block="10.64.4.0/22"
+    )
+    lab3 = plan.plan_lab(
+        region, "lab3", ZONES, "my-key", legacy, address_block="10.64.8.0/22"
+    )
+
+    assert "address_prefix lab1-prefix-us-south-1 (10.64.0.0/24)" in lab1["create"]
+    assert "address_prefix lab1-prefix-us-south-2 (10.64.1.0/24)" in lab1["create"]
+    assert "address_prefix lab2-prefix-us-south-1 (10.64.4.0/24)" in lab2["reuse"]
+    assert "address_prefix lab2-prefix-us-south-2 (10.64.5.0/24)" in lab2["create"]
+    # A VPC created without a block keeps its VPC-picked CIDRs
+    assert not any(item.startswith("address_prefix") for item in lab3["create"])
+
+
+def test_quota_headroom_counts_planned_creates():
+    region = snapshot(
+        vpc=[{"id": f"v-{n}", "name": f"other-{n}"} for n in range(8)],
+        instance=[{"id": "i-1", "name": "big", "vcpu": 190}],
+    )
+    plans = [
+        plan.plan_lab(region, prefix, ZONES, "my-key", Journal(prefix, "us-south"))
+        for prefix in ("lab1", "lab2", "lab3")
+    ]
+
+    quota = plan.quota_headroom(region, plans, {"vcpu": 400})
+
+    assert quota["vpc"] == {"limit": 10, "used": 8, "planned": 3, "headroom": -1}
+    assert quota["vcpu"]["planned"] == 6
+    assert quota["vcpu"]["headroom"] == 204
+
+
+def test_snapshot_is_listed_once_and_cached():
+    client = MagicMock()
+    for method, collection in plan.SNAPSHOT_COLLECTIONS.values():
+        getattr(client, method).return_value.get_result.return_value = {
+            collection: [{"id": f"{collection}-1", "name": collection}]
+        }
+
+    with patch("plan.getAccountId", return_value="acct"):
+        first = plan.load_snapshot(client, "us-south")
+        second = plan.load_snapshot(client, "us-south")
+
+    assert first["calls"] == 6
+    assert second["calls"] == 0
+    assert second["resources"] == first["resources"]
+    client.list_vpcs.assert_called_once()
+
+
+def test_profile_vcpus():
+    assert plan.profile_vcpus("bx2-2x8") == 2
+    assert plan.profile_vcpus("cx2-16x32") == 16
@@ -0,0 +1,88 @@
+import sys
+import os
+import threading
+from functools import partial
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import destroy
+import fleet
+from pool import WarmPool, claim_lab, replenish
+
+
+@pytest.fixture
+def cloud(cloud, monkeypatch):
+    for module in (fleet, destroy):
+        waiter = partial(module.ResourceWaiter, base_delay=0.05)
+        monkeypatch.setattr(module, "ResourceWaiter", waiter)
+    return cloud
+
+
+def test_concurrent_claims_never_share_a_lab(tmp_path):
+    path = tmp_path / "pool.sqlite3"
+    pool = WarmPool("warm", path)
+    for _ in range(5):
+        pool.update(pool.reserve("us-south"), state="ready", ready_at=0)
+    # Separate connections stand in for separate claim processes
+    claimers = [WarmPool("warm", path) for _ in range(10)]
+    claimed = []
+
+    def claim(claimer, n):
+        claimed.append(claimer.take("us-south", f"learner{n}"))
+
+    threads = [
+        threading.Thread(target=claim, args=(claimer, n))
+        for n, claimer in enumerate(claimers)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    labs = [member["prefix"] for member in claimed if member]
+    assert sorted(labs) == [f"warm-{n:04d}" for n in range(1, 6)]
+    assert claimed.count(None) == 5
+    assert pool.members(state="ready") == []
+
+
+def test_replenish_claim_and_retire_against_fake_cloud(cloud):
+    pool = WarmPool("warm")
+    options = dict(
+        regions=["us-south"],
+        size=2,
+        resource_group="default",
+        ssh_key="lab-key",
+        tailscale_tag="tag:pool",
+    )
+
+    first = replenish(pool, **options)
+    assert sorted(first["built"]) == ["warm-0001", "warm-0002"]
+
+    lab = claim_lab(pool, "us-south", "ada", "tag:learner")
+    assert lab["prefix"] == "warm-0001"
+    assert lab["tailscale_key"].startswith("tskey-auth-")
+    tagged = [
+        resource["name"]
+        for kind in ("vpc", "instance")
+        for resource in cloud.resources("us-south", kind)
+        if "claimed-by:ada" in resource.get("tags", [])
+    ]
+    assert sorted(tagged) == ["warm-0001-tailscale-instance", "warm-0001-vpc"]
+
+    # The claimed lab is replaced; the unclaimed one is kept
+    second = replenish(pool, **options)
+    assert second == {"retired": [], "built": ["warm-0003"], "failed": []}
+
+    # Ready labs past their age are torn down and rebuilt
+    third = replenish(pool, max_age=0, **options)
+    assert sorted(third["retired"]) == ["warm-0002", "warm-0003"]
+    assert sorted(third["built"]) == ["warm-0004", "warm-0005"]
+    vpcs = sorted(vpc["name"] for vpc in cloud.resources("us-south", "vpc"))
+    assert vpcs == ["warm-0001-vpc", "warm-0004-vpc", "warm-0005-vpc"]
+    assert [m["prefix"] for m in pool.members(state="claimed")] == ["warm-0001"]
+
+    with pytest.raises(LookupError):
+        for _ in range(3):
+            claim_lab(pool, "us-south", "bob", "tag:learner")
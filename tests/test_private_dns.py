@@ -0,0 +1,132 @@
+import sys
+import os
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import private_dns
+from private_dns import (
+    create_dns_instance,
+    create_dns_zone,
+    dns_instance_name,
+    permit_vpc,
+    register_records,
+)
+
+
+@pytest.fixture
+def cloud(fake_cloud, monkeypatch):
+    monkeypatch.setattr(private_dns, "POLL_INTERVAL", 0.01)
+    return fake_cloud(transition=0.3, delete_delay=0)
+
+
+def operations(cloud, method, suffix):
+    return sum(
+        count
+        for operation, count in cloud.stats()["operations"].items()
+        if operation.startswith(f"{method} dns:") and operation.endswith(suffix)
+    )
+
+
+def test_records_are_reconciled_with_one_list(cloud):
+    instance = create_dns_instance("rg0", "lab001-us-south-dns")
+    zone = create_dns_zone(instance["guid"], "lab.internal", "lab001")
+    permit_vpc(zone, "crn:v1:bluemix:public:is:us-south:a/x::vpc:r006-1")
+    # Permitting the same VPC again returns the existing link
+    permit_vpc(zone, "crn:v1:bluemix:public:is:us-south:a/x::vpc:r006-1")
+    records = [
+        {"name": f"host{n}", "type": "A", "rdata": {"ip": f"10.240.0.{n}"}}
+        for n in range(40)
+    ]
+
+    first = register_records(zone, records, concurrency=8)
+    assert len(first) == 40
+    assert operations(cloud, "GET", "/resource_records") == 1
+    assert operations(cloud, "POST", "/resource_records") == 40
+
+    records[3]["rdata"] = {"ip": "10.240.1.3"}
+    second = register_records(zone, records)
+    assert second == first
+    assert operations(cloud, "GET", "/resource_records") == 2
+    assert operations(cloud, "POST", "/resource_records") == 40
+    assert operations(cloud, "PUT", "/resource_records/{record}") == 1
+
+    (stored,) = cloud.dns_instances()[0]["zones"]
+    assert stored["state"] == "active"
+    assert len(stored["permitted_networks"]) == 1
+    addresses = {r["name"]: r["rdata"]["ip"] for r in stored["records"]}
+    assert addresses["host3.lab.internal"] == "10.240.1.3"
+
+
+def test_dns_stage_overlaps_compute_and_is_destroyed(cloud):
+    import destroy
+    import utils
+    from main import deploy_lab
+    from journal import Journal
+    from waiters import ResourceWaiter
+
+    client = utils.vpc_client(os.environ["IBMCLOUD_API_KEY"], "us-south")
+    finished = []
+    results = deploy_lab(
+        client,
+        "default",
+        "us-south",
+        "dns",
+        "lab-key",
+        "tag:lab",
+        waiter=ResourceWaiter(client, base_delay=0.05),
+        on_step=lambda name, result: finished.append(name),
+        journal=Journal("dns", "us-south"),
+        dns_zone="lab.internal",
+    )
+
+    # Records only wait for the router to be created, not to boot
+    assert finished.index("dns_records") < finished.index("instance_ready")
+    (instance,) = cloud.dns_instances()
+    assert instance["name"] == "dns-us-south-dns"
+    (zone,) = instance["zones"]
+    (vpc,) = cloud.resources("us-south", "vpc")
+    assert [n["permitted_network"]["vpc_crn"] for n in zone["permitted_networks"]] == [
+        vpc["crn"]
+    ]
+    router = results["instance"]["primary_network_interface"]["primary_ip"]["address"]
+    records = {(r["type"], r["name"]): r["rdata"] for r in zone["records"]}
+    assert records.pop(("A", "dns-tailscale-instance.lab.internal")) == {"ip": router}
+    assert sorted(name for _, name in records) == [
+        "dns-backend-subnet-us-south-1.lab.internal",
+        "dns-backend-subnet-us-south-2.lab.internal",
+        "dns-backend-subnet-us-south-3.lab.internal",
+        "dns-frontend-subnet-us-south-1.lab.internal",
+    ]
+
+    labs = destroy.discover_labs(client, "us-south", ["dns"])
+    assert labs["dns"]["dns_instance"] == instance["guid"]
+    waiter = ResourceWaiter(client, base_delay=0.05)
+    (status,) = destroy.destroy_labs(client, "us-south", labs, waiter)
+    assert status["state"] == "destroyed", status["error"]
+    assert cloud.dns_instances() == []
+    assert cloud.resources("us-south", "vpc") == []
+
+
+def test_unjournaled_instance_is_reused_and_destroyed(cloud):
+    import destroy
+    import utils
+    from waiters import ResourceWaiter
+
+    # A run interrupted while provisioning created the instance but never
+    # journaled it
+    name = dns_instance_name("orphan", "us-south")
+    first = create_dns_instance("rg0", name)
+
+    assert create_dns_instance("rg0", name) == first
+    assert len(cloud.dns_instances()) == 1
+
+    client = utils.vpc_client(os.environ["IBMCLOUD_API_KEY"], "us-south")
+    labs = destroy.discover_labs(client, "us-south", ["orphan", "other"])
+    assert list(labs) == ["orphan"]
+    assert labs["orphan"]["dns_instance"] == first["guid"]
+    waiter = ResourceWaiter(client, base_delay=0.05)
+    (status,) = destroy.destroy_labs(client, "us-south", labs, waiter)
+    assert status["state"] == "destroyed", status["error"]
+    assert cloud.dns_instances() == []
@@ -0,0 +1,202 @@
+import sys
+import os
+import io
+import json
+import asyncio
+import httpx
+import pytest
+import requests
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import ratelimit
+from ibm_cloud_sdk_core.api_exception import ApiException
+
+FAST = ratelimit.RetryPolicy(max_attempts=4, base=0.001, cap=0.01)
+
+
+def make_response(status, body=None, headers=None):
+    response = requests.Response()
+    response.status_code = status
+    response._content = json.dumps(body or {}).encode()
+    response.headers.update(headers or {})
+    response.raw = io.BytesIO()
+    return response
+
+
+def session_with(responses):
+    session = requests.Session()
+    session.mount("https://", ratelimit.RateLimitedAdapter(policy=FAST))
+    sent = []
+
+    def fake_send(self, request, **kwargs):
+        sent.append((request.method, request.url))
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    return session, sent, patch.object(ratelimit.SSLHTTPAdapter, "send", fake_send)
+
+
+def test_token_bucket_spaces_requests_after_burst():
+    bucket = ratelimit.TokenBucket(rate=10, burst=2)
+
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == pytest.approx(0.1, abs=0.02)
+
+
+def test_endpoint_families():
+    assert (
+        ratelimit.endpoint_family("https://us-south.iaas.cloud.ibm.com/v1/vpcs")
+        == "vpc"
+    )
+    assert (
+        ratelimit.endpoint_family("https://iam.cloud.ibm.com/identity/token") == "iam"
+    )
+    assert ratelimit.endpoint_family("https://api.tailscale.com/api/v2") == "tailscale"
+
+
+def test_retry_after_is_honored_on_429():
+    session, sent, patched = session_with(
+        [
+            make_response(429, headers={"Retry-After": "0"}),
+            make_response(200, {"vpcs": []}),
+        ]
+    )
+    with patched:
+        response = session.get("https://us-south.iaas.cloud.ibm.com/v1/vpcs")
+
+    assert response.status_code == 200
+    assert len(sent) == 2
+
+
+def test_ambiguous_create_failure_reuses_existing_resource():
+    session, sent, patched = session_with(
+        [
+            make_response(502),
+            make_response(200, {"vpcs": [{"id": "vpc-1", "name": "lab-vpc"}]}),
+        ]
+    )
+    with patched:
+        response = session.post(
+            "https://us-south.iaas.cloud.ibm.com/v1/vpcs?version=2024-12-17&generation=2",
+            json={"name": "lab-vpc"},
+        )
+
+    assert response.status_code == 201
+    assert response.json()["id"] == "vpc-1"
+    assert [method for method, _ in sent] == ["POST", "GET"]
+    assert "name=lab-vpc" in sent[1][1]
+
+
+def test_ambiguous_create_failure_retries_when_not_found():
+    session, sent, patched = session_with(
+        [
+            make_response(500),
+            make_response(200, {"vpcs": []}),
+            make_response(201, {"id": "vpc-2", "name": "lab-vpc"}),
+        ]
+    )
+    with patched:
+        response = session.post(
+            "https://us-south.iaas.cloud.ibm.com/v1/vpcs", json={"name": "lab-vpc"}
+        )
+
+    assert response.json()["id"] == "vpc-2"
+    assert [method for method, _ in sent] == ["POST", "GET", "POST"]
+
+
+def test_create_dropped_after_sending_is_looked_up_not_resent():
+    import http.client
+    import urllib3
+
+    aborted = requests.exceptions.ConnectionError(
+        urllib3.exceptions.ProtocolError(
+            "Connection aborted.", http.client.RemoteDisconnected("closed")
+        )
+    )
+    session, sent, patched = session_with(
+        [
+            aborted,
+            make_response(200, {"vpcs": [{"id": "vpc-1", "name": "lab-vpc"}]}),
+        ]
+    )
+    with patched:
+        response = session.post(
+            "https://us-south.iaas.cloud.ibm.com/v1/vpcs", json={"name": "lab-vpc"}
+        )
+
+    assert response.json()["id"] == "vpc-1"
+    assert [method for method, _ in sent] == ["POST", "GET"]
+
+
+def test_create_that_never_connected_is_retried():
+    import urllib3
+
+    refused = requests.exceptions.ConnectionError(
+        urllib3.exceptions.MaxRetryError(
+            None, "/v1/vpcs", urllib3.exceptions.NewConnectionError(None, "refused")
+        )
+    )
+    session, sent, patched = session_with(
+        [refused, make_response(201, {"id": "vpc-2", "name": "lab-vpc"})]
+    )
+    with patched:
+        response = session.post(
+            "https://us-south.iaas.cloud.ibm.com/v1/vpcs", json={"name": "lab-vpc"}
+        )
+
+    assert response.json()["id"] == "vpc-2"
+    assert [method for method, _ in sent] == ["POST", "POST"]
+
+
+def test_async_create_dropped_after_sending_is_looked_up():
+    sent = []
+
+    def handler(request):
+        sent.append(request.method)
+        if request.method == "POST":
+            raise httpx.RemoteProtocolError("Server disconnected", request=request)
+        return httpx.Response(200, json={"vpcs": [{"id": "vpc-1", "name": "lab-vpc"}]})
+
+    async def call():
+        transport = ratelimit.RateLimitedTransport(httpx.MockTransport(handler), FAST)
+        async with httpx.AsyncClient(transport=transport) as client:
+            return await client.post(
+                "https://us-south.iaas.cloud.ibm.com/v1/vpcs", json={"name": "lab-vpc"}
+            )
+
+    response = asyncio.run(call())
+    assert response.json()["id"] == "vpc-1"
+    assert sent == ["POST", "GET"]
+
+
+def test_async_transport_retries_429():
+    statuses = [429, 200]
+
+    def handler(request):
+        return httpx.Response(statuses.pop(0), json={"key": "tskey"})
+
+    async def call():
+        transport = ratelimit.RateLimitedTransport(httpx.MockTransport(handler), FAST)
+        async with httpx.AsyncClient(transport=transport) as client:
+            return await client.post("https://api.tailscale.com/api/v2/keys", json={})
+
+    response = asyncio.run(call())
+    assert response.status_code == 200
+    assert statuses == []
+
+
+def test_retry_call_gives_up_on_non_retryable_status():
+    calls = []
+
+    def forbidden():
+        calls.append(1)
+        raise ApiException(403, message="forbidden")
+
+    with pytest.raises(ApiException):
+        ratelimit.retry_call("iam", forbidden, policy=FAST)
+    assert len(calls) == 1
@@ -0,0 +1,96 @@
+import sys
+import os
+import re
+import subprocess
+
+import pytest
+from click.testing import CliRunner
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+CLI_MODULES = [
+    "main",
+    "fleet",
+    "destroy",
+    "plan",
+    "inventory",
+    "tracing",
+    "boottime",
+    "pool",
+    "daemon",
+    "ipam",
+]
+
+# Packages only a command that talks to the APIs (or renders output) may load
+HEAVY = {
+    "ibm_vpc",
+    "ibm_platform_services",
+    "ibm_cloud_sdk_core",
+    "httpx",
+    "requests",
+    "jwt",
+    "jinja2",
+    "tamga",
+    "rich",
+}
+
+# Cumulative import time allowed for each CLI module; the SDKs alone take ~0.5s
+IMPORT_BUDGET_MS = 150
+
+CREDENTIALS = ("IBMCLOUD_API_KEY", "TAILSCALE_API_KEY", "TAILNET_ID")
+
+
+def run_python(*args):
+    env = {k: v for k, v in os.environ.items() if k not in CREDENTIALS}
+    return subprocess.run(
+        [sys.executable, *args], cwd=ROOT, env=env, capture_output=True, text=True
+    )
+
+
+def test_cli_modules_import_without_sdks_or_credentials():
+    code = (
+        f"import sys, {', '.join(CLI_MODULES)}; "
+        "print(' '.join(sorted({name.split('.')[0] for name in sys.modules})))"
+    )
+    result = run_python("-c", code)
+
+    assert result.returncode == 0, result.stderr
+    assert HEAVY.isdisjoint(result.stdout.split())
+
+
+@pytest.mark.parametrize("module", CLI_MODULES)
+def test_import_time_budget(module):
+    result = run_python("-X", "importtime", "-c", f"import {module}")
+
+    assert result.returncode == 0, result.stderr
+    (line,) = [
+        line for line in result.stderr.splitlines() if line.endswith(f"| {module}")
+    ]
+    cumulative_us = int(re.split(r"\s*\|\s*", line)[1])
+    assert cumulative_us / 1000 < IMPORT_BUDGET_MS
+
+
+def test_help_needs_no_credentials():
+    result = run_python("main.py", "--help")
+
+    assert result.returncode == 0, result.stderr
+    assert "--resource-group" in result.stdout
+
+
+def test_missing_credentials_fail_before_any_work(monkeypatch, tmp_path):
+    from main import main
+
+    monkeypatch.setenv("VPC_LAB_CACHE_DIR", str(tmp_path))
+    monkeypatch.setenv("TAILNET_ID", "mock_tailnet_id")
+    for name in ("IBMCLOUD_API_KEY", "TAILSCALE_API_KEY"):
+        monkeypatch.delenv(name, raising=False)
+
+    args = ["--resource-group", "rg", "--region", "us-south", "--prefix", "lab"]
+    args += ["--tailscale-tag", "tag:lab", "--ssh-key", "key"]
+    result = CliRunner().invoke(main, args)
+
+    assert result.exit_code == 1
+    assert "IBMCLOUD_API_KEY, TAILSCALE_API_KEY not set" in result.output
+    assert not (tmp_path / "journals").exists()
@@ -0,0 +1,136 @@
+import sys
+import os
+import io
+import json
+import time
+
+import pytest
+import requests
+from click.testing import CliRunner
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import ratelimit
+import tracing
+from engine import ProvisioningGraph
+from tracing import critical_paths, latency_percentiles, operation_name, span, traced
+
+
+@pytest.fixture
+def tracer():
+    tracer = tracing.start_tracing()
+    yield tracer
+    tracing.stop_tracing()
+
+
+def test_spans_nest_and_record_errors(tracer):
+    @traced
+    def create_vpc():
+        raise ValueError("quota exceeded")
+
+    with span("deploy", "step") as outer:
+        with pytest.raises(ValueError):
+            create_vpc()
+
+    inner, deploy = tracer.to_chrome()["traceEvents"][::-1]
+    assert deploy["name"] == "deploy"
+    assert inner["name"] == "create_vpc"
+    assert inner["cat"] == "utils"
+    assert inner["args"]["parent_id"] == outer["span_id"]
+    assert inner["args"]["error"] == "ValueError: quota exceeded"
+
+
+def test_spans_are_noops_without_tracer():
+    with span("deploy") as args:
+        args["status"] = 200
+
+    assert tracing.stop_tracing() is None
+
+
+def test_graph_critical_path(tracer):
+    graph = ProvisioningGraph(max_workers=4, name="us-south/lab1")
+    graph.add("vpc", lambda r: time.sleep(0.01))
+    graph.add("subnet", lambda r: time.sleep(0.08), requires=["vpc"])
+    graph.add("security_group", lambda r: time.sleep(0.01), requires=["vpc"])
+    graph.add(
+        "instance", lambda r: time.sleep(0.01), requires=["subnet", "security_group"]
+    )
+    graph.run()
+
+    paths = critical_paths(tracer.to_chrome()["traceEvents"])
+
+    assert [step["step"] for step in paths["us-south/lab1"]] == [
+        "vpc",
+        "subnet",
+        "instance",
+    ]
+
+
+def test_http_spans_record_status_and_retries(tracer):
+    session = requests.Session()
+    session.mount(
+        "https://",
+        ratelimit.RateLimitedAdapter(
+            policy=ratelimit.RetryPolicy(max_attempts=3, base=0.001, cap=0.01)
+        ),
+    )
+    responses = []
+    for status in (503, 200):
+        response = requests.Response()
+        response.status_code = status
+        response._content = b"{}"
+        response.headers["Content-Length"] = "2"
+        response.raw = io.BytesIO()
+        responses.append(response)
+
+    with patch.object(
+        ratelimit.SSLHTTPAdapter,
+        "send",
+        lambda self, request, **kwargs: responses.pop(0),
+    ):
+        session.get("https://us-south.iaas.cloud.ibm.com/v1/vpcs/r006-0123456789abcdef")
+
+    (event,) = tracer.to_chrome()["traceEvents"]
+    assert event["name"] == "GET /v1/vpcs/{id}"
+    assert event["cat"] == "http"
+    assert event["args"]["status"] == 200
+    assert event["args"]["attempts"] == 2
+    assert event["args"]["response_bytes"] == 2
+
+
+def test_operation_name_keeps_collection_paths():
+    url = "https://x.iaas.cloud.ibm.com/v1/vpcs?version=1"
+    assert operation_name("POST", url) == "POST /v1/vpcs"
+
+
+def test_latency_percentiles():
+    events = [
+        {"cat": "utils", "name": "create_vpc", "dur": ms * 1000, "args": {}}
+        for ms in range(1, 101)
+    ]
+    events[0]["args"]["error"] = "boom"
+
+    stats = latency_percentiles(events)[("utils", "create_vpc")]
+
+    assert stats["count"] == 100
+    assert stats["errors"] == 1
+    assert (stats["p50"], stats["p90"], stats["p99"], stats["max"]) == (50, 90, 99, 100)
+
+
+def test_trace_run_writes_file_for_summary(monkeypatch, tmp_path):
+    monkeypatch.setenv("VPC_LAB_CACHE_DIR", str(tmp_path))
+    with tracing.trace_run("lab1"):
+        graph = ProvisioningGraph(name="us-south/lab1")
+        graph.add("vpc", lambda r: "vpc-1")
+        graph.add("instance", lambda r: "i-1", requires=["vpc"])
+        graph.run()
+
+    (path,) = (tmp_path / "traces").iterdir()
+    result = CliRunner().invoke(tracing.trace_summary, ["--json"])
+
+    assert result.exit_code == 0, result.output
+    summary = json.loads(result.output)
+    (steps,) = summary["critical_paths"].values()
+    assert [step["step"] for step in steps] == ["vpc", "instance"]
+    assert {entry["name"] for entry in summary["latency"]} == {"vpc", "instance"}
@@ -0,0 +1,96 @@
+import sys
+import os
+import email
+import gzip
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import userdata
+from userdata import (
+    UserDataTooLarge,
+    boot_profile_parts,
+    build_user_data,
+    template_environment,
+)
+
+CONTEXT = {"tailscale_api_token": "tskey-abc", "advertise_routes": "10.0.0.0/24"}
+BOTH = ("cloud_config.sh", "cloud_config_template.yaml")
+
+
+@pytest.fixture(autouse=True)
+def fresh_environment(monkeypatch, tmp_path):
+    monkeypatch.setenv("VPC_LAB_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(userdata, "_environment", None)
+
+
+def test_environment_is_shared_and_caches_bytecode(tmp_path):
+    env = template_environment()
+    env.get_template("cloud_config.sh")
+
+    assert template_environment() is env
+    assert list((tmp_path / "jinja").iterdir())
+
+
+def test_single_part_is_sent_as_rendered():
+    payload = build_user_data(**CONTEXT)
+
+    assert payload.startswith("#!")
+    assert "tskey-abc" in payload
+    assert "10.0.0.0/24" in payload
+
+
+def test_parts_are_combined_into_multipart():
+    message = email.message_from_string(build_user_data(parts=BOTH, **CONTEXT))
+
+    types = [part.get_content_type() for part in message.get_payload()]
+    assert types == ["text/x-shellscript", "text/cloud-config"]
+
+
+def test_compressed_parts_round_trip():
+    payload = build_user_data(parts=BOTH, compress=True, **CONTEXT)
+    message = email.message_from_string(payload)
+
+    parts = [
+        gzip.decompress(part.get_payload(decode=True)).decode()
+        for part in message.get_payload()
+    ]
+    assert parts[0].startswith("#!") and "tskey-abc" in parts[0]
+    assert parts[1].startswith("#cloud-config") and "tskey-abc" in parts[1]
+    assert payload.isascii()
+
+
+def test_compresses_only_when_over_limit():
+    plain = build_user_data(parts=BOTH, **CONTEXT)
+    limit = len(plain.encode()) - 1
+
+    payload = build_user_data(parts=BOTH, limit=limit, **CONTEXT)
+
+    assert "application/x-gzip" in payload
+    assert len(payload.encode()) <= limit
+
+
+def test_too_large_raises():
+    with pytest.raises(UserDataTooLarge) as excinfo:
+        build_user_data(limit=100, **CONTEXT)
+
+    assert excinfo.value.limit == 100
+    assert excinfo.value.size > 100
+
+
+def test_boot_profiles_record_phases():
+    full = build_user_data(parts=boot_profile_parts("full"), **CONTEXT)
+    minimal = build_user_data(parts=boot_profile_parts("minimal"), **CONTEXT)
+
+    for payload in (full, minimal):
+        assert "vpc-lab-phase start" in payload
+        assert "/var/log/vpc-lab/boot-timings.log" in payload
+    assert full.index("apt-get upgrade") < full.index("tailscale up")
+    assert minimal.index("tailscale up") < minimal.index("upgrade -y")
+    assert "systemd-run --unit=vpc-lab-deferred-setup" in minimal
+
+
+def test_unknown_boot_profile():
+    with pytest.raises(ValueError):
+        boot_profile_parts("tiny")
@@ -0,0 +1,112 @@
+import sys
+import os
+import pytest
+from unittest.mock import MagicMock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import utils
+
+
+def test_security_group_is_created_with_rules_in_one_call():
+    client = MagicMock()
+    client.create_security_group.return_value.get_result.return_value = {
+        "id": "mock_sg_id"
+    }
+
+    response = utils.create_tailscale_sg_group(
+        client, "mock_vpc_id", "mock_resource_group_id", "rpv3"
+    )
+
+    assert response == {"id": "mock_sg_id"}
+    client.create_security_group.assert_called_once_with(
+        vpc={"id": "mock_vpc_id"},
+        name="rpv3-security-group",
+        resource_group={"id": "mock_resource_group_id"},
+        rules=utils.TAILSCALE_SG_RULES,
+    )
+    client.create_security_group_rule.assert_not_called()
+
+
+def test_create_rules_retries_rules_missing_after_reconcile():
+    ssh_rule = utils.TAILSCALE_SG_RULES[1]
+    listed = [
+        [rule for rule in utils.TAILSCALE_SG_RULES if rule is not ssh_rule],
+        list(utils.TAILSCALE_SG_RULES),
+    ]
+    client = MagicMock()
+    client.list_security_group_rules.return_value.get_result.side_effect = [
+        {"rules": rules} for rules in listed
+    ]
+
+    rules = utils.create_rules(client, "mock_sg_id")
+
+    assert rules == listed[1]
+    assert client.create_security_group_rule.call_count == 6
+    client.create_security_group_rule.assert_called_with("mock_sg_id", ssh_rule)
+
+
+def test_create_rules_raises_when_rules_stay_missing():
+    client = MagicMock()
+    client.list_security_group_rules.return_value.get_result.return_value = {
+        "rules": []
+    }
+
+    with pytest.raises(RuntimeError, match="missing 5"):
+        utils.create_rules(client, "mock_sg_id")
+
+
+def test_router_layout_covers_every_zone():
+    zones = ["z-1", "z-2", "z-3"]
+
+    assert utils.router_layout(zones, 1) == [("z-1", ["z-1", "z-2", "z-3"])]
+    assert utils.router_layout(zones, 2) == [("z-1", ["z-1", "z-3"]), ("z-2", ["z-2"])]
+    assert utils.router_layout(zones, 4) == [
+        ("z-1", ["z-1"]),
+        ("z-2", ["z-2"]),
+        ("z-3", ["z-3"]),
+        ("z-1", ["z-1"]),
+    ]
+    assert utils.router_name("lab1", 0) == "lab1-tailscale-instance"
+    assert utils.router_name("lab1", 3) == "lab1-tailscale-instance-4"
+
+
+def test_select_instance_profile_picks_the_smallest_fast_enough_profile():
+    def spec(bandwidth, vcpus, memory, architecture="amd64", gpus=0):
+        return {
+            "bandwidth": bandwidth,
+            "vcpus": vcpus,
+            "memory": memory,
+            "architecture": architecture,
+            "gpus": gpus,
+        }
+
+    profiles = {
+        "bx2-2x8": spec(4000, 2, 8),
+        "cx2-2x4": spec(4000, 2, 4),
+        "bx2-4x16": spec(8000, 4, 16),
+        "gx2-8x64x1v100": spec(16000, 8, 64, gpus=1),
+        "bz2-16x64": spec(32000, 16, 64, architecture="s390x"),
+    }
+
+    assert utils.select_instance_profile(profiles, 1000) == "cx2-2x4"
+    assert utils.select_instance_profile(profiles, 6000) == "bx2-4x16"
+    with pytest.raises(LookupError, match="8000 Mbps"):
+        utils.select_instance_profile(profiles, 10000)
+
+
+def test_ssh_key_lookup_pages_through_every_key():
+    client = MagicMock(spec=["list_keys"])
+    href = "https://us-south.iaas.cloud.ibm.com/v1/keys?start=page2"
+    client.list_keys.side_effect = [
+        MagicMock(
+            get_result=lambda: {
+                "keys": [{"name": "first", "id": "key-1"}],
+                "next": {"href": href},
+            }
+        ),
+        MagicMock(get_result=lambda: {"keys": [{"name": "second", "id": "key-2"}]}),
+    ]
+
+    assert utils.get_ssh_key_id(client, "second") == "key-2"
+    assert client.list_keys.call_args.kwargs["start"] == "page2"
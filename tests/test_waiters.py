@@ -0,0 +1,83 @@
+import sys
+import os
+import pytest
+from unittest.mock import MagicMock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from waiters import ResourceWaiter, WaiterError
+
+
+def collection_client(method, collection, rounds):
+    client = MagicMock()
+    getattr(client, method).side_effect = [
+        MagicMock(get_result=MagicMock(return_value={collection: resources}))
+        for resources in rounds
+    ]
+    return client
+
+
+def test_subnets_are_polled_with_one_list_call_per_round():
+    rounds = [
+        [
+            {"id": "a", "status": "pending"},
+            {"id": "b", "status": "pending"},
+            {"id": "other", "status": "available"},
+        ],
+        [{"id": "a", "status": "available"}, {"id": "b", "status": "pending"}],
+        [{"id": "a", "status": "available"}, {"id": "b", "status": "available"}],
+    ]
+    client = collection_client("list_subnets", "subnets", rounds)
+    waiter = ResourceWaiter(client, base_delay=0.01, max_delay=0.02)
+
+    ready = list(waiter.as_ready([("subnet", "a", "vpc-1"), ("subnet", "b", "vpc-1")]))
+
+    assert [resource["id"] for resource in ready] == ["a", "b"]
+    assert client.list_subnets.call_count == 3
+    assert client.list_subnets.call_args.kwargs["vpc_id"] == "vpc-1"
+    assert set(waiter.pop_ready_times([("subnet", "a"), ("subnet", "other")])) == {
+        ("subnet", "a")
+    }
+    # Popped timings are forgotten; the rest stay until their lab reports them
+    assert set(waiter.ready_times) == {("subnet", "b")}
+
+
+def test_failed_resource_raises():
+    client = collection_client(
+        "list_instances", "instances", [[{"id": "i-1", "status": "failed"}]]
+    )
+    waiter = ResourceWaiter(client, base_delay=0.01)
+
+    with pytest.raises(WaiterError, match="failed"):
+        waiter.wait("instance", "i-1", "vpc-1")
+
+
+def test_timeout_raises():
+    client = MagicMock()
+    client.list_public_gateways.return_value.get_result.return_value = {
+        "public_gateways": [{"id": "pgw-1", "status": "pending"}]
+    }
+    waiter = ResourceWaiter(client, base_delay=0.01, max_delay=0.01, timeout=0.05)
+
+    with pytest.raises(WaiterError, match="not available"):
+        waiter.wait("public_gateway", "pgw-1")
+
+
+def test_deletions_settle_when_resources_leave_the_list():
+    rounds = [
+        [{"id": "i-1", "status": "deleting"}, {"id": "i-2", "status": "deleting"}],
+        [{"id": "i-2", "status": "deleting"}],
+        [],
+    ]
+    client = collection_client("list_instances", "instances", rounds)
+    waiter = ResourceWaiter(client, base_delay=0.01, max_delay=0.02)
+
+    futures = [
+        waiter.watch("instance", "i-1", "vpc-1", deleted=True),
+        waiter.watch("instance", "i-2", "vpc-1", deleted=True),
+    ]
+
+    assert [future.result(timeout=5) for future in futures] == [None, None]
+    assert client.list_instances.call_count == 3
+    # Nothing reports deletion times, so a long-lived waiter keeps none
+    assert waiter.ready_times == {}
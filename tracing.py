@@ -0,0 +1,478 @@
+import contextvars
+import functools
+import itertools
+import json
+import math
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+import click
+
+from cache import cache_dir
+
+_tracer = None
+_current_span = contextvars.ContextVar("current_span", default=None)
+_span_ids = itertools.count(1)
+
+
+class Tracer:
+    """
+    Collects timed spans and writes them as a Chrome trace.
+
+    Spans nest through a context variable, so a span opened inside another one
+    (in the same thread or task) records it as its parent. The trace loads in
+    chrome://tracing or Perfetto: one complete ("X") event per span, with its
+    attributes under `args`.
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self.events = []
+
+    @contextmanager
+    def span(self, name, category="function", **attrs):
+        """
+        Times a block of code.
+
+        Args:
+            name (str): Operation name, e.g. "create_vpc" or "POST /vpcs".
+            category (str): Span category, e.g. "utils", "step" or "http".
+            **attrs: Attributes recorded with the span.
+
+        Yields:
+            dict: The span's attributes; add to it while the span is open.
+        """
+        span_id = next(_span_ids)
+        parent = _current_span.get()
+        args = dict(attrs, span_id=span_id)
+        if parent is not None:
+            args["parent_id"] = parent
+        token = _current_span.set(span_id)
+        start = time.perf_counter()
+        try:
+            yield args
+        except BaseException as e:
+            args["error"] = f"{type(e).__name__}: {e}"
+            status = getattr(e, "code", None) or getattr(e, "status_code", None)
+            if isinstance(status, int):
+                args.setdefault("status", status)
+            raise
+        finally:
+            end = time.perf_counter()
+            _current_span.reset(token)
+            event = {
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": round((start - self._origin) * 1e6, 1),
+                "dur": round((end - start) * 1e6, 1),
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "args": args,
+            }
+            with self._lock:
+                self.events.append(event)
+
+    def to_chrome(self):
+        """
+        Returns the trace in Chrome trace event format.
+
+        Returns:
+            dict: `traceEvents` plus the wall-clock start under `otherData`.
+        """
+        with self._lock:
+            events = list(self.events)
+        return {
+            "traceEvents": sorted(events, key=lambda event: event["ts"]),
+            "displayTimeUnit": "ms",
+            "otherData": {"started_at": self.started_at},
+        }
+
+    def write(self, path):
+        """
+        Writes the trace to a JSON file.
+
+        Args:
+            path (Path): Destination file.
+        """
+        with open(path, "w") as handle:
+            json.dump(self.to_chrome(), handle, default=str)
+
+
+def start_tracing():
+    """
+    Starts collecting spans for the whole process.
+
+    Returns:
+        Tracer: The active tracer.
+    """
+    global _tracer
+    _tracer = Tracer()
+    return _tracer
+
+
+def stop_tracing():
+    """
+    Stops collecting spans.
+
+    Returns:
+        Tracer: The tracer that was active, or None.
+    """
+    global _tracer
+    tracer, _tracer = _tracer, None
+    return tracer
+
+
+def trace_path(label):
+    """
+    Returns a new trace file path under the cache root's `traces` directory.
+
+    Args:
+        label (str): Run label, e.g. the lab prefix.
+
+    Returns:
+        Path: `<timestamp>-<label>.json`.
+    """
+    stamp = datetime.now().strftime("%Y%m%dT%H%M%S")
+    safe = re.sub(r"[^A-Za-z0-9_.-]", "_", label)
+    return cache_dir("traces") / f"{stamp}-{safe}.json"
+
+
+@contextmanager
+def trace_run(label, enabled=True):
+    """
+    Traces everything run inside the block and writes the trace at the end.
+
+    The trace is written even if the block raises, since failed runs are often
+    the ones worth looking at.
+
+    Args:
+        label (str): Run label for the file name, e.g. the lab prefix.
+        enabled (bool): When False, the block runs untraced.
+
+    Yields:
+        Tracer: The active tracer, or None when disabled.
+    """
+    if not enabled:
+        yield None
+        return
+    tracer = start_tracing()
+    try:
+        yield tracer
+    finally:
+        stop_tracing()
+        path = trace_path(label)
+        tracer.write(path)
+        click.echo(f"Trace written to {path}", err=True)
+
+
+@contextmanager
+def span(name, category="function", **attrs):
+    """
+    Times a block with the active tracer; does nothing when tracing is off.
+
+    Args:
+        name (str): Operation name.
+        category (str): Span category.
+        **attrs: Attributes recorded with the span.
+
+    Yields:
+        dict: The span's attributes; add to it while the span is open.
+    """
+    tracer = _tracer
+    if tracer is None:
+        yield {}
+        return
+    with tracer.span(name, category, **attrs) as args:
+        yield args
+
+
+def traced(func):
+    """
+    Decorator that records a span named after the function around every call.
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if _tracer is None:
+            return func(*args, **kwargs)
+        with span(func.__name__, "utils"):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def operation_name(method, url):
+    """
+    Names an HTTP request by method and path, with resource IDs replaced.
+
+    Args:
+        method (str): The HTTP method.
+        url (str): The request URL.
+
+    Returns:
+        str: E.g. "GET /v1/vpcs/{id}".
+    """
+    path = re.sub(r"^[a-z]+://[^/]+", "", str(url)).split("?")[0]
+    segments = [
+        "{id}" if len(segment) > 12 and re.search(r"\d", segment) else segment
+        for segment in path.split("/")
+    ]
+    return f"{method} {'/'.join(segments)}"
+
+
+def load_events(path):
+    """
+    Reads the complete events of a trace file.
+
+    Args:
+        path (Path): A file written by `Tracer.write`.
+
+    Returns:
+        list: The trace's "X" events.
+    """
+    with open(path) as handle:
+        trace = json.load(handle)
+    return [event for event in trace.get("traceEvents", []) if event.get("ph") == "X"]
+
+
+def percentile(values, fraction):
+    """
+    Returns the nearest-rank percentile of a list of numbers.
+
+    Args:
+        values (list): The numbers.
+        fraction (float): The percentile as a fraction, e.g. 0.9.
+
+    Returns:
+        float: The percentile, or None for an empty list.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(len(ordered) * fraction))
+    return ordered[rank - 1]
+
+
+def latency_percentiles(events):
+    """
+    Summarizes span durations per operation.
+
+    Args:
+        events (list): Events from one or more traces.
+
+    Returns:
+        dict: (category, name) mapped to count, errors, p50, p90, p99 and max,
+            with durations in milliseconds.
+    """
+    durations = {}
+    errors = {}
+    for event in events:
+        key = (event["cat"], event["name"])
+        durations.setdefault(key, []).append(event["dur"] / 1000)
+        if "error" in event.get("args", {}):
+            errors[key] = errors.get(key, 0) + 1
+    return {
+        key: {
+            "count": len(values),
+            "errors": errors.get(key, 0),
+            "p50": percentile(values, 0.5),
+            "p90": percentile(values, 0.9),
+            "p99": percentile(values, 0.99),
+            "max": max(values),
+        }
+        for key, values in durations.items()
+    }
+
+
+def _end(event):
+    return event["ts"] + event["dur"]
+
+
+def critical_paths(events):
+    """
+    Finds the critical path of every provisioning graph in a trace.
+
+    Starting from the step that finished last, the path repeatedly follows the
+    dependency that finished last, which is the one the step had to wait for.
+
+    Args:
+        events (list): Events from one trace.
+
+    Returns:
+        dict: Graph name mapped to its path, a list of dicts with `step`,
+            `start` and `duration` in milliseconds, earliest first.
+    """
+    graphs = {}
+    for event in events:
+        if event["cat"] == "step":
+            graph = event["args"].get("graph") or ""
+            graphs.setdefault(graph, {})[event["name"]] = event
+    paths = {}
+    for graph, steps in graphs.items():
+        origin = min(step["ts"] for step in steps.values())
+        current = max(steps, key=lambda name: _end(steps[name]))
+        path = []
+        while current is not None:
+            step = steps[current]
+            path.append(
+                {
+                    "step": current,
+                    "start": (step["ts"] - origin) / 1000,
+                    "duration": step["dur"] / 1000,
+                }
+            )
+            requires = [
+                name for name in step["args"].get("requires", []) if name in steps
+            ]
+            current = None
+            if requires:
+                current = max(requires, key=lambda name: _end(steps[name]))
+        paths[graph] = list(reversed(path))
+    return paths
+
+
+def step_kind(step):
+    """
+    Strips the zone from a per-zone step name, e.g. "pgw:us-south-1" -> "pgw".
+    """
+    return step.split(":")[0]
+
+
+def summarize(paths):
+    """
+    Builds the summary of one or more traces.
+
+    Args:
+        paths (list): Trace files.
+
+    Returns:
+        dict: `latency` (from `latency_percentiles`), `critical_paths` (graph
+            mapped to path, across all traces) and `critical_steps` (step kind
+            mapped to how many critical paths it is on and its total time there).
+    """
+    events = []
+    graphs = {}
+    for path in paths:
+        trace_events = load_events(path)
+        events.extend(trace_events)
+        for graph, steps in critical_paths(trace_events).items():
+            graphs[f"{Path(path).stem}:{graph}"] = steps
+    critical_steps = {}
+    for steps in graphs.values():
+        for step in steps:
+            entry = critical_steps.setdefault(step_kind(step["step"]), [0, 0.0])
+            entry[0] += 1
+            entry[1] += step["duration"]
+    return {
+        "latency": latency_percentiles(events),
+        "critical_paths": graphs,
+        "critical_steps": critical_steps,
+    }
+
+
+def _ms(value):
+    return "" if value is None else f"{value:.0f}"
+
+
+@click.command()
+@click.argument("paths", nargs=-1, type=click.Path(exists=True, dir_okay=False))
+@click.option("--category", help="Only show operations of one category, e.g. http")
+@click.option("--json", "as_json", is_flag=True, help="Print the summary as JSON")
+def trace_summary(paths, category, as_json):
+    """
+    Summarize deployment traces: critical paths and per-operation latency.
+
+    Reads the given trace files, or every trace under the cache root when none
+    are given.
+    """
+    from rich.console import Console
+    from rich.table import Table
+
+    paths = list(paths) or sorted(cache_dir("traces").glob("*.json"))
+    if not paths:
+        raise click.ClickException("No traces found; deploy with --trace first")
+    summary = summarize(paths)
+    latency = {
+        key: stats
+        for key, stats in summary["latency"].items()
+        if category is None or key[0] == category
+    }
+    if as_json:
+        click.echo(
+            json.dumps(
+                {
+                    "latency": [
+                        dict(stats, category=key[0], name=key[1])
+                        for key, stats in latency.items()
+                    ],
+                    "critical_paths": summary["critical_paths"],
+                },
+                indent=2,
+            )
+        )
+        return
+
+    console = Console()
+    table = Table(title=f"Latency per operation (ms) across {len(paths)} traces")
+    for column in [
+        "Category",
+        "Operation",
+        "Count",
+        "Errors",
+        "p50",
+        "p90",
+        "p99",
+        "Max",
+    ]:
+        justify = "left" if column in ("Category", "Operation") else "right"
+        table.add_column(column, justify=justify)
+    for (cat, name), stats in sorted(latency.items(), key=lambda item: -item[1]["p90"]):
+        table.add_row(
+            cat,
+            name,
+            str(stats["count"]),
+            str(stats["errors"]),
+            _ms(stats["p50"]),
+            _ms(stats["p90"]),
+            _ms(stats["p99"]),
+            _ms(stats["max"]),
+        )
+    console.print(table)
+
+    graphs = summary["critical_paths"]
+    if not graphs:
+        return
+    table = Table(title=f"Steps on the critical path of {len(graphs)} deployments")
+    for column in ["Step", "On path", "Mean time on path (s)"]:
+        table.add_column(column)
+    for kind, (count, total) in sorted(
+        summary["critical_steps"].items(), key=lambda item: -item[1][1]
+    ):
+        table.add_row(kind, str(count), f"{total / count / 1000:.1f}")
+    console.print(table)
+
+    slowest, steps = max(
+        graphs.items(), key=lambda item: item[1][-1]["start"] + item[1][-1]["duration"]
+    )
+    table = Table(title=f"Critical path of the slowest deployment ({slowest})")
+    for column in ["Step", "Start (s)", "Took (s)"]:
+        table.add_column(column)
+    for step in steps:
+        table.add_row(
+            step["step"],
+            f"{step['start'] / 1000:.1f}",
+            f"{step['duration'] / 1000:.1f}",
+        )
+    console.print(table)
+
+
+if __name__ == "__main__":
+    trace_summary()
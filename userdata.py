@@ -0,0 +1,194 @@
+import gzip
+import os
+import threading
+
+from cache import cache_dir
+
+TEMPLATE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Largest user_data the VPC API accepts for an instance
+USER_DATA_LIMIT = 64 * 1024
+
+# Boot profiles and the user-data script each one renders. "minimal" brings
+# Tailscale up first and upgrades packages in a background unit afterwards.
+BOOT_PROFILES = {
+    "full": "cloud_config.sh",
+    "minimal": "cloud_config_minimal.sh",
+}
+DEFAULT_BOOT_PROFILE = "full"
+
+DEFAULT_PARTS = (BOOT_PROFILES[DEFAULT_BOOT_PROFILE],)
+
+# Where the boot scripts record their phase markers on the instance
+BOOT_TIMINGS_PATH = "/var/log/vpc-lab/boot-timings.log"
+
+_environment = None
+_environment_lock = threading.Lock()
+
+
+class UserDataTooLarge(ValueError):
+    """
+    Raised when rendered user data does not fit the VPC user_data limit.
+
+    Attributes:
+        size (int): Size of the smallest payload that could be built, in bytes.
+        limit (int): The limit, in bytes.
+    """
+
+    def __init__(self, size, limit):
+        super().__init__(f"User data is {size} bytes; the limit is {limit} bytes")
+        self.size = size
+        self.limit = limit
+
+
+def template_environment():
+    """
+    Returns the process-wide Jinja environment for the user-data templates.
+
+    Templates are compiled once per process and kept in the environment's cache
+    without re-checking the files, and compiled bytecode is stored under the
+    cache root so later runs skip parsing too.
+
+    Returns:
+        Environment: The shared environment.
+    """
+    from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+
+    global _environment
+    with _environment_lock:
+        if _environment is None:
+            _environment = Environment(
+                loader=FileSystemLoader(TEMPLATE_DIR),
+                bytecode_cache=FileSystemBytecodeCache(str(cache_dir("jinja"))),
+                auto_reload=False,
+                keep_trailing_newline=True,
+            )
+        return _environment
+
+
+def render_template(name, **context):
+    """
+    Renders one template.
+
+    Args:
+        name (str): Template file name, e.g. "cloud_config.sh".
+        **context: Template variables.
+
+    Returns:
+        str: The rendered template.
+    """
+    return template_environment().get_template(name).render(**context)
+
+
+def boot_profile_parts(profile, extra=()):
+    """
+    Returns the user-data templates for a boot profile.
+
+    Args:
+        profile (str): A key of BOOT_PROFILES.
+        extra (tuple): Further templates to send after the boot script.
+
+    Returns:
+        tuple: Template file names.
+
+    Raises:
+        ValueError: If the profile is unknown.
+    """
+    if profile not in BOOT_PROFILES:
+        raise ValueError(
+            f"Unknown boot profile {profile!r}; expected one of {', '.join(BOOT_PROFILES)}"
+        )
+    return (BOOT_PROFILES[profile],) + tuple(extra)
+
+
+def part_type(rendered):
+    """
+    Returns the cloud-init MIME type of a rendered part, from its first line.
+
+    Args:
+        rendered (str): The rendered part.
+
+    Returns:
+        str: "text/x-shellscript" or "text/cloud-config".
+
+    Raises:
+        ValueError: If the part is neither a script nor a cloud-config document.
+    """
+    if rendered.startswith("#!"):
+        return "text/x-shellscript"
+    if rendered.startswith("#cloud-config"):
+        return "text/cloud-config"
+    raise ValueError("User data parts must start with '#!' or '#cloud-config'")
+
+
+def multipart(parts, compress=False):
+    """
+    Combines rendered parts into a MIME multipart document cloud-init understands.
+
+    With `compress`, each part is gzipped and attached as base64-encoded
+    application/x-gzip. cloud-init decompresses such parts and detects their
+    type from the first line, and the document stays plain ASCII, which the
+    user_data string field requires.
+
+    Args:
+        parts (list): Tuples of (file name, rendered text).
+        compress (bool): Gzip each part.
+
+    Returns:
+        str: The MIME document.
+    """
+    from email.mime.application import MIMEApplication
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
+
+    message = MIMEMultipart()
+    for name, rendered in parts:
+        if compress:
+            part = MIMEApplication(gzip.compress(rendered.encode(), mtime=0), "x-gzip")
+        else:
+            subtype = part_type(rendered).split("/")[1]
+            part = MIMEText(rendered, subtype, "utf-8")
+        part.add_header("Content-Disposition", "attachment", filename=name)
+        message.attach(part)
+    return message.as_string()
+
+
+def build_user_data(
+    parts=DEFAULT_PARTS, compress=None, limit=USER_DATA_LIMIT, **context
+):
+    """
+    Renders the user-data templates into one payload that fits the VPC limit.
+
+    A single part is sent as rendered. Several parts are combined into a MIME
+    multipart document. With `compress=None`, parts are gzipped only when the
+    plain payload is over the limit.
+
+    Args:
+        parts (tuple): Template file names, in the order cloud-init should run them.
+        compress (bool): Force (True) or disable (False) compression.
+        limit (int): Maximum payload size in bytes.
+        **context: Template variables. `boot_timings_path` defaults to
+            BOOT_TIMINGS_PATH.
+
+    Returns:
+        str: The user_data payload.
+
+    Raises:
+        UserDataTooLarge: If the payload does not fit even when compressed.
+    """
+    context.setdefault("boot_timings_path", BOOT_TIMINGS_PATH)
+    rendered = [(name, render_template(name, **context)) for name in parts]
+    payload = None
+    if not compress:
+        if len(rendered) == 1:
+            payload = rendered[0][1]
+        else:
+            payload = multipart(rendered)
+        if compress is False or len(payload.encode()) <= limit:
+            compress = False
+    if compress is not False:
+        payload = multipart(rendered, compress=True)
+    size = len(payload.encode())
+    if size > limit:
+        raise UserDataTooLarge(size, limit)
+    return payload
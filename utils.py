@@ -1,46 +1,71 @@
 import os
-import httpx
 import base64
+import logging
 from datetime import datetime
-from ibm_vpc import VpcV1
-from ibm_cloud_sdk_core.authenticators import IAMAuthenticator
-from ibm_cloud_sdk_core.api_exception import ApiException
-from ibm_platform_services.resource_controller_v2 import *
-from ibm_platform_services import IamIdentityV1, ResourceManagerV2
+from concurrent.futures import ThreadPoolExecutor
 
-from jinja2 import Environment, FileSystemLoader
+# The IBM Cloud SDKs, httpx and the rate limiter are imported by the functions
+# that use them, so importing this module (and every CLI built on it) is cheap.
+import images
+from cache import lookup_cache
+from pagination import list_all
+from userdata import DEFAULT_PARTS, build_user_data
+from tracing import traced
+from endpoints import service_url
+from credentials import ibmcloud_api_key
 
-ibmcloud_api_key = os.environ.get("IBMCLOUD_API_KEY")
-if not ibmcloud_api_key:
-    raise ValueError("IBMCLOUD_API_KEY environment variable not found")
+
+def _rate_limited(service, url):
+    """
+    Points an SDK service at its endpoint and mounts the shared rate limiter.
+    """
+    import ratelimit
+
+    service.set_service_url(url)
+    return ratelimit.install(service)
+
+
+def _pooled(api_key, client_class, *args):
+    """
+    Wraps an async service client in a blocking, SDK-shaped facade.
+
+    Calls go through the shared httpx pool (keep-alive, HTTP/2 and the rate
+    limiter), and the client authenticates with the shared IAM token.
+    """
+    import async_client
+    from auth import AsyncTokenSource, get_token_provider
+
+    token_source = AsyncTokenSource(get_token_provider(api_key))
+    client = getattr(async_client, client_class)(token_source, *args)
+    return async_client.SyncClient(client)
 
 
 def ibm_client():
     """
-    Initializes and returns an instance of the IamIdentityV1 service.
+    Initializes and returns an IAM Identity client.
 
-    This function uses the IBM Cloud SDK to create an IAM Identity Service client,
-    which can be used to interact with the IBM Cloud Identity and Access Management (IAM) service.
+    This function creates an IAM Identity Service client, which can be used to
+    interact with the IBM Cloud Identity and Access Management (IAM) service.
     It relies on the `IBMCLOUD_API_KEY` environment variable for authentication.
 
     Returns:
-        IamIdentityV1: An instance of the IamIdentityV1 service.
+        async_client.SyncClient: An IamIdentityV1-compatible client over the
+            pooled HTTP client.
 
     Raises:
         ValueError: If the `IBMCLOUD_API_KEY` environment variable is not set.
     """
-    authenticator = IAMAuthenticator(ibmcloud_api_key)
-    iamIdentityService = IamIdentityV1(authenticator=authenticator)
-    return iamIdentityService
+    return _pooled(ibmcloud_api_key(), "AsyncIamIdentityClient")
 
 
+@traced
 def getAccountId():
     """
     Retrieves the account ID associated with the provided IBM Cloud API key.
 
-    This function uses the IamIdentityV1 service to retrieve details about the API key
-    specified in the `IBMCLOUD_API_KEY` environment variable. It then extracts and returns
-    the account ID from the API key details.
+    The account ID is read from the shared IAM access token, which every service
+    client needs anyway. Only if the token carries no account claim does this fall
+    back to the IamIdentityV1 service to look up the API key details.
 
     Returns:
         str: The account ID associated with the IBM Cloud API key.
@@ -49,12 +74,19 @@ def getAccountId():
         ApiException: If there is an error while calling the IBM Cloud API.
         ValueError: If the `IBMCLOUD_API_KEY` environment variable is not set.
     """
+    from ibm_cloud_sdk_core.api_exception import ApiException
+    from auth import get_token_provider
+
+    api_key = ibmcloud_api_key()
+    account_id = get_token_provider(api_key).account_id()
+    if account_id:
+        return account_id
     try:
         client = ibm_client()
-        api_key = client.get_api_keys_details(iam_api_key=ibmcloud_api_key).get_result()
+        api_key = client.get_api_keys_details(iam_api_key=api_key).get_result()
     except ApiException as e:
         logging.error("API exception {}.".format(str(e)))
-        quit(1)
+        raise
     account_id = api_key["account_id"]
     return account_id
 
@@ -73,59 +105,78 @@ def resource_controller_service():
     Raises:
         ValueError: If the `IBMCLOUD_API_KEY` environment variable is not set.
     """
-    authenticator = IAMAuthenticator(ibmcloud_api_key)
-    return ResourceControllerV2(authenticator=authenticator)
+    from ibm_platform_services import ResourceControllerV2
+    from auth import get_authenticator
+
+    authenticator = get_authenticator(ibmcloud_api_key())
+    service = ResourceControllerV2(authenticator=authenticator)
+    return _rate_limited(service, service_url("resource_manager"))
 
 
 def resource_manager_service():
     """
-    Initializes and returns an instance of the ResourceManagerV2 service.
+    Initializes and returns a Resource Manager client.
 
-    This function uses the IBM Cloud SDK to create a Resource Manager service client,
-    which can be used to interact with the IBM Cloud Resource Manager service.
+    This function creates a Resource Manager service client, which can be used to
+    interact with the IBM Cloud Resource Manager service.
     It relies on the `IBMCLOUD_API_KEY` environment variable for authentication.
 
     Returns:
-        ResourceManagerV2: An instance of the ResourceManagerV2 service.
+        async_client.SyncClient: A ResourceManagerV2-compatible client over the
+            pooled HTTP client.
 
     Raises:
         ValueError: If the `IBMCLOUD_API_KEY` environment variable is not set.
     """
-    authenticator = IAMAuthenticator(ibmcloud_api_key)
-    return ResourceManagerV2(authenticator=authenticator)
+    return _pooled(ibmcloud_api_key(), "AsyncResourceManagerClient")
+
+
+def tagging_service():
+    """
+    Initializes and returns an instance of the GlobalTaggingV1 service.
+
+    Returns:
+        GlobalTaggingV1: An instance of the GlobalTaggingV1 service.
+
+    Raises:
+        ValueError: If the `IBMCLOUD_API_KEY` environment variable is not set.
+    """
+    from ibm_platform_services import GlobalTaggingV1
+    from auth import get_authenticator
+
+    authenticator = get_authenticator(ibmcloud_api_key())
+    service = GlobalTaggingV1(authenticator=authenticator)
+    return _rate_limited(service, service_url("tagging"))
 
 
 def vpc_client(ibmcloud_api_key, region):
     """
-    Initializes and returns an instance of the VpcV1 service for a specific region.
+    Initializes and returns a VPC client for a specific region.
 
-    This function uses the IBM Cloud SDK to create a VPC service client, which can be
-    used to interact with the IBM Cloud VPC service in a specific region.
-    It relies on the `IBMCLOUD_API_KEY` environment variable for authentication.
+    The client has the VpcV1 methods used by this tool and returns
+    DetailedResponse objects, but every call is made through a single
+    long-lived httpx.AsyncClient with keep-alive and HTTP/2, so the many
+    concurrent calls of a deployment share a few TLS connections.
 
     Args:
         ibmcloud_api_key (str): The IBM Cloud API key.
         region (str): The IBM Cloud region to target (e.g., "us-south").
 
     Returns:
-        VpcV1: An instance of the VpcV1 service.
-
-    Raises:
-        ValueError: If the `IBMCLOUD_API_KEY` environment variable is not set.
+        async_client.SyncClient: A VpcV1-compatible client over an AsyncVpcClient.
     """
-    authenticator = IAMAuthenticator(ibmcloud_api_key)
-    service = VpcV1(authenticator=authenticator)
-    service.set_service_url(f"https://{region}.iaas.cloud.ibm.com/v1")
-    return service
+    return _pooled(ibmcloud_api_key, "AsyncVpcClient", region)
 
 
+@traced
 def get_group_id_by_name(resource_group_name):
     """
     Retrieves the ID of a resource group by its name.
 
     This function uses the Resource Manager service to list all resource groups
-    in the account and then iterates through the list to find the resource group
-    with the specified name.
+    in the account once and caches a name-to-ID map locally, so later lookups are
+    answered without an API call until the cache entry expires. A group missing
+    from the cached map triggers one fresh listing before None is returned.
 
     Args:
         resource_group_name (str): The name of the resource group to find.
@@ -137,21 +188,23 @@ def get_group_id_by_name(resource_group_name):
         ApiException: If there is an error while calling the IBM Cloud API.
         ValueError: If the `IBMCLOUD_API_KEY` environment variable is not set.
     """
-    # rc_service = resource_controller_service()
-    rm_service = resource_manager_service()
     account_id = getAccountId()
-    resource_groups = rm_service.list_resource_groups(
-        account_id=account_id,
-    ).get_result()
 
-    for group in resource_groups["resources"]:
-        if group["name"] == resource_group_name:
-            return group["id"]
+    def list_groups():
+        # rc_service = resource_controller_service()
+        rm_service = resource_manager_service()
+        resource_groups = rm_service.list_resource_groups(
+            account_id=account_id,
+        ).get_result()
+        return {group["name"]: group["id"] for group in resource_groups["resources"]}
 
-    return None
+    return lookup_cache(account_id).find(
+        "resource_groups", resource_group_name, list_groups
+    )
 
 
-def create_vpc(vpc_client, resource_group_id, prefix):
+@traced
+def create_vpc(vpc_client, resource_group_id, prefix, address_prefix_management="auto"):
     """
     Creates a VPC (Virtual Private Cloud).
 
@@ -161,6 +214,8 @@ def create_vpc(vpc_client, resource_group_id, prefix):
         vpc_client (VpcV1): An instance of the VpcV1 service.
         resource_group_id (str): The ID of the resource group to create the VPC in.
         prefix (str): A prefix to use for the VPC name.
+        address_prefix_management (str): "auto" to let the VPC create a prefix per
+            zone, or "manual" for prefixes from `create_address_prefix`.
 
     Returns:
         dict: The response from the VPC service, containing details about the created VPC.
@@ -169,16 +224,71 @@ def create_vpc(vpc_client, resource_group_id, prefix):
         ApiException: If there is an error while calling the IBM Cloud API.
         ValueError: If the `IBMCLOUD_API_KEY` environment variable is not set.
     """
-    address_prefix_management = "auto"
     response = vpc_client.create_vpc(
         classic_access=False,
-        address_prefix_management="auto",
+        address_prefix_management=address_prefix_management,
         name=f"{prefix}-vpc",
         resource_group={"id": resource_group_id},
     ).get_result()
     return response
 
 
+@traced
+def create_address_prefix(vpc_client, vpc_id, zone, cidr, prefix):
+    """
+    Creates an address prefix, from which a VPC's subnets in a zone are taken.
+
+    Args:
+        vpc_client (VpcV1): An instance of the VpcV1 service.
+        vpc_id (str): The ID of the VPC.
+        zone (str): The name of the zone (e.g., "us-south-1").
+        cidr (str): The prefix's CIDR, as planned by `ipam.zone_plan`.
+        prefix (str): A prefix to use for the address prefix name.
+
+    Returns:
+        dict: The address prefix, with a `vpc` reference added.
+
+    Raises:
+        ApiException: If there is an error while calling the IBM Cloud API.
+    """
+    response = vpc_client.create_vpc_address_prefix(
+        vpc_id=vpc_id,
+        cidr=cidr,
+        zone={"name": zone},
+        name=f"{prefix}-prefix-{zone}",
+    ).get_result()
+    return dict(response, vpc={"id": vpc_id})
+
+
+@traced
+def address_prefix_exists(client, address_prefix):
+    """
+    Checks that a journaled address prefix still exists.
+
+    Args:
+        client (VpcV1): An instance of the VpcV1 service.
+        address_prefix (dict): The result of `create_address_prefix`.
+
+    Returns:
+        bool: True if the prefix exists.
+
+    Raises:
+        ApiException: If the API returns an error other than 404.
+    """
+    from ibm_cloud_sdk_core.api_exception import ApiException
+
+    try:
+        client.get_vpc_address_prefix(
+            vpc_id=address_prefix["vpc"]["id"], id=address_prefix["id"]
+        )
+    except ApiException as e:
+        if e.status_code == 404:
+            return False
+        raise
+    return True
+
+
+@traced
 def create_public_gateways(vpc_client, vpc_id, zone_name, resource_group_id, prefix):
     """
     Creates a public gateway in a specific zone.
@@ -210,8 +320,15 @@ def create_public_gateways(vpc_client, vpc_id, zone_name, resource_group_id, pre
     return response
 
 
+@traced
 def create_subnets(
-    vpc_client, public_gateway_id, resource_group_id, vpc_id, zone, prefix
+    vpc_client,
+    public_gateway_id,
+    resource_group_id,
+    vpc_id,
+    zone,
+    prefix,
+    ipv4_cidr_block=None,
 ):
     """
     Creates a subnet in a specific zone.
@@ -225,6 +342,8 @@ def create_subnets(
         vpc_id (str): The ID of the VPC to associate the subnet with.
         zone (str): The name of the zone to create the subnet in (e.g., "us-south-1").
         prefix (str): A prefix to use for the subnet name.
+        ipv4_cidr_block (str): The subnet's CIDR, inside an address prefix of the
+            zone; without it the VPC picks a block of 128 addresses.
 
     Returns:
         dict: The response from the VPC service, containing details about the created subnet.
@@ -239,25 +358,125 @@ def create_subnets(
         "public_gateway": {"id": public_gateway_id} if public_gateway_id else None,
         "resource_group": {"id": resource_group_id},
         "vpc": {"id": vpc_id},
-        "total_ipv4_address_count": 128,
         "zone": {"name": zone},
     }
+    if ipv4_cidr_block:
+        subnet_prototype["ipv4_cidr_block"] = ipv4_cidr_block
+    else:
+        subnet_prototype["total_ipv4_address_count"] = 128
 
     response = vpc_client.create_subnet(subnet_prototype).get_result()
     return response
 
 
-def create_tailscale_sg_group(vpc_client, vpc_id, resource_group_id, prefix):
+TAILSCALE_NETWORK = "100.64.0.0/10"
+
+INSTANCE_PROFILE = "bx2-2x8"
+
+# Most Tailscale routers one lab can have; destroy looks for this many by name
+MAX_ROUTERS = 12
+
+
+def router_name(prefix, index=0):
+    """
+    Returns the name of one of a lab's Tailscale routers.
+
+    The first router keeps the name a lab with a single router has always had.
+
+    Args:
+        prefix (str): The lab prefix.
+        index (int): Position of the router in the tier, from 0.
+
+    Returns:
+        str: The instance name, e.g. "lab1-tailscale-instance-2" for index 1.
+    """
+    if index == 0:
+        return f"{prefix}-tailscale-instance"
+    return f"{prefix}-tailscale-instance-{index + 1}"
+
+
+def router_layout(zones, routers):
+    """
+    Spreads a lab's routers over its zones and decides which zones each serves.
+
+    Routers are placed round-robin, so no zone gets a second router before every
+    zone has one. Each router advertises the subnets of its own zone; routers in
+    the same zone advertise the same routes, so Tailscale fails over between
+    them. Zones left without a router (fewer routers than zones) are handed out
+    round-robin, so their subnets are still reachable.
+
+    Args:
+        zones (list): Sorted zone names of the region.
+        routers (int): Number of routers, at least 1.
+
+    Returns:
+        list: One (zone, served zones) tuple per router, in router order. The
+            router's own zone is always the first served zone.
+    """
+    placed = [zones[i % len(zones)] for i in range(routers)]
+    served = [[zone] for zone in placed]
+    for n, zone in enumerate(zone for zone in zones if zone not in placed):
+        served[n % routers].append(zone)
+    return list(zip(placed, served))
+
+
+TAILSCALE_SG_RULES = [
+    {
+        "direction": "inbound",
+        "ip_version": "ipv4",
+        "protocol": "icmp",
+        "code": 0,
+        "type": 8,
+    },
+    {
+        "direction": "inbound",
+        "ip_version": "ipv4",
+        "protocol": "tcp",
+        "port_min": 22,
+        "port_max": 22,
+        "remote": {"cidr_block": TAILSCALE_NETWORK},
+    },
+    {
+        "direction": "inbound",
+        "ip_version": "ipv4",
+        "protocol": "tcp",
+        "port_min": 80,
+        "port_max": 80,
+    },
+    {
+        "direction": "inbound",
+        "ip_version": "ipv4",
+        "protocol": "tcp",
+        "port_min": 443,
+        "port_max": 443,
+    },
+    {"direction": "outbound", "ip_version": "ipv4", "protocol": "all"},
+]
+
+# Rule sets by lab role, so other roles can reuse the same creation path
+SECURITY_GROUP_RULE_SETS = {
+    "tailscale": TAILSCALE_SG_RULES,
+}
+
+
+@traced
+def create_tailscale_sg_group(
+    vpc_client, vpc_id, resource_group_id, prefix, rules=TAILSCALE_SG_RULES
+):
     """
-    Creates a security group for Tailscale.
+    Creates a security group for Tailscale, including its rules.
 
     This function uses the VPC service to create a security group associated with the specified VPC.
+    The rules are part of the security group prototype, so the group and all of its rules
+    are created in a single request.
 
     Args:
         vpc_client (VpcV1): An instance of the VpcV1 service.
         vpc_id (str): The ID of the VPC to associate the security group with.
         resource_group_id (str): The ID of the resource group to create the security group in.
         prefix (str): A prefix to use for the security group name.
+        rules (list): Security group rule prototypes to create with the group.
+            Defaults to `TAILSCALE_SG_RULES`.
 
     Returns:
         dict: The response from the VPC service, containing details about the created security group.
@@ -269,87 +488,86 @@ def create_tailscale_sg_group(vpc_client, vpc_id, resource_group_id, prefix):
         vpc={"id": vpc_id},
         name=f"{prefix}-security-group",
         resource_group={"id": resource_group_id},
+        rules=list(rules),
     )
 
     response = security_group.get_result()
     return response
 
 
-def create_rules(vpc_client, sg_id):
+def _rule_key(rule):
+    remote = rule.get("remote") or {}
+    return (
+        rule.get("direction"),
+        rule.get("ip_version", "ipv4"),
+        rule.get("protocol"),
+        rule.get("port_min"),
+        rule.get("port_max"),
+        rule.get("type"),
+        rule.get("code"),
+        remote.get("cidr_block") or remote.get("address") or "0.0.0.0/0",
+    )
+
+
+@traced
+def create_rules(vpc_client, sg_id, rules=TAILSCALE_SG_RULES, max_workers=8):
     """
-    Creates security group rules for a given security group.
+    Adds a set of rules to an existing security group.
 
-    This function adds several inbound and outbound rules to the specified security group.
-    The rules allow ICMP, SSH (port 22) from Tailscale's network, HTTP (port 80), HTTPS (port 443),
-    and all outbound traffic.
+    The rule creates are sent concurrently, and the group's rules are then listed
+    once and reconciled against the requested set. Any rule still missing after
+    the concurrent pass is retried once.
 
     Args:
         vpc_client (VpcV1): An instance of the VpcV1 service.
         sg_id (str): The ID of the security group to add the rules to.
+        rules (list): Security group rule prototypes. Defaults to `TAILSCALE_SG_RULES`.
+        max_workers (int): Maximum number of concurrent rule creates.
+
+    Returns:
+        list: The security group's rules after reconciliation.
 
     Raises:
         ApiException: If there is an error while calling the IBM Cloud API.
+        RuntimeError: If requested rules are still missing after the retry.
     """
-    security_group_rule_protocol_tcp_tailscale_model = {}
-    security_group_rule_protocol_tcp_tailscale_model["cidr_block"] = "100.64.0.0/10"
-    security_group_rule_prototype_model = {}
-    security_group_rule_prototype_model["direction"] = "inbound"
-    security_group_rule_prototype_model["ip_version"] = "ipv4"
-    security_group_rule_prototype_model["protocol"] = "icmp"
-    security_group_rule_prototype_model["code"] = 0
-    security_group_rule_prototype_model["type"] = 8
-    security_group_rule_prototype = security_group_rule_prototype_model
-    response = vpc_client.create_security_group_rule(
-        sg_id, security_group_rule_prototype
-    )
-
-    security_group_rule_prototype_model = {}
-    security_group_rule_prototype_model["direction"] = "inbound"
-    security_group_rule_prototype_model["ip_version"] = "ipv4"
-    security_group_rule_prototype_model["protocol"] = "tcp"
-    security_group_rule_prototype_model["port_min"] = 22
-    security_group_rule_prototype_model["port_max"] = 22
-    security_group_rule_prototype_model[
-        "remote"
-    ] = security_group_rule_protocol_tcp_tailscale_model
-    security_group_rule_prototype = security_group_rule_prototype_model
-    response = vpc_client.create_security_group_rule(
-        sg_id, security_group_rule_prototype
-    )
-
-    security_group_rule_prototype_model = {}
-    security_group_rule_prototype_model["direction"] = "inbound"
-    security_group_rule_prototype_model["ip_version"] = "ipv4"
-    security_group_rule_prototype_model["protocol"] = "tcp"
-    security_group_rule_prototype_model["port_min"] = 80
-    security_group_rule_prototype_model["port_max"] = 80
-    security_group_rule_prototype = security_group_rule_prototype_model
-    response = vpc_client.create_security_group_rule(
-        sg_id, security_group_rule_prototype
-    )
-
-    security_group_rule_prototype_model = {}
-    security_group_rule_prototype_model["direction"] = "inbound"
-    security_group_rule_prototype_model["ip_version"] = "ipv4"
-    security_group_rule_prototype_model["protocol"] = "tcp"
-    security_group_rule_prototype_model["port_min"] = 443
-    security_group_rule_prototype_model["port_max"] = 443
-    security_group_rule_prototype = security_group_rule_prototype_model
-    response = vpc_client.create_security_group_rule(
-        sg_id, security_group_rule_prototype
-    )
-
-    security_group_rule_prototype_model = {}
-    security_group_rule_prototype_model["direction"] = "outbound"
-    security_group_rule_prototype_model["ip_version"] = "ipv4"
-    security_group_rule_prototype_model["protocol"] = "all"
-    security_group_rule_prototype = security_group_rule_prototype_model
-    response = vpc_client.create_security_group_rule(
-        sg_id, security_group_rule_prototype
-    )
 
-
-def create_tailscale_key(token, tailnet_id, tailscale_tag):
+    from ibm_cloud_sdk_core.api_exception import ApiException
+
+    def existing_rules():
+        result = vpc_client.list_security_group_rules(sg_id).get_result()
+        return result["rules"]
+
+    def create_missing(present):
+        present_keys = {_rule_key(rule) for rule in present}
+        missing = [rule for rule in rules if _rule_key(rule) not in present_keys]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(vpc_client.create_security_group_rule, sg_id, rule)
+                for rule in missing
+            ]
+        for future in futures:
+            try:
+                future.result()
+            except ApiException as e:
+                logging.warning(f"Security group rule create failed: {e}")
+        return missing
+
+    create_missing([])
+    present = existing_rules()
+    if create_missing(present):
+        present = existing_rules()
+        wanted = {_rule_key(rule) for rule in rules}
+        missing = wanted - {_rule_key(rule) for rule in present}
+        if missing:
+            raise RuntimeError(
+                f"Security group {sg_id} is missing {len(missing)} requested rules"
+            )
+    return present
+
+
+@traced
+def create_tailscale_key(token, tailnet_id, tailscale_tag, reusable=False):
     """
     Creates a Tailscale API key with specific capabilities.
 
@@ -360,6 +578,8 @@ def create_tailscale_key(token, tailnet_id, tailscale_tag):
         token (str): The Tailscale API token.
         tailnet_id (str): The ID of the Tailscale tailnet.
         tailscale_tag (str): The tag to apply to devices created with this key.
+        reusable (bool): Let several devices join with the key, e.g. every router
+            of a lab. The key stays ephemeral and expires after a day either way.
 
     Returns:
         dict: The JSON response from the Tailscale API, containing details about the created key.
@@ -367,27 +587,83 @@ def create_tailscale_key(token, tailnet_id, tailscale_tag):
     Raises:
         httpx.HTTPError: If there is an error while calling the Tailscale API.
     """
-    url = f"https://api.tailscale.com/api/v2/tailnet/{tailnet_id}/keys?all=true"
-    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
-    data = {
-        "capabilities": {
-            "devices": {
-                "create": {
-                    "reusable": False,
-                    "ephemeral": True,
-                    "preauthorized": True,
-                    "tags": [f"{tailscale_tag}"],
-                }
-            }
-        },
-        "expirySeconds": 86400,
-        "description": "Labme access",
-    }
+    import async_client
+
+    return async_client.run_sync(
+        async_client.create_tailscale_key(
+            token, tailnet_id, tailscale_tag, reusable=reusable
+        )
+    )
+
+
+@traced
+def revoke_tailscale_key(token, tailnet_id, key_id):
+    """
+    Revokes a Tailscale auth key.
+
+    Args:
+        token (str): The Tailscale API token.
+        tailnet_id (str): The ID of the Tailscale tailnet.
+        key_id (str): The ID of the key to revoke.
+
+    Returns:
+        bool: True if the key was revoked, False if it no longer existed.
 
-    response = httpx.post(url, headers=headers, json=data)
-    return response.json()
+    Raises:
+        httpx.HTTPError: If there is an error while calling the Tailscale API.
+    """
+    import async_client
+
+    return async_client.run_sync(
+        async_client.delete_tailscale_key(token, tailnet_id, key_id)
+    )
+
+
+@traced
+def tag_resources(crns, tags):
+    """
+    Attaches user tags to resources.
+
+    Args:
+        crns (list): CRNs of the resources to tag.
+        tags (list): Tags to attach, e.g. ["claimed-by:ada"].
+
+    Raises:
+        ApiException: If there is an error while calling the IBM Cloud API.
+        RuntimeError: If any of the resources could not be tagged.
+    """
+    result = (
+        tagging_service()
+        .attach_tag(
+            resources=[{"resource_id": crn} for crn in crns],
+            tag_names=list(tags),
+            tag_type="user",
+        )
+        .get_result()
+    )
+    failed = [item["resource_id"] for item in result["results"] if item.get("is_error")]
+    if failed:
+        raise RuntimeError(f"Could not tag {', '.join(failed)}")
 
 
+def tailscale_key_usable(key, margin=3600):
+    """
+    Checks whether a previously created Tailscale auth key can still be used.
+
+    Args:
+        key (dict): The key as returned by `create_tailscale_key`.
+        margin (int): Seconds the key must remain valid for.
+
+    Returns:
+        bool: True if the key has a secret and does not expire within `margin`.
+    """
+    if not key.get("key") or not key.get("expires"):
+        return False
+    expires = datetime.fromisoformat(key["expires"].replace("Z", "+00:00"))
+    return expires.timestamp() - margin > datetime.now().timestamp()
+
+
+@traced
 def create_vnic(vpc_client, subnet_id, resource_group_id, prefix, security_group_id):
     """
     Creates a virtual network interface (VNIC).
@@ -423,40 +699,42 @@ def create_vnic(vpc_client, subnet_id, resource_group_id, prefix, security_group
     return virtual_network_interface
 
 
-def get_latest_ubuntu(vpc_client):
+@traced
+def get_latest_ubuntu(vpc_client, region=None, version="24.04", architecture="amd64"):
     """
     Retrieves the ID of the latest Ubuntu 24.04 amd64 image.
 
-    This function uses the VPC service to list all available public images and then
-    filters the list to find the latest Ubuntu 24.04 amd64 image.
+    The lookup is answered from the region's on-disk image catalog index, which is
+    revalidated with a single small request once its TTL expires. If the client's
+    region cannot be determined, the public catalog is streamed page by page and
+    the scan stops at the first page containing a match.
 
     Args:
         vpc_client (VpcV1): An instance of the VpcV1 service.
+        region (str): The client's region. Derived from the client if omitted.
+        version (str): Ubuntu version prefix to match.
+        architecture (str): CPU architecture to match.
 
     Returns:
         str: The ID of the latest Ubuntu 24.04 amd64 image.
 
     Raises:
         ApiException: If there is an error while calling the IBM Cloud API.
+        LookupError: If no matching image exists in the region.
     """
-    all_images = vpc_client.list_images(
-        limit=100,
-        status=["available"],
-        visibility="public",
-        user_data_format=["cloud_init"],
-    ).get_result()["images"]
-
-    ubuntu_24_images = [
-        image
-        for image in all_images
-        if image.get("name", "").startswith("ibm-ubuntu-24")
-        and image.get("operating_system", {}).get("architecture") == "amd64"
-    ]
-
-    image_id = ubuntu_24_images[0]["id"]
-    return image_id
-
-
+    region = region or images.client_region(vpc_client)
+    if region:
+        image = images.ImageCatalog(region).resolve(
+            vpc_client, "ubuntu", version, architecture
+        )
+    else:
+        image = images.find_latest_image(vpc_client, "ubuntu", version, architecture)
+    if image is None:
+        raise LookupError(f"No public Ubuntu {version} {architecture} image found")
+    return image["id"]
+
+
+@traced
 def create_new_instance(
     vpc_client,
     prefix,
@@ -468,7 +746,10 @@ def create_new_instance(
     my_key_id,
     first_subnet_id,
     tailscale_device_token,
-    first_subnet_cidr,
+    advertise_routes,
+    user_data_parts=DEFAULT_PARTS,
+    profile=INSTANCE_PROFILE,
+    index=0,
 ):
     """
     Creates a new compute instance.
@@ -485,6 +766,14 @@ def create_new_instance(
         image_id (str): The ID of the image to use for the instance.
         my_key_id (str): The ID of the SSH key to use for the instance.
         first_subnet_id (str): The ID of the subnet to create the instance in.
+        tailscale_device_token (str): Auth key the instance joins the tailnet with.
+        advertise_routes (list): CIDRs of the subnets the instance advertises as
+            Tailscale routes.
+        user_data_parts (tuple): User-data templates to render, e.g. add
+            "cloud_config_template.yaml" to send the cloud-config as well.
+        profile (str): Instance profile name.
+        index (int): Position of the instance in the lab's router tier; see
+            `router_name`.
 
     Returns:
         dict: The response from the VPC service, containing details about the created instance.
@@ -492,6 +781,7 @@ def create_new_instance(
     Raises:
         ApiException: If there is an error while calling the IBM Cloud API.
         ValueError: If the `IBMCLOUD_API_KEY` environment variable is not set.
+        UserDataTooLarge: If the rendered user data is over the VPC limit.
     """
     security_group_identity_model = {"id": sg_id}
     subnet_identity_model = {"id": first_subnet_id}
@@ -500,7 +790,7 @@ def create_new_instance(
         "subnet": subnet_identity_model,
         "security_groups": [security_group_identity_model],
     }
-    vsi_name = f"{prefix}-tailscale-instance"
+    vsi_name = router_name(prefix, index)
     storage_volume_name = f"{vsi_name}-boot"
 
     boot_volume_profile = {
@@ -515,43 +805,42 @@ def create_new_instance(
     }
 
     key_identity_model = {"id": my_key_id}
-    profile_name = "bx2-2x8"
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-
-    # Load and render the cloud-config template
-    env = Environment(loader=FileSystemLoader(script_dir))
-
-    template = env.get_template("cloud_config.sh")
-    user_data_script = template.render(
-        tailscale_api_token=tailscale_device_token, first_subnet_cidr=first_subnet_cidr
+    user_data = build_user_data(
+        parts=user_data_parts,
+        tailscale_api_token=tailscale_device_token,
+        advertise_routes=",".join(advertise_routes),
     )
 
     instance_prototype = {}
     instance_prototype["name"] = vsi_name
     instance_prototype["keys"] = [key_identity_model]
-    instance_prototype["profile"] = {"name": profile_name}
+    instance_prototype["profile"] = {"name": profile}
     instance_prototype["resource_group"] = {"id": resource_group_id}
     instance_prototype["vpc"] = {"id": vpc_id}
     instance_prototype["image"] = {"id": image_id}
     instance_prototype["zone"] = {"name": zone}
     instance_prototype["boot_volume_attachment"] = boot_volume_attachment
     instance_prototype["primary_network_interface"] = primary_network_interface
-    instance_prototype["user_data"] = user_data_script
+    instance_prototype["user_data"] = user_data
+
+    from ibm_cloud_sdk_core.api_exception import ApiException
 
     try:
         resp = vpc_client.create_instance(instance_prototype)
         return resp
     except ApiException as e:
         logging.error("API exception {}.".format(str(e)))
-        quit(1)
+        raise
 
 
+@traced
 def get_ssh_key_id(client, ssh_key):
     """
     Retrieves the ID of an SSH key by its name.
 
-    This function uses the VPC service to list all SSH keys in the account and then
-    iterates through the list to find the key with the specified name.
+    This function uses the VPC service to list all SSH keys in the region once and
+    caches a name-to-ID map locally, keyed by account and region. A name missing
+    from the cached map triggers one fresh listing before None is returned.
 
     Args:
         client (VpcV1): An instance of the VpcV1 service.
@@ -564,8 +853,218 @@ def get_ssh_key_id(client, ssh_key):
         ApiException: If there is an error while calling the IBM Cloud API.
         ValueError: If the `IBMCLOUD_API_KEY` environment variable is not set.
     """
-    keys = client.list_keys().get_result()
-    for key in keys["keys"]:
-        if key["name"] == ssh_key:
-            return key["id"]
-    return None
+
+    def list_keys():
+        return {key["name"]: key["id"] for key in list_all(client.list_keys, "keys")}
+
+    region = images.client_region(client)
+    if not region:
+        return list_keys().get(ssh_key)
+    return lookup_cache(getAccountId(), region).find("keys", ssh_key, list_keys)
+
+
+@traced
+def get_zone_names(client, region):
+    """
+    Retrieves the names of the zones in a region.
+
+    Zones are the same for every account, so the list is cached per region and
+    shared by all accounts using this machine.
+
+    Args:
+        client (VpcV1): An instance of the VpcV1 service.
+        region (str): The IBM Cloud region (e.g., "us-south").
+
+    Returns:
+        list: The zone names, e.g. ["us-south-1", "us-south-2", "us-south-3"].
+
+    Raises:
+        ApiException: If there is an error while calling the IBM Cloud API.
+    """
+
+    def list_zones():
+        zones = client.list_region_zones(region).get_result()["zones"]
+        return {zone["name"]: zone.get("status") for zone in zones}
+
+    return sorted(lookup_cache("public", region).lookup("zones", list_zones))
+
+
+def _profile_value(field):
+    # Fixed fields carry a value; ranges and enums a default
+    field = field or {}
+    return field.get("value", field.get("default"))
+
+
+@traced
+def get_instance_profiles(client, region):
+    """
+    Retrieves the instance profiles of a region with the fields used for sizing.
+
+    Profiles are the same for every account, so the list is cached per region and
+    shared by all accounts using this machine.
+
+    Args:
+        client (VpcV1): An instance of the VpcV1 service.
+        region (str): The IBM Cloud region (e.g., "us-south").
+
+    Returns:
+        dict: Profile name mapped to its `bandwidth` (Mbps), `vcpus`, `memory`
+            (GB), `architecture` and `gpus`.
+
+    Raises:
+        ApiException: If there is an error while calling the IBM Cloud API.
+    """
+
+    def list_profiles():
+        profiles = client.list_instance_profiles().get_result()["profiles"]
+        return {
+            profile["name"]: {
+                "bandwidth": _profile_value(profile.get("bandwidth")) or 0,
+                "vcpus": _profile_value(profile.get("vcpu_count")) or 0,
+                "memory": _profile_value(profile.get("memory")) or 0,
+                "architecture": _profile_value(profile.get("vcpu_architecture")),
+                "gpus": _profile_value(profile.get("gpu_count")) or 0,
+            }
+            for profile in profiles
+        }
+
+    return lookup_cache("public", region).lookup("instance_profiles", list_profiles)
+
+
+def select_instance_profile(profiles, bandwidth, architecture="amd64"):
+    """
+    Picks the smallest instance profile that reaches a target bandwidth.
+
+    Profiles are compared by bandwidth, then vCPUs, then memory, so the cheapest
+    profile that is fast enough wins. GPU profiles are never picked.
+
+    Args:
+        profiles (dict): Profiles as from `get_instance_profiles`.
+        bandwidth (int): Bandwidth one instance must reach, in Mbps.
+        architecture (str): CPU architecture of the image, e.g. "amd64".
+
+    Returns:
+        str: The profile name.
+
+    Raises:
+        LookupError: If no profile reaches the bandwidth.
+    """
+    candidates = [
+        (spec["bandwidth"], spec["vcpus"], spec["memory"], name)
+        for name, spec in profiles.items()
+        if spec["architecture"] == architecture and not spec["gpus"]
+    ]
+    fast_enough = [candidate for candidate in candidates if candidate[0] >= bandwidth]
+    if not fast_enough:
+        fastest = max((candidate[0] for candidate in candidates), default=0)
+        raise LookupError(
+            f"No {architecture} instance profile reaches {bandwidth} Mbps (the fastest "
+            f"has {fastest} Mbps); add routers to spread the bandwidth"
+        )
+    return min(fast_enough)[3]
+
+
+# kind -> VpcV1 method that fetches one resource by ID
+RESOURCE_GETTERS = {
+    "vpc": "get_vpc",
+    "public_gateway": "get_public_gateway",
+    "subnet": "get_subnet",
+    "security_group": "get_security_group",
+    "instance": "get_instance",
+}
+
+# kind -> VpcV1 method that deletes one resource by ID
+RESOURCE_DELETERS = {
+    "vpc": "delete_vpc",
+    "public_gateway": "delete_public_gateway",
+    "subnet": "delete_subnet",
+    "security_group": "delete_security_group",
+    "instance": "delete_instance",
+}
+
+
+@traced
+def resource_exists(client, kind, resource_id):
+    """
+    Checks that a previously created resource still exists and is usable.
+
+    Used to verify journaled steps before a resumed deployment skips them.
+
+    Args:
+        client (VpcV1): An instance of the VpcV1 service.
+        kind (str): One of the keys of `RESOURCE_GETTERS`.
+        resource_id (str): The ID of the resource.
+
+    Returns:
+        bool: True if the resource exists and is not failed or being deleted.
+
+    Raises:
+        ApiException: If the API returns an error other than 404.
+    """
+    from ibm_cloud_sdk_core.api_exception import ApiException
+
+    try:
+        resource = getattr(client, RESOURCE_GETTERS[kind])(id=resource_id).get_result()
+    except ApiException as e:
+        if e.status_code == 404:
+            return False
+        raise
+    status = resource.get("status") or resource.get("lifecycle_state")
+    return status not in ("failed", "deleting", "pending_deletion")
+
+
+@traced
+def delete_resource(client, kind, resource_id):
+    """
+    Starts deleting a resource.
+
+    VPC deletions are asynchronous; the resource disappears from its collection
+    once the deletion finishes.
+
+    Args:
+        client (VpcV1): An instance of the VpcV1 service.
+        kind (str): One of the keys of `RESOURCE_DELETERS`.
+        resource_id (str): The ID of the resource.
+
+    Returns:
+        bool: True if a deletion was started, False if the resource was already gone.
+
+    Raises:
+        ApiException: If the API returns an error other than 404.
+    """
+    from ibm_cloud_sdk_core.api_exception import ApiException
+
+    try:
+        getattr(client, RESOURCE_DELETERS[kind])(id=resource_id)
+    except ApiException as e:
+        if e.status_code == 404:
+            return False
+        raise
+    return True
+
+
+def lab_resource_names(prefix, zones, routers=1):
+    """
+    Returns the names the deploy steps give a lab's resources.
+
+    Mirrors the names built by `create_vpc`, `create_public_gateways`,
+    `create_subnets`, `create_tailscale_sg_group` and `create_new_instance`.
+
+    Args:
+        prefix (str): The lab prefix.
+        zones (list): Sorted zone names of the region, as from `get_zone_names`.
+        routers (int): Number of Tailscale routers in the lab.
+
+    Returns:
+        dict: Resource kind mapped to the set of names for that kind.
+    """
+    # deploy_lab puts a frontend subnet in every zone that hosts a router
+    router_zones = {zone for zone, _ in router_layout(zones, routers)}
+    return {
+        "vpc": {f"{prefix}-vpc"},
+        "public_gateway": {f"{prefix}-pgw-{zone}" for zone in zones},
+        "subnet": {f"{prefix}-frontend-subnet-{zone}" for zone in router_zones}
+        | {f"{prefix}-backend-subnet-{zone}" for zone in zones},
+        "security_group": {f"{prefix}-security-group"},
+        "instance": {router_name(prefix, index) for index in range(routers)},
+    }
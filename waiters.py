@@ -0,0 +1,263 @@
+import logging
+import random
+import threading
+import time
+from concurrent.futures import Future, as_completed
+
+from pagination import list_all
+
+logger = logging.getLogger(__name__)
+
+# kind -> (list method, collection key, filterable by vpc_id, ready status)
+COLLECTIONS = {
+    "vpc": ("list_vpcs", "vpcs", False, "available"),
+    "public_gateway": ("list_public_gateways", "public_gateways", False, "available"),
+    "subnet": ("list_subnets", "subnets", True, "available"),
+    "instance": ("list_instances", "instances", True, "running"),
+    "security_group": ("list_security_groups", "security_groups", True, None),
+}
+
+FAILED_STATES = {"failed", "deleting", "stopped"}
+
+# Above this many VPCs with pending resources of one kind, a single unfiltered
+# list call is cheaper than one filtered call per VPC
+UNFILTERED_VPC_THRESHOLD = 3
+
+
+class WaiterError(Exception):
+    """
+    Raised when a watched resource fails or does not become ready in time.
+
+    Attributes:
+        kind (str): The resource kind, e.g. "subnet".
+        resource_id (str): The ID of the resource.
+    """
+
+    def __init__(self, message, kind, resource_id):
+        super().__init__(message)
+        self.kind = kind
+        self.resource_id = resource_id
+
+
+class ResourceWaiter:
+    """
+    Waits for many pending resources at once by polling whole collections.
+
+    Each poll round makes one list call per kind (and VPC, where the collection
+    can be filtered by VPC) no matter how many resources of that kind are pending,
+    instead of one GET per resource. When many VPCs are pending at once, as in
+    fleet runs sharing one waiter, the kind is listed once without a VPC filter.
+    When a round finds nothing new, the delay grows with decorrelated jitter up to
+    `max_delay`; when something becomes ready, it drops back to `base_delay`. Resources are handed back through futures as
+    soon as the round that sees them ready completes. Deletions are tracked the
+    same way: a deleted resource settles once it no longer appears in its list.
+
+    Args:
+        vpc_client (VpcV1): An instance of the VpcV1 service.
+        base_delay (float): Shortest delay between poll rounds, in seconds.
+        max_delay (float): Longest delay between poll rounds, in seconds.
+        timeout (float): Seconds a resource may stay pending before failing.
+    """
+
+    def __init__(self, vpc_client, base_delay=2.0, max_delay=30.0, timeout=1200.0):
+        self.vpc_client = vpc_client
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.ready_times = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def watch(self, kind, resource_id, vpc_id=None, deleted=False):
+        """
+        Starts tracking a resource and returns a future for its ready state.
+
+        Args:
+            kind (str): One of "vpc", "public_gateway", "subnet", "instance" or
+                "security_group".
+            resource_id (str): The ID of the resource.
+            vpc_id (str): The VPC the resource belongs to, used to narrow the list call.
+            deleted (bool): Wait for the resource to disappear instead of becoming ready.
+
+        Returns:
+            Future: Resolves to the resource dict once it is ready (or to None once
+                it is deleted), or raises WaiterError if it fails or times out.
+        """
+        if kind not in COLLECTIONS:
+            raise ValueError(f"Unsupported resource kind: {kind}")
+        with self._lock:
+            key = (kind, resource_id)
+            if key in self._pending:
+                return self._pending[key]["future"]
+            future = Future()
+            self._pending[key] = {
+                "future": future,
+                "vpc_id": vpc_id,
+                "deleted": deleted,
+                "started": time.monotonic(),
+            }
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._poll_loop, name="resource-waiter", daemon=True
+                )
+                self._thread.start()
+        return future
+
+    def wait(self, kind, resource_id, vpc_id=None):
+        """
+        Blocks until a resource is ready and returns it.
+
+        Args:
+            kind (str): The resource kind.
+            resource_id (str): The ID of the resource.
+            vpc_id (str): The VPC the resource belongs to.
+
+        Returns:
+            dict: The ready resource.
+
+        Raises:
+            WaiterError: If the resource fails or times out.
+        """
+        return self.watch(kind, resource_id, vpc_id).result()
+
+    def wait_deleted(self, kind, resource_id, vpc_id=None):
+        """
+        Blocks until a resource no longer exists.
+
+        Args:
+            kind (str): The resource kind.
+            resource_id (str): The ID of the resource.
+            vpc_id (str): The VPC the resource belonged to.
+
+        Raises:
+            WaiterError: If the deletion fails or times out.
+        """
+        self.watch(kind, resource_id, vpc_id, deleted=True).result()
+
+    def pop_ready_times(self, keys):
+        """
+        Returns and forgets how long resources took to become ready.
+
+        Each lab pops the timings of the resources it waited on, so a waiter
+        shared by a fleet or a long-running daemon only holds the timings of
+        labs still in progress.
+
+        Args:
+            keys (iterable): Tuples of (kind, resource_id).
+
+        Returns:
+            dict: (kind, resource_id) mapped to seconds, for the keys that became
+                ready.
+        """
+        with self._lock:
+            return {
+                key: self.ready_times.pop(key)
+                for key in keys
+                if key in self.ready_times
+            }
+
+    def as_ready(self, resources):
+        """
+        Yields resources in the order they become ready.
+
+        Args:
+            resources (iterable): Tuples of (kind, resource_id, vpc_id).
+
+        Yields:
+            dict: Each resource as soon as it is ready.
+
+        Raises:
+            WaiterError: If any resource fails or times out.
+        """
+        futures = [self.watch(*resource) for resource in resources]
+        for future in as_completed(futures):
+            yield future.result()
+
+    def _poll_loop(self):
+        delay = self.base_delay
+        while True:
+            time.sleep(delay)
+            with self._lock:
+                if not self._pending:
+                    self._thread = None
+                    return
+                pending = dict(self._pending)
+            progressed = self._poll_once(pending)
+            if progressed:
+                delay = self.base_delay
+            else:
+                delay = min(self.max_delay, random.uniform(self.base_delay, delay * 3))
+
+    def _poll_once(self, pending):
+        vpcs_by_kind = {}
+        for (kind, _), entry in pending.items():
+            vpcs_by_kind.setdefault(kind, set()).add(entry["vpc_id"])
+
+        groups = {}
+        for (kind, resource_id), entry in pending.items():
+            filterable = COLLECTIONS[kind][2]
+            if len(vpcs_by_kind[kind]) > UNFILTERED_VPC_THRESHOLD:
+                filterable = False
+            vpc_id = entry["vpc_id"] if filterable else None
+            groups.setdefault((kind, vpc_id), []).append(resource_id)
+
+        progressed = False
+        for (kind, vpc_id), ids in groups.items():
+            method, collection, _, ready_status = COLLECTIONS[kind]
+            params = {"vpc_id": vpc_id} if vpc_id else {}
+            try:
+                found = {
+                    resource["id"]: resource
+                    for resource in list_all(
+                        getattr(self.vpc_client, method), collection, **params
+                    )
+                    if resource["id"] in ids
+                }
+            except Exception as e:
+                logger.warning(f"Polling {collection} failed, will retry: {e}")
+                continue
+            for resource_id in ids:
+                progressed |= self._settle(
+                    kind, resource_id, found.get(resource_id), ready_status
+                )
+        return progressed
+
+    def _settle(self, kind, resource_id, resource, ready_status):
+        key = (kind, resource_id)
+        entry = self._pending[key]
+        elapsed = time.monotonic() - entry["started"]
+        status = (resource or {}).get("status") or (resource or {}).get(
+            "lifecycle_state"
+        )
+        failed_states = FAILED_STATES
+        if entry["deleted"]:
+            # Resources pass through "deleting" on their way out of the list
+            ready_status, failed_states = "deleted", {"failed"}
+            if resource is None:
+                status = "deleted"
+        if status == ready_status:
+            outcome = resource
+        elif status in failed_states:
+            outcome = WaiterError(
+                f"{kind} {resource_id} entered status {status}", kind, resource_id
+            )
+        elif elapsed > self.timeout:
+            outcome = WaiterError(
+                f"{kind} {resource_id} not {ready_status} after {elapsed:.0f}s",
+                kind,
+                resource_id,
+            )
+        else:
+            return False
+
+        with self._lock:
+            del self._pending[key]
+            if not isinstance(outcome, WaiterError) and not entry["deleted"]:
+                self.ready_times[key] = elapsed
+        if isinstance(outcome, WaiterError):
+            entry["future"].set_exception(outcome)
+        else:
+            logger.info(f"{kind} {resource_id} {ready_status} after {elapsed:.1f}s")
+            entry["future"].set_result(outcome)
+        return True